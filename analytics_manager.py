@@ -8,6 +8,8 @@ from typing import Dict, List, Any, Optional, Tuple
 from collections import defaultdict, Counter
 import statistics
 import logging
+from history_rollups import DailyRollups, rollup_file_for
+from snapshot import read_snapshot, write_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +19,7 @@ class AnalyticsManager:
     def __init__(self, analytics_file: str = "analytics_data.json"):
         self.analytics_file = analytics_file
         self.data = self._load_analytics_data()
+        self.rollups = DailyRollups(rollup_file_for(analytics_file))  # số liệu theo ngày đã gộp
     
     def _load_analytics_data(self) -> Dict[str, Any]:
         """Tải dữ liệu analytics từ file"""
@@ -30,6 +33,11 @@ class AnalyticsManager:
             "last_updated": datetime.now().isoformat()
         }
         
+        cached = read_snapshot(self.analytics_file)
+        if cached is not None:
+            logger.info(f"Đã nạp {self.analytics_file} từ snapshot")
+            return cached
+
         if os.path.exists(self.analytics_file):
             try:
                 with open(self.analytics_file, 'r', encoding='utf-8') as f:
@@ -44,14 +52,22 @@ class AnalyticsManager:
         
         return default_data
     
-    def save_analytics_data(self):
+    def save_analytics_data(self) -> bool:
         """Lưu dữ liệu analytics"""
         try:
             self.data["last_updated"] = datetime.now().isoformat()
             with open(self.analytics_file, 'w', encoding='utf-8') as f:
                 json.dump(self.data, f, ensure_ascii=False, indent=2)
+            return True
         except Exception as e:
             logger.error(f"Lỗi khi lưu analytics: {e}")
+            return False
+
+    def save_snapshot(self) -> bool:
+        """Lưu analytics rồi ghi snapshot nhị phân để lần khởi động sau nạp nhanh hơn"""
+        if not self.save_analytics_data():
+            return False
+        return write_snapshot(self.analytics_file, self.data)
     
     def record_post(self, post_data: Dict[str, Any]):
         """Ghi nhận một bài đăng mới"""
@@ -165,7 +181,8 @@ class AnalyticsManager:
     
     def get_overview_stats(self) -> Dict[str, Any]:
         """Lấy thống kê tổng quan"""
-        total_posts = len(self.data["posts"])
+        rollup_totals = self.rollups.totals
+        total_posts = len(self.data["posts"]) + rollup_totals["posts"]
         if total_posts == 0:
             return {
                 "total_posts": 0,
@@ -177,6 +194,8 @@ class AnalyticsManager:
         
         total_success = sum(post["success_count"] for post in self.data["posts"])
         total_attempts = sum(post["success_count"] + post["failure_count"] for post in self.data["posts"])
+        total_success += rollup_totals["successful_sends"]
+        total_attempts += rollup_totals["successful_sends"] + rollup_totals["failed_sends"]
         success_rate = (total_success / total_attempts * 100) if total_attempts > 0 else 0
         
         # Kênh hoạt động (có bài đăng trong 7 ngày qua)
@@ -199,17 +218,22 @@ class AnalyticsManager:
         stats = []
         for i in range(days):
             date = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
-            day_stats = self.data["daily_stats"].get(date, {
-                "total_posts": 0,
-                "successful_posts": 0,
-                "failed_posts": 0,
-                "total_channels_reached": 0
-            })
+            day_stats = self.data["daily_stats"].get(date) or self._daily_stats_from_rollup(date)
             day_stats["date"] = date
             stats.append(day_stats)
         
         return list(reversed(stats))
     
+    def _daily_stats_from_rollup(self, date: str) -> Dict[str, Any]:
+        """Thống kê một ngày lấy từ rollup (ngày đã bị dọn dữ liệu gốc)"""
+        day = self.rollups.get_day(date) or {}
+        return {
+            "total_posts": day.get("posts", 0),
+            "successful_posts": day.get("successful_sends", 0),
+            "failed_posts": day.get("failed_sends", 0),
+            "total_channels_reached": day.get("channels_reached", 0)
+        }
+    
     def get_channel_performance(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Lấy hiệu suất top channels"""
         channels = []
@@ -233,6 +257,8 @@ class AnalyticsManager:
         distribution = defaultdict(int)
         for post in self.data["posts"]:
             distribution[post["type"]] += 1
+        for post_type, count in self.rollups.totals["by_type"].items():
+            distribution[post_type] += count
         return dict(distribution)
     
     def get_peak_hours(self) -> List[Tuple[int, int]]:
@@ -242,6 +268,8 @@ class AnalyticsManager:
         for post in self.data["posts"]:
             hour = int(post["timestamp"][11:13])
             hour_counts[hour] += 1
+        for hour, count in self.rollups.totals["by_hour"].items():
+            hour_counts[int(hour)] += count
         
         # Trả về top 5 giờ cao điểm
         return sorted(hour_counts.items(), key=lambda x: x[1], reverse=True)[:5]
@@ -344,24 +372,33 @@ class AnalyticsManager:
             logger.error(f"Lỗi khi xuất báo cáo: {e}")
             return ""
     
-    def cleanup_old_data(self, days: int = 90):
-        """Dọn dẹp dữ liệu cũ"""
+    def cleanup_old_data(self, days: int = 90) -> int:
+        """Dọn dẹp dữ liệu cũ (gộp vào rollup theo ngày trước khi xóa), trả về số bài đã xóa"""
         cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
         
-        # Xóa posts cũ
-        self.data["posts"] = [
-            post for post in self.data["posts"]
-            if post["timestamp"] > cutoff_date
-        ]
+        # Gộp rồi xóa posts cũ
+        kept_posts = []
+        removed_count = 0
+        for post in self.data["posts"]:
+            if post["timestamp"] > cutoff_date:
+                kept_posts.append(post)
+            else:
+                self.rollups.add_analytics_record(post)
+                removed_count += 1
+        self.data["posts"] = kept_posts
         
-        # Xóa daily stats cũ
+        # Xóa daily stats cũ (ngày chưa có trong rollup thì gộp từ daily stats)
         old_dates = [
             date for date in self.data["daily_stats"].keys()
             if date < cutoff_date[:10]
         ]
         for date in old_dates:
+            self.rollups.add_daily_stats(date, self.data["daily_stats"][date])
             del self.data["daily_stats"][date]
         
+        if removed_count or old_dates:
+            self.rollups.save()
+        
         # Xóa errors cũ
         self.data["errors"] = [
             error for error in self.data["errors"]
@@ -369,4 +406,5 @@ class AnalyticsManager:
         ]
         
         self.save_analytics_data()
-        logger.info(f"Đã dọn dẹp dữ liệu cũ hơn {days} ngày") 
\ No newline at end of file
+        logger.info(f"Đã dọn dẹp dữ liệu cũ hơn {days} ngày")
+        return removed_count
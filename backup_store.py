@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+import logging
+
+from file_sync import SharedJSONStore
+
+try:
+    import zstandard
+except ImportError:  # zstd là tùy chọn, mặc định dùng gzip
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Chia chunk theo nội dung, cắt tại ranh giới dòng: chèn/xóa một bản ghi chỉ làm đổi
+# các chunk quanh nó, phần còn lại của file vẫn trùng hash với lần backup trước
+MIN_CHUNK_SIZE = 4 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+BOUNDARY_MASK = 0x1FF  # trung bình ~512 dòng sau MIN_CHUNK_SIZE thì có một điểm cắt
+# Chunk mới ghi hoặc vừa được dùng lại gần đây chưa bị dọn: tiến trình khác có thể đang tạo backup dùng tới nó
+GC_GRACE_SECONDS = 600
+
+
+def iter_chunks(stream: BinaryIO) -> Iterator[bytes]:
+    """Chia một stream nhị phân thành các chunk theo nội dung (đọc từng dòng, không nạp cả file)"""
+    buf = bytearray()
+    while True:
+        line = stream.readline(MAX_CHUNK_SIZE)
+        if not line:
+            break
+        buf += line
+        if len(buf) >= MAX_CHUNK_SIZE or (
+            len(buf) >= MIN_CHUNK_SIZE and zlib.crc32(line) & BOUNDARY_MASK == 0
+        ):
+            yield bytes(buf)
+            buf = bytearray()
+    if buf:
+        yield bytes(buf)
+
+
+def configured_backup_settings(settings_file: str = "bot_settings.json") -> Dict[str, Any]:
+    """Đọc nhóm cài đặt `backup` (max_backup_files, backup_location) mà không cần SettingsManager"""
+    try:
+        with open(settings_file, 'r', encoding='utf-8') as f:
+            return json.load(f).get('backup', {})
+    except Exception:
+        return {}
+
+
+class BackupStore:
+    """
+    Kho backup định danh theo nội dung (content-addressed).
+
+    - `store/chunks/<ab>/<sha256>.gz|.zst`: mỗi chunk duy nhất chỉ lưu một lần, đã nén
+    - `store/recipes/<backup_id>.recipe`: danh sách chunk tạo nên một bản backup
+    - `store/manifest.json`: index các bản backup (list_backups chỉ đọc file này)
+    """
+
+    def __init__(self, root: Optional[str] = None, max_backups: Optional[int] = None):
+        settings = configured_backup_settings()
+        self.root = root or settings.get('backup_location') or "backups"
+        self.max_backups = max_backups if max_backups is not None else settings.get('max_backup_files')
+        self.store_dir = os.path.join(self.root, "store")
+        self.chunks_dir = os.path.join(self.store_dir, "chunks")
+        self.recipes_dir = os.path.join(self.store_dir, "recipes")
+        self._manifest_store = SharedJSONStore(os.path.join(self.store_dir, "manifest.json"))
+        self.codec = 'zst' if zstandard is not None else 'gz'
+
+    # ---------- Manifest ----------
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self._manifest_store.path):
+            return {}
+        try:
+            return self._manifest_store.load() or {}
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc manifest backup: {e}")
+            return {}
+
+    def list_backups(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Danh sách bản backup (mới nhất trước), lọc theo loại nếu có"""
+        entries = [
+            entry for entry in self._load_manifest().values()
+            if kind is None or entry.get('kind') == kind
+        ]
+        return sorted(entries, key=lambda e: (e.get('created_at', ''), e['id']), reverse=True)
+
+    def get_backup(self, backup_id: str) -> Optional[Dict[str, Any]]:
+        return self._load_manifest().get(backup_id)
+
+    # ---------- Chunk ----------
+
+    def _chunk_path(self, digest: str, codec: str) -> str:
+        return os.path.join(self.chunks_dir, digest[:2], f"{digest}.{codec}")
+
+    def _find_chunk(self, digest: str) -> Optional[str]:
+        for codec in ('zst', 'gz'):
+            path = self._chunk_path(digest, codec)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == 'zst':
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    @staticmethod
+    def _decompress(path: str, data: bytes) -> bytes:
+        if path.endswith('.zst'):
+            if zstandard is None:
+                raise RuntimeError("Cần cài zstandard để đọc chunk .zst")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def _put_chunk(self, chunk: bytes) -> tuple:
+        """Lưu chunk nếu chưa có, trả về (digest, số byte mới ghi ra đĩa)"""
+        digest = hashlib.sha256(chunk).hexdigest()
+        existing = self._find_chunk(digest)
+        if existing:
+            # Làm mới mtime: dọn chunk chỉ bỏ qua chunk chưa có recipe nếu còn trong thời gian ân hạn,
+            # chunk cũ được dùng lại mà không chạm vào có thể bị xóa trước khi recipe được ghi
+            try:
+                os.utime(existing)
+                return digest, 0
+            except FileNotFoundError:
+                pass  # vừa bị dọn: ghi lại
+        path = self._chunk_path(digest, self.codec)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = self._compress(chunk)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        return digest, len(compressed)
+
+    # ---------- Tạo backup ----------
+
+    def _new_backup_id(self, kind: str, manifest: Dict[str, Any]) -> str:
+        base = f"{kind}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        backup_id = f"{base}.json"
+        suffix = 1
+        while backup_id in manifest:
+            backup_id = f"{base}_{suffix}.json"
+            suffix += 1
+        return backup_id
+
+    def backup_stream(self, stream: BinaryIO, kind: str, backup_id: Optional[str] = None,
+                      source: str = "") -> Dict[str, Any]:
+        """Backup nội dung một stream nhị phân, trả về mục manifest của bản backup"""
+        os.makedirs(self.recipes_dir, exist_ok=True)
+        digests = []
+        size = 0
+        stored = 0
+        file_hash = hashlib.sha256()
+        for chunk in iter_chunks(stream):
+            digest, written = self._put_chunk(chunk)
+            digests.append(digest)
+            size += len(chunk)
+            stored += written
+            file_hash.update(chunk)
+
+        with self._manifest_store.locked():
+            manifest = self._load_manifest()
+            backup_id = backup_id or self._new_backup_id(kind, manifest)
+            with open(os.path.join(self.recipes_dir, f"{backup_id}.recipe"), 'w', encoding='utf-8') as f:
+                json.dump(digests, f)
+            entry = {
+                'id': backup_id,
+                'kind': kind,
+                'source': source,
+                'created_at': datetime.now().isoformat(),
+                'size': size,
+                'stored_bytes': stored,
+                'chunks': len(digests),
+                'sha256': file_hash.hexdigest()
+            }
+            manifest[backup_id] = entry
+            self._manifest_store.save(manifest)
+
+        logger.info(
+            f"Đã backup {kind} -> {backup_id}: {size} byte, {len(digests)} chunk, ghi mới {stored} byte"
+        )
+        if self.max_backups:
+            self.prune(kind, int(self.max_backups))
+        return entry
+
+    def backup_file(self, path: str, kind: str, backup_id: Optional[str] = None) -> Dict[str, Any]:
+        """Backup một file trên đĩa (đọc streaming)"""
+        with open(path, 'rb') as f:
+            return self.backup_stream(f, kind, backup_id, source=path)
+
+    def backup_bytes(self, data: bytes, kind: str, backup_id: Optional[str] = None,
+                     source: str = "") -> Dict[str, Any]:
+        """Backup dữ liệu đã có trong bộ nhớ"""
+        return self.backup_stream(io.BytesIO(data), kind, backup_id, source)
+
+    # ---------- Khôi phục ----------
+
+    def _read_recipe(self, backup_id: str) -> List[str]:
+        with open(os.path.join(self.recipes_dir, f"{backup_id}.recipe"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def iter_backup(self, backup_id: str) -> Iterator[bytes]:
+        """Đọc lại nội dung một bản backup theo từng chunk"""
+        for digest in self._read_recipe(backup_id):
+            path = self._find_chunk(digest)
+            if path is None:
+                raise FileNotFoundError(f"Thiếu chunk {digest} của backup {backup_id}")
+            with open(path, 'rb') as f:
+                chunk = self._decompress(path, f.read())
+            if hashlib.sha256(chunk).hexdigest() != digest:
+                raise ValueError(f"Chunk {digest} của backup {backup_id} bị hỏng")
+            yield chunk
+
+    def restore_to(self, backup_id: str, target_path: str) -> int:
+        """Khôi phục bản backup ra file (ghi streaming + os.replace), trả về số byte"""
+        tmp_path = f"{target_path}.restore{os.getpid()}"
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in self.iter_backup(backup_id):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return size
+
+    def read_text(self, backup_id: str) -> str:
+        """Nội dung bản backup dạng chuỗi (cho dữ liệu JSON nhỏ như cài đặt, kênh)"""
+        return b''.join(self.iter_backup(backup_id)).decode('utf-8')
+
+    # ---------- Retention ----------
+
+    def prune(self, kind: str, keep: int) -> int:
+        """Chỉ giữ `keep` bản mới nhất của một loại, xóa chunk không còn được tham chiếu"""
+        with self._manifest_store.locked():
+            manifest = self._load_manifest()
+            same_kind = sorted(
+                (e for e in manifest.values() if e.get('kind') == kind),
+                key=lambda e: (e.get('created_at', ''), e['id']),
+                reverse=True
+            )
+            expired = [e['id'] for e in same_kind[max(keep, 1):]]
+            if not expired:
+                return 0
+            for backup_id in expired:
+                del manifest[backup_id]
+            self._manifest_store.save(manifest)
+
+            for backup_id in expired:
+                recipe_path = os.path.join(self.recipes_dir, f"{backup_id}.recipe")
+                if os.path.exists(recipe_path):
+                    os.remove(recipe_path)
+            removed_chunks = self._collect_garbage(manifest)
+
+        logger.info(f"Đã xóa {len(expired)} backup {kind} cũ và {removed_chunks} chunk không dùng")
+        return len(expired)
+
+    def _collect_garbage(self, manifest: Dict[str, Any]) -> int:
+        """Xóa các chunk không thuộc bản backup nào còn lại"""
+        referenced = set()
+        for backup_id in manifest:
+            try:
+                referenced.update(self._read_recipe(backup_id))
+            except Exception as e:
+                logger.error(f"Không đọc được recipe {backup_id}, bỏ qua dọn chunk: {e}")
+                return 0
+        removed = 0
+        if not os.path.isdir(self.chunks_dir):
+            return 0
+        grace_cutoff = time.time() - GC_GRACE_SECONDS
+        for prefix in os.listdir(self.chunks_dir):
+            prefix_dir = os.path.join(self.chunks_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                if name.split('.', 1)[0] in referenced or os.path.getmtime(path) > grace_cutoff:
+                    continue
+                os.remove(path)
+                removed += 1
+        return removed
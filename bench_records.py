@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Đo bộ nhớ lịch sử bài đăng: dict thường so với bản ghi __slots__ (records.py).
+
+Dữ liệu giả lập: 2.000 bài x 50 kênh = 100.000 kết quả gửi.
+
+    python bench_records.py [--posts 2000] [--channels 50]
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+
+from records import PostRecord, json_default
+
+
+def build_posts_json(post_count: int, channel_count: int) -> str:
+    """Sinh nội dung posts.json giống định dạng PostManager ghi ra"""
+    start = datetime(2024, 1, 1)
+    posts = {}
+    for i in range(post_count):
+        created = start + timedelta(minutes=i * 7)
+        channels = {}
+        for c in range(channel_count):
+            channel_id = -1001000000000 - c
+            success = (i + c) % 10 != 0
+            result = {
+                'channel_id': channel_id,
+                'channel_title': f"Kênh số {c}",
+                'success': success,
+                'sent_at': (created + timedelta(seconds=c)).isoformat()
+            }
+            if success:
+                result['message_id'] = 1000 + i
+            else:
+                result['error'] = 'Forbidden: bot was kicked'
+            channels[str(channel_id)] = result
+        post_id = f"post_{created.strftime('%Y%m%d_%H%M%S')}_{i}"
+        posts[post_id] = {
+            'id': post_id,
+            'content': f"Nội dung bài {i}",
+            'type': 'text',
+            'created_at': created.isoformat(),
+            'channels': channels,
+            'total_channels': channel_count,
+            'successful_sends': sum(1 for r in channels.values() if r['success']),
+            'failed_sends': sum(1 for r in channels.values() if not r['success']),
+            'status': 'completed',
+            'completed_at': (created + timedelta(seconds=channel_count)).isoformat()
+        }
+    return json.dumps(posts, ensure_ascii=False)
+
+
+def measure(loader, text: str):
+    """Bộ nhớ còn giữ (byte) sau khi nạp dữ liệu bằng loader"""
+    gc.collect()
+    tracemalloc.start()
+    data = loader(text)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, current, peak
+
+
+def load_dicts(text: str):
+    return json.loads(text)
+
+
+def load_records(text: str):
+    return {key: PostRecord.from_dict(value) for key, value in json.loads(text).items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo bộ nhớ dict so với bản ghi __slots__")
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--channels', type=int, default=50)
+    args = parser.parse_args()
+
+    text = build_posts_json(args.posts, args.channels)
+    print(f"📦 {args.posts} bài x {args.channels} kênh = {args.posts * args.channels} kết quả gửi, "
+          f"JSON {len(text) / 1024 / 1024:.1f} MB")
+
+    dicts, dict_current, dict_peak = measure(load_dicts, text)
+    del dicts
+    records, record_current, record_peak = measure(load_records, text)
+
+    # Ghi lại phải giống hệt dữ liệu gốc
+    round_trip = json.dumps(records, ensure_ascii=False, default=json_default)
+    assert json.loads(round_trip) == json.loads(text), "Round-trip JSON không khớp"
+
+    print(f"dict:    {dict_current / 1024 / 1024:7.1f} MB giữ lại (đỉnh {dict_peak / 1024 / 1024:.1f} MB)")
+    print(f"records: {record_current / 1024 / 1024:7.1f} MB giữ lại (đỉnh {record_peak / 1024 / 1024:.1f} MB)")
+    print(f"Tiết kiệm: {(1 - record_current / dict_current) * 100:.0f}%")
+    print("✅ Round-trip JSON không mất dữ liệu")
+
+
+if __name__ == "__main__":
+    main()
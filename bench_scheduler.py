@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark PostScheduler với đồng hồ giả lập (không cần mạng, không gửi Telegram thật).
+
+Sinh N lịch đăng với nhiều kiểu lặp (hàng ngày/tuần/tháng, cron ngày thường, RRULE 6 giờ
+một lần, đăng một lần), cho thời gian giả lập chạy qua D ngày theo đúng cách vòng lặp
+scheduler thức dậy (tới lịch sớm nhất, tối đa --tick giây), rồi đo:
+
+- CPU của luồng event loop mỗi lượt kiểm tra (p50/p95/p99/max) và tổng; phần ghi file
+  chạy trên thread pool nên không tính vào đây
+- Độ trễ khi chạy so với giờ hẹn (theo thời gian giả lập)
+- Bộ nhớ của các lịch sau khi nạp (tracemalloc) và RSS cao nhất của tiến trình
+- Số byte ghi ra đĩa: file lịch đăng (mỗi lần lưu) và run log
+
+    python bench_scheduler.py [--schedules 100000] [--days 30] [--channels 50] [--tick 30]
+    python bench_scheduler.py --schedules 100000 --days 30 --no-persist   # chỉ đo logic lập lịch
+
+Với --no-persist, việc ghi file lịch đăng được thay bằng no-op (run log vẫn ghi).
+Thư mục tạm (khi không có --dir) bị xóa sau khi chạy xong.
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from records import ScheduleRecord
+from scheduler import PostScheduler
+
+# (tỷ lệ, kiểu lặp) của các lịch được sinh ra
+RECURRENCE_MIX = (
+    (0.50, 'daily'),
+    (0.15, 'weekly'),
+    (0.10, 'monthly'),
+    (0.10, 'cron_weekdays'),
+    (0.05, 'rrule_6h'),
+    (0.10, 'once'),
+)
+
+
+class SimClock:
+    """Đồng hồ giả lập có cùng giao diện với scheduler.SystemClock"""
+
+    def __init__(self, start: datetime):
+        self.current = start.timestamp()
+
+    def time(self) -> float:
+        return self.current
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.current)
+
+
+class _Message:
+    def __init__(self, message_id: int):
+        self.message_id = message_id
+
+
+class FakeBot:
+    """Bot giả: nhận lệnh gửi và trả về message_id, không gọi mạng"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+        return _Message(self.sent)
+
+
+class FakePostManager:
+    """Gửi qua FakeBot và trả kết quả cùng định dạng PostManager.send_to_multiple_channels"""
+
+    def __init__(self):
+        self.posts = 0
+
+    async def send_to_multiple_channels(self, post_data, channels, bot, delay_between_sends=0):
+        self.posts += 1
+        results = []
+        for channel in channels:
+            message = await bot.send_message(chat_id=channel['id'], text=post_data.get('content', ''))
+            results.append({
+                'channel_id': channel['id'],
+                'channel_title': channel.get('title', ''),
+                'success': True,
+                'message_id': message.message_id
+            })
+        return {
+            'post_id': f"bench_{self.posts}",
+            'results': results,
+            'successful_sends': len(results),
+            'failed_sends': 0
+        }
+
+
+class FakeChannelManager:
+    def __init__(self, channels: List[Dict[str, Any]]):
+        self.channels = {str(c['id']): c for c in channels}
+
+    async def get_channel(self, channel_id: str):
+        return self.channels.get(channel_id)
+
+    async def update_channel_stats_many(self, results):
+        return len(results)
+
+
+class BenchScheduler(PostScheduler):
+    """PostScheduler ghi lại độ trễ chạy so với giờ hẹn"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies: List[float] = []
+
+    async def _execute_scheduled_post(self, schedule_id: str, schedule_info: Dict[str, Any], save: bool = True):
+        due = datetime.fromisoformat(schedule_info['next_execution']).timestamp()
+        self.latencies.append(self.clock.time() - due)
+        await super()._execute_scheduled_post(schedule_id, schedule_info, save)
+
+
+def build_schedules(count: int, channels: List[Dict[str, Any]], start: datetime, days: int,
+                    rng: random.Random) -> Dict[str, ScheduleRecord]:
+    """Sinh lịch đăng; giờ hẹn rơi vào các mốc 5 phút như bàn phím chọn phút của bot"""
+    kinds = [kind for share, kind in RECURRENCE_MIX for _ in range(int(share * 100))]
+    schedules = {}
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        slot = rng.randrange(288) * 5
+        first = start + timedelta(minutes=slot)
+        if kind == 'once':
+            first += timedelta(days=rng.randrange(max(1, days)))
+        schedule_id = f"bench_{i}"
+        record = ScheduleRecord(
+            id=schedule_id,
+            post_data={'type': 'text', 'content': f"Bài đăng định kỳ số {i}"},
+            channels=rng.sample(channels, min(len(channels), 3)),
+            scheduled_time=first.isoformat(),
+            repeat_type={'daily': 'daily', 'weekly': 'weekly', 'monthly': 'monthly'}.get(kind, 'none'),
+            repeat_count=0 if kind != 'once' else 1,
+            executed_count=0,
+            status='pending',
+            created_at=start.isoformat(),
+            next_execution=first.isoformat(),
+            last_execution=None,
+            execution_history=[]
+        )
+        if kind == 'cron_weekdays':
+            record['repeat_type'] = 'custom'
+            record['recurrence'] = f"cron: {first.minute} {first.hour} * * 1-5"
+        elif kind == 'rrule_6h':
+            record['repeat_type'] = 'custom'
+            record['recurrence'] = 'FREQ=HOURLY;INTERVAL=6'
+        schedules[schedule_id] = record
+    return schedules
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def simulate(scheduler: BenchScheduler, clock: SimClock, end: float, tick: float) -> List[float]:
+    """Chạy các lượt kiểm tra như PostScheduler._run_loop nhưng với thời gian giả lập"""
+    tick_cpu = []
+    while clock.current < end:
+        started = time.thread_time()
+        await scheduler._check_and_execute_scheduled_posts()
+        tick_cpu.append(time.thread_time() - started)
+        next_due = scheduler._next_due()
+        step = tick if next_due is None else min(tick, max(0.0, next_due - clock.current))
+        clock.current += step
+    return tick_cpu
+
+
+def run(args) -> Dict[str, Any]:
+    workdir = args.dir or tempfile.mkdtemp(prefix="bench_scheduler_")
+    try:
+        return _run(args, workdir)
+    finally:
+        if not args.dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run(args, workdir: str) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    start = datetime(2025, 1, 1)
+    clock = SimClock(start)
+    os.makedirs(workdir, exist_ok=True)
+    db_file = os.path.join(workdir, "scheduled_posts.json")
+    channels = [{'id': str(-1001000000000 - i), 'title': f"Kênh {i}", 'active': True} for i in range(args.channels)]
+
+    scheduler = BenchScheduler(
+        db_file,
+        bot=FakeBot(),
+        manager_provider=lambda managers=(FakePostManager(), FakeChannelManager(channels)): managers,
+        clock=clock
+    )
+    scheduler._notify_admins = lambda message: asyncio.sleep(0)
+
+    # Byte ghi ra của file lịch đăng: kích thước file sau mỗi lần lưu
+    saves = {'count': 0, 'bytes': 0, 'seconds': 0.0}
+    original_save = scheduler._store.save
+
+    def counted_save(data, apply=None, changed=None):
+        started = time.perf_counter()
+        if args.persist:
+            original_save(data, apply, changed)
+            saves['bytes'] += os.path.getsize(db_file)
+        saves['count'] += 1
+        saves['seconds'] += time.perf_counter() - started
+
+    scheduler._store.save = counted_save
+
+    # Lượt kiểm tra lưu qua save_async: phần ghi chạy trên thread pool
+    original_write = scheduler._store._write_fragments
+
+    def counted_write(entries, signature):
+        started = time.perf_counter()
+        written = True
+        if args.persist:
+            written = original_write(entries, signature)
+            saves['bytes'] += os.path.getsize(db_file)
+        saves['count'] += 1
+        saves['seconds'] += time.perf_counter() - started
+        return written
+
+    scheduler._store._write_fragments = counted_write
+
+    gc.collect()
+    tracemalloc.start()
+    build_started = time.perf_counter()
+    scheduler.scheduled_posts = build_schedules(args.schedules, channels, start, args.days, rng)
+    scheduler._rebuild_indexes()
+    build_seconds = time.perf_counter() - build_started
+    schedule_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    sim_started = time.perf_counter()
+    tick_cpu = asyncio.run(simulate(scheduler, clock, start.timestamp() + args.days * 86400, args.tick))
+    sim_seconds = time.perf_counter() - sim_started
+
+    run_log_bytes = os.path.getsize(scheduler.run_log.path) if os.path.exists(scheduler.run_log.path) else 0
+    latencies = scheduler.latencies
+    return {
+        'workdir': workdir,
+        'build_seconds': build_seconds,
+        'schedule_memory': schedule_memory,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        'ticks': len(tick_cpu),
+        'executions': len(latencies),
+        'messages': scheduler.bot.sent,
+        'tick_cpu': tick_cpu,
+        'latencies': latencies,
+        'sim_seconds': sim_seconds,
+        'saves': saves,
+        'run_log_bytes': run_log_bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PostScheduler với đồng hồ giả lập")
+    parser.add_argument('--schedules', type=int, default=100000, help="Số lịch đăng")
+    parser.add_argument('--days', type=int, default=30, help="Số ngày giả lập")
+    parser.add_argument('--channels', type=int, default=50, help="Số kênh (mỗi lịch gửi tới 3 kênh ngẫu nhiên)")
+    parser.add_argument('--tick', type=float, default=30, help="Thời gian ngủ tối đa mỗi lượt (SCHEDULER_CHECK_INTERVAL)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dir', help="Thư mục chứa file sinh ra (mặc định: thư mục tạm)")
+    parser.add_argument('--no-persist', dest='persist', action='store_false', help="Không ghi file lịch đăng")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    result = run(args)
+
+    tick_cpu = result['tick_cpu']
+    latencies = result['latencies']
+    saves = result['saves']
+    location = f", thư mục {result['workdir']}" if args.dir else ""
+    print(f"📦 {args.schedules:,} lịch, {args.days} ngày giả lập{location}")
+    print(f"   Sinh + dựng index: {result['build_seconds']:.2f}s, bộ nhớ lịch: {result['schedule_memory'] / 1024 / 1024:.1f} MB")
+    if result['max_rss_kb'] is not None:
+        print(f"   RSS cao nhất: {result['max_rss_kb'] / 1024:.1f} MB")
+    print(f"⏱️ {result['ticks']:,} lượt kiểm tra, {result['executions']:,} lần chạy, {result['messages']:,} tin gửi "
+          f"trong {result['sim_seconds']:.1f}s thực")
+    print(f"   CPU event loop mỗi lượt: p50 {percentile(tick_cpu, 50) * 1000:.2f} ms, p95 {percentile(tick_cpu, 95) * 1000:.2f} ms, "
+          f"p99 {percentile(tick_cpu, 99) * 1000:.2f} ms, max {max(tick_cpu, default=0) * 1000:.1f} ms, "
+          f"tổng {sum(tick_cpu):.1f}s")
+    if latencies:
+        print(f"   Trễ so với giờ hẹn: trung bình {statistics.mean(latencies):.3f}s, "
+              f"p99 {percentile(latencies, 99):.3f}s, max {max(latencies):.1f}s")
+    print(f"💾 Lưu file lịch: {saves['count']:,} lần, {saves['bytes'] / 1024 / 1024:.1f} MB, {saves['seconds']:.1f}s"
+          f"{'' if args.persist else ' (--no-persist)'}; run log: {result['run_log_bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,45 +3,188 @@
 
 import json
 import os
+from collections import defaultdict
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set, Tuple
 from telegram import Bot
 from telegram.constants import ChatMemberStatus
 from telegram.error import TelegramError
+from file_sync import SharedJSONStore, DELETED
+from channel_targeting import (
+    MembershipIndex, TargetExpressionError, count_bits, normalize_tag, parse_target, referenced_groups
+)
+from backup_store import BackupStore
+from records import ChannelRecord, json_default
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Độ dài n-gram lớn nhất được index cho tìm kiếm kênh
+SEARCH_NGRAM_SIZE = 3
+
+
+def canonical_channel_id(channel_id: Any) -> Any:
+    """Chuẩn hóa ID kênh: số nguyên nếu parse được, ngược lại là chuỗi đã strip"""
+    text = str(channel_id).strip()
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def _ngrams(text: str) -> Set[str]:
+    """Tất cả chuỗi con độ dài 1..SEARCH_NGRAM_SIZE của text"""
+    grams = set()
+    for size in range(1, SEARCH_NGRAM_SIZE + 1):
+        for i in range(len(text) - size + 1):
+            grams.add(text[i:i + size])
+    return grams
+
 # pyright: reportOptionalMemberAccess=false, reportCallIssue=false, reportArgumentType=false
 class ChannelManager:
     """Quản lý danh sách kênh Telegram"""
     
     def __init__(self, db_file: str = "channels.json"):
         self.db_file = db_file
+        self._store = SharedJSONStore(db_file, record_type=ChannelRecord)  # khóa file + theo dõi thay đổi từ dashboard
         self.channels = {}  # channel_id: channel_info
+        # Các index phụ, luôn đồng bộ với self.channels
+        self._id_index: Dict[Any, str] = {}  # canonical id -> key
+        self._username_index: Dict[str, str] = {}  # username (casefold) -> key
+        self._ngram_index: Dict[str, Set[str]] = defaultdict(set)  # n-gram -> keys
+        self._search_text: Dict[str, Tuple[str, str]] = {}  # key -> (title, username) đã casefold
+        self._order: Dict[str, int] = {}  # key -> thứ tự thêm vào
+        self._next_order = 0
+        self._membership = MembershipIndex()  # bitset theo tag / active để chọn kênh bằng biểu thức
+        # Nhóm kênh: tên -> {'expression', 'updated_at'}, lưu cạnh file kênh (channels_groups.json)
+        self._groups_store = SharedJSONStore(f"{os.path.splitext(db_file)[0]}_groups.json")
+        self.groups: Dict[str, Dict[str, Any]] = {}
+        self._group_cache: Dict[str, int] = {}
+        self._group_cache_version = -1
         self.load_channels()
+        self.load_groups()
     
     def load_channels(self):
         """Tải danh sách kênh từ file"""
         if os.path.exists(self.db_file):
             try:
-                with open(self.db_file, 'r', encoding='utf-8') as f:
-                    self.channels = json.load(f)
+                self.channels = self._store.load() or {}
                 logger.info(f"Đã tải {len(self.channels)} kênh từ {self.db_file}")
             except Exception as e:
                 logger.error(f"Lỗi khi tải kênh: {e}")
                 self.channels = {}
         else:
             self.channels = {}
+        self._rebuild_indexes()
+
+    # ---------- Index ----------
+
+    def _rebuild_indexes(self):
+        """Xây lại toàn bộ index từ self.channels"""
+        self._id_index = {}
+        self._username_index = {}
+        self._ngram_index = defaultdict(set)
+        self._search_text = {}
+        self._order = {}
+        self._next_order = 0
+        self._membership = MembershipIndex(version=self._membership.version + 1)
+        for key, channel_info in self.channels.items():
+            self._index_channel(key, channel_info)
+
+    def _index_channel(self, key: str, channel_info: Dict[str, Any]):
+        """Thêm một kênh vào các index"""
+        self._id_index[canonical_channel_id(key)] = key
+        if channel_info.get('id') is not None:
+            self._id_index.setdefault(canonical_channel_id(channel_info['id']), key)
+
+        username = (channel_info.get('username') or '').lstrip('@').casefold()
+        if username:
+            self._username_index.setdefault(username, key)
+
+        title = (channel_info.get('title') or channel_info.get('name') or '').casefold()
+        self._search_text[key] = (title, username)
+        for gram in _ngrams(title) | _ngrams(username):
+            self._ngram_index[gram].add(key)
+
+        if key not in self._order:
+            self._order[key] = self._next_order
+            self._next_order += 1
+
+        self._membership.add(key, channel_info.get('tags') or (), channel_info.get('active', True))
+
+    def _unindex_channel(self, key: str):
+        """Gỡ một kênh khỏi các index"""
+        channel_info = self.channels.get(key, {})
+        for id_value in (key, channel_info.get('id')):
+            if id_value is not None and self._id_index.get(canonical_channel_id(id_value)) == key:
+                del self._id_index[canonical_channel_id(id_value)]
+
+        title, username = self._search_text.pop(key, ('', ''))
+        if username and self._username_index.get(username) == key:
+            del self._username_index[username]
+        for gram in _ngrams(title) | _ngrams(username):
+            keys = self._ngram_index.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._ngram_index[gram]
+
+        self._order.pop(key, None)
+        self._membership.remove(key)
+
+    def _apply_remote_changes(self, updates: Dict[str, Any]):
+        """Áp dụng thay đổi do tiến trình khác ghi vào file, chỉ cập nhật index của các key bị đổi"""
+        for key, channel_info in updates.items():
+            if key in self.channels:
+                self._unindex_channel(key)
+            if channel_info is DELETED:
+                self.channels.pop(key, None)
+            else:
+                self.channels[key] = channel_info
+                self._index_channel(key, channel_info)
+
+    def _sync(self):
+        """Nạp thay đổi từ file nếu tiến trình khác (dashboard...) vừa ghi"""
+        self._store.refresh(self.channels, self._apply_remote_changes)
+
+    def index_version(self) -> int:
+        """Tăng mỗi khi kênh được thêm/xóa/sửa, đổi tag hoặc bật/tắt (dùng để cache giao diện)"""
+        self._sync()
+        return self._membership.version
+
+    def _resolve_key(self, channel_id: Any) -> Optional[str]:
+        """Tìm key lưu trữ của kênh theo key, ID (str/int) trong O(1)"""
+        self._sync()
+        if channel_id in self.channels:
+            return channel_id
+        return self._id_index.get(canonical_channel_id(channel_id))
+
+    def upsert_channel(self, channel_key: str, channel_info: Dict[str, Any]):
+        """Thêm/cập nhật bản ghi kênh và lưu file (dùng cho dashboard)"""
+        channel_key = str(channel_key)
+        channel_info = ChannelRecord.from_dict(channel_info)
+        if channel_key in self.channels:
+            self._unindex_channel(channel_key)
+        self.channels[channel_key] = channel_info
+        self._index_channel(channel_key, channel_info)
+        self.save_channels()
+
+    def _delete_channel_key(self, key: str):
+        """Xóa kênh khỏi danh sách và index (chưa lưu file)"""
+        self._unindex_channel(key)
+        del self.channels[key]
     
     def save_channels(self):
         """Lưu danh sách kênh vào file"""
         try:
-            with open(self.db_file, 'w', encoding='utf-8') as f:
-                json.dump(self.channels, f, ensure_ascii=False, indent=2)
+            self._store.save(self.channels, self._apply_remote_changes)
             logger.info(f"Đã lưu {len(self.channels)} kênh vào {self.db_file}")
         except Exception as e:
             logger.error(f"Lỗi khi lưu kênh: {e}")
+
+    def save_snapshot(self) -> bool:
+        """Ghi snapshot nhị phân để lần khởi động sau nạp nhanh hơn"""
+        return self._store.write_snapshot(self.channels, self._apply_remote_changes)
     
     async def add_channel(self, channel_input: str, bot: Bot) -> Dict[str, Any]:
         """
@@ -106,27 +249,28 @@ class ChannelManager:
                 }
             
             # Kiểm tra kênh đã tồn tại chưa
-            if str(chat.id) in self.channels:
+            if self._resolve_key(chat.id) is not None:
                 return {
                     'success': False,
                     'error': 'Kênh đã được thêm rồi'
                 }
             
             # Thêm kênh vào danh sách
-            channel_info = {
-                'id': chat.id,
-                'title': chat.title,
-                'username': chat.username or '',
-                'type': chat.type,
-                'active': True,
-                'added_date': datetime.now().isoformat(),
-                'post_count': 0,
-                'success_count': 0,
-                'fail_count': 0,
-                'last_post': None
-            }
+            channel_info = ChannelRecord(
+                id=chat.id,
+                title=chat.title,
+                username=chat.username or '',
+                type=chat.type,
+                active=True,
+                added_date=datetime.now().isoformat(),
+                post_count=0,
+                success_count=0,
+                fail_count=0,
+                last_post=None
+            )
             
             self.channels[str(chat.id)] = channel_info
+            self._index_channel(str(chat.id), channel_info)
             self.save_channels()
             
             return {
@@ -149,96 +293,79 @@ class ChannelManager:
     
     async def remove_channel(self, channel_id: str) -> bool:
         """Xóa kênh khỏi danh sách (hỗ trợ id dạng str hoặc int)"""
-        # Tìm kênh theo nhiều cách
-        channel_key_to_remove = None
-        
-        # 1. Thử tìm theo key trực tiếp
-        key = str(channel_id)
-        if key in self.channels:
-            channel_key_to_remove = key
-        
-        # 2. Thử tìm theo int key (cho JSON cũ)
-        if not channel_key_to_remove:
-            try:
-                int_key = int(channel_id)
-                if int_key in self.channels:
-                    channel_key_to_remove = int_key
-            except ValueError:
-                pass
-        
-        # 3. Thử tìm theo id field trong data
-        if not channel_key_to_remove:
-            for key, channel_data in self.channels.items():
-                if str(channel_data.get('id')) == str(channel_id):
-                    channel_key_to_remove = key
-                    break
-        
-        # Xóa kênh nếu tìm thấy
-        if channel_key_to_remove is not None:
-            del self.channels[channel_key_to_remove]
-            self.save_channels()
-            return True
-        
-        return False
+        key = self._resolve_key(channel_id)
+        if key is None:
+            return False
+
+        self._delete_channel_key(key)
+        self.save_channels()
+        return True
     
     async def get_channel(self, channel_id: str) -> Optional[Dict[str, Any]]:
         """Lấy thông tin kênh"""
-        # 1. Thử tìm theo key trực tiếp
-        if channel_id in self.channels:
-            return self.channels[channel_id]
-        
-        # 2. Thử tìm theo int key
-        try:
-            int_key = int(channel_id)
-            if int_key in self.channels:
-                return self.channels[int_key]
-        except ValueError:
-            pass
-        
-        # 3. Thử tìm theo id field trong data
-        for channel_data in self.channels.values():
-            if str(channel_data.get('id')) == str(channel_id):
-                return channel_data
-        
-        return None
+        key = self._resolve_key(channel_id)
+        return self.channels[key] if key is not None else None
     
     async def get_all_channels(self) -> List[Dict[str, Any]]:
         """Lấy tất cả kênh"""
+        self._sync()
         return list(self.channels.values())
 
     # Synchronous wrapper cho dashboard
     def get_all_channels_sync(self) -> List[Dict[str, Any]]:
         """Trả về danh sách kênh (sync)"""
+        self._sync()
         return list(self.channels.values())
 
     def get_active_channels_sync(self) -> List[Dict[str, Any]]:
         """Trả về kênh active (sync)"""
+        self._sync()
         return [c for c in self.channels.values() if c.get('active', True)]
     
     async def get_active_channels(self) -> List[Dict[str, Any]]:
         """Lấy các kênh đang hoạt động"""
+        self._sync()
         return [channel for channel in self.channels.values() if channel.get('active', True)]
     
     async def toggle_channel_status(self, channel_id: str) -> bool:
         """Bật/tắt trạng thái kênh"""
-        if channel_id in self.channels:
-            self.channels[channel_id]['active'] = not self.channels[channel_id].get('active', True)
+        key = self._resolve_key(channel_id)
+        if key is not None:
+            self.channels[key]['active'] = not self.channels[key].get('active', True)
+            self._membership.set_active(key, self.channels[key]['active'])
             self.save_channels()
             return True
         return False
     
+    def _apply_channel_stats(self, key: str, success: bool, when: str):
+        channel = self.channels[key]
+        channel['post_count'] = channel.get('post_count', 0) + 1
+        channel['last_post'] = when
+        
+        if success:
+            channel['success_count'] = channel.get('success_count', 0) + 1
+        else:
+            channel['fail_count'] = channel.get('fail_count', 0) + 1
+
     async def update_channel_stats(self, channel_id: str, success: bool = True):
         """Cập nhật thống kê kênh"""
-        if channel_id in self.channels:
-            self.channels[channel_id]['post_count'] += 1
-            self.channels[channel_id]['last_post'] = datetime.now().isoformat()
-            
-            if success:
-                self.channels[channel_id]['success_count'] += 1
-            else:
-                self.channels[channel_id]['fail_count'] += 1
-            
+        key = self._resolve_key(channel_id)
+        if key is not None:
+            self._apply_channel_stats(key, success, datetime.now().isoformat())
+            self.save_channels()
+
+    async def update_channel_stats_many(self, results: List[Dict[str, Any]]) -> int:
+        """Cập nhật thống kê từ nhiều kết quả gửi ({'channel_id', 'success'}) rồi lưu file một lần"""
+        when = datetime.now().isoformat()
+        updated = 0
+        for result in results:
+            key = self._resolve_key(str(result['channel_id']))
+            if key is not None:
+                self._apply_channel_stats(key, bool(result.get('success')), when)
+                updated += 1
+        if updated:
             self.save_channels()
+        return updated
     
     async def check_channel_permissions(self, channel_id: str, bot: Bot) -> Dict[str, Any]:
         """Kiểm tra quyền bot trong kênh"""
@@ -263,6 +390,7 @@ class ChannelManager:
     
     async def get_channel_stats(self) -> Dict[str, Any]:
         """Lấy thống kê tổng quan về kênh"""
+        self._sync()
         total_channels = len(self.channels)
         active_channels = len(await self.get_active_channels())
         
@@ -293,6 +421,7 @@ class ChannelManager:
     
     async def cleanup_inactive_channels(self) -> int:
         """Dọn dẹp kênh không hoạt động"""
+        self._sync()
         removed_count = 0
         channels_to_remove = []
         
@@ -301,7 +430,7 @@ class ChannelManager:
                 channels_to_remove.append(channel_id)
         
         for channel_id in channels_to_remove:
-            del self.channels[channel_id]
+            self._delete_channel_key(channel_id)
             removed_count += 1
         
         if removed_count > 0:
@@ -311,24 +440,209 @@ class ChannelManager:
     
     def get_channel_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """Tìm kênh theo username"""
-        username = username.replace('@', '')
-        for channel in self.channels.values():
-            if channel.get('username', '').lower() == username.lower():
-                return channel
-        return None
+        self._sync()
+        key = self._username_index.get(username.replace('@', '').casefold())
+        return self.channels[key] if key is not None else None
     
     def search_channels(self, query: str) -> List[Dict[str, Any]]:
-        """Tìm kiếm kênh theo tên hoặc username"""
-        query = query.lower()
-        results = []
-        
-        for channel in self.channels.values():
-            if (query in channel.get('title', '').lower() or 
-                query in channel.get('username', '').lower()):
-                results.append(channel)
-        
-        return results
+        """Tìm kiếm kênh theo tên hoặc username (dùng index n-gram)"""
+        self._sync()
+        query = query.casefold()
+        if not query:
+            return list(self.channels.values())
+
+        if len(query) <= SEARCH_NGRAM_SIZE:
+            # Mọi kênh chứa n-gram này đều khớp, không cần kiểm tra lại
+            keys = set(self._ngram_index.get(query, ()))
+        else:
+            # Giao các tập ứng viên (tập nhỏ nhất trước) rồi kiểm tra chuỗi con thật sự
+            candidate_sets = sorted(
+                (self._ngram_index.get(query[i:i + SEARCH_NGRAM_SIZE], set())
+                 for i in range(len(query) - SEARCH_NGRAM_SIZE + 1)),
+                key=len
+            )
+            keys = set(candidate_sets[0])
+            for candidate_set in candidate_sets[1:]:
+                if not keys:
+                    break
+                keys &= candidate_set
+            keys = {
+                key for key in keys
+                if query in self._search_text[key][0] or query in self._search_text[key][1]
+            }
+
+        return [self.channels[key] for key in sorted(keys, key=self._order.__getitem__)]
     
+    # ---------- Tag, nhóm kênh & biểu thức chọn kênh ----------
+
+    def load_groups(self):
+        """Tải danh sách nhóm kênh"""
+        try:
+            self.groups = self._groups_store.load() or {}
+        except Exception as e:
+            logger.error(f"Lỗi khi tải nhóm kênh: {e}")
+            self.groups = {}
+        self._group_cache = {}
+
+    def _apply_group_changes(self, updates: Dict[str, Any]):
+        for name, group in updates.items():
+            if group is DELETED:
+                self.groups.pop(name, None)
+            else:
+                self.groups[name] = group
+        self._group_cache = {}
+
+    def _sync_groups(self):
+        self._groups_store.refresh(self.groups, self._apply_group_changes)
+
+    def _save_groups(self):
+        try:
+            self._groups_store.save(self.groups, self._apply_group_changes)
+        except Exception as e:
+            logger.error(f"Lỗi khi lưu nhóm kênh: {e}")
+        self._group_cache = {}
+
+    def set_channel_tags(self, channel_id: Any, tags: List[str]) -> Optional[List[str]]:
+        """Đặt lại toàn bộ tag của kênh; trả về tag mới (None nếu không có kênh)"""
+        key = self._resolve_key(channel_id)
+        if key is None:
+            return None
+        normalized = list(dict.fromkeys(normalize_tag(tag) for tag in tags))
+        channel_info = self.channels[key]
+        if normalized:
+            channel_info['tags'] = normalized
+        else:
+            channel_info.pop('tags', None)
+        self._membership.add(key, normalized, channel_info.get('active', True))
+        self.save_channels()
+        return normalized
+
+    def update_channel_tags(self, channel_id: Any, add: List[str] = (), remove: List[str] = ()) -> Optional[List[str]]:
+        """Thêm/bớt tag của kênh; trả về tag mới (None nếu không có kênh)"""
+        key = self._resolve_key(channel_id)
+        if key is None:
+            return None
+        removed = {normalize_tag(tag) for tag in remove}
+        tags = [tag for tag in self._membership.tags_of(key) if tag not in removed]
+        return self.set_channel_tags(key, tags + [normalize_tag(tag) for tag in add])
+
+    def get_tag_counts(self) -> Dict[str, int]:
+        """Tất cả tag đang dùng và số kênh của mỗi tag"""
+        self._sync()
+        return self._membership.tag_counts()
+
+    def save_group(self, name: str, expression: str) -> str:
+        """
+        Lưu nhóm kênh `name` là một biểu thức chọn kênh (dùng lại bằng `@name`).
+
+        Raises:
+            TargetExpressionError: tên/biểu thức không hợp lệ, nhóm tham chiếu không tồn tại hoặc vòng lặp
+        """
+        self._sync_groups()
+        name = normalize_tag(name)
+        expression = expression.strip()
+        node = parse_target(expression)
+        for ref in referenced_groups(node):
+            if ref != name and ref not in self.groups:
+                raise TargetExpressionError(f"Nhóm @{ref} không tồn tại")
+        previous = self.groups.get(name)
+        self.groups[name] = {'expression': expression, 'updated_at': datetime.now().isoformat()}
+        self._group_cache = {}
+        try:
+            self._group_bits(name, ())
+        except TargetExpressionError:
+            if previous is None:
+                del self.groups[name]
+            else:
+                self.groups[name] = previous
+            self._group_cache = {}
+            raise
+        self._save_groups()
+        return name
+
+    def group_references(self, name: str, schedule_targets: Optional[Dict[str, str]] = None) -> List[str]:
+        """Những nơi đang dùng nhóm `name`: nhóm khác (`@tên`) và lịch đăng ({id lịch: biểu thức target})"""
+        self._sync_groups()
+        name = str(name).lstrip('@').casefold()
+        users = []
+        expressions = [
+            (f"@{other}", group.get('expression', ''))
+            for other, group in sorted(self.groups.items()) if other != name
+        ]
+        expressions += [(f"lịch {schedule_id}", target) for schedule_id, target in (schedule_targets or {}).items()]
+        for user, expression in expressions:
+            try:
+                if name in referenced_groups(parse_target(expression.strip())):
+                    users.append(user)
+            except TargetExpressionError:
+                continue  # biểu thức đã hỏng từ trước, không chặn việc xóa
+        return users
+
+    def delete_group(self, name: str, schedule_targets: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Xóa nhóm kênh; False nếu không có nhóm này.
+
+        Raises:
+            TargetExpressionError: nhóm còn được nhóm khác hoặc lịch đăng (`schedule_targets`) tham chiếu
+        """
+        self._sync_groups()
+        name = str(name).lstrip('@').casefold()
+        if name not in self.groups:
+            return False
+        users = self.group_references(name, schedule_targets)
+        if users:
+            raise TargetExpressionError(f"Nhóm @{name} đang được dùng bởi: {', '.join(users)}")
+        del self.groups[name]
+        self._save_groups()
+        return True
+
+    def get_groups(self) -> Dict[str, str]:
+        """Tên nhóm -> biểu thức"""
+        self._sync_groups()
+        return {name: group.get('expression', '') for name, group in sorted(self.groups.items())}
+
+    def _group_bits(self, name: str, visiting: Tuple[str, ...]) -> int:
+        """Bitset của nhóm, cache tới khi thành viên kênh hoặc nhóm thay đổi"""
+        if self._group_cache_version != self._membership.version:
+            self._group_cache = {}
+            self._group_cache_version = self._membership.version
+        if name in self._group_cache:
+            return self._group_cache[name]
+        if name in visiting:
+            raise TargetExpressionError(f"Nhóm @{name} tham chiếu vòng: {' -> '.join(visiting + (name,))}")
+        group = self.groups.get(name)
+        if group is None:
+            raise TargetExpressionError(f"Nhóm @{name} không tồn tại")
+        bits = self._membership.evaluate(
+            parse_target(group.get('expression', '')),
+            lambda ref: self._group_bits(ref, visiting + (name,))
+        )
+        self._group_cache[name] = bits
+        return bits
+
+    def _target_bits(self, expression: str) -> int:
+        self._sync()
+        self._sync_groups()
+        return self._membership.evaluate(parse_target(expression.strip()), lambda name: self._group_bits(name, ()))
+
+    def resolve_target_keys(self, expression: str) -> List[str]:
+        """
+        Key các kênh khớp biểu thức (vd `vn & promo & !paused`, `@nhom | sale`), theo thứ tự thêm vào.
+
+        Raises:
+            TargetExpressionError: biểu thức không hợp lệ hoặc nhóm không tồn tại
+        """
+        keys = self._membership.keys_of(self._target_bits(expression))
+        return sorted(keys, key=self._order.__getitem__)
+
+    def resolve_target(self, expression: str) -> List[Dict[str, Any]]:
+        """Các kênh khớp biểu thức (dùng chung cho bot, scheduler, dashboard)"""
+        return [self.channels[key] for key in self.resolve_target_keys(expression)]
+
+    def count_target(self, expression: str) -> int:
+        """Số kênh khớp biểu thức (không cần dựng danh sách)"""
+        return count_bits(self._target_bits(expression))
+
     def export_channels_to_json(self) -> str:
         """Xuất danh sách kênh ra JSON string"""
         import json
@@ -340,7 +654,7 @@ class ChannelManager:
             'channels': self.channels
         }
         
-        return json.dumps(export_data, ensure_ascii=False, indent=2)
+        return json.dumps(export_data, ensure_ascii=False, indent=2, default=json_default)
     
     def import_channels_from_json(self, json_data: str) -> Dict[str, Any]:
         """Nhập danh sách kênh từ JSON string"""
@@ -356,8 +670,10 @@ class ChannelManager:
             skipped_count = 0
             
             for channel_id, channel_info in imported_channels.items():
-                if channel_id not in self.channels:
+                if self._resolve_key(channel_id) is None:
+                    channel_info = ChannelRecord.from_dict(channel_info)
                     self.channels[channel_id] = channel_info
+                    self._index_channel(channel_id, channel_info)
                     added_count += 1
                 else:
                     skipped_count += 1
@@ -378,54 +694,33 @@ class ChannelManager:
             return {'success': False, 'error': f'Lỗi: {str(e)}'}
     
     def create_backup(self, backup_name: str = None) -> str:
-        """Tạo backup của danh sách kênh"""
-        from datetime import datetime
-        import os
-        
-        if not backup_name:
-            backup_name = f"channels_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        
-        backup_path = f"backups/{backup_name}"
-        
-        # Tạo thư mục backup nếu chưa có
-        os.makedirs("backups", exist_ok=True)
-        
+        """Tạo backup của danh sách kênh (lưu vào kho backup chống trùng lặp), trả về ID backup"""
         backup_data = self.export_channels_to_json()
         
         try:
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                f.write(backup_data)
-            return backup_path
+            entry = BackupStore().backup_bytes(backup_data.encode('utf-8'), 'channels', backup_name)
+            return entry['id']
         except Exception as e:
             raise Exception(f"Không thể tạo backup: {str(e)}")
     
     def list_backups(self) -> List[str]:
-        """Liệt kê các file backup có sẵn"""
-        import os
-        backup_dir = "backups"
-        
-        if not os.path.exists(backup_dir):
-            return []
-        
-        backups = []
-        for file in os.listdir(backup_dir):
-            if file.endswith('.json') and 'channels_backup' in file:
-                backups.append(file)
-        
-        return sorted(backups, reverse=True)  # Mới nhất trước
+        """Liệt kê các backup có sẵn (đọc manifest của kho backup)"""
+        return [entry['id'] for entry in BackupStore().list_backups('channels')]  # Mới nhất trước
     
     def restore_from_backup(self, backup_file: str) -> Dict[str, Any]:
-        """Khôi phục từ backup file"""
-        import os
-        
-        backup_path = f"backups/{backup_file}"
+        """Khôi phục từ backup (kho backup, hoặc file backup kiểu cũ trong backups/)"""
+        store = BackupStore()
+        backup_path = os.path.join(store.root, backup_file)
         
-        if not os.path.exists(backup_path):
+        if store.get_backup(backup_file) is None and not os.path.exists(backup_path):
             return {'success': False, 'error': 'File backup không tồn tại'}
         
         try:
-            with open(backup_path, 'r', encoding='utf-8') as f:
-                backup_data = f.read()
+            if store.get_backup(backup_file) is not None:
+                backup_data = store.read_text(backup_file)
+            else:
+                with open(backup_path, 'r', encoding='utf-8') as f:
+                    backup_data = f.read()
             
             result = self.import_channels_from_json(backup_data)
             return result
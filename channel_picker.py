@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bàn phím chọn kênh phân trang cho danh sách kênh lớn (hàng nghìn kênh).
+
+Telegram từ chối inline keyboard quá lớn nên mỗi lần chỉ hiện một trang kênh. Danh sách đang
+xem (tất cả kênh hoặc kết quả tìm qua index n-gram của ChannelManager) được tính một lần và
+cache tới khi danh sách kênh đổi; hàng nút của từng trang cũng được cache, chọn/bỏ chọn một
+kênh chỉ thay đúng nút đó. Số trang và số kênh đã chọn nằm trên nút chứ không nằm trong nội
+dung tin nhắn, nên phần lớn thao tác chỉ cần sửa bàn phím (edit_message_reply_markup).
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from channel_targeting import TargetExpressionError
+
+# Độ dài tối đa tên kênh trên nút
+LABEL_MAX_LENGTH = 40
+
+
+def _label(channel: Dict[str, Any]) -> str:
+    name = channel.get('name') or channel.get('title') or str(channel.get('id'))
+    return name if len(name) <= LABEL_MAX_LENGTH else name[:LABEL_MAX_LENGTH - 1] + '…'
+
+
+class ChannelPicker:
+    """Trạng thái bàn phím chọn kênh của một admin (trang, từ khóa tìm, kênh đã chọn)"""
+
+    def __init__(self, channel_manager, selected: Iterable[str] = (), page_size: int = 10):
+        self.channel_manager = channel_manager
+        self.page_size = max(1, page_size)
+        self.selected: Set[str] = set(selected)
+        self.query = ''
+        self.page = 0
+        self.last_text: Optional[str] = None  # nội dung tin nhắn đang hiển thị bàn phím này
+        self._view: List[Tuple[str, str]] = []  # (id kênh, tên) theo thứ tự hiển thị
+        self._positions: Dict[str, int] = {}  # id kênh -> vị trí trong _view
+        self._view_key: Optional[Tuple[int, str]] = None  # (phiên bản index kênh, từ khóa)
+        self._rows: Dict[int, List[List[InlineKeyboardButton]]] = {}  # trang -> hàng nút kênh
+        self._group_options: List[str] = []  # biểu thức ứng với nút picker_group_<i>
+        self.group_page = 0  # trang đang xem trong màn chọn theo nhóm/tag
+
+    # ---------- Danh sách đang xem ----------
+
+    def refresh(self):
+        """Tính lại danh sách đang xem nếu kênh hoặc từ khóa đã đổi"""
+        key = (self.channel_manager.index_version(), self.query)
+        if key == self._view_key:
+            return
+        channels = self.channel_manager.search_channels(self.query)
+        self._view = [(str(ch.get('id')), _label(ch)) for ch in channels if ch.get('id') is not None]
+        self._positions = {channel_id: i for i, (channel_id, _) in enumerate(self._view)}
+        self._rows = {}
+        self._view_key = key
+        self.page = min(self.page, self.page_count - 1)
+
+    @property
+    def total(self) -> int:
+        return len(self._view)
+
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-len(self._view) // self.page_size))
+
+    def page_ids(self) -> List[str]:
+        start = self.page * self.page_size
+        return [channel_id for channel_id, _ in self._view[start:start + self.page_size]]
+
+    def go(self, page: int):
+        self.refresh()
+        self.page = max(0, min(page, self.page_count - 1))
+
+    def search(self, query: str):
+        self.query = query.strip()
+        self.page = 0
+        self.refresh()
+
+    # ---------- Chọn kênh ----------
+
+    def set_selected(self, selected: Iterable[str]):
+        selected = set(selected)
+        if selected != self.selected:
+            self.selected = selected
+            self._rows = {}
+
+    def _button(self, channel_id: str, name: str) -> InlineKeyboardButton:
+        prefix = "✅ " if channel_id in self.selected else "☑️ "
+        return InlineKeyboardButton(f"{prefix}{name}", callback_data=f"select_channel_{channel_id}")
+
+    def toggle(self, channel_id: str):
+        """Chọn/bỏ chọn một kênh, chỉ vẽ lại nút của kênh đó"""
+        if channel_id in self.selected:
+            self.selected.discard(channel_id)
+        else:
+            self.selected.add(channel_id)
+        position = self._positions.get(channel_id)
+        if position is None:
+            return
+        rows = self._rows.get(position // self.page_size)
+        if rows is not None:
+            rows[position % self.page_size] = [self._button(channel_id, self._view[position][1])]
+
+    def toggle_page(self):
+        """Chọn cả trang (hoặc bỏ chọn nếu cả trang đã được chọn)"""
+        ids = self.page_ids()
+        if all(channel_id in self.selected for channel_id in ids):
+            self.selected.difference_update(ids)
+        else:
+            self.selected.update(ids)
+        self._rows.pop(self.page, None)
+
+    def toggle_many(self, ids: Iterable[str]) -> int:
+        """Chọn các kênh (hoặc bỏ chọn nếu tất cả đã được chọn); trả về số kênh thêm (âm: bỏ)"""
+        ids = set(ids)
+        if ids and ids <= self.selected:
+            self.selected -= ids
+            changed = -len(ids)
+        else:
+            changed = len(ids - self.selected)
+            self.selected |= ids
+        self._rows = {}
+        return changed
+
+    def clear(self):
+        self.selected = set()
+        self._rows = {}
+
+    # ---------- Nhóm / tag ----------
+
+    def group_options(self) -> List[Tuple[str, Optional[int]]]:
+        """(biểu thức, số kênh của tag; None với nhóm) của các nhóm và tag, dùng cho nút picker_group_<i>"""
+        options = [(f"@{name}", None) for name in self.channel_manager.get_groups()]
+        options += list(self.channel_manager.get_tag_counts().items())
+        self._group_options = [expression for expression, _ in options]
+        return options
+
+    def _group_count(self, expression: str, count: Optional[int]) -> str:
+        """Số kênh của nhóm/tag trên nút; '?' nếu biểu thức của nhóm hỏng (vd: tham chiếu vòng)"""
+        if count is not None:
+            return str(count)
+        try:
+            return str(self.channel_manager.count_target(expression))
+        except TargetExpressionError:
+            return "?"
+
+    def group_expression(self, index: int) -> Optional[str]:
+        return self._group_options[index] if 0 <= index < len(self._group_options) else None
+
+    # ---------- Hiển thị ----------
+
+    def channel_rows(self) -> List[List[InlineKeyboardButton]]:
+        rows = self._rows.get(self.page)
+        if rows is None:
+            start = self.page * self.page_size
+            rows = [[self._button(channel_id, name)] for channel_id, name in self._view[start:start + self.page_size]]
+            self._rows[self.page] = rows
+        return rows
+
+    def text(self, target: Optional[str] = None) -> str:
+        text = f"📋 **Chọn kênh đăng bài** ({len(self.channel_manager.channels)} kênh)\n\n"
+        if self.query:
+            text += f"🔍 Lọc: `{self.query.replace('`', '')}` ({self.total} kênh khớp)\n"
+        if target:
+            text += f"🎯 Theo biểu thức: `{target.replace('`', '')}`\n"
+        if not self._view:
+            text += "Không có kênh nào khớp.\n"
+        text += "Chạm vào kênh để chọn/bỏ chọn, sau đó nhấn Gửi."
+        return text
+
+    def markup(self, done_label: Optional[str] = None) -> InlineKeyboardMarkup:
+        """Bàn phím của trang hiện tại; `done_label`: nhãn nút xác nhận (Gửi/Tiếp tục)"""
+        keyboard = list(self.channel_rows())
+
+        if self.page_count > 1:
+            last = self.page_count - 1
+            keyboard.append([
+                InlineKeyboardButton("⏮", callback_data="picker_page_0"),
+                InlineKeyboardButton("⬅️", callback_data=f"picker_page_{max(0, self.page - 1)}"),
+                InlineKeyboardButton(f"{self.page + 1}/{self.page_count}", callback_data="noop"),
+                InlineKeyboardButton("➡️", callback_data=f"picker_page_{min(last, self.page + 1)}"),
+                InlineKeyboardButton("⏭", callback_data=f"picker_page_{last}")
+            ])
+
+        page_ids = self.page_ids()
+        page_selected = bool(page_ids) and all(channel_id in self.selected for channel_id in page_ids)
+        keyboard.append([
+            InlineKeyboardButton("✖️ Bỏ cả trang" if page_selected else "☑️ Chọn cả trang", callback_data="picker_all_page"),
+            InlineKeyboardButton("🔍 Tìm", callback_data="picker_search"),
+            InlineKeyboardButton("👥 Nhóm/tag", callback_data="picker_groups")
+        ])
+        extra_row = [InlineKeyboardButton("🎯 Biểu thức", callback_data="select_channels_target")]
+        if self.query:
+            extra_row.append(InlineKeyboardButton("✖️ Bỏ lọc", callback_data="picker_search_clear"))
+        if self.selected:
+            extra_row.append(InlineKeyboardButton(f"♻️ Bỏ chọn ({len(self.selected)})", callback_data="picker_clear"))
+        keyboard.append(extra_row)
+
+        bottom_row = [InlineKeyboardButton("🔙 Quay lại", callback_data="back_to_previous")]
+        if done_label:
+            bottom_row.insert(0, InlineKeyboardButton(f"{done_label} ({len(self.selected)})", callback_data="select_channels_done"))
+        if len(self.channel_manager.channels) > 1:
+            bottom_row.append(InlineKeyboardButton("✅ Gửi tất cả", callback_data="post_to_all"))
+        keyboard.append(bottom_row)
+        return InlineKeyboardMarkup(keyboard)
+
+    def groups_markup(self, page: Optional[int] = None) -> Tuple[str, InlineKeyboardMarkup]:
+        """Màn chọn nhanh theo nhóm/tag, phân trang như danh sách kênh; chỉ đếm kênh cho trang đang xem"""
+        options = self.group_options()
+        page_count = max(1, -(-len(options) // self.page_size))
+        if page is not None:
+            self.group_page = page
+        self.group_page = max(0, min(self.group_page, page_count - 1))
+        start = self.group_page * self.page_size
+
+        keyboard = []
+        for i, (expression, count) in enumerate(options[start:start + self.page_size], start):
+            icon = '👥' if expression.startswith('@') else '🏷️'
+            keyboard.append([InlineKeyboardButton(f"{icon} {expression} ({self._group_count(expression, count)})",
+                                                  callback_data=f"picker_group_{i}")])
+        if page_count > 1:
+            last = page_count - 1
+            keyboard.append([
+                InlineKeyboardButton("⏮", callback_data="picker_groups_page_0"),
+                InlineKeyboardButton("⬅️", callback_data=f"picker_groups_page_{max(0, self.group_page - 1)}"),
+                InlineKeyboardButton(f"{self.group_page + 1}/{page_count}", callback_data="noop"),
+                InlineKeyboardButton("➡️", callback_data=f"picker_groups_page_{min(last, self.group_page + 1)}"),
+                InlineKeyboardButton("⏭", callback_data=f"picker_groups_page_{last}")
+            ])
+        keyboard.append([InlineKeyboardButton("🔙 Quay lại", callback_data="select_channels_show")])
+        if not options:
+            text = "👥 Chưa có nhóm hoặc tag nào. Dùng /tag và /group để tạo."
+        else:
+            text = "👥 **Chọn theo nhóm/tag**\n\nChạm để chọn các kênh đang bật trong nhóm/tag (chạm lại để bỏ chọn)."
+        return text, InlineKeyboardMarkup(keyboard)
@@ -14,10 +14,72 @@ class Config:
     # Cấu hình đăng bài
     DEFAULT_DELAY_BETWEEN_POSTS = int(os.getenv('DEFAULT_DELAY_BETWEEN_POSTS', '2'))  # giây
     MAX_CHANNELS_PER_POST = int(os.getenv('MAX_CHANNELS_PER_POST', '50'))
+    # Gửi đồng thời: tối đa SEND_CONCURRENCY kênh cùng lúc, tổng SEND_RATE_PER_SECOND tin/giây (0 = không giới hạn)
+    SEND_CONCURRENCY = int(os.getenv('SEND_CONCURRENCY', '10'))
+    SEND_RATE_PER_SECOND = float(os.getenv('SEND_RATE_PER_SECOND', '25'))
     
     # Cấu hình scheduler
     SCHEDULER_CHECK_INTERVAL = int(os.getenv('SCHEDULER_CHECK_INTERVAL', '30'))  # giây
     AUTO_CLEANUP_DAYS = int(os.getenv('AUTO_CLEANUP_DAYS', '30'))  # ngày
+    # Số lần chạy gần nhất giữ ngay trong lịch đăng; toàn bộ lịch sử ở <file lịch>.runs.jsonl
+    SCHEDULE_HISTORY_INLINE = int(os.getenv('SCHEDULE_HISTORY_INLINE', '5'))
+    # Lịch bị lỡ (bot tắt/treo): trễ quá MISFIRE_GRACE_SECONDS giây thì xử lý theo MISFIRE_POLICY
+    # once = chạy bù một lần rồi sang lần kế tiếp, skip = bỏ qua, all = chạy bù từng lần (tối đa MISFIRE_MAX_CATCH_UP)
+    MISFIRE_POLICY = os.getenv('MISFIRE_POLICY', 'once')
+    MISFIRE_GRACE_SECONDS = int(os.getenv('MISFIRE_GRACE_SECONDS', '300'))
+    MISFIRE_MAX_CATCH_UP = int(os.getenv('MISFIRE_MAX_CATCH_UP', '10'))
+    # Các lần chạy bù được trải đều: cách nhau ít nhất CATCHUP_SPACING_SECONDS giây và
+    # không quá CATCHUP_RATE_PER_SECOND tin/giây (chừa ngân sách cho các lịch đúng giờ)
+    CATCHUP_SPACING_SECONDS = float(os.getenv('CATCHUP_SPACING_SECONDS', '5'))
+    CATCHUP_RATE_PER_SECOND = float(os.getenv('CATCHUP_RATE_PER_SECOND', '10'))
+    # Giãn tải khi nhiều lịch trùng giờ: tải được tính theo khung LOAD_BUCKET_SECONDS giây,
+    # ngân sách mỗi khung = SEND_RATE_PER_SECOND * độ dài khung.
+    # Lịch lặp được tính tải cho mọi lần chạy trong LOAD_HORIZON_HOURS giờ tới (0 = chỉ lần kế tiếp).
+    # SCHEDULE_SMOOTHING: off / jitter / stagger, lùi tối đa SCHEDULE_SMOOTHING_TOLERANCE giây;
+    # mặc định off (chỉ cảnh báo) để giờ đăng không bị đổi khi admin chưa chọn
+    LOAD_BUCKET_SECONDS = int(os.getenv('LOAD_BUCKET_SECONDS', '60'))
+    LOAD_HORIZON_HOURS = float(os.getenv('LOAD_HORIZON_HOURS', '24'))
+    SCHEDULE_SMOOTHING = os.getenv('SCHEDULE_SMOOTHING', 'off')
+    SCHEDULE_SMOOTHING_TOLERANCE = float(os.getenv('SCHEDULE_SMOOTHING_TOLERANCE', '120'))
+    # Chạy nhiều bản bot (rolling deploy): chỉ replica giữ lease mới chạy scheduler.
+    # LEADER_ELECTION: off / file / sqlite; lease hết hạn sau LEADER_LEASE_TTL giây nếu leader chết
+    LEADER_ELECTION = os.getenv('LEADER_ELECTION', 'off')
+    LEADER_LEASE_PATH = os.getenv('LEADER_LEASE_PATH', 'bot_leader.lease')
+    LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', '15'))
+    # Gửi theo đợt (canary): gửi thử ROLLOUT_CANARY_SIZE kênh, đợt nào lỗi quá ROLLOUT_MAX_ERROR_RATE thì tạm dừng;
+    # ROLLOUT_CONFIRM_CANARY = chờ admin xác nhận sau canary; các đợt ROLLOUT_WAVE_SIZE kênh cách nhau ROLLOUT_WAVE_INTERVAL giây
+    ROLLOUT_DEFAULT = os.getenv('ROLLOUT_DEFAULT', 'false').lower() == 'true'
+    ROLLOUT_CANARY_SIZE = int(os.getenv('ROLLOUT_CANARY_SIZE', '3'))
+    ROLLOUT_WAVE_SIZE = int(os.getenv('ROLLOUT_WAVE_SIZE', '20'))
+    ROLLOUT_MAX_ERROR_RATE = float(os.getenv('ROLLOUT_MAX_ERROR_RATE', '0.2'))
+    ROLLOUT_CONFIRM_CANARY = os.getenv('ROLLOUT_CONFIRM_CANARY', 'true').lower() == 'true'
+    ROLLOUT_WAVE_INTERVAL = float(os.getenv('ROLLOUT_WAVE_INTERVAL', '5'))
+    # Tự xóa bài hết hạn: worker kiểm tra tối đa mỗi EXPIRY_CHECK_INTERVAL giây; lỗi tạm thời
+    # được thử lại sau EXPIRY_RETRY_SECONDS giây, tối đa EXPIRY_MAX_ATTEMPTS lượt
+    EXPIRY_CHECK_INTERVAL = int(os.getenv('EXPIRY_CHECK_INTERVAL', '60'))
+    EXPIRY_RETRY_SECONDS = int(os.getenv('EXPIRY_RETRY_SECONDS', '300'))
+    EXPIRY_MAX_ATTEMPTS = int(os.getenv('EXPIRY_MAX_ATTEMPTS', '3'))
+    # Bàn phím chọn kênh khi gửi bài: số kênh mỗi trang
+    CHANNEL_PICKER_PAGE_SIZE = int(os.getenv('CHANNEL_PICKER_PAGE_SIZE', '10'))
+    
+    # Cấu hình retention: lịch sử cũ hơn AUTO_CLEANUP_DAYS (bài đăng) / ANALYTICS_RETENTION_DAYS (analytics)
+    # được gộp thành số liệu theo ngày rồi xóa, chạy định kỳ mỗi RETENTION_INTERVAL_HOURS giờ.
+    # Mặc định tắt (0): xóa lịch sử là thao tác không hoàn tác được nên admin phải tự bật
+    ANALYTICS_RETENTION_DAYS = int(os.getenv('ANALYTICS_RETENTION_DAYS', '90'))  # ngày
+    RETENTION_INTERVAL_HOURS = float(os.getenv('RETENTION_INTERVAL_HOURS', '0'))  # giờ
+    
+    # Cấu hình lịch sử bài đăng: chỉ giữ trong bộ nhớ N ngày / N bài gần nhất (0 = không giới hạn),
+    # phần cũ hơn được chuyển sang kho lưu trữ trên đĩa và đọc khi cần
+    POST_HISTORY_WINDOW_DAYS = int(os.getenv('POST_HISTORY_WINDOW_DAYS', '0'))
+    POST_HISTORY_WINDOW_POSTS = int(os.getenv('POST_HISTORY_WINDOW_POSTS', '0'))
+    
+    # Cấu hình khởi động: nạp các manager song song, ghi snapshot nhị phân khi tắt bot
+    # để lần khởi động sau đọc snapshot thay vì parse JSON (chỉ dùng khi JSON chưa bị sửa)
+    STARTUP_PARALLEL_LOAD = os.getenv('STARTUP_PARALLEL_LOAD', 'true').lower() == 'true'
+    STARTUP_SNAPSHOT = os.getenv('STARTUP_SNAPSHOT', 'true').lower() == 'true'
+    # STARTUP_LAZY: chỉ tạo scheduler khi khởi động, các manager khác tạo khi dùng lần đầu
+    # hoặc trên luồng nền sau khi bot bắt đầu nhận update
+    STARTUP_LAZY = os.getenv('STARTUP_LAZY', 'false').lower() == 'true'
     
     # Cấu hình file
     CHANNELS_DB_FILE = os.getenv('CHANNELS_DB_FILE', 'channels.json')
@@ -7,18 +7,12 @@ import asyncio
 from datetime import datetime, timedelta
 from threading import Thread
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session  # type: ignore
-from telegram import Bot
 from werkzeug.security import check_password_hash, generate_password_hash  # type: ignore
 from config import Config
-from channel_manager import ChannelManager
-from post_manager import PostManager
-from scheduler import PostScheduler
-from emoji_handler import EmojiHandler
+from startup import LazyProxy
 import logging
 import concurrent.futures  # Thêm để chạy coroutine trong thread
 
-from telegram import constants as tg_constants
-
 # Cấu hình logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,14 +20,39 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this'  # Thay đổi key này trong production
 
-# Khởi tạo các managers
-channel_manager = ChannelManager()
-post_manager = PostManager()
-scheduler = PostScheduler()
-emoji_handler = EmojiHandler()
+# Các managers (và thư viện telegram) chỉ được import/khởi tạo khi trang đầu tiên cần tới
+def _create_channel_manager():
+    from channel_manager import ChannelManager
+    return ChannelManager()
+
+
+def _create_post_manager():
+    from post_manager import PostManager
+    return PostManager()
+
+
+def _create_scheduler():
+    from scheduler import PostScheduler
+    return PostScheduler()
+
+
+def _create_emoji_handler():
+    from emoji_handler import EmojiHandler
+    return EmojiHandler()
+
+
+def _create_telegram_bot():
+    from telegram import Bot
+    return Bot(Config.BOT_TOKEN)
+
+
+channel_manager = LazyProxy(_create_channel_manager)
+post_manager = LazyProxy(_create_post_manager)
+scheduler = LazyProxy(_create_scheduler)
+emoji_handler = LazyProxy(_create_emoji_handler)
 
 # Bot Telegram để thao tác quản lý nhóm
-telegram_bot = Bot(Config.BOT_TOKEN)
+telegram_bot = LazyProxy(_create_telegram_bot)
 GROUP_ID = Config.MANAGED_GROUP_ID
 
 # Cấu hình dashboard
@@ -128,8 +147,7 @@ def add_channel():
             'active': True,
             'added_date': datetime.now().isoformat()
         }
-        channel_manager.channels[channel_id] = channel_info
-        channel_manager.save_channels()
+        channel_manager.upsert_channel(channel_id, channel_info)
         return jsonify({'success': True, 'message': 'Đã thêm kênh thành công'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -149,6 +167,25 @@ def remove_channel(channel_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/channels/target')
+def api_channel_target():
+    """Xem trước các kênh khớp biểu thức chọn kênh (?expr=vn & promo & !paused)"""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Chưa đăng nhập'}), 401
+    
+    from channel_targeting import TargetExpressionError
+    expression = request.args.get('expr', '')
+    try:
+        channels_data = channel_manager.resolve_target(expression)
+    except TargetExpressionError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'expression': expression,
+        'count': len(channels_data),
+        'channels': [{'id': c.get('id'), 'title': c.get('title') or c.get('name'), 'tags': c.get('tags', [])} for c in channels_data],
+        'groups': channel_manager.get_groups()
+    })
+
 @app.route('/post')
 def post_page():
     """Trang đăng bài"""
@@ -173,6 +210,12 @@ def send_post():
     data = request.get_json()
     content = data.get('content')
     selected_channels = data.get('channels', [])
+    if not selected_channels and data.get('target'):
+        from channel_targeting import TargetExpressionError
+        try:
+            selected_channels = [c['id'] for c in channel_manager.resolve_target(data['target']) if c.get('active', True)]
+        except TargetExpressionError as e:
+            return jsonify({'error': str(e)}), 400
     
     if not content:
         return jsonify({'error': 'Nội dung bài đăng là bắt buộc'}), 400
@@ -236,10 +279,11 @@ def add_schedule():
     data = request.get_json()
     content = data.get('content')
     channels = data.get('channels', [])
+    target = data.get('target')  # biểu thức chọn kênh, tính lại mỗi lần chạy
     schedule_time = data.get('schedule_time')
     repeat_type = data.get('repeat_type', 'once')
     
-    if not all([content, channels, schedule_time]):
+    if not all([content, channels or target, schedule_time]):
         return jsonify({'error': 'Thiếu thông tin bắt buộc'}), 400
     
     try:
@@ -254,7 +298,8 @@ def add_schedule():
             post_data=post_data,
             channels=channels,
             scheduled_time=schedule_datetime,
-            repeat_type=repeat_type
+            repeat_type=repeat_type,
+            target=target
         ))
         
         return jsonify({
@@ -45,14 +45,12 @@ class BotDatabase:
             print(f"❌ Lỗi khi lưu dữ liệu: {e}")
     
     def create_backup(self):
-        """Tạo file backup"""
+        """Tạo backup (kho backup chống trùng lặp, đọc file theo stream)"""
         if os.path.exists(self.db_file):
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = f"{self.db_file}.backup_{timestamp}"
             try:
-                import shutil
-                shutil.copy2(self.db_file, backup_file)
-                print(f"💾 Đã tạo backup: {backup_file}")
+                from backup_store import BackupStore
+                entry = BackupStore().backup_file(self.db_file, 'bot_data')
+                print(f"💾 Đã tạo backup: {entry['id']} ({entry['stored_bytes']} byte mới)")
             except Exception as e:
                 print(f"⚠️ Lỗi khi tạo backup: {e}")
     
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tự xóa bài đăng khi hết hạn (bài khuyến mãi hết đợt...).
+
+Bài có `expire_after` (giây, tính từ lúc gửi) hoặc `expire_at` (ISO) trong post_data được
+PostManager lưu kèm `expires_at` cạnh các message_id đã gửi tới từng kênh (album: mọi tin trong
+`message_ids`). `expire_after` tính riêng cho từng kênh từ `sent_at` của kênh đó (gửi theo đợt:
+tin canary hết hạn trước các đợt sau); `expires_at` của bài là lượt xóa kế tiếp. ExpiryWorker giữ một heap theo thời điểm hết hạn, ngủ đúng tới bài sớm nhất rồi
+xóa tin ở các kênh đồng thời (tối đa SEND_CONCURRENCY kênh, mỗi request deleteMessage lấy một
+token từ ngân sách gửi chung của PostManager). Trạng thái xóa được
+ghi vào posts.json nên sau khi khởi động lại worker dựng lại heap từ các bài chưa xóa xong.
+"""
+
+import asyncio
+import heapq
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Các mức "tự xóa sau" để bấm vòng trong menu gửi bài (giây, 0 = tắt)
+TTL_CHOICES = (0, 3600, 6 * 3600, 24 * 3600, 48 * 3600, 7 * 24 * 3600)
+_DURATION_PART = re.compile(r'(\d+)\s*(d|ngày|h|giờ|m|phút)', re.IGNORECASE)
+_DURATION_UNITS = {'d': 86400, 'ngày': 86400, 'h': 3600, 'giờ': 3600, 'm': 60, 'phút': 60}
+_ABSOLUTE_FORMATS = ('%Y-%m-%d %H:%M', '%d/%m/%Y %H:%M', '%d/%m %H:%M', '%H:%M')
+
+
+def parse_expiry(text: str, now: datetime) -> Optional[Dict[str, Any]]:
+    """
+    Đọc hạn tự xóa admin nhập: khoảng thời gian ("24h", "1d 12h", "90m", "2 ngày") hoặc
+    thời điểm ("23:59", "31/12 23:59", "31/12/2025 23:59", "2025-12-31 23:59").
+
+    Trả về {'expire_after': giây} hoặc {'expire_at': ISO}, None nếu không hợp lệ / đã qua.
+    """
+    text = text.strip()
+    parts = _DURATION_PART.findall(text)
+    if parts and not _DURATION_PART.sub('', text).strip():
+        seconds = sum(int(value) * _DURATION_UNITS[unit.lower()] for value, unit in parts)
+        return {'expire_after': seconds} if seconds > 0 else None
+
+    for fmt in _ABSOLUTE_FORMATS:
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if fmt == '%H:%M':
+            parsed = now.replace(hour=parsed.hour, minute=parsed.minute, second=0, microsecond=0)
+            if parsed <= now:
+                parsed += timedelta(days=1)  # giờ đã qua hôm nay: hiểu là ngày mai
+        elif fmt == '%d/%m %H:%M':
+            parsed = parsed.replace(year=now.year)
+            if parsed <= now:
+                parsed = parsed.replace(year=now.year + 1)
+        return {'expire_at': parsed.isoformat()} if parsed > now else None
+    return None
+
+
+def format_ttl(seconds: float) -> str:
+    """24 giờ, 7 ngày, 1 giờ 30 phút..."""
+    seconds = int(seconds)
+    days, rest = divmod(seconds, 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes = rest // 60
+    parts = [f"{value} {unit}" for value, unit in ((days, 'ngày'), (hours, 'giờ'), (minutes, 'phút')) if value]
+    return " ".join(parts) or f"{seconds} giây"
+
+
+def expiry_time(spec: Dict[str, Any], sent_at: datetime) -> Optional[datetime]:
+    """Thời điểm hết hạn theo `expire_at` / `expire_after` của post_data (None = không tự xóa)"""
+    expire_at = spec.get('expire_at')
+    if expire_at:
+        try:
+            return datetime.fromisoformat(expire_at)
+        except (TypeError, ValueError):
+            logger.warning(f"expire_at không hợp lệ: {expire_at}")
+            return None
+    expire_after = spec.get('expire_after')
+    if expire_after:
+        return sent_at + timedelta(seconds=float(expire_after))
+    return None
+
+
+def delivery_expiry(spec: Dict[str, Any], result: Dict[str, Any], default: datetime) -> Optional[datetime]:
+    """Thời điểm hết hạn của một kết quả gửi, tính từ `sent_at` của nó (`default` nếu thiếu)"""
+    try:
+        sent_at = datetime.fromisoformat(result['sent_at'])
+    except (KeyError, TypeError, ValueError):
+        sent_at = default
+    return expiry_time(spec, sent_at)
+
+
+def pending_deletions(post: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Các kết quả gửi (thành công, có message_id) của bài còn chờ xóa"""
+    return [
+        result for result in (post.get('channels') or {}).values()
+        if result.get('success') and result.get('message_id') is not None
+        and not result.get('deleted_at') and not result.get('delete_error')
+    ]
+
+
+def message_ids_of(result: Dict[str, Any]) -> List[int]:
+    """Mọi message_id của một kết quả gửi (album có nhiều tin, bài thường chỉ một)"""
+    return list(result.get('message_ids') or [result['message_id']])
+
+
+def is_expiry_pending(post: Dict[str, Any]) -> bool:
+    """Bài có hạn tự xóa và chưa xóa xong (không được chuyển sang kho lưu trữ)"""
+    return bool(post.get('expires_at')) and not post.get('expired_at')
+
+
+def _is_due(result: Dict[str, Any], now: float) -> bool:
+    """Kết quả gửi đã tới hạn xóa (bản ghi cũ không có hạn riêng: theo hạn của cả bài)"""
+    try:
+        return datetime.fromisoformat(result['expires_at']).timestamp() <= now
+    except (KeyError, TypeError, ValueError):
+        return True
+
+
+def _expiry_timestamp(post: Dict[str, Any]) -> Optional[float]:
+    if not is_expiry_pending(post):
+        return None
+    try:
+        return datetime.fromisoformat(post['expires_at']).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class ExpiryWorker:
+    """
+    Worker xóa bài hết hạn trên event loop của bot.
+
+    Mỗi lượt lấy các bài tới hạn khỏi heap, gom message_id theo kênh, xóa từng tin bằng
+    deleteMessage (các kênh chạy đồng thời) rồi ghi posts.json một lần. Lỗi tạm thời (mạng, RetryAfter) được thử lại sau EXPIRY_RETRY_SECONDS, tối đa
+    EXPIRY_MAX_ATTEMPTS lượt; lỗi vĩnh viễn (bot mất quyền, tin quá cũ) được ghi vào kết quả.
+    """
+
+    def __init__(self, post_manager, bot=None):
+        from config import Config
+        self.post_manager = post_manager
+        self.bot = bot
+        self.check_interval = max(1, Config.EXPIRY_CHECK_INTERVAL)
+        self.retry_seconds = max(1, Config.EXPIRY_RETRY_SECONDS)
+        self.max_attempts = max(1, Config.EXPIRY_MAX_ATTEMPTS)
+        self.concurrency = max(1, Config.SEND_CONCURRENCY)
+        # Chỉ xóa khi điều kiện đúng (vd: replica đang là leader), None = luôn xóa
+        self.should_run = None
+        self._heap: List[Tuple[float, str]] = []
+        self._generation = None  # generation của posts.json lúc dựng heap
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        post_manager.on_expiry = self.schedule
+
+    # ---------- Heap ----------
+
+    def schedule(self, post_id: str, expires_at: datetime):
+        """Đưa bài vào heap (PostManager gọi sau khi lưu bài có hạn tự xóa)"""
+        heapq.heappush(self._heap, (expires_at.timestamp(), post_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def rebuild(self):
+        """Dựng lại heap từ các bài còn chờ xóa (khi khởi động hoặc posts.json đổi từ tiến trình khác)"""
+        self._heap = [
+            (due, post_id)
+            for post_id, post in self.post_manager.posts.items()
+            for due in (_expiry_timestamp(post),)
+            if due is not None
+        ]
+        heapq.heapify(self._heap)
+        self._generation = self.post_manager._store.generation
+
+    def _pop_due(self, now: float) -> List[str]:
+        due_ids = []
+        seen = set()
+        while self._heap and self._heap[0][0] <= now:
+            due, post_id = heapq.heappop(self._heap)
+            post = self.post_manager.posts.get(post_id)
+            if post is not None and _expiry_timestamp(post) == due and post_id not in seen:
+                seen.add(post_id)
+                due_ids.append(post_id)
+        return due_ids
+
+    def next_due(self) -> Optional[float]:
+        while self._heap:
+            due, post_id = self._heap[0]
+            post = self.post_manager.posts.get(post_id)
+            if post is not None and _expiry_timestamp(post) == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    # ---------- Xóa tin ----------
+
+    async def _delete_channel(self, channel_id: str, results: List[Dict[str, Any]], semaphore: asyncio.Semaphore):
+        """Xóa các tin của một kênh; ghi deleted_at / delete_error vào từng kết quả, trả về lỗi tạm thời nếu có"""
+        rate_limiter = self.post_manager.rate_limiter
+        async with semaphore:
+            for result in results:
+                error = None
+                for message_id in message_ids_of(result):
+                    await rate_limiter.acquire()
+                    try:
+                        await self.bot.delete_message(chat_id=channel_id, message_id=message_id)
+                    except RetryAfter as e:
+                        retry_after = e.retry_after
+                        rate_limiter.pause(getattr(retry_after, 'total_seconds', lambda: retry_after)())
+                        return str(e)
+                    except BadRequest as e:
+                        # Tin đã bị xóa tay thì coi như xong; còn lại (quá cũ, không có quyền xóa) là lỗi vĩnh viễn
+                        if 'not found' not in str(e).lower():
+                            error = str(e)
+                    except Forbidden as e:
+                        # Bot mất quyền ở kênh: mọi tin còn lại của kênh đều không xóa được
+                        for pending in results:
+                            if not pending.get('deleted_at'):
+                                pending['delete_error'] = str(e)
+                        return None
+                    except Exception as e:
+                        logger.warning(f"Lỗi khi xóa tin ở kênh {channel_id}: {e}")
+                        return str(e)
+                if error is not None:
+                    result['delete_error'] = error
+                else:
+                    result['deleted_at'] = datetime.now().isoformat()
+        return None
+
+    async def expire(self, post_ids: List[str]) -> Dict[str, int]:
+        """Xóa các tin đã tới hạn của các bài, trả về số tin đã xóa / lỗi / sẽ thử lại"""
+        posts = [(post_id, self.post_manager.posts[post_id]) for post_id in post_ids if post_id in self.post_manager.posts]
+        started = time.time()
+        by_channel: Dict[str, List[Dict[str, Any]]] = {}
+        for post_id, post in posts:
+            for result in pending_deletions(post):
+                if _is_due(result, started):
+                    by_channel.setdefault(str(result['channel_id']), []).append(result)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._delete_channel(channel_id, results, semaphore) for channel_id, results in by_channel.items()))
+
+        summary = {'deleted': 0, 'failed': 0, 'retrying': 0}
+        now = datetime.now()
+        for post_id, post in posts:
+            remaining, later = [], []
+            for result in pending_deletions(post):
+                (remaining if _is_due(result, started) else later).append(result)
+            next_at = None
+            attempts = post.get('expiry_attempts', 0) + 1
+            if remaining and attempts < self.max_attempts:
+                post['expiry_attempts'] = attempts
+                next_at = now + timedelta(seconds=self.retry_seconds)
+                summary['retrying'] += len(remaining)
+            else:
+                for result in remaining:
+                    result['delete_error'] = 'Hết số lần thử xóa'
+            if later:
+                # Kênh gửi sau (đợt sau của lần gửi theo đợt) hết hạn muộn hơn: hẹn lượt xóa kế tiếp
+                due = min(datetime.fromisoformat(result['expires_at']) for result in later)
+                next_at = due if next_at is None else min(next_at, due)
+            if next_at is None:
+                post['expired_at'] = now.isoformat()
+            else:
+                post['expires_at'] = next_at.isoformat()
+                self.schedule(post_id, next_at)
+            for result in post.get('channels', {}).values():
+                if result.get('deleted_at'):
+                    summary['deleted'] += 1
+                elif result.get('delete_error'):
+                    summary['failed'] += 1
+        if posts:
+            self.post_manager.save_posts([post_id for post_id, _ in posts])
+            logger.info(
+                f"Tự xóa {len(posts)} bài hết hạn: đã xóa {summary['deleted']} tin, lỗi {summary['failed']}, "
+                f"thử lại sau {summary['retrying']}"
+            )
+        return summary
+
+    async def run_due(self) -> Dict[str, int]:
+        """Một lượt: nạp thay đổi từ file, xóa các bài đã tới hạn"""
+        if self.should_run is not None and not self.should_run():
+            return {'deleted': 0, 'failed': 0, 'retrying': 0}
+        self.post_manager._sync()
+        if self._generation != self.post_manager._store.generation:
+            self.rebuild()
+        return await self.expire(self._pop_due(time.time()))
+
+    async def _run_forever(self):
+        self._wakeup = asyncio.Event()
+        self.rebuild()
+        try:
+            while True:
+                self._wakeup.clear()
+                try:
+                    await self.run_due()
+                except Exception as e:
+                    logger.error(f"Lỗi khi tự xóa bài hết hạn: {e}")
+                next_due = self.next_due()
+                timeout = self.check_interval if next_due is None else min(
+                    self.check_interval, max(0.0, next_due - time.time())
+                )
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wakeup = None
+
+    def start(self):
+        """Chạy worker nền trên event loop hiện tại"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run_forever())
+            logger.info("Worker tự xóa bài hết hạn đã bắt đầu")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from records import SlotRecord, json_default
+from snapshot import read_snapshot, write_snapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có khóa advisory, chỉ còn ghi atomic + theo dõi mtime
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Giá trị đánh dấu một key đã bị xóa trong danh sách thay đổi
+DELETED = object()
+
+
+def _fingerprint_default(value: Any) -> Any:
+    return value.to_dict() if isinstance(value, SlotRecord) else str(value)
+
+
+def _fingerprint(value: Any) -> str:
+    """Dấu vân tay ổn định của một bản ghi (không phụ thuộc thứ tự key)"""
+    encoded = json.dumps(value, ensure_ascii=False, sort_keys=True, default=_fingerprint_default).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def apply_updates(data: Dict[str, Any], updates: Dict[str, Any]):
+    """Áp dụng danh sách thay đổi (DELETED = xóa key) vào dict trong bộ nhớ"""
+    for key, value in updates.items():
+        if value is DELETED:
+            data.pop(key, None)
+        else:
+            data[key] = value
+
+
+class SharedJSONStore:
+    """
+    Điều phối một file JSON (dạng dict) được nhiều tiến trình cùng đọc/ghi
+    (bot, dashboard...).
+
+    - Khóa advisory (fcntl.flock) trên `<file>.lock` quanh mỗi lần đọc/ghi
+    - Ghi atomic: file tạm + os.replace, tiến trình khác không bao giờ đọc phải file dở
+    - Theo dõi thay đổi bằng chữ ký stat (mtime_ns, size, inode): chỉ parse lại khi file
+      thực sự đổi, mỗi lần đổi tăng `generation`
+    - Gộp 3 chiều theo từng key so với bản đã đồng bộ lần cuối: thay đổi cục bộ chưa lưu
+      được giữ, thay đổi của tiến trình khác được nạp vào thay vì bị ghi đè
+    """
+
+    def __init__(self, path: str, indent: Optional[int] = 2, record_type: Optional[type] = None):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.indent = indent
+        self.record_type = record_type  # nếu có: mỗi giá trị đọc từ file được chuyển thành bản ghi này
+        self.generation = 0
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._base: Dict[str, str] = {}  # key -> fingerprint lúc đồng bộ lần cuối
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0  # khóa lồng nhau trong cùng luồng không flock lại
+        # save_async: một lần ghi nền tại một thời điểm; version để gộp các lần gọi chồng nhau
+        self._save_lock: Optional[asyncio.Lock] = None
+        self._requested_version = 0
+        self._saved_version = 0
+        self._fragments: Dict[str, Tuple[str, str]] = {}  # key -> (JSON gọn, fingerprint) của bản trong bộ nhớ
+
+    # ---------- Khóa & chữ ký ----------
+
+    @contextmanager
+    def locked(self, exclusive: bool = True):
+        """Giữ khóa file (và khóa trong tiến trình) trong suốt khối lệnh, cho phép lồng nhau"""
+        with self._thread_lock:
+            if fcntl is None or self._lock_depth > 0:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _stat_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def changed(self) -> bool:
+        """File đã bị thay đổi kể từ lần đồng bộ cuối chưa (chỉ một lần stat)"""
+        return self._stat_signature() != self._signature
+
+    # ---------- Đọc / ghi ----------
+
+    def _read_disk(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if self.record_type is not None and isinstance(data, dict):
+            data = {key: self.record_type.from_dict(value) for key, value in data.items()}
+        return data
+
+    def _mark_synced(self, data: Optional[Dict[str, Any]]):
+        self._base = {key: _fingerprint(value) for key, value in (data or {}).items()}
+        self._signature = self._stat_signature()
+        self.generation += 1
+
+    def _advance_base(self, fingerprints: Dict[str, Optional[str]]):
+        """Đánh dấu đồng bộ chỉ với các key vừa ghi/nạp (fingerprint None = key không còn trên đĩa)"""
+        for key, fingerprint in fingerprints.items():
+            if fingerprint is None:
+                self._base.pop(key, None)
+            else:
+                self._base[key] = fingerprint
+        self._signature = self._stat_signature()
+        self.generation += 1
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """
+        Đọc toàn bộ file (None nếu chưa có) và ghi nhận làm mốc đồng bộ.
+
+        Nếu có snapshot nhị phân còn khớp với file JSON (xem snapshot.py) thì nạp từ
+        snapshot: không phải parse JSON và tính lại fingerprint từng key.
+        """
+        self._fragments.clear()
+        with self.locked(exclusive=False):
+            cached = read_snapshot(self.path)
+            if cached is not None:
+                data, self._base = cached
+                self._signature = self._stat_signature()
+                self.generation += 1
+                logger.info(f"Đã nạp {self.path} từ snapshot")
+                return data
+            data = self._read_disk()
+            self._mark_synced(data)
+        return data
+
+    def write_snapshot(
+        self,
+        data: Dict[str, Any],
+        apply: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> bool:
+        """Ghi snapshot cho lần khởi động sau (lưu JSON trước nếu bộ nhớ còn thay đổi chưa ghi)"""
+        with self.locked(exclusive=True):
+            current = {key: _fingerprint(value) for key, value in data.items()}
+            if self.changed() or current != self._base:
+                self.save(data, apply)
+                current = self._base
+            return write_snapshot(self.path, (data, current))
+
+    def _incoming_updates(
+        self,
+        local: Dict[str, Any],
+        disk: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Dict[str, Optional[str]]]:
+        """
+        Các thay đổi trên đĩa cần nạp vào bộ nhớ (gộp 3 chiều theo key), kèm fingerprint trên
+        đĩa của mọi key tiến trình khác đã đổi so với mốc (None = đã xóa) để cập nhật mốc.
+        """
+        updates: Dict[str, Any] = {}
+        disk_changes: Dict[str, Optional[str]] = {}
+        for key in set(disk) | set(self._base):
+            base_fp = self._base.get(key)
+            disk_fp = _fingerprint(disk[key]) if key in disk else None
+            if disk_fp == base_fp:
+                continue  # tiến trình khác không đổi key này
+            disk_changes[key] = disk_fp
+            local_fp = _fingerprint(local[key]) if key in local else None
+            if local_fp == disk_fp:
+                continue
+            if local_fp != base_fp:
+                logger.warning(f"Xung đột khi đồng bộ {self.path}: key {key} bị sửa ở cả hai phía, giữ bản cục bộ")
+                continue
+            updates[key] = disk[key] if key in disk else DELETED
+        return updates, disk_changes
+
+    def _apply_incoming(
+        self,
+        data: Dict[str, Any],
+        updates: Dict[str, Any],
+        apply: Optional[Callable[[Dict[str, Any]], None]]
+    ):
+        for key in updates:
+            self._fragments.pop(key, None)
+        (apply or (lambda u: apply_updates(data, u)))(updates)
+
+    def refresh(
+        self,
+        data: Dict[str, Any],
+        apply: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> bool:
+        """
+        Nạp thay đổi của tiến trình khác vào `data` nếu file đã đổi.
+
+        Trả về True nếu có thay đổi được áp dụng. `apply` nhận dict thay đổi
+        (giá trị DELETED = xóa) để manager tự cập nhật index của mình.
+        """
+        if not self.changed():
+            return False
+        with self.locked(exclusive=False):
+            if not self.changed():
+                return False  # lần ghi nền của chính tiến trình này vừa xong
+            try:
+                disk = self._read_disk() or {}
+            except Exception as e:
+                logger.error(f"Lỗi khi đọc lại {self.path}: {e}")
+                return False
+            updates, disk_changes = self._incoming_updates(data, disk)
+            if updates:
+                self._apply_incoming(data, updates, apply)
+                logger.info(f"Đã nạp {len(updates)} thay đổi từ tiến trình khác trong {self.path}")
+            # Mốc mới là bản trên đĩa (chỉ các key đã đổi); key cục bộ chưa lưu vẫn khác mốc nên
+            # sẽ được ghi ở lần save sau
+            self._advance_base(disk_changes)
+        return bool(updates)
+
+    def save(
+        self,
+        data: Dict[str, Any],
+        apply: Optional[Callable[[Dict[str, Any]], None]] = None,
+        changed: Optional[Iterable[str]] = None
+    ):
+        """
+        Read-modify-write dưới khóa độc quyền: gộp thay đổi trên đĩa rồi ghi atomic.
+
+        `changed`: các key đã sửa/xóa trong bộ nhớ kể từ lần lưu trước; khi có thì chỉ tính lại
+        fingerprint của các key đó và các key vừa gộp từ đĩa (None = tính lại mọi key).
+        """
+        with self.locked(exclusive=True):
+            disk_changes: Dict[str, Optional[str]] = {}
+            if self.changed():
+                try:
+                    disk = self._read_disk() or {}
+                except Exception as e:
+                    logger.error(f"Lỗi khi đọc {self.path} trước khi ghi, ghi đè bằng bản cục bộ: {e}")
+                    disk = None
+                if disk is not None:
+                    updates, disk_changes = self._incoming_updates(data, disk)
+                    if updates:
+                        self._apply_incoming(data, updates, apply)
+                        logger.info(f"Đã gộp {len(updates)} thay đổi từ tiến trình khác vào {self.path}")
+
+            tmp_path = f"{self.path}.tmp{os.getpid()}"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=self.indent, default=json_default)
+            os.replace(tmp_path, self.path)
+            if changed is None:
+                self._mark_synced(data)
+                return
+            # Sau khi ghi, đĩa = bộ nhớ: key đĩa đã đổi (gộp vào hoặc trùng bản cục bộ) nhận fingerprint
+            # trên đĩa, key cục bộ đã sửa nhận fingerprint mới, các key còn lại giữ nguyên mốc
+            for key in changed:
+                self._fragments.pop(key, None)
+                disk_changes[key] = _fingerprint(data[key]) if key in data else None
+            self._advance_base(disk_changes)
+
+    async def save_async(
+        self,
+        data: Dict[str, Any],
+        apply: Optional[Callable[[Dict[str, Any]], None]] = None,
+        changed: Optional[Iterable[str]] = None
+    ):
+        """
+        Như save() nhưng không chặn event loop. `changed`: các key đã sửa trong bộ nhớ kể
+        từ lần save_async trước (None = coi như mọi key đều đổi).
+
+        Trên loop chỉ mã hóa lại các key đã đổi (JSON gọn của từng bản ghi được giữ lại giữa
+        các lần ghi, cũng chính là chuỗi để tính fingerprint); ghép file, ghi và đánh dấu đồng
+        bộ chạy trên thread pool. Các lần gọi chồng nhau được gộp: lần đang chờ ghi trạng thái
+        mới nhất. Nếu tiến trình khác vừa ghi file thì gộp và ghi ngay trên loop như save().
+        """
+        if changed is None:
+            self._fragments.clear()
+        else:
+            for key in changed:
+                self._fragments.pop(key, None)
+        self._requested_version += 1
+        version = self._requested_version
+        if self._save_lock is None:
+            self._save_lock = asyncio.Lock()
+        async with self._save_lock:
+            if self._saved_version >= version:
+                return  # lần ghi trước đã chụp cả thay đổi này
+            version = self._requested_version
+            if self.changed():
+                self.save(data, apply)
+            else:
+                signature = self._signature
+                loop = asyncio.get_running_loop()
+                written = await loop.run_in_executor(None, self._write_fragments, self._encode(data), signature)
+                if not written:
+                    self.save(data, apply)
+            self._saved_version = version
+
+    def _encode(self, data: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+        """(key, JSON của bản ghi, fingerprint) cho mọi key; chỉ mã hóa các key chưa có trong cache"""
+        entries = []
+        for key, value in data.items():
+            cached = self._fragments.get(key)
+            if cached is None:
+                fragment = json.dumps(value, ensure_ascii=False, sort_keys=True, default=_fingerprint_default)
+                cached = self._fragments[key] = (fragment, hashlib.sha1(fragment.encode('utf-8')).hexdigest())
+            entries.append((key, cached[0], cached[1]))
+        return entries
+
+    def _write_fragments(self, entries: List[Tuple[str, str, str]], signature: Optional[Tuple[int, int, int]]) -> bool:
+        """Ghi bản chụp của save_async (chạy trên thread pool); False nếu file đã đổi từ lúc chụp"""
+        with self.locked(exclusive=True):
+            if self._signature != signature or self.changed():
+                return False
+            # Mỗi bản ghi một dòng: file vẫn là JSON hợp lệ, không phải định dạng lại cả file
+            body = ",\n".join(f"{json.dumps(key, ensure_ascii=False)}: {fragment}" for key, fragment, _ in entries)
+            tmp_path = f"{self.path}.tmp{os.getpid()}"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write("{\n" + body + "\n}" if entries else "{}")
+            os.replace(tmp_path, self.path)
+            self._base = {key: fingerprint for key, _, fingerprint in entries}
+            self._signature = self._stat_signature()
+            self.generation += 1
+        return True
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import os
+from typing import Any, Dict, Iterable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def rollup_file_for(db_file: str) -> str:
+    """Tên file rollup đi kèm một file dữ liệu (vd: posts.json -> posts.rollups.json)"""
+    base, _ = os.path.splitext(db_file)
+    return f"{base}.rollups.json"
+
+
+class DailyRollups:
+    """
+    Số liệu tổng hợp theo ngày của các bản ghi đã bị dọn dẹp.
+
+    Mỗi ngày (YYYY-MM-DD) lưu: số bài, số bài có ít nhất một lần gửi thành công,
+    số lần gửi thành công/thất bại, số kênh đã gửi, phân bố theo loại, theo giờ và theo kênh.
+    Theo kênh: `posts` là số bài gửi tới kênh; `success`/`failed` chỉ có từ bản ghi của
+    PostManager (bản ghi analytics không lưu kết quả từng kênh nên chỉ cộng `posts`).
+    """
+
+    def __init__(self, rollup_file: str):
+        self.rollup_file = rollup_file
+        self.days: Dict[str, Dict[str, Any]] = {}
+        self._totals: Optional[Dict[str, Any]] = None
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.rollup_file):
+            try:
+                with open(self.rollup_file, 'r', encoding='utf-8') as f:
+                    self.days = json.load(f).get('days', {})
+            except Exception as e:
+                logger.error(f"Lỗi khi tải rollup {self.rollup_file}: {e}")
+                self.days = {}
+        self._totals = None
+
+    def save(self):
+        try:
+            with open(self.rollup_file, 'w', encoding='utf-8') as f:
+                json.dump({'days': self.days}, f, ensure_ascii=False, separators=(',', ':'))
+        except Exception as e:
+            logger.error(f"Lỗi khi lưu rollup {self.rollup_file}: {e}")
+
+    @staticmethod
+    def _empty_day() -> Dict[str, Any]:
+        return {
+            'posts': 0,
+            'successful_posts': 0,
+            'successful_sends': 0,
+            'failed_sends': 0,
+            'channels_reached': 0,
+            'by_type': {},
+            'by_hour': {},
+            'channels': {}
+        }
+
+    def _day(self, timestamp: str) -> Optional[Dict[str, Any]]:
+        date_key = (timestamp or '')[:10]
+        if len(date_key) != 10:
+            return None
+        self._totals = None
+        return self.days.setdefault(date_key, self._empty_day())
+
+    @staticmethod
+    def _bump(counter: Dict[str, int], key: str, amount: int = 1):
+        counter[key] = counter.get(key, 0) + amount
+
+    @staticmethod
+    def _channel(day: Dict[str, Any], channel_id: Any, title: str) -> Dict[str, Any]:
+        stats = day['channels'].setdefault(str(channel_id), {'title': title, 'posts': 0, 'success': 0, 'failed': 0})
+        stats.setdefault('posts', stats.get('success', 0) + stats.get('failed', 0))  # rollup cũ chưa có posts
+        return stats
+
+    def add_post_record(self, post: Dict[str, Any]):
+        """Gộp một bản ghi của PostManager (created_at, channels: {id: kết quả})"""
+        created_at = post.get('created_at', '')
+        day = self._day(created_at)
+        if day is None:
+            return
+        results = post.get('channels', {})
+        successes = sum(1 for r in results.values() if r.get('success', False))
+        day['posts'] += 1
+        day['successful_posts'] += 1 if post.get('successful_sends', successes) > 0 else 0
+        day['successful_sends'] += successes
+        day['failed_sends'] += len(results) - successes
+        day['channels_reached'] += len(results)
+        self._bump(day['by_type'], post.get('type', 'text'))
+        if len(created_at) >= 13:
+            self._bump(day['by_hour'], str(int(created_at[11:13])))
+        for channel_id, result in results.items():
+            stats = self._channel(day, channel_id, result.get('channel_title', 'Unknown'))
+            stats['posts'] += 1
+            stats['success' if result.get('success', False) else 'failed'] += 1
+
+    def add_analytics_record(self, post: Dict[str, Any]):
+        """Gộp một bản ghi của AnalyticsManager (timestamp, channels: [id], success_count...)"""
+        timestamp = post.get('timestamp', '')
+        day = self._day(timestamp)
+        if day is None:
+            return
+        channels = post.get('channels', [])
+        day['posts'] += 1
+        day['successful_posts'] += 1 if post.get('success_count', 0) > 0 else 0
+        day['successful_sends'] += post.get('success_count', 0)
+        day['failed_sends'] += post.get('failure_count', 0)
+        day['channels_reached'] += len(channels)
+        self._bump(day['by_type'], post.get('type', 'text'))
+        if len(timestamp) >= 13:
+            self._bump(day['by_hour'], str(int(timestamp[11:13])))
+        for channel_id in channels:
+            self._channel(day, channel_id, str(channel_id))['posts'] += 1
+
+    def add_daily_stats(self, date_key: str, stats: Dict[str, Any]):
+        """Gộp một mục daily_stats cũ của analytics (khi không còn bản ghi gốc)"""
+        if date_key in self.days:
+            return
+        day = self._day(date_key)
+        if day is None:
+            return
+        day['posts'] = stats.get('total_posts', 0)
+        day['successful_sends'] = stats.get('successful_posts', 0)
+        day['failed_sends'] = stats.get('failed_posts', 0)
+        day['channels_reached'] = stats.get('total_channels_reached', 0)
+        day['by_type'] = dict(stats.get('post_types', {}))
+        day['by_hour'] = dict(stats.get('peak_hour', {}))
+
+    # ---------- Truy vấn ----------
+
+    def get_day(self, date_key: str) -> Optional[Dict[str, Any]]:
+        return self.days.get(date_key)
+
+    @property
+    def totals(self) -> Dict[str, Any]:
+        """Tổng hợp trên toàn bộ các ngày (cache tới lần thay đổi tiếp theo)"""
+        if self._totals is None:
+            totals = self._empty_day()
+            for day in self.days.values():
+                for key in ('posts', 'successful_posts', 'successful_sends', 'failed_sends', 'channels_reached'):
+                    totals[key] += day.get(key, 0)
+                for key in ('by_type', 'by_hour'):
+                    for sub_key, value in day.get(key, {}).items():
+                        self._bump(totals[key], sub_key, value)
+                for channel_id, stats in day.get('channels', {}).items():
+                    merged = totals['channels'].setdefault(
+                        channel_id, {'title': stats.get('title', 'Unknown'), 'posts': 0, 'success': 0, 'failed': 0}
+                    )
+                    merged['posts'] += stats.get('posts', stats.get('success', 0) + stats.get('failed', 0))
+                    merged['success'] += stats.get('success', 0)
+                    merged['failed'] += stats.get('failed', 0)
+            self._totals = totals
+        return self._totals
+
+
+class RetentionManager:
+    """Định kỳ gộp lịch sử cũ thành rollup theo ngày rồi mới xóa bản ghi gốc"""
+
+    def __init__(
+        self,
+        post_manager=None,
+        analytics_manager=None,
+        post_retention_days: int = 30,
+        analytics_retention_days: int = 90,
+        interval_hours: float = 24
+    ):
+        self.post_manager = post_manager
+        self.analytics_manager = analytics_manager
+        self.post_retention_days = post_retention_days
+        self.analytics_retention_days = analytics_retention_days
+        self.interval_hours = interval_hours
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> Dict[str, int]:
+        """Chạy một lượt gộp + dọn dẹp"""
+        result = {'posts': 0, 'analytics_posts': 0}
+        if self.post_manager is not None and self.post_retention_days > 0:
+            result['posts'] = await self.post_manager.cleanup_old_posts(self.post_retention_days)
+        if self.analytics_manager is not None and self.analytics_retention_days > 0:
+            result['analytics_posts'] = self.analytics_manager.cleanup_old_data(self.analytics_retention_days)
+        logger.info(
+            f"Retention: đã gộp và dọn {result['posts']} bài đăng, {result['analytics_posts']} bản ghi analytics"
+        )
+        return result
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Lỗi khi chạy retention: {e}")
+            await asyncio.sleep(self.interval_hours * 3600)
+
+    def start(self):
+        """Chạy retention nền trên event loop hiện tại"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run_forever())
+            logger.info(f"Retention đã bắt đầu (mỗi {self.interval_hours} giờ)")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+def merge_channel_counts(target: Dict[str, int], rollup_channels: Iterable[Dict[str, Any]]):
+    """Cộng số lần gửi thành công theo tên kênh từ rollup vào target"""
+    for stats in rollup_channels:
+        if stats.get('success', 0) > 0:
+            title = stats.get('title', 'Unknown')
+            target[title] = target.get(title, 0) + stats['success']
+
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bầu leader bằng lease cho khi chạy nhiều bản bot cùng lúc (rolling deploy...).
+
+Chỉ replica đang giữ lease mới chạy scheduler. Leader gia hạn lease mỗi `ttl / 3` giây;
+nếu leader chết, lease hết hạn sau `ttl` giây và một replica dự phòng giành lấy.
+Khi tắt êm, leader trả lease ngay để replica khác tiếp quản không phải chờ hết hạn.
+
+Backend dùng chung một giao diện (`try_acquire` / `release` / `holder`):
+- FileLeaseBackend: file JSON + khóa fcntl (các replica trên cùng máy/ổ đĩa chung)
+- SQLiteLeaseBackend: một dòng trong bảng `leases`, cập nhật trong transaction IMMEDIATE
+- MemoryLeaseBackend: kiểu Redis `SET NX PX` trong bộ nhớ (thử nghiệm, nhiều bot trong một tiến trình)
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có khóa advisory, chỉ còn ghi atomic
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# (owner, thời điểm hết hạn epoch, fencing token)
+Lease = Tuple[str, float, int]
+
+
+class LeaseBackend:
+    """Giao diện chung của các backend lưu lease"""
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> Optional[int]:
+        """
+        Giành hoặc gia hạn lease `name` cho `owner` trong `ttl` giây.
+
+        Thành công khi lease đang trống, đã hết hạn hoặc đang thuộc `owner`; trả về
+        fencing token (tăng mỗi lần đổi chủ), None nếu replica khác đang giữ.
+        """
+        raise NotImplementedError
+
+    def release(self, name: str, owner: str) -> bool:
+        """Trả lease nếu `owner` đang giữ"""
+        raise NotImplementedError
+
+    def holder(self, name: str) -> Optional[Lease]:
+        """Lease hiện tại (kể cả đã hết hạn), None nếu chưa từng có"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _grant(current: Optional[Lease], owner: str, ttl: float, now: float) -> Optional[Lease]:
+        """Lease mới nếu `owner` được phép giữ, None nếu replica khác đang giữ"""
+        if current is not None and current[0] != owner and current[1] > now:
+            return None
+        token = current[2] if current is not None else 0
+        if current is None or current[0] != owner or current[1] <= now:
+            token += 1  # đổi chủ (hoặc giành lại sau khi hết hạn): token mới
+        return (owner, now + ttl, token)
+
+
+class MemoryLeaseBackend(LeaseBackend):
+    """Lease trong bộ nhớ, ngữ nghĩa như Redis SET key owner NX PX ttl"""
+
+    def __init__(self):
+        self._leases: Dict[str, Lease] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> Optional[int]:
+        with self._lock:
+            lease = self._grant(self._leases.get(name), owner, ttl, time.time())
+            if lease is None:
+                return None
+            self._leases[name] = lease
+            return lease[2]
+
+    def release(self, name: str, owner: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(name)
+            if lease is None or lease[0] != owner:
+                return False
+            self._leases[name] = ('', 0.0, lease[2])
+            return True
+
+    def holder(self, name: str) -> Optional[Lease]:
+        with self._lock:
+            return self._leases.get(name)
+
+
+class FileLeaseBackend(LeaseBackend):
+    """Lease lưu trong file JSON, đọc-sửa-ghi dưới khóa fcntl trên `<file>.lock`"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data: Dict[str, Any]):
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _lease(entry: Optional[Dict[str, Any]]) -> Optional[Lease]:
+        if not entry:
+            return None
+        return (entry.get('owner', ''), float(entry.get('expires_at', 0)), int(entry.get('token', 0)))
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> Optional[int]:
+        with self._locked():
+            data = self._read()
+            lease = self._grant(self._lease(data.get(name)), owner, ttl, time.time())
+            if lease is None:
+                return None
+            data[name] = {'owner': lease[0], 'expires_at': lease[1], 'token': lease[2]}
+            self._write(data)
+            return lease[2]
+
+    def release(self, name: str, owner: str) -> bool:
+        with self._locked():
+            data = self._read()
+            lease = self._lease(data.get(name))
+            if lease is None or lease[0] != owner:
+                return False
+            data[name] = {'owner': '', 'expires_at': 0, 'token': lease[2]}
+            self._write(data)
+            return True
+
+    def holder(self, name: str) -> Optional[Lease]:
+        with self._locked():
+            return self._lease(self._read().get(name))
+
+
+class SQLiteLeaseBackend(LeaseBackend):
+    """Lease là một dòng của bảng `leases`; BEGIN IMMEDIATE khóa ghi nên chỉ một replica thắng"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL, token INTEGER NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Mỗi lần gọi một kết nối riêng: backend được dùng từ luồng của executor
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, name: str) -> Optional[Lease]:
+        row = conn.execute("SELECT owner, expires_at, token FROM leases WHERE name = ?", (name,)).fetchone()
+        return (row[0], row[1], row[2]) if row else None
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> Optional[int]:
+        with self._transaction() as conn:
+            lease = self._grant(self._select(conn, name), owner, ttl, time.time())
+            if lease is None:
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, expires_at, token) VALUES (?, ?, ?, ?)",
+                (name, *lease)
+            )
+            return lease[2]
+
+    def release(self, name: str, owner: str) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE leases SET owner = '', expires_at = 0 WHERE name = ? AND owner = ?", (name, owner)
+            )
+            return cursor.rowcount > 0
+
+    def holder(self, name: str) -> Optional[Lease]:
+        conn = self._connect()
+        try:
+            return self._select(conn, name)
+        finally:
+            conn.close()
+
+
+def create_backend(kind: str, path: str) -> LeaseBackend:
+    """Tạo backend theo cấu hình LEADER_ELECTION (file, sqlite, memory)"""
+    if kind == 'file':
+        return FileLeaseBackend(path)
+    if kind == 'sqlite':
+        return SQLiteLeaseBackend(path)
+    if kind == 'memory':
+        return MemoryLeaseBackend()
+    raise ValueError(f"Backend bầu leader không hợp lệ: {kind}")
+
+
+def default_owner_id() -> str:
+    """Định danh replica: máy + PID + chuỗi ngẫu nhiên (PID có thể trùng giữa các container)"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderElector:
+    """
+    Giữ lease `name` trên event loop của bot, gọi `on_elected` khi trở thành leader và
+    `on_demoted` khi mất quyền (gia hạn thất bại tới lúc lease hết hạn, hoặc dừng elector).
+    """
+
+    def __init__(
+        self,
+        backend: LeaseBackend,
+        name: str = 'scheduler',
+        owner: Optional[str] = None,
+        ttl: float = 15,
+        on_elected: Optional[Callable[[], Any]] = None,
+        on_demoted: Optional[Callable[[], Any]] = None
+    ):
+        self.backend = backend
+        self.name = name
+        self.owner = owner or default_owner_id()
+        self.ttl = ttl
+        self.renew_interval = max(0.05, ttl / 3)
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.token: Optional[int] = None  # fencing token khi đang là leader
+        self._valid_until = 0.0  # monotonic: hết thời điểm này mà chưa gia hạn được thì tự hạ cấp
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        """Đang giữ lease còn hạn (tính theo đồng hồ của replica này)"""
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    async def _attempt(self) -> Optional[int]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.backend.try_acquire, self.name, self.owner, self.ttl)
+
+    def _set_leader(self, token: Optional[int]):
+        was_leader = self.token is not None
+        self.token = token
+        if token is not None and not was_leader:
+            logger.info(f"Replica {self.owner} trở thành leader '{self.name}' (token {token})")
+            if self.on_elected:
+                self.on_elected()
+        elif token is None and was_leader:
+            logger.warning(f"Replica {self.owner} không còn là leader '{self.name}'")
+            if self.on_demoted:
+                self.on_demoted()
+
+    async def step(self):
+        """Một lượt giành/gia hạn lease"""
+        started = time.monotonic()
+        try:
+            token = await self._attempt()
+        except Exception as e:
+            logger.error(f"Lỗi khi gia hạn lease '{self.name}': {e}")
+            if self.token is not None and time.monotonic() >= self._valid_until:
+                self._set_leader(None)
+            return
+        if token is None:
+            self._set_leader(None)
+        else:
+            # Tính hạn từ lúc gửi yêu cầu: an toàn khi backend trả lời chậm
+            self._valid_until = started + self.ttl
+            self._set_leader(token)
+
+    async def _run_forever(self):
+        try:
+            while True:
+                await self.step()
+                await asyncio.sleep(self.renew_interval)
+        finally:
+            self._resign()
+
+    def _resign(self):
+        if self.token is None:
+            return
+        try:
+            self.backend.release(self.name, self.owner)
+        except Exception as e:
+            logger.error(f"Lỗi khi trả lease '{self.name}': {e}")
+        self._set_leader(None)
+
+    def start(self):
+        """Chạy elector nền trên event loop hiện tại"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run_forever())
+            logger.info(f"Bầu leader '{self.name}' đã bắt đầu (replica {self.owner}, lease {self.ttl} giây)")
+
+    def stop(self):
+        """Dừng elector và trả lease (replica khác tiếp quản ngay)"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._resign()
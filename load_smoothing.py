@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# off:     giữ nguyên giờ admin chọn (chỉ cảnh báo khi khung giờ quá tải)
+# jitter:  lùi ngẫu nhiên trong [0, tolerance] giây nếu khung giờ đã có lịch khác
+# stagger: lùi tới lúc các lịch trước trong khung gửi xong (theo ngân sách gửi), không quá tolerance
+SMOOTHING_MODES = ('off', 'jitter', 'stagger')
+
+
+def plan_offset(
+    index,
+    due: float,
+    channel_count: int,
+    mode: str,
+    tolerance: float,
+    rate: float,
+    rng: Optional[random.Random] = None
+) -> Dict[str, Any]:
+    """
+    Chọn độ lùi (giây) cho một lần chạy gửi tới `channel_count` kênh vào thời điểm `due`.
+
+    `index` là ScheduleIndex (tải theo khung `bucket_seconds`); ngân sách một khung là
+    `rate` tin/giây * độ dài khung. Trả về offset, tải dự kiến của khung sau khi thêm lịch,
+    ngân sách và cờ quá tải.
+    """
+    bucket_seconds = index.bucket_seconds
+    budget = int(rate * bucket_seconds) if rate > 0 else 0
+    tolerance = max(0.0, tolerance)
+
+    def result(offset: float) -> Dict[str, Any]:
+        load = index.load_at(due + offset) + channel_count
+        return {
+            'offset': round(offset, 3),
+            'load': load,
+            'budget': budget,
+            'over_budget': budget > 0 and load > budget
+        }
+
+    current = index.load_at(due)
+    if mode not in ('jitter', 'stagger') or current == 0 or tolerance == 0:
+        return result(0.0)
+
+    if mode == 'jitter':
+        return result((rng or random).uniform(0, tolerance))
+
+    if budget == 0:
+        return result(0.0)  # không giới hạn tốc độ gửi: không cần giãn
+    # stagger: duyệt các khung trong phạm vi cho phép, bắt đầu lúc các lịch trước trong khung
+    # (dự kiến) đã gửi xong; lấy khung đầu tiên còn đủ ngân sách, nếu không có thì khung nhẹ nhất
+    best = None
+    bucket = index.bucket_of(due)
+    last_bucket = index.bucket_of(due + tolerance)
+    while bucket <= last_bucket:
+        start = bucket * bucket_seconds
+        load = index.load_by_bucket.get(bucket, 0)
+        offset = min(tolerance, max(0.0, start + load / rate - due))
+        if load + channel_count <= budget:
+            return result(offset)
+        if best is None or load < best[0]:
+            best = (load, offset)
+        bucket += 1
+    return result(best[1])
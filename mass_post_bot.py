@@ -1,13 +1,21 @@
 # -*- coding: utf-8 -*-
 # (Dòng trống cuối file, chuẩn hóa thụt lề)
 import asyncio
+import html
 import json
 import logging
 import os
 import sys
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional
 import pathlib
+import threading
+import time
+
+from startup import PROCESS_START, StartupTimer, lazy_component, load_managers, profile_imports_if_requested
+
+# --profile-startup: đo thời gian import từ đây (trước telegram và các manager)
+_import_profiler = profile_imports_if_requested()
 
 from telegram import (
     Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup,
@@ -24,14 +32,17 @@ from telegram.ext import (
 )
 from telegram.error import BadRequest, Forbidden
 
+from telegram.ext import TypeHandler
+
 from config import Config
 from channel_manager import ChannelManager
+from channel_picker import ChannelPicker
 from post_manager import PostManager
+from records import DeliveryResult
 from scheduler import PostScheduler
-from settings_manager import SettingsManager
 from language_manager import LanguageManager, Language, get_text
-from analytics_manager import AnalyticsManager
-from ai_assistant import AIAssistant, get_content_suggestions, check_spam_content
+# settings_manager, analytics_manager, history_rollups, ai_assistant được import khi
+# thành phần tương ứng được tạo lần đầu (xem các lazy_component trong MassPostBot)
 
 # Cấu hình logging
 logging.basicConfig(
@@ -93,18 +104,19 @@ class MassPostBot:
         user_id = self.check_user_and_admin(update)
         if user_id is None:
             return
-        keyboard = [
-            [
-                InlineKeyboardButton("🇻🇳 Tiếng Việt", callback_data="set_lang_vi"),
-                InlineKeyboardButton("🇬🇧 English", callback_data="set_lang_en"),
-                InlineKeyboardButton("🇨🇳 中文", callback_data="set_lang_zh")
-            ]
-        ]
         await update.message.reply_text(
             "🌐 Chọn ngôn ngữ cho bot:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=self._language_keyboard()
         )
 
+    @staticmethod
+    def _language_keyboard() -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup([[
+            InlineKeyboardButton("🇻🇳 Tiếng Việt", callback_data="set_lang_vi"),
+            InlineKeyboardButton("🇬🇧 English", callback_data="set_lang_en"),
+            InlineKeyboardButton("🇨🇳 中文", callback_data="set_lang_zh")
+        ]])
+
     async def handle_set_language(self, query, data: str):
         # Xử lý chọn ngôn ngữ từ callback
         user_id = query.from_user.id
@@ -121,6 +133,7 @@ class MassPostBot:
             lang = "vi"
             text = "Đã chuyển ngôn ngữ bot thành Tiếng Việt."
         self.user_states.setdefault(user_id, {})['language'] = lang
+        self.language_manager.save_user_language(user_id, Language(lang))
         await query.edit_message_text(text)
     async def delete_saved_button(self, query, idx: int):
         """Xóa nút đã lưu theo chỉ số idx"""
@@ -138,36 +151,112 @@ class MassPostBot:
             json.dump(self.saved_buttons, f, ensure_ascii=False, indent=2)
     """Bot đăng bài hàng loạt lên nhiều kênh Telegram"""
     # (End of file. All indentation errors and trailing indented lines have been removed.)
+    # ---------- Thành phần: tạo ngay khi khởi động, hoặc khi dùng lần đầu nếu STARTUP_LAZY ----------
+    COMPONENTS = (
+        'channel_manager', 'post_manager', 'scheduler', 'settings_manager',
+        'language_manager', 'analytics_manager', 'ai_assistant'
+    )
+    # Những thành phần luôn được tạo ngay (scheduler phải chạy từ đầu)
+    EAGER_COMPONENTS = ('scheduler',)
+
+    @lazy_component
+    def channel_manager(self):
+        return ChannelManager()
+
+    @lazy_component
+    def post_manager(self):
+        return PostManager()
+
+    @lazy_component
+    def scheduler(self):
+        # Lịch đăng gửi qua PostManager/ChannelManager dùng chung (tạo khi lịch đầu tiên chạy nếu STARTUP_LAZY)
+        return PostScheduler(
+            bot=self.application.bot,
+            manager_provider=lambda: (self.post_manager, self.channel_manager)
+        )
+
+    @lazy_component
+    def leader(self):
+        # Lease leader: chỉ replica giữ lease mới chạy scheduler (LEADER_ELECTION != off)
+        from leader_election import LeaderElector, create_backend
+        return LeaderElector(
+            create_backend(Config.LEADER_ELECTION, Config.LEADER_LEASE_PATH),
+            ttl=Config.LEADER_LEASE_TTL,
+            on_elected=self.scheduler.start,
+            on_demoted=self.scheduler.stop
+        )
+
+    @lazy_component
+    def expiry_worker(self):
+        # Tự xóa bài hết hạn (expire_after / expire_at) ở mọi kênh đã gửi
+        from expiry import ExpiryWorker
+        return ExpiryWorker(self.post_manager, bot=self.application.bot)
+
+    @lazy_component
+    def settings_manager(self):
+        from settings_manager import SettingsManager
+        return SettingsManager()
+
+    @lazy_component
+    def language_manager(self):
+        return LanguageManager()
+
+    @lazy_component
+    def analytics_manager(self):
+        from analytics_manager import AnalyticsManager
+        return AnalyticsManager()
+
+    @lazy_component
+    def ai_assistant(self):
+        from ai_assistant import AIAssistant
+        return AIAssistant()
+
+    @lazy_component
+    def retention(self):
+        from history_rollups import RetentionManager
+        return RetentionManager(
+            post_manager=self.post_manager,
+            analytics_manager=self.analytics_manager,
+            post_retention_days=Config.AUTO_CLEANUP_DAYS,
+            analytics_retention_days=Config.ANALYTICS_RETENTION_DAYS,
+            interval_hours=Config.RETENTION_INTERVAL_HOURS
+        )
+
     def __init__(self, token: str, application: Optional[Application] = None):
         self.token = token
-        # Đảm bảo bot ở chế độ polling, xoá webhook cũ nếu có
-        try:
-            asyncio.run(Bot(token).delete_webhook(drop_pending_updates=True))
-        except Exception:
-            pass  # Bỏ qua lỗi nếu chưa từng thiết lập webhook
+        self.startup_timer = StartupTimer()
+        self._first_update_seen = False
+
+        # Đảm bảo bot ở chế độ polling, xoá webhook cũ nếu có (chạy song song với phần khởi tạo)
+        self._webhook_thread = threading.Thread(
+            target=self._delete_webhook, name="delete-webhook", daemon=True
+        )
+        self._webhook_thread.start()
 
-        # Sau khi asyncio.run đóng loop, tạo loop mới nếu cần
+        # Đảm bảo luồng chính có event loop
         try:
             asyncio.get_event_loop()
         except RuntimeError:
             asyncio.set_event_loop(asyncio.new_event_loop())
 
         # Dùng Application chung nếu có, tránh tạo mới
+        phase_start = self.startup_timer.elapsed()
         self.application = application if application else Application.builder().token(token).build()
-        
-        # Khởi tạo các module
-        self.channel_manager = ChannelManager()
-        self.post_manager = PostManager()
-        self.scheduler = PostScheduler(bot=self.application.bot)
-        # Đảm bảo scheduler có bot instance
-        # self.scheduler.set_bot(self.application.bot)  # không cần vì truyền trong ctor
-        self.settings_manager = SettingsManager()
-        self.language_manager = LanguageManager()
-        self.analytics_manager = AnalyticsManager()
-        self.ai_assistant = AIAssistant()
+        self.startup_timer.record('application', self.startup_timer.elapsed() - phase_start)
+        
+        # Khởi tạo các module (song song, mỗi manager tự đọc file của mình);
+        # ở chế độ STARTUP_LAZY chỉ tạo ngay các thành phần bắt buộc, phần còn lại tạo khi dùng
+        eager = self.EAGER_COMPONENTS if Config.STARTUP_LAZY else self.COMPONENTS
+        load_managers(
+            {name: (lambda name=name: getattr(self, name)) for name in eager},
+            self.startup_timer,
+            parallel=Config.STARTUP_PARALLEL_LOAD
+        )
         
         # Trạng thái người dùng
         self.user_states: Dict[int, Dict] = {}
+        # Các lần gửi theo đợt (canary) đang chạy / chờ xác nhận, theo admin
+        self.rollouts: Dict[int, Dict[str, Any]] = {}
         
         # Bộ nút đã lưu
         self._saved_buttons_file = pathlib.Path("saved_buttons.json")
@@ -175,10 +264,88 @@ class MassPostBot:
         
         # Thiết lập handlers
         self.setup_handlers()
+        
+        # Chạy scheduler + retention trên event loop của bot khi loop đã sẵn sàng, dừng khi tắt
+        self._previous_post_init = self.application.post_init
+        self.application.post_init = self._on_post_init
+        self._previous_post_shutdown = self.application.post_shutdown
+        self.application.post_shutdown = self._on_post_shutdown
+
+        logger.info(f"⏱️ Khởi động bot: {self.startup_timer.summary()}")
+        if _import_profiler is not None:
+            _import_profiler.uninstall()
+            print(_import_profiler.report())
+            print(self.startup_timer.report())
+
+    def _delete_webhook(self):
+        """Xoá webhook cũ (chạy trên luồng riêng với event loop riêng)"""
+        start = time.perf_counter()
+        try:
+            asyncio.run(Bot(self.token).delete_webhook(drop_pending_updates=True))
+        except Exception:
+            pass  # Bỏ qua lỗi nếu chưa từng thiết lập webhook
+        self.startup_timer.record('delete_webhook (song song)', time.perf_counter() - start)
+
+    def _warm_up_components(self, loop: asyncio.AbstractEventLoop):
+        """Chế độ STARTUP_LAZY: tạo dần các thành phần còn lại trên luồng nền sau khi bot đã nhận update"""
+        pending = [name for name in self.COMPONENTS if not lazy_component.is_loaded(self, name)]
+        timer = StartupTimer()
+        try:
+            load_managers({name: (lambda name=name: getattr(self, name)) for name in pending}, timer)
+            logger.info(f"⏱️ Đã tạo nền các thành phần còn lại: {timer.summary()}")
+        except Exception as e:
+            logger.error(f"Lỗi khi tạo nền các thành phần: {e}")
+            return
+        loop.call_soon_threadsafe(self._start_expiry_worker)
+        if Config.RETENTION_INTERVAL_HOURS > 0:
+            loop.call_soon_threadsafe(self.retention.start)
+
+    def _start_expiry_worker(self):
+        if Config.LEADER_ELECTION != 'off':
+            self.expiry_worker.should_run = lambda: self.leader.is_leader  # chỉ leader xóa tin
+        self.expiry_worker.start()
+
+    async def _on_post_init(self, application: Application):
+        """Hook post_init: khởi động các tác vụ nền chạy trên event loop của bot"""
+        if self._previous_post_init:
+            await self._previous_post_init(application)
+        if Config.LEADER_ELECTION != 'off':
+            self.scheduler.should_run = lambda: self.leader.is_leader
+            self.leader.start()  # scheduler chạy khi replica này được bầu làm leader
+        else:
+            self.scheduler.start()
+        if Config.STARTUP_LAZY:
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(None, self._warm_up_components, loop)
+        else:
+            self._start_expiry_worker()
+            if Config.RETENTION_INTERVAL_HOURS > 0:
+                self.retention.start()
+
+    async def _on_post_shutdown(self, application: Application):
+        """Hook post_shutdown: trả lease leader, dừng scheduler khi event loop của bot vẫn còn chạy"""
+        if lazy_component.is_loaded(self, 'leader'):
+            self.leader.stop()
+        self.scheduler.stop()
+        if lazy_component.is_loaded(self, 'expiry_worker'):
+            self.expiry_worker.stop()
+        if self._previous_post_shutdown:
+            await self._previous_post_shutdown(application)
+
+    async def _track_first_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ghi log thời gian từ lúc khởi động tới update đầu tiên"""
+        if not self._first_update_seen:
+            self._first_update_seen = True
+            logger.info(
+                f"⏱️ Update đầu tiên sau {(time.perf_counter() - PROCESS_START) * 1000:.0f} ms kể từ khi khởi động"
+            )
     
     def setup_handlers(self):
         """Thiết lập các handlers cho bot"""
         
+        # Đo thời gian tới update đầu tiên (group -1: chạy trước mọi handler khác)
+        self.application.add_handler(TypeHandler(Update, self._track_first_update), group=-1)
+
         # Command handlers
         self.application.add_handler(CommandHandler("start", self.start))
         self.application.add_handler(CommandHandler("help", self.help_command))
@@ -190,6 +357,8 @@ class MassPostBot:
         self.application.add_handler(CommandHandler("cancel", self.cancel_flow))
         self.application.add_handler(CommandHandler("schedules", self.list_schedules))
         self.application.add_handler(CommandHandler("language", self.language_command))
+        self.application.add_handler(CommandHandler("tag", self.tag_command))
+        self.application.add_handler(CommandHandler("group", self.group_command))
         
         # Callback handlers
         self.application.add_handler(CallbackQueryHandler(self.handle_callback))
@@ -232,9 +401,9 @@ class MassPostBot:
             return
         
         # Lấy ngôn ngữ người dùng
-        lang_code = self.user_states.get(user_id, {}).get('language', 'vi')
-        from language_manager import Language
-        welcome_text = self.language_manager.get_text('welcome', Language(lang_code))
+        lang_code = self.user_states.get(user_id, {}).get('language')
+        language = Language(lang_code) if lang_code else self.language_manager.get_user_language(user_id)
+        welcome_text = self.language_manager.get_text('welcome', language)
         await update.message.reply_text(
             welcome_text,
             parse_mode=ParseMode.MARKDOWN
@@ -254,6 +423,8 @@ class MassPostBot:
 /add_channel - Thêm kênh mới
 /post - Tạo bài đăng mới
 /stats - Thống kê bot
+/tag - Gắn tag cho kênh
+/group - Nhóm kênh theo biểu thức tag
 
 **🎯 Quy trình sử dụng:**
 1. Thêm kênh: /add_channel @channel_name
@@ -297,15 +468,12 @@ class MassPostBot:
                 InlineKeyboardButton("📝 Lịch sử đăng", callback_data="post_history"),
                 InlineKeyboardButton("⚙️ Cài đặt", callback_data="settings")
             ],
- HEAD
             [
                 InlineKeyboardButton("🌐 Ngôn ngữ", callback_data="show_language_menu")
             ]
-
             # [
             #     InlineKeyboardButton("😊 Công cụ Emoji", callback_data="emoji_tools")
             # ]
- cb64ceb (Clean up .pyc and __pycache__ files)
         ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -345,15 +513,12 @@ class MassPostBot:
                 InlineKeyboardButton("📝 Lịch sử đăng", callback_data="post_history"),
                 InlineKeyboardButton("⚙️ Cài đặt", callback_data="settings")
             ],
-<<<<<<< HEAD
             [
                 InlineKeyboardButton("🌐 Ngôn ngữ", callback_data="show_language_menu")
             ]
-=======
             # [
             #     InlineKeyboardButton("😊 Công cụ Emoji", callback_data="emoji_tools")
             # ]
->>>>>>> cb64ceb (Clean up .pyc and __pycache__ files)
         ]
 
         stats_text = f"""
@@ -374,8 +539,6 @@ class MassPostBot:
         )
     
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if data == "show_language_menu":
-            await self.language_command(query, context)
         # Xử lý callback từ inline keyboard
         query = update.callback_query
         if not query:
@@ -404,7 +567,9 @@ class MassPostBot:
                 await query.answer("❌ Lỗi khi xóa nút đã lưu!", show_alert=True)
             return
 
-        if data in ["set_lang_vi", "set_lang_en", "set_lang_zh"]:
+        if data == "show_language_menu":
+            await query.edit_message_text("🌐 Chọn ngôn ngữ cho bot:", reply_markup=self._language_keyboard())
+        elif data in ["set_lang_vi", "set_lang_en", "set_lang_zh"]:
             await self.handle_set_language(query, data)
         elif data == "quick_post":
             # Khởi tạo state cài đặt bài đăng (mặc định)
@@ -426,6 +591,13 @@ class MassPostBot:
         elif data == "schedule_post":
             await self.start_schedule_flow(query)
         # ---------- Quick post setting toggles ----------
+        elif data in ("rollout_continue", "rollout_abort"):
+            await self.handle_rollout_action(query, data)
+        elif data == "quick_setting_expiry_custom":
+            await self.prompt_expiry_input(query)
+        elif data == "quick_post_settings":
+            self.user_states.get(query.from_user.id, {}).pop('step', None)
+            await self.show_quick_post_intro(query)
         elif data.startswith("quick_setting_toggle_"):
             await self.toggle_quick_setting(query, data)
         elif data.startswith("quick_setting_info_"):
@@ -438,6 +610,8 @@ class MassPostBot:
             await self.handle_skip_add_buttons(query)
         elif data.startswith("schedule_date_"):
             await self.handle_schedule_date(query, data)
+        elif data == "schedule_recurring":
+            await self.prompt_recurring_schedule(query)
         elif data.startswith("schedule_hour_"):
             await self.handle_schedule_hour(query, data)
         elif data.startswith("schedule_min_"):
@@ -473,6 +647,18 @@ class MassPostBot:
             await self.handle_select_channel(query, data)
         elif data == "select_channels_done":
             await self.handle_channels_done(query)
+        elif data == "select_channels_target":
+            await self.prompt_target_input(query)
+        elif data == "select_channels_show":
+            await self.show_channel_selection(query, None)
+        elif data == "picker_search":
+            await self.prompt_picker_search(query)
+        elif data == "picker_groups":
+            await self.show_picker_groups(query)
+        elif data.startswith("picker_groups_page_"):
+            await self.show_picker_groups(query, int(data.replace("picker_groups_page_", "")))
+        elif data.startswith("picker_"):
+            await self.handle_picker_action(query, data)
         elif data == "post_to_all":
             if hasattr(self, "handle_post_to_channels"):
                 await self.handle_post_to_channels(query, data)
@@ -619,7 +805,16 @@ class MassPostBot:
         """Hiển thị phần giới thiệu gửi bài với các nút tuỳ chỉnh (theo yêu cầu)"""
         user_id = query.from_user.id
         settings = self.user_states.get(user_id, {}).get('settings', {})
+        intro_text, reply_markup = self._quick_post_intro(settings)
+        await self.safe_edit_message(
+            query,
+            intro_text,
+            reply_markup=reply_markup,
+            parse_mode=ParseMode.MARKDOWN
+        )
 
+    def _quick_post_intro(self, settings: Dict[str, Any]):
+        """Nội dung + bàn phím của menu cài đặt gửi bài"""
         intro_text = (
             "📨 **Gửi bài đăng**\n\n"
             "Trong menu này, bạn có thể chọn **Cài đặt Tweet**\n\n"
@@ -653,17 +848,31 @@ class MassPostBot:
                 InlineKeyboardButton("🔒 Bảo vệ", callback_data="quick_setting_info_protect"),
                 InlineKeyboardButton(protect_label, callback_data="quick_setting_toggle_protect")
             ],
+            [
+                InlineKeyboardButton("🐤 Gửi theo đợt", callback_data="quick_setting_info_rollout"),
+                InlineKeyboardButton(on_off_icon(settings.get('rollout', Config.ROLLOUT_DEFAULT)), callback_data="quick_setting_toggle_rollout")
+            ],
+            [
+                InlineKeyboardButton("⏳ Tự xóa", callback_data="quick_setting_info_expiry"),
+                InlineKeyboardButton(self._expiry_label(settings), callback_data="quick_setting_toggle_expiry")
+            ],
+            [InlineKeyboardButton("✍️ Nhập hạn tự xóa", callback_data="quick_setting_expiry_custom")],
             [
                 InlineKeyboardButton("🏠 Menu", callback_data="back_main"),
                 InlineKeyboardButton("🔙 Quay lại", callback_data="quick_post")
             ]
         ]
-        await self.safe_edit_message(
-            query,
-            intro_text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN
-        )
+        return intro_text, InlineKeyboardMarkup(keyboard)
+
+    @staticmethod
+    def _expiry_label(settings: Dict[str, Any]) -> str:
+        """Nhãn hạn tự xóa đang chọn: thời điểm cụ thể, khoảng thời gian hoặc tắt"""
+        from expiry import format_ttl
+        if settings.get('expire_at'):
+            return f"🕒 {datetime.fromisoformat(settings['expire_at']).strftime('%d/%m %H:%M')}"
+        if settings.get('expire_after'):
+            return f"⏳ {format_ttl(settings['expire_after'])}"
+        return "❌ Không"
 
     # ---------- Quick setting helpers ----------
 
@@ -677,6 +886,16 @@ class MassPostBot:
         if key == 'format':
             # Vòng qua telegram -> html -> telegram
             settings['format'] = 'html' if settings.get('format', 'telegram') == 'telegram' else 'telegram'
+        elif key == 'expiry':
+            # Vòng qua các mức tự xóa: tắt -> 1 giờ -> ... -> 7 ngày -> tắt
+            from expiry import TTL_CHOICES
+            current = 0 if settings.pop('expire_at', None) else settings.get('expire_after', 0)
+            following = [choice for choice in TTL_CHOICES if choice > current]
+            settings['expire_after'] = following[0] if following else 0
+            if not settings['expire_after']:
+                settings.pop('expire_after')
+        elif key == 'rollout':
+            settings['rollout'] = not settings.get('rollout', Config.ROLLOUT_DEFAULT)
         else:
             current = settings.get(key, False)
             settings[key] = not current
@@ -690,10 +909,43 @@ class MassPostBot:
             'notify': "Bật để người dùng kênh nhận thông báo đẩy khi bài đăng được gửi.",
             'preview': "Bật để Telegram hiển thị ảnh xem trước của liên kết (nếu có) trong bài đăng.",
             'format': "Chọn kiểu định dạng văn bản: Telegram (MarkdownV2) hoặc HTML.",
-            'protect': "Bật để bảo vệ nội dung (ngăn chuyển tiếp và lưu)."
+            'protect': "Bật để bảo vệ nội dung (ngăn chuyển tiếp và lưu).",
+            'rollout': f"Gửi thử tới {Config.ROLLOUT_CANARY_SIZE} kênh trước, kiểm tra lỗi rồi mới gửi "
+                       f"phần còn lại theo đợt {Config.ROLLOUT_WAVE_SIZE} kênh (dừng được giữa chừng).",
+            'expiry': "Tự xóa bài ở mọi kênh đã gửi khi hết hạn (vd: hết đợt khuyến mãi). "
+                      "Bấm để đổi mức, hoặc nhập giờ cụ thể."
         }
         await query.answer(info_map.get(key, "Đang phát triển"), show_alert=True)
     
+    async def prompt_expiry_input(self, query):
+        """Yêu cầu nhập hạn tự xóa (khoảng thời gian hoặc thời điểm)"""
+        state = self.user_states.setdefault(query.from_user.id, {'action': 'quick_post_setup', 'settings': {}})
+        state['step'] = 'waiting_expiry'
+        await self.safe_edit_message(
+            query,
+            "⏳ **Nhập hạn tự xóa bài đăng**\n\n"
+            "• Sau một khoảng thời gian: `24h`, `90m`, `1d 12h`, `2 ngày`\n"
+            "• Vào thời điểm cụ thể: `23:59`, `31/12 23:59`, `2025-12-31 23:59`",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Quay lại", callback_data="quick_post_settings")]]),
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    async def process_expiry_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lưu hạn tự xóa admin vừa nhập vào cài đặt gửi bài"""
+        from expiry import parse_expiry
+        state = self.user_states[update.effective_user.id]
+        expiry = parse_expiry(update.message.text or '', datetime.now())
+        if expiry is None:
+            await update.message.reply_text("❌ Hạn tự xóa không hợp lệ hoặc đã qua, hãy nhập lại (vd: 24h, 31/12 23:59).")
+            return
+        settings = state.setdefault('settings', {})
+        settings.pop('expire_after', None)
+        settings.pop('expire_at', None)
+        settings.update(expiry)
+        state.pop('step', None)
+        intro_text, reply_markup = self._quick_post_intro(settings)
+        await update.message.reply_text(intro_text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
     async def show_manage_channels(self, query, page: int = 0):
         """Hiển thị quản lý kênh với phân trang và tính năng mới"""
         all_channels = await self.channel_manager.get_all_channels()
@@ -971,6 +1223,12 @@ class MassPostBot:
             await self.process_post_content(update, context)
         elif state.get('action') == 'creating_post' and state.get('step') == 'adding_buttons':
             await self.process_add_buttons(update, context)
+        elif state.get('action') == 'quick_post_setup' and state.get('step') == 'waiting_expiry':
+            await self.process_expiry_input(update, context)
+        elif state.get('step') == 'waiting_target':
+            await self.process_target_input(update, context)
+        elif state.get('step') == 'waiting_picker_search':
+            await self.process_picker_search(update, context)
         elif state.get('action') == 'adding_template' and state.get('step') == 'waiting_content':
             # Lưu mẫu bài đăng
             content = {}
@@ -1051,9 +1309,10 @@ class MassPostBot:
             content = {'type': 'audio', 'audio': update.message.audio.file_id, 'caption': update.message.caption or ''}
 
         # AI kiểm duyệt nội dung
-        ai_result = await self.ai_assistant.check_spam_content(content.get('text', '') if content.get('type') == 'text' else content.get('caption', ''))
+        ai_result = self.ai_assistant.detect_spam_content(content.get('text', '') if content.get('type') == 'text' else content.get('caption', ''))
         if ai_result.get('is_spam'):
-            await update.message.reply_text(f"⚠️ Nội dung bị chặn bởi AI kiểm duyệt: {ai_result.get('reason', 'Nội dung không phù hợp.')}")
+            reason = ", ".join(ai_result.get('issues', [])) or 'Nội dung không phù hợp.'
+            await update.message.reply_text(f"⚠️ Nội dung bị chặn bởi AI kiểm duyệt: {reason}")
             return
         
         # Lưu nội dung
@@ -1172,9 +1431,10 @@ class MassPostBot:
         await self.show_channel_selection(update.message, context)
     
     async def show_channel_selection(self, update_or_query, context, refresh=False):
-        """Hiển thị lựa chọn kênh"""
+        """Hiển thị bàn phím chọn kênh (phân trang, tìm kiếm, chọn theo trang/nhóm)"""
         # update_or_query: có thể là Update (message) hoặc CallbackQuery
         from telegram import CallbackQuery, Message
+        user_id = None
         if isinstance(update_or_query, CallbackQuery):
             message_sender = update_or_query  # dùng edit_message_text
             user_id = update_or_query.from_user.id
@@ -1187,45 +1447,108 @@ class MassPostBot:
         if user_id is None:
             return
         state = self.user_states.get(user_id, {})
-        selected = set(state.get('selected_channels', []))
+        picker = self._channel_picker(state)
         
-        channels = await self.channel_manager.get_all_channels()
-        
-        if not channels:
-            await message_sender.reply_text(
-                "❌ **Chưa có kênh nào!**\n\n"
-                "Sử dụng /add_channel để thêm kênh trước.",
-                parse_mode=ParseMode.MARKDOWN
-            )
+        if not self.channel_manager.channels:
+            text = "❌ **Chưa có kênh nào!**\n\nSử dụng /add_channel để thêm kênh trước."
+            if isinstance(message_sender, Message):
+                await message_sender.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+            else:
+                await self.safe_edit_message(message_sender, text, parse_mode=ParseMode.MARKDOWN)
             return
         
-        keyboard = []
-        for channel in channels:
-            channel_id = str(channel.get('id'))
-            name = channel.get('name') or channel.get('title') or channel_id
-            prefix = "✅ " if channel_id in selected else "☑️ "
-            keyboard.append([
-                InlineKeyboardButton(f"{prefix}{name}", callback_data=f"select_channel_{channel_id}")
-            ])
-        
-        bottom_row = [InlineKeyboardButton("🔙 Quay lại", callback_data="back_to_previous")]
+        done_label = None
         if state.get('action') == 'creating_post':
-            bottom_row.insert(0, InlineKeyboardButton("✅ Gửi", callback_data="select_channels_done"))
+            done_label = "✅ Gửi"
         elif state.get('action') == 'scheduling_post':
-            bottom_row.insert(0, InlineKeyboardButton("➡️ Tiếp tục", callback_data="select_channels_done"))
-        if len(channels) > 1:
-            bottom_row.append(InlineKeyboardButton("✅ Gửi tất cả", callback_data="post_to_all"))
-        keyboard.append(bottom_row)
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        text = "📋 **Chọn kênh đăng bài:**\n\n"
-        if selected:
-            text += f"✅ Đã chọn: {len(selected)} kênh\n"
-        text += "Chạm vào kênh để chọn/bỏ chọn, sau đó nhấn Gửi."
+            done_label = "➡️ Tiếp tục"
+        reply_markup = picker.markup(done_label)
+        text = picker.text(state.get('target'))
         if isinstance(message_sender, Message):
             await message_sender.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+        elif refresh and text == picker.last_text:
+            # Nội dung không đổi (chọn kênh, chuyển trang...): chỉ gửi lại bàn phím
+            try:
+                await message_sender.edit_message_reply_markup(reply_markup=reply_markup)
+            except BadRequest as e:
+                if "message is not modified" not in str(e).lower():
+                    raise
         elif hasattr(message_sender, 'edit_message_text'):
-            await message_sender.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+            await self.safe_edit_message(message_sender, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+        picker.last_text = text
+
+    def _channel_picker(self, state: Dict[str, Any]) -> ChannelPicker:
+        """Bàn phím chọn kênh của luồng đăng bài hiện tại (tạo mới nếu chưa có)"""
+        picker = state.get('picker')
+        if picker is None:
+            picker = ChannelPicker(self.channel_manager, state.get('selected_channels', []), Config.CHANNEL_PICKER_PAGE_SIZE)
+            state['picker'] = picker
+        else:
+            picker.set_selected(state.get('selected_channels', []))
+        picker.refresh()
+        return picker
+
+    async def handle_picker_action(self, query, data: str):
+        """Chuyển trang, chọn cả trang, bỏ lọc, bỏ chọn, chọn theo nhóm/tag trong bàn phím chọn kênh"""
+        state = self.user_states.get(query.from_user.id)
+        if not state:
+            return
+        picker = self._channel_picker(state)
+        if data.startswith("picker_page_"):
+            picker.go(int(data.replace("picker_page_", "")))
+        elif data == "picker_all_page":
+            picker.toggle_page()
+        elif data == "picker_clear":
+            picker.clear()
+        elif data == "picker_search_clear":
+            picker.search('')
+        elif data.startswith("picker_group_"):
+            from channel_targeting import TargetExpressionError
+            expression = picker.group_expression(int(data.replace("picker_group_", "")))
+            if expression is None:
+                return
+            try:
+                channels = self.channel_manager.resolve_target(expression)
+            except TargetExpressionError as e:
+                await query.answer(f"❌ {e}", show_alert=True)
+                return
+            changed = picker.toggle_many(str(ch.get('id')) for ch in channels if ch.get('active', True) and ch.get('id') is not None)
+            await query.answer(f"{'Đã chọn thêm' if changed >= 0 else 'Đã bỏ chọn'} {abs(changed)} kênh ({expression})")
+        if picker.selected != set(state.get('selected_channels', [])):
+            state.pop('target', None)  # chọn tay thì không còn theo biểu thức nữa
+            state['selected_channels'] = list(picker.selected)
+        await self.show_channel_selection(query, None, refresh=True)
+
+    async def show_picker_groups(self, query, page: Optional[int] = None):
+        """Màn chọn nhanh các kênh theo nhóm/tag (`page`: trang nhóm/tag, mặc định trang đang xem)"""
+        state = self.user_states.get(query.from_user.id)
+        if not state:
+            return
+        picker = self._channel_picker(state)
+        text, reply_markup = picker.groups_markup(page)
+        picker.last_text = None
+        await self.safe_edit_message(query, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+    async def prompt_picker_search(self, query):
+        """Yêu cầu nhập từ khóa tìm kênh trong bàn phím chọn kênh"""
+        state = self.user_states.get(query.from_user.id)
+        if not state:
+            return
+        state['step'] = 'waiting_picker_search'
+        self._channel_picker(state).last_text = None
+        await self.safe_edit_message(
+            query,
+            "🔍 **Tìm kênh**\n\nNhập một phần tên hoặc username kênh:",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Quay lại", callback_data="select_channels_show")]]),
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    async def process_picker_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lọc bàn phím chọn kênh theo từ khóa (index n-gram của ChannelManager)"""
+        state = self.user_states[update.effective_user.id]
+        self._channel_picker(state).search(update.message.text or '')
+        state['step'] = 'selecting_channels'
+        await self.show_channel_selection(update.message, context)
     
     
     async def show_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1295,6 +1618,9 @@ class MassPostBot:
                 row = []
         if row:
             keyboard.append(row)
+        keyboard.append([
+            InlineKeyboardButton("🔁 Lịch lặp (cron/RRULE)", callback_data="schedule_recurring")
+        ])
         keyboard.append([
             InlineKeyboardButton("🔙 Quay lại", callback_data="back_main")
         ])
@@ -1304,11 +1630,28 @@ class MassPostBot:
             parse_mode=ParseMode.MARKDOWN
         )
     
+    def _selected_schedule_day(self, query) -> Optional[datetime]:
+        """Ngày đang chọn trong luồng lên lịch (None nếu chưa chọn)"""
+        state = self.user_states.get(query.from_user.id) or {}
+        date_str = state.get('schedule', {}).get('date')
+        return datetime.strptime(date_str, "%Y%m%d") if date_str else None
+
+    @staticmethod
+    def _load_marker(load: int, over_budget: bool) -> str:
+        """Ký hiệu tải của một khung giờ trên bàn phím lên lịch"""
+        if over_budget:
+            return "🔴"
+        return "🟡" if load else ""
+
     async def show_hour_keyboard(self, query):
+        day = self._selected_schedule_day(query)
+        # Khung bận nhất (theo phút) của từng giờ trong ngày đã chọn
+        loads = self.scheduler.slot_loads(day, 3600, 24) if day else [(0, False)] * 24
         keyboard = []
         row = []
         for h in range(24):
-            label = f"{h:02d}"
+            load, over_budget = loads[h]
+            label = f"{h:02d}{self._load_marker(load, over_budget)}"
             row.append(InlineKeyboardButton(label, callback_data=f"schedule_hour_{h:02d}"))
             if len(row) == 6:
                 keyboard.append(row)
@@ -1320,17 +1663,24 @@ class MassPostBot:
             InlineKeyboardButton("⏭️ Bỏ qua", callback_data="schedule_skip_hour")
         ])
         await query.edit_message_text(
-            "🕑 **Chọn giờ (0-23):**",
+            "🕑 **Chọn giờ (0-23):**\n🟡 đã có lịch • 🔴 vượt giới hạn gửi",
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.MARKDOWN
         )
 
     async def show_minute_keyboard(self, query):
         minutes = [0,5,10,15,20,25,30,35,40,45,50,55]
+        day = self._selected_schedule_day(query)
+        state = self.user_states.get(query.from_user.id) or {}
+        hour = state.get('schedule', {}).get('hour', 0)
+        # Tải của từng ô 5 phút: số tin sẽ gửi trong phút bận nhất của ô
+        loads = self.scheduler.slot_loads(day.replace(hour=hour), 300, 12) if day else [(0, False)] * 12
         keyboard = []
         row = []
-        for m in minutes:
+        for m, (load, over_budget) in zip(minutes, loads):
             label = f"{m:02d}"
+            if load:
+                label += f" {self._load_marker(load, over_budget)}{load}"
             row.append(InlineKeyboardButton(label, callback_data=f"schedule_min_{m:02d}"))
             if len(row) == 4:
                 keyboard.append(row)
@@ -1341,8 +1691,10 @@ class MassPostBot:
             InlineKeyboardButton("⬅️ Quay lại", callback_data="schedule_back_hour"),
             InlineKeyboardButton("⏭️ Bỏ qua", callback_data="schedule_skip_min")
         ])
+        budget = int(Config.SEND_RATE_PER_SECOND * Config.LOAD_BUCKET_SECONDS)
         await query.edit_message_text(
-            "⏰ **Chọn phút:**",
+            "⏰ **Chọn phút:**\n"
+            f"Số bên cạnh = số tin đã lên lịch (giới hạn {budget} tin/{Config.LOAD_BUCKET_SECONDS}s)",
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.MARKDOWN
         )
@@ -1406,16 +1758,24 @@ class MassPostBot:
             await query.answer("Thời gian đã qua", show_alert=True)
             return
         post_data: Dict[str, Any] = state.get('post_data', {})
-        channels = await self.channel_manager.get_all_channels()
-        schedule_id = await self.scheduler.schedule_post(post_data, channels, schedule_time)
+        channels, target = await self._scheduled_channels(state)
+        schedule_id = await self.scheduler.schedule_post(post_data, channels, schedule_time, target=target)
         # clear state
         user_id = query.from_user.id
         self.user_states.pop(user_id, None)
         keyboard = [
             [InlineKeyboardButton("⬅️ Quay lại", callback_data="schedule_post"), InlineKeyboardButton("🏠 Menu chính", callback_data="back_main")]
         ]
+        load_note = ""
+        info = self.scheduler.scheduled_posts.get(schedule_id) or {}
+        if info.get('load_offset'):
+            run_at = datetime.fromisoformat(info['next_execution'])
+            load_note = f"\n⏱️ Khung giờ đã có lịch khác, tự lùi tới {run_at.strftime('%H:%M:%S')} để giãn tải."
+        plan = self.scheduler.plan_load(datetime.fromisoformat(info['next_execution']), 0, 'off') if info else None
+        if plan and plan['over_budget']:
+            load_note += f"\n⚠️ Khung giờ này dự kiến gửi {plan['load']} tin, vượt giới hạn {plan['budget']} tin/{Config.LOAD_BUCKET_SECONDS}s."
         await query.edit_message_text(
-            f"✅ Đã lên lịch <code>{schedule_id}</code> lúc {schedule_time.strftime('%H:%M %d/%m/%Y')}",
+            f"✅ Đã lên lịch <code>{schedule_id}</code> lúc {schedule_time.strftime('%H:%M %d/%m/%Y')}{load_note}",
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.HTML
         )
@@ -1424,10 +1784,10 @@ class MassPostBot:
         """Hiển thị lịch sử đăng bài với phân trang"""
         
         # Lấy dữ liệu từ post_manager
-        all_posts = await self.post_manager.get_post_history(limit=100)  # Lấy 100 bài gần nhất
+        total_posts = await self.post_manager.get_total_posts()
         stats = await self.post_manager.get_statistics()
         
-        if not all_posts:
+        if not total_posts:
             keyboard = [
                 [InlineKeyboardButton("📢 Đăng bài đầu tiên", callback_data="quick_post")],
                 [InlineKeyboardButton("🔙 Quay lại", callback_data="back_main")]
@@ -1443,13 +1803,13 @@ class MassPostBot:
             )
             return
         
-        # Cấu hình phân trang
+        # Cấu hình phân trang (chỉ đọc đúng trang cần hiển thị, trang cũ lấy từ kho lưu trữ)
         per_page = 5
-        total_pages = max(1, (len(all_posts) + per_page - 1) // per_page)
+        total_pages = max(1, (total_posts + per_page - 1) // per_page)
         page = max(0, min(page, total_pages - 1))
         
         start = page * per_page
-        page_posts = all_posts[start:start + per_page]
+        page_posts = await self.post_manager.get_post_history(limit=per_page, offset=start)
         
         # Tạo text hiển thị
         history_text = (
@@ -1622,15 +1982,160 @@ class MassPostBot:
         if not state:
             return
         channel_id = data.replace("select_channel_", "")
-        selected: Set[str] = set(state.setdefault('selected_channels', []))
-        if channel_id in selected:
-            selected.remove(channel_id)
-        else:
-            selected.add(channel_id)
-        state['selected_channels'] = list(selected)
-        # Hiển thị lại danh sách kênh với dấu tick
+        state.pop('target', None)  # chọn tay thì không còn theo biểu thức nữa
+        picker = self._channel_picker(state)
+        picker.toggle(channel_id)
+        state['selected_channels'] = list(picker.selected)
+        # Chỉ vẽ lại nút của kênh vừa chạm trên trang hiện tại
         await self.show_channel_selection(query, None, refresh=True)
 
+    async def prompt_target_input(self, query):
+        """Yêu cầu nhập biểu thức chọn kênh theo tag/nhóm"""
+        state = self.user_states.get(query.from_user.id)
+        if not state:
+            return
+        state['step'] = 'waiting_target'
+        self._channel_picker(state).last_text = None
+        tags = self.channel_manager.get_tag_counts()
+        groups = self.channel_manager.get_groups()
+        text = (
+            "🎯 <b>Chọn kênh theo tag/nhóm</b>\n\n"
+            "Nhập biểu thức, ví dụ: <code>vn &amp; promo &amp; !paused</code>, <code>@khach_vip | sale</code>\n"
+            "• <code>&amp;</code> và, <code>|</code> hoặc, <code>!</code> phủ định, ngoặc đơn để nhóm\n"
+            "• <code>@tên</code>: nhóm kênh; <code>active</code>/<code>paused</code>/<code>all</code>: kênh đang bật/tạm dừng/tất cả\n"
+            "Chỉ các kênh đang bật được chọn.\n"
+        )
+        if tags:
+            text += "\n🏷️ Tag: " + ", ".join(f"<code>{html.escape(tag)}</code> ({count})" for tag, count in tags.items())
+        if groups:
+            text += "\n👥 Nhóm: " + ", ".join(f"<code>@{html.escape(name)}</code>" for name in groups)
+        if not tags and not groups:
+            text += "\nChưa có tag nào, dùng /tag để gắn tag cho kênh."
+        await self.safe_edit_message(
+            query, text,
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Quay lại", callback_data="select_channels_show")]]),
+            parse_mode=ParseMode.HTML
+        )
+
+    async def process_target_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Chọn các kênh đang bật khớp biểu thức admin vừa nhập"""
+        from channel_targeting import TargetExpressionError
+        state = self.user_states[update.effective_user.id]
+        expression = (update.message.text or '').strip()
+        try:
+            channels = self.channel_manager.resolve_target(expression)
+        except TargetExpressionError as e:
+            await update.message.reply_text(f"❌ Biểu thức không hợp lệ: {e}")
+            return
+        selected = [str(ch.get('id')) for ch in channels if ch.get('active', True) and ch.get('id') is not None]
+        if not selected:
+            await update.message.reply_text("⚠️ Không có kênh đang bật nào khớp biểu thức, hãy nhập lại.")
+            return
+        state['selected_channels'] = selected
+        state['target'] = expression
+        state['step'] = 'selecting_channels'
+        await self.show_channel_selection(update.message, context)
+
+    async def tag_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/tag <kênh> tag1 -tag2: gắn/bỏ tag cho kênh; /tag: xem các tag"""
+        if not update.message:
+            return
+        user_id = self.check_user_and_admin(update)
+        if user_id is None or not await self.is_admin(user_id):
+            await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này!")
+            return
+        from channel_targeting import TargetExpressionError
+        args = context.args or []
+        if len(args) < 2:
+            tags = self.channel_manager.get_tag_counts()
+            text = (
+                "🏷️ <b>Tag kênh</b>\n\n"
+                "Gắn tag: <code>/tag @channel vn promo</code>\n"
+                "Bỏ tag: <code>/tag @channel -promo</code>\n"
+            )
+            if tags:
+                text += "\n" + "\n".join(f"• <code>{html.escape(tag)}</code>: {count} kênh" for tag, count in tags.items())
+            await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+            return
+        add = [arg for arg in args[1:] if not arg.startswith('-')]
+        remove = [arg[1:] for arg in args[1:] if arg.startswith('-')]
+        channel_id = args[0]
+        if channel_id.startswith('@'):
+            channel = self.channel_manager.get_channel_by_username(channel_id)
+            channel_id = channel.get('id') if channel else channel_id
+        try:
+            tags = self.channel_manager.update_channel_tags(channel_id, add=add, remove=remove)
+        except TargetExpressionError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        if tags is None:
+            await update.message.reply_text("❌ Không tìm thấy kênh!")
+            return
+        tag_text = ", ".join(f"<code>{html.escape(tag)}</code>" for tag in tags) or "(không có)"
+        await update.message.reply_text(f"✅ Tag của kênh {html.escape(args[0])}: {tag_text}", parse_mode=ParseMode.HTML)
+
+    async def group_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/group <tên> <biểu thức>: lưu nhóm kênh; /group -<tên>: xóa; /group: xem các nhóm"""
+        if not update.message:
+            return
+        user_id = self.check_user_and_admin(update)
+        if user_id is None or not await self.is_admin(user_id):
+            await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này!")
+            return
+        from channel_targeting import TargetExpressionError
+        args = context.args or []
+        if len(args) == 1 and args[0].startswith('-'):
+            # Lịch chưa chạy xong mà chọn kênh theo nhóm này sẽ lỗi khi tới giờ -> không cho xóa
+            schedule_targets = {
+                schedule_info.get('id', ''): schedule_info['target']
+                for status in ('pending', 'executing')
+                for schedule_info in await self.scheduler.get_scheduled_posts(status)
+                if schedule_info.get('target')
+            }
+            try:
+                deleted = self.channel_manager.delete_group(args[0][1:], schedule_targets)
+            except TargetExpressionError as e:
+                await update.message.reply_text(f"❌ {html.escape(str(e))}", parse_mode=ParseMode.HTML)
+                return
+            if deleted:
+                await update.message.reply_text(f"🗑️ Đã xóa nhóm @{html.escape(args[0][1:])}", parse_mode=ParseMode.HTML)
+            else:
+                await update.message.reply_text("❌ Không tìm thấy nhóm!")
+            return
+        if len(args) < 2:
+            groups = self.channel_manager.get_groups()
+            text = (
+                "👥 <b>Nhóm kênh</b>\n\n"
+                "Tạo/sửa: <code>/group khach_vip vn &amp; promo &amp; !paused</code>\n"
+                "Xóa: <code>/group -khach_vip</code>\n"
+                "Dùng trong biểu thức chọn kênh: <code>@khach_vip</code>\n"
+            )
+            for name, expression in groups.items():
+                try:
+                    count = self.channel_manager.count_target(f"@{name}")
+                except TargetExpressionError:
+                    count = '?'
+                text += f"\n• <code>@{html.escape(name)}</code> = <code>{html.escape(expression)}</code> ({count} kênh)"
+            await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+            return
+        try:
+            name = self.channel_manager.save_group(args[0], " ".join(args[1:]))
+            count = self.channel_manager.count_target(f"@{name}")
+        except TargetExpressionError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        await update.message.reply_text(f"✅ Đã lưu nhóm <code>@{html.escape(name)}</code>: {count} kênh", parse_mode=ParseMode.HTML)
+
+    async def _scheduled_channels(self, state: Dict[str, Any]):
+        """(kênh, biểu thức) cho lịch đăng: theo biểu thức đã chọn, các kênh đã tick, hoặc tất cả"""
+        if state.get('target'):
+            return [], state['target']
+        channels = await self.channel_manager.get_all_channels()
+        selected = set(state.get('channels_selected') or ())
+        if selected:
+            channels = [ch for ch in channels if str(ch.get('id')) in selected]
+        return channels, None
+
     async def handle_channels_done(self, query):
         # Người dùng xác nhận chọn kênh
         user_id = query.from_user.id
@@ -1664,59 +2169,17 @@ class MassPostBot:
             reply_markup = InlineKeyboardMarkup(keyboard)
             print(f"DEBUG: Sending with {len(post['buttons'])} buttons")  # Debug
 
+        if self._use_rollout(settings, channel_ids):
+            await self._start_rollout(query, post, settings, [str(ch_id) for ch_id in channel_ids], reply_markup)
+            return
+
+        delivered: List[DeliveryResult] = []
         for ch_id in channel_ids:
             try:
-                if post['type'] == 'text':
-                    await self.application.bot.send_message(
-                        chat_id=ch_id,
-                        text=post['text'],
-                        disable_web_page_preview=not settings.get('preview', True),
-                        disable_notification=not settings.get('notify', True),
-                        protect_content=settings.get('protect', False),
-            reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
-                    )
-                elif post['type'] == 'photo':
-                    await self.application.bot.send_photo(
-                        chat_id=ch_id,
-                        photo=post['photo'],
-                        caption=post.get('caption'),
-                        disable_notification=not settings.get('notify', True),
-                        protect_content=settings.get('protect', False),
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
-                    )
-                elif post['type'] == 'video':
-                    await self.application.bot.send_video(
-                        chat_id=ch_id,
-                        video=post['video'],
-                        caption=post.get('caption'),
-                        disable_notification=not settings.get('notify', True),
-                        protect_content=settings.get('protect', False),
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
-                    )
-                elif post['type'] == 'document':
-                    await self.application.bot.send_document(
-                        chat_id=ch_id,
-                        document=post['document'],
-                        caption=post.get('caption'),
-                        disable_notification=not settings.get('notify', True),
-                        protect_content=settings.get('protect', False),
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
-                    )
-                elif post['type'] == 'audio':
-                    await self.application.bot.send_audio(
-                        chat_id=ch_id,
-                        audio=post['audio'],
-                        caption=post.get('caption'),
-                        disable_notification=not settings.get('notify', True),
-                        protect_content=settings.get('protect', False),
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
-                    )
+                message = await self._send_post_to_channel(ch_id, post, settings, reply_markup)
                 sent += 1
+                if message is not None:
+                    delivered.append(self._delivery_result(ch_id, message))
             except Exception:
                 failed.append(str(ch_id))
         user_id = query.from_user.id
@@ -1724,7 +2187,170 @@ class MassPostBot:
         text = f"📤 Đã gửi bài tới {sent}/{len(channel_ids)} kênh."
         if failed:
             text += "\n⚠️ Lỗi ở: " + ", ".join(failed)
+        text += await self._track_expiring_post(post, settings, delivered)
         await query.edit_message_text(text)
+
+    async def _send_post_to_channel(self, channel_id: str, post: Dict[str, Any], settings: Dict[str, Any], reply_markup):
+        """Gửi bài đã soạn (theo cài đặt gửi bài) tới một kênh, trả về tin đã gửi"""
+        parse_mode = ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
+        common = {
+            'chat_id': channel_id,
+            'disable_notification': not settings.get('notify', True),
+            'protect_content': settings.get('protect', False),
+            'reply_markup': reply_markup,
+            'parse_mode': parse_mode
+        }
+        bot = self.application.bot
+        if post['type'] == 'text':
+            return await bot.send_message(
+                text=post['text'],
+                disable_web_page_preview=not settings.get('preview', True),
+                **common
+            )
+        elif post['type'] == 'photo':
+            return await bot.send_photo(photo=post['photo'], caption=post.get('caption'), **common)
+        elif post['type'] == 'video':
+            return await bot.send_video(video=post['video'], caption=post.get('caption'), **common)
+        elif post['type'] == 'document':
+            return await bot.send_document(document=post['document'], caption=post.get('caption'), **common)
+        elif post['type'] == 'audio':
+            return await bot.send_audio(audio=post['audio'], caption=post.get('caption'), **common)
+        return None
+
+    @staticmethod
+    def _delivery_result(channel_id: str, message, sent_at: Optional[datetime] = None) -> DeliveryResult:
+        return DeliveryResult(
+            channel_id=str(channel_id),
+            channel_title='',
+            success=True,
+            message_id=message.message_id,
+            sent_at=(sent_at or datetime.now()).isoformat()
+        )
+
+    async def _track_expiring_post(self, post: Dict[str, Any], settings: Dict[str, Any], delivered: List[DeliveryResult]) -> str:
+        """Bài có hạn tự xóa: lưu message_id vào PostManager để worker xóa khi hết hạn, trả về dòng thông báo"""
+        expiry = {key: settings[key] for key in ('expire_after', 'expire_at') if settings.get(key)}
+        if not expiry or not delivered:
+            return ""
+        titles = {str(channel.get('id')): channel.get('title', '') for channel in await self.channel_manager.get_all_channels()}
+        for result in delivered:
+            result['channel_title'] = titles.get(result['channel_id'], result['channel_id'])
+        record = self.post_manager.record_sent_post(dict(post, **expiry), delivered)
+        expires_at = datetime.fromisoformat(record['expires_at'])
+        return f"\n⏳ Tự xóa lúc {expires_at.strftime('%H:%M %d/%m/%Y')}."
+
+    # ---------- Gửi theo đợt (canary) ----------
+
+    @staticmethod
+    def _use_rollout(settings: Dict[str, Any], channels: List[Any]) -> bool:
+        """Chỉ gửi theo đợt khi bật và số kênh nhiều hơn đợt canary"""
+        return settings.get('rollout', Config.ROLLOUT_DEFAULT) and len(channels) > Config.ROLLOUT_CANARY_SIZE
+
+    async def _start_rollout(self, query, post: Dict[str, Any], settings: Dict[str, Any], channel_ids: List[str], reply_markup):
+        """Gửi thử tới vài kênh (canary), đánh giá lỗi rồi mới gửi phần còn lại theo từng đợt"""
+        from rollout import Rollout
+        user_id = query.from_user.id
+        self.user_states.pop(user_id, None)
+        previous = self.rollouts.get(user_id)
+        if previous and not previous['rollout'].finished:
+            previous['rollout'].abort()
+        rollout = Rollout(
+            channel_ids,
+            lambda channel_id: self._send_post_to_channel(channel_id, post, settings, reply_markup),
+            canary_size=Config.ROLLOUT_CANARY_SIZE,
+            wave_size=Config.ROLLOUT_WAVE_SIZE,
+            max_error_rate=Config.ROLLOUT_MAX_ERROR_RATE,
+            rate_limiter=self.post_manager.rate_limiter,
+            concurrency=Config.SEND_CONCURRENCY,
+            confirm_canary=Config.ROLLOUT_CONFIRM_CANARY
+        )
+        entry = {'rollout': rollout, 'post': post, 'settings': settings, 'query': query}
+        self.rollouts[user_id] = entry
+        entry['task'] = asyncio.get_running_loop().create_task(self._drive_rollout(user_id, entry))
+
+    async def _drive_rollout(self, user_id: int, entry: Dict[str, Any]):
+        """Gửi lần lượt các đợt cho tới khi xong, bị dừng, vượt ngưỡng lỗi hoặc cần admin xác nhận"""
+        from rollout import ROLLOUT_RUNNING
+        rollout = entry['rollout']
+        try:
+            while rollout.status == ROLLOUT_RUNNING:
+                await rollout.run_next_wave()
+                if rollout.status == ROLLOUT_RUNNING:
+                    await self._show_rollout(entry)
+                    # Nghỉ giữa các đợt: admin kịp xem bài trong kênh và bấm Dừng nếu có vấn đề
+                    await asyncio.sleep(Config.ROLLOUT_WAVE_INTERVAL)
+        except Exception as e:
+            logger.error(f"Lỗi khi gửi theo đợt: {e}")
+            rollout.abort()
+        await self._show_rollout(entry)
+        if rollout.finished and self.rollouts.get(user_id) is entry:
+            self.rollouts.pop(user_id, None)
+
+    async def _show_rollout(self, entry: Dict[str, Any]):
+        """Cập nhật tin nhắn tiến độ gửi theo đợt cùng các nút điều khiển"""
+        from rollout import ROLLOUT_AWAITING, ROLLOUT_HALTED, ROLLOUT_RUNNING
+        rollout = entry['rollout']
+        text = (
+            f"🐤 Gửi theo đợt: {rollout.sent}/{rollout.total} kênh đã gửi, {len(rollout.failed)} lỗi "
+            f"(đợt {rollout.next_wave}/{len(rollout.waves)})"
+        )
+        if rollout.failed:
+            errors = list(rollout.failed.items())[:5]
+            text += "\n⚠️ Lỗi: " + "; ".join(f"{channel_id}: {error}" for channel_id, error in errors)
+        keyboard = []
+        if rollout.status == ROLLOUT_RUNNING:
+            text += "\n⏳ Đang gửi các đợt tiếp theo..."
+            keyboard = [[InlineKeyboardButton("⛔ Dừng", callback_data="rollout_abort")]]
+        elif rollout.status == ROLLOUT_AWAITING:
+            text += "\n\n🔍 Đã gửi thử. Hãy kiểm tra bài trong các kênh trên rồi xác nhận gửi phần còn lại."
+            keyboard = [[
+                InlineKeyboardButton("✅ Gửi tiếp", callback_data="rollout_continue"),
+                InlineKeyboardButton("⛔ Dừng", callback_data="rollout_abort")
+            ]]
+        elif rollout.status == ROLLOUT_HALTED:
+            wave = rollout.last_wave
+            text += (
+                f"\n\n🛑 Đã tạm dừng: đợt {wave.get('wave')} lỗi {wave.get('failed')}/{wave.get('size')} kênh "
+                f"(ngưỡng {Config.ROLLOUT_MAX_ERROR_RATE:.0%}). {rollout.remaining} kênh chưa gửi."
+            )
+            keyboard = [[
+                InlineKeyboardButton("▶️ Vẫn gửi tiếp", callback_data="rollout_continue"),
+                InlineKeyboardButton("⛔ Dừng", callback_data="rollout_abort")
+            ]]
+        else:
+            if rollout.skipped:
+                text += f"\n⛔ Đã dừng, {rollout.skipped} kênh không được gửi."
+            else:
+                text += "\n✅ Hoàn tất."
+            delivered = [
+                self._delivery_result(channel_id, message, rollout.sent_at.get(channel_id))
+                for channel_id, message in rollout.messages.items()
+            ]
+            text += await self._track_expiring_post(entry['post'], entry['settings'], delivered)
+        try:
+            await entry['query'].edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None)
+        except BadRequest as e:
+            if "message is not modified" not in str(e).lower():
+                logger.warning(f"Không thể cập nhật tiến độ gửi theo đợt: {e}")
+
+    async def handle_rollout_action(self, query, data: str):
+        """Nút Gửi tiếp / Dừng của lần gửi theo đợt"""
+        user_id = query.from_user.id
+        entry = self.rollouts.get(user_id)
+        if entry is None or entry['rollout'].finished:
+            await query.answer("Không có lần gửi theo đợt nào đang chạy", show_alert=True)
+            return
+        rollout = entry['rollout']
+        if data == "rollout_abort":
+            rollout.abort()
+            await query.answer("⛔ Đang dừng gửi...")
+            if entry['task'].done():
+                await self._show_rollout(entry)
+                self.rollouts.pop(user_id, None)
+        elif entry['task'].done():
+            rollout.resume()
+            await query.answer("▶️ Tiếp tục gửi")
+            entry['task'] = asyncio.get_running_loop().create_task(self._drive_rollout(user_id, entry))
     
     async def handle_post_to_channels(self, query, data: str):
         """Gửi bài đã soạn tới tất cả kênh"""
@@ -1744,67 +2370,26 @@ class MassPostBot:
         errors = 0
         failed_channels: List[str] = []
         settings = state.get('settings', {})
+        delay = self.settings_manager.snapshot().get("bot", "delay_between_posts", Config.DEFAULT_DELAY_BETWEEN_POSTS)
         reply_markup = None
         if post.get('buttons'):
             keyboard = [[InlineKeyboardButton(btn['text'], url=btn['url'])] for btn in post['buttons']]
             reply_markup = InlineKeyboardMarkup(keyboard)
+        if self._use_rollout(settings, channels):
+            channel_ids = [str(ch.get('id')) for ch in channels if ch.get('id') is not None]
+            await self._start_rollout(query, post, settings, channel_ids, reply_markup)
+            return
+        delivered: List[DeliveryResult] = []
         for ch in channels:
             channel_id_any = ch.get('id')
             if channel_id_any is None:
                 continue
             channel_id = str(channel_id_any)
             try:
-                if post['type'] == 'text':
-                    await self.application.bot.send_message(
-                        chat_id=channel_id,
-                        text=post['text'],
-                        disable_web_page_preview=not settings.get('preview', True),
-                        disable_notification=not settings.get('notify', True),
-                        protect_content=settings.get('protect', False),
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
-                    )
-                elif post['type'] == 'photo':
-                    await self.application.bot.send_photo(
-                        chat_id=channel_id,
-                        photo=post['photo'],
-                        caption=post.get('caption'),
-                        disable_notification=not settings.get('notify', True),
-                        protect_content=settings.get('protect', False),
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
-                    )
-                elif post['type'] == 'video':
-                    await self.application.bot.send_video(
-                        chat_id=channel_id,
-                        video=post['video'],
-                        caption=post.get('caption'),
-                        disable_notification=not settings.get('notify', True),
-                        protect_content=settings.get('protect', False),
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
-                    )
-                elif post['type'] == 'document':
-                    await self.application.bot.send_document(
-                        chat_id=channel_id,
-                        document=post['document'],
-                        caption=post.get('caption'),
-                        disable_notification=not settings.get('notify', True),
-                        protect_content=settings.get('protect', False),
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
-                    )
-                elif post['type'] == 'audio':
-                    await self.application.bot.send_audio(
-                        chat_id=channel_id,
-                        audio=post['audio'],
-                        caption=post.get('caption'),
-                        disable_notification=not settings.get('notify', True),
-                        protect_content=settings.get('protect', False),
-                        reply_markup=reply_markup,
-                        parse_mode=ParseMode.HTML if settings.get('format', 'telegram') == 'html' else ParseMode.MARKDOWN_V2
-                    )
+                message = await self._send_post_to_channel(channel_id, post, settings, reply_markup)
                 sent += 1
+                if message is not None:
+                    delivered.append(self._delivery_result(channel_id, message))
             except Forbidden:
                 errors += 1
                 failed_channels.append(str(channel_id))
@@ -1813,7 +2398,7 @@ class MassPostBot:
                 failed_channels.append(str(channel_id))
             # Rate-limit nhẹ
             try:
-                await asyncio.sleep(Config.DEFAULT_DELAY_BETWEEN_POSTS)
+                await asyncio.sleep(delay)
             except Exception:
                 pass
         # Xoá state
@@ -1823,6 +2408,7 @@ class MassPostBot:
         if failed_channels:
             failed_list = ", ".join(failed_channels)
             result_text += f"\n⚠️ Không thể gửi tới: {failed_list}.\nHãy kiểm tra xem bot đã được thêm làm admin và có quyền Post Messages chưa."
+        result_text += await self._track_expiring_post(post, settings, delivered)
         await query.edit_message_text(result_text)
     
     async def start_quick_text_post(self, query):
@@ -2241,16 +2827,35 @@ class MassPostBot:
             asyncio.set_event_loop(asyncio.new_event_loop())
 
         try:
-            # Bắt đầu scheduler
-            self.scheduler.start()
-            
-            # Chạy bot
+            # Webhook phải được xoá xong trước khi bắt đầu polling
+            self._webhook_thread.join(timeout=30)
+
+            # Chạy bot (scheduler được khởi động trong post_init, trên event loop của bot)
             self.application.run_polling(allowed_updates=Update.ALL_TYPES)
         except KeyboardInterrupt:
             print("\n🛑 Bot đã dừng!")
         finally:
-            # Dừng scheduler
+            # Trả lease leader, dừng scheduler
+            if lazy_component.is_loaded(self, 'leader'):
+                self.leader.stop()
             self.scheduler.stop()
+            if lazy_component.is_loaded(self, 'expiry_worker'):
+                self.expiry_worker.stop()
+            if lazy_component.is_loaded(self, 'retention'):
+                self.retention.stop()
+            if Config.STARTUP_SNAPSHOT:
+                self.write_snapshots()
+
+    def write_snapshots(self):
+        """Ghi snapshot nhị phân của các manager khi tắt bot êm để lần khởi động sau nhanh hơn"""
+        for name in ('channel_manager', 'post_manager', 'scheduler', 'analytics_manager'):
+            if not lazy_component.is_loaded(self, name):
+                continue  # chưa từng được tạo: dữ liệu không đổi, snapshot cũ (nếu có) vẫn dùng được
+            manager = getattr(self, name)
+            try:
+                manager.save_snapshot()
+            except Exception as e:
+                logger.error(f"Lỗi khi ghi snapshot {type(manager).__name__}: {e}")
 
     async def process_schedule_content(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Lưu nội dung rồi hỏi thời gian"""
@@ -2262,11 +2867,66 @@ class MassPostBot:
             self.user_states[user_id]['action'] = 'scheduling_post'
             # step đã là selecting_channels
 
+    async def prompt_recurring_schedule(self, query):
+        """Hỏi quy tắc lặp (cron hoặc RRULE) cho bài đang lên lịch"""
+        user_id = query.from_user.id
+        state = self.user_states.setdefault(user_id, {'action': 'scheduling_post'})
+        state['action'] = 'scheduling_post'
+        state['step'] = 'waiting_time'
+        await query.edit_message_text(
+            "🔁 **Nhập quy tắc lặp:**\n\n"
+            "• Cron: `cron: 0 9,18 * * 1-5` (9h và 18h các ngày trong tuần)\n"
+            "• RRULE: `FREQ=MONTHLY;BYDAY=-1FR;BYHOUR=20;BYMINUTE=0` (20h thứ Sáu cuối tháng)\n"
+            "• Viết tắt: `@daily`, `@weekly`, `@monthly`\n\n"
+            f"Múi giờ: `{Config.TIMEZONE}`. Thêm dòng `bỏ qua: 2024-12-25, 2025-01-01` để loại trừ ngày.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Quay lại", callback_data="back_main")]]),
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    @staticmethod
+    def _is_recurrence_input(text: str) -> bool:
+        lowered = text.lower()
+        return lowered.startswith(('cron:', 'rrule:', 'freq=', '@'))
+
+    async def process_recurring_schedule(self, update: Update, input_text: str, post_data: Dict[str, Any], channels, target: Optional[str] = None):
+        """Tạo lịch lặp từ quy tắc cron/RRULE (dòng 'bỏ qua: ...' là các ngày loại trừ)"""
+        lines = [line.strip() for line in input_text.splitlines() if line.strip()]
+        rule = lines[0]
+        exdates = []
+        for line in lines[1:]:
+            key, _, value = line.partition(':')
+            if key.strip().lower() in ('bỏ qua', 'bo qua', 'exdate'):
+                exdates.extend(v.strip() for v in value.split(',') if v.strip())
+        try:
+            schedule_id = await self.scheduler.schedule_post(
+                post_data, channels, datetime.now(), repeat_count=0,
+                recurrence=rule, exdates=exdates, target=target
+            )
+        except ValueError as e:
+            await update.message.reply_text(f"❌ Quy tắc lặp không hợp lệ: {e}")
+            return False
+        info = self.scheduler.scheduled_posts.get(schedule_id)
+        first_run = datetime.fromisoformat(info['next_execution']).strftime('%H:%M %d/%m/%Y') if info else '?'
+        await update.message.reply_text(
+            f"✅ Đã tạo lịch lặp <code>{schedule_id}</code>\nQuy tắc: <code>{html.escape(rule)}</code>\nLần đầu: {first_run}",
+            parse_mode=ParseMode.HTML
+        )
+        return True
+
     async def process_schedule_time(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Nhận thời gian, tạo lịch"""
+        """Nhận thời gian (hoặc quy tắc lặp cron/RRULE), tạo lịch"""
         input_text = update.message.text.strip()
         user_id = update.effective_user.id if update.effective_user else 0
         state = self.user_states.get(user_id, {})
+        if self._is_recurrence_input(input_text):
+            post_data = state.get('post_data', {})
+            if not post_data:
+                await update.message.reply_text("❌ Chưa có nội dung bài đăng!")
+                return
+            channels, target = await self._scheduled_channels(state)
+            if await self.process_recurring_schedule(update, input_text, post_data, channels, target):
+                self.user_states.pop(user_id, None)
+            return
         try:
             day_part = datetime.strptime(input_text, "%H:%M %d/%m/%Y")
             if day_part < datetime.now():
@@ -2278,8 +2938,8 @@ class MassPostBot:
         if not post_data:
             await update.message.reply_text("❌ Chưa có nội dung bài đăng!")
             return
-        channels = await self.channel_manager.get_all_channels()
-        schedule_id = await self.scheduler.schedule_post(post_data, channels, day_part)
+        channels, target = await self._scheduled_channels(state)
+        schedule_id = await self.scheduler.schedule_post(post_data, channels, day_part, target=target)
         if user_id in self.user_states:
             self.user_states.pop(user_id)
         await update.message.reply_text(
@@ -2977,7 +3637,8 @@ class MassPostBot:
         try:
             # Xuất dữ liệu thống kê
             stats = await self.post_manager.get_statistics()
-            all_posts = await self.post_manager.get_post_history(limit=1000)
+            total_posts = await self.post_manager.get_total_posts()
+            all_posts = await self.post_manager.get_post_history(limit=20)
             
             export_text = (
                 f"📤 **Báo cáo lịch sử đăng bài**\n"
@@ -2990,7 +3651,7 @@ class MassPostBot:
                 f"• Hôm nay: {stats['today_posts']} bài\n"
                 f"• Kênh phổ biến: {stats['top_channel']}\n\n"
                 
-                f"📋 **Chi tiết {min(len(all_posts), 20)} bài gần nhất:**\n"
+                f"📋 **Chi tiết {len(all_posts)} bài gần nhất:**\n"
             )
             
             for i, post in enumerate(all_posts[:20], 1):
@@ -3010,8 +3671,8 @@ class MassPostBot:
                 
                 export_text += f"`{i}.` {post_id} ({post_type}) - {time_str} - {success_channels}/{total_channels} kênh\n"
             
-            if len(all_posts) > 20:
-                export_text += f"\n... và {len(all_posts) - 20} bài khác"
+            if total_posts > 20:
+                export_text += f"\n... và {total_posts - 20} bài khác"
             
             keyboard = [
                 [InlineKeyboardButton("💾 Lưu file JSON", callback_data="export_posts_json")],
@@ -3062,7 +3723,7 @@ class MassPostBot:
             await self.handle_set_setting(query, action)
         elif action.startswith("enable_all_notif") or action.startswith("disable_all_notif"):
             await self.handle_bulk_notification_toggle(query, action)
-        elif action.startswith("backup_now") or action.startswith("export_now") or action.startswith("confirm_reset"):
+        elif action.startswith("backup_now") or action.startswith("list_backups") or action.startswith("export_now") or action.startswith("confirm_reset"):
             await self.handle_settings_action(query, action)
         else:
             await query.answer("🚧 Cài đặt này đang phát triển!", show_alert=False)
@@ -3615,9 +4276,10 @@ class MassPostBot:
             "error_notifications"
         ]
         
-        # Cập nhật tất cả
-        for key in notification_keys:
-            self.settings_manager.set_setting("notifications", key, enable_all)
+        # Cập nhật tất cả (một lần ghi file)
+        with self.settings_manager.batch():
+            for key in notification_keys:
+                self.settings_manager.set_setting("notifications", key, enable_all)
         
         action_text = "bật" if enable_all else "tắt"
         await query.answer(f"✅ Đã {action_text} tất cả thông báo!", show_alert=True)
@@ -3637,6 +4299,15 @@ class MassPostBot:
                     await query.answer("❌ Không thể tạo backup!", show_alert=True)
                 await self.show_backup_settings(query)
                 
+            elif action == "list_backups":
+                # Liệt kê backup từ manifest của kho backup
+                backups = self.settings_manager.list_backups()[:10]
+                if backups:
+                    lines = [f"• {b['id']} ({b['size']} byte)" for b in backups]
+                    await query.answer("📋 Backup gần nhất:\n" + "\n".join(lines)[:190], show_alert=True)
+                else:
+                    await query.answer("📭 Chưa có backup nào!", show_alert=True)
+                
             elif action == "export_now":
                 # Xuất cài đặt
                 export_path = self.settings_manager.export_settings()
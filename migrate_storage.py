@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chuyển dữ liệu JSON của bot sang backend SQLite theo kiểu streaming.
+
+Mỗi file nguồn được đọc tuần tự từng bản ghi (không dùng json.load cho cả file),
+ghi vào SQLite theo từng lô trong một transaction, lưu tiến độ để có thể chạy tiếp
+khi bị gián đoạn và kiểm tra lại số bản ghi + checksum sau khi chuyển xong.
+
+Ví dụ:
+    python migrate_storage.py --target bot_storage.db
+    python migrate_storage.py --target bot_storage.db --only analytics --batch-size 2000
+    python migrate_storage.py --target bot_storage.db --verify-only
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import logging
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# (collection, file nguồn, các key cấp 1 cần tách tiếp thành từng bản ghi)
+MIGRATION_SOURCES: List[Tuple[str, str, Tuple[str, ...]]] = [
+    ("channels", Config.CHANNELS_DB_FILE, ()),
+    ("posts", Config.POSTS_DB_FILE, ()),
+    ("scheduled_posts", Config.SCHEDULED_POSTS_DB_FILE, ()),
+    ("analytics", "analytics_data.json",
+     ("posts", "channels", "daily_stats", "user_activity", "performance_metrics", "errors")),
+    ("bot_data", "bot_data.json",
+     ("warnings", "banned_users", "muted_users", "user_stats", "group_settings")),
+    ("media_index", os.path.join("media_library", "media_index.json"), ("files", "tags")),
+]
+
+CHECKSUM_MODULUS = 1 << 256
+
+# Ký tự có thể còn nằm trong một số JSON (phần thập phân, số mũ)
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+class JSONStreamReader:
+    """Đọc tuần tự các phần tử của object/array JSON mà không nạp cả file vào bộ nhớ"""
+
+    def __init__(self, fp, chunk_size: int = 64 * 1024):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        """Đọc thêm dữ liệu vào buffer, bỏ phần đã xử lý"""
+        if self.eof:
+            return False
+        chunk = self.fp.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Bỏ qua khoảng trắng và trả về ký tự kế tiếp ('' nếu hết file)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"JSON không hợp lệ: cần '{char}' nhưng gặp '{found or 'EOF'}'")
+        self.pos += 1
+
+    def _read_value(self) -> Any:
+        """Giải mã một giá trị JSON hoàn chỉnh tại vị trí hiện tại"""
+        self._peek()
+        read_size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Giá trị bị cắt ngang ở cuối buffer -> đọc thêm rồi thử lại
+                if not self._fill(read_size):
+                    raise
+                read_size *= 2
+                continue
+            if (
+                isinstance(value, (int, float)) and not isinstance(value, bool)
+                and all(char in _NUMBER_CHARS for char in self.buf[end:])
+                and self._fill(read_size)
+            ):
+                # Số ở cuối buffer có thể bị cắt ngang ("98." | "5", "1e" | "5") -> đọc thêm rồi giải mã lại
+                continue
+            self.pos = end
+            return value
+
+    def _iter_members(self) -> Iterator[Tuple[Any, Any]]:
+        """Duyệt (key, value) của object hoặc (index, value) của array tại vị trí hiện tại"""
+        opener = self._peek()
+        if opener not in "{[" or not opener:
+            raise ValueError("Chỉ hỗ trợ streaming object hoặc array")
+        closer = "}" if opener == "{" else "]"
+        self.pos += 1
+
+        index = 0
+        if self._peek() == closer:
+            self.pos += 1
+            return
+        while True:
+            if opener == "{":
+                key = self._read_value()
+                self._expect(":")
+            else:
+                key = index
+            yield key, None
+            index += 1
+            separator = self._peek()
+            self.pos += 1
+            if separator == closer:
+                return
+            if separator != ",":
+                raise ValueError(f"JSON không hợp lệ: gặp '{separator or 'EOF'}' giữa các phần tử")
+
+    def iter_records(self, expand: Sequence[str] = ()) -> Iterator[Tuple[str, Any]]:
+        """
+        Duyệt các bản ghi cấp cao nhất của file.
+
+        Args:
+            expand: Các key cấp 1 có giá trị lớn (list/dict) cần tách tiếp,
+                    bản ghi con có key dạng "<key>/<key con>"
+        """
+        for key, _ in self._iter_members():
+            opener = self._peek()
+            if str(key) in expand and opener in ("{", "["):
+                empty = True
+                for sub_key, _ in self._iter_members():
+                    empty = False
+                    yield f"{key}/{sub_key}", self._read_value()
+                if empty:
+                    # Container rỗng vẫn được giữ làm một bản ghi để migration không mất key
+                    yield str(key), {} if opener == "{" else []
+            else:
+                yield str(key), self._read_value()
+
+
+def canonical_json(value: Any) -> str:
+    """Chuỗi JSON chuẩn hóa để lưu và tính checksum"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def record_digest(record_key: str, value_json: str) -> int:
+    """Hash của một bản ghi; checksum collection là tổng các hash nên không phụ thuộc thứ tự"""
+    digest = hashlib.sha256(f"{record_key}\0{value_json}".encode("utf-8")).digest()
+    return int.from_bytes(digest, "big")
+
+
+class SQLiteMigrationTarget:
+    """Backend SQLite đích: bảng records + bảng tiến độ migration"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                collection TEXT NOT NULL,
+                record_key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (collection, record_key)
+            );
+            CREATE TABLE IF NOT EXISTS migration_progress (
+                collection TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                source_size INTEGER NOT NULL,
+                source_mtime REAL NOT NULL,
+                records_done INTEGER NOT NULL DEFAULT 0,
+                checksum TEXT NOT NULL DEFAULT '0',
+                completed INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT
+            );
+            """
+        )
+
+    def close(self):
+        self.conn.close()
+
+    def get_progress(self, collection: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT source, source_size, source_mtime, records_done, checksum, completed "
+            "FROM migration_progress WHERE collection = ?",
+            (collection,)
+        ).fetchone()
+        if not row:
+            return None
+        return {
+            "source": row[0],
+            "source_size": row[1],
+            "source_mtime": row[2],
+            "records_done": row[3],
+            "checksum": int(row[4], 16),
+            "completed": bool(row[5]),
+        }
+
+    def reset_collection(self, collection: str, source: str, size: int, mtime: float):
+        """Xóa dữ liệu cũ của collection và bắt đầu lại từ đầu"""
+        with self.conn:
+            self.conn.execute("DELETE FROM records WHERE collection = ?", (collection,))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO migration_progress "
+                "(collection, source, source_size, source_mtime, records_done, checksum, completed, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, '0', 0, ?)",
+                (collection, source, size, mtime, datetime.now().isoformat())
+            )
+
+    def write_batch(self, collection: str, rows: List[Tuple[str, str]],
+                    records_done: int, checksum: int, completed: bool = False):
+        """Ghi một lô bản ghi cùng tiến độ trong cùng một transaction"""
+        with self.conn:
+            if rows:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO records (collection, record_key, value) VALUES (?, ?, ?)",
+                    [(collection, key, value) for key, value in rows]
+                )
+            self.conn.execute(
+                "UPDATE migration_progress SET records_done = ?, checksum = ?, completed = ?, updated_at = ? "
+                "WHERE collection = ?",
+                (records_done, format(checksum, "x"), int(completed), datetime.now().isoformat(), collection)
+            )
+
+    def compute_checksum(self, collection: str) -> Tuple[int, int]:
+        """Đếm và tính checksum dữ liệu đã ghi (đọc theo cursor, không nạp hết)"""
+        count = 0
+        checksum = 0
+        cursor = self.conn.execute(
+            "SELECT record_key, value FROM records WHERE collection = ?", (collection,)
+        )
+        for record_key, value in cursor:
+            count += 1
+            checksum = (checksum + record_digest(record_key, value)) % CHECKSUM_MODULUS
+        return count, checksum
+
+
+def migrate_collection(
+    target: SQLiteMigrationTarget,
+    collection: str,
+    source: str,
+    expand: Sequence[str] = (),
+    batch_size: int = 500,
+    restart: bool = False
+) -> Dict[str, Any]:
+    """
+    Chuyển một file JSON sang collection trong SQLite.
+
+    Returns:
+        Dict chứa kết quả (số bản ghi, checksum, trạng thái)
+    """
+    if not os.path.exists(source):
+        return {"collection": collection, "success": True, "skipped": True, "reason": "không có file nguồn"}
+
+    stat = os.stat(source)
+    progress = target.get_progress(collection)
+    source_changed = (
+        progress is None
+        or progress["source"] != source
+        or progress["source_size"] != stat.st_size
+        or progress["source_mtime"] != stat.st_mtime
+    )
+    if restart or source_changed:
+        if progress and source_changed and not restart:
+            logger.warning(f"File {source} đã thay đổi kể từ lần chạy trước, chuyển lại từ đầu")
+        target.reset_collection(collection, source, stat.st_size, stat.st_mtime)
+        progress = target.get_progress(collection)
+    elif progress["completed"]:
+        return {
+            "collection": collection,
+            "success": True,
+            "records": progress["records_done"],
+            "checksum": progress["checksum"],
+            "resumed_from": progress["records_done"],
+            "already_completed": True,
+        }
+
+    resumed_from = progress["records_done"]
+    records_done = resumed_from
+    checksum = progress["checksum"]
+    batch: List[Tuple[str, str]] = []
+
+    with open(source, "r", encoding="utf-8") as f:
+        reader = JSONStreamReader(f)
+        for index, (record_key, value) in enumerate(reader.iter_records(expand)):
+            if index < resumed_from:
+                continue
+            value_json = canonical_json(value)
+            batch.append((record_key, value_json))
+            checksum = (checksum + record_digest(record_key, value_json)) % CHECKSUM_MODULUS
+            records_done += 1
+            if len(batch) >= batch_size:
+                target.write_batch(collection, batch, records_done, checksum)
+                batch = []
+
+    target.write_batch(collection, batch, records_done, checksum, completed=True)
+    logger.info(f"Đã chuyển {records_done} bản ghi từ {source} sang collection {collection}")
+
+    return {
+        "collection": collection,
+        "success": True,
+        "records": records_done,
+        "checksum": checksum,
+        "resumed_from": resumed_from,
+    }
+
+
+def verify_collection(target: SQLiteMigrationTarget, collection: str, source: str,
+                      expand: Sequence[str] = ()) -> Dict[str, Any]:
+    """So sánh số bản ghi và checksum giữa file nguồn và SQLite"""
+    if not os.path.exists(source):
+        return {"collection": collection, "success": True, "skipped": True}
+
+    source_count = 0
+    source_checksum = 0
+    with open(source, "r", encoding="utf-8") as f:
+        for record_key, value in JSONStreamReader(f).iter_records(expand):
+            source_count += 1
+            source_checksum = (source_checksum + record_digest(record_key, canonical_json(value))) % CHECKSUM_MODULUS
+
+    target_count, target_checksum = target.compute_checksum(collection)
+    return {
+        "collection": collection,
+        "success": source_count == target_count and source_checksum == target_checksum,
+        "source_records": source_count,
+        "target_records": target_count,
+        "checksum_match": source_checksum == target_checksum,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chuyển dữ liệu JSON của bot sang SQLite (streaming)")
+    parser.add_argument("--target", default="bot_storage.db", help="File SQLite đích")
+    parser.add_argument("--batch-size", type=int, default=500, help="Số bản ghi mỗi transaction")
+    parser.add_argument("--only", nargs="*", help="Chỉ chuyển các collection này")
+    parser.add_argument("--restart", action="store_true", help="Bỏ tiến độ cũ, chuyển lại từ đầu")
+    parser.add_argument("--verify-only", action="store_true", help="Chỉ kiểm tra, không chuyển")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    sources = [s for s in MIGRATION_SOURCES if not args.only or s[0] in args.only]
+    target = SQLiteMigrationTarget(args.target)
+    all_ok = True
+    try:
+        for collection, source, expand in sources:
+            if not args.verify_only:
+                result = migrate_collection(
+                    target, collection, source, expand,
+                    batch_size=max(1, args.batch_size), restart=args.restart
+                )
+                if result.get("skipped"):
+                    print(f"⏭️  {collection}: bỏ qua ({result['reason']})")
+                    continue
+                note = f" (tiếp tục từ {result['resumed_from']})" if result["resumed_from"] else ""
+                print(f"📦 {collection}: {result['records']} bản ghi{note}")
+
+            check = verify_collection(target, collection, source, expand)
+            if check.get("skipped"):
+                continue
+            if check["success"]:
+                print(f"✅ {collection}: khớp {check['target_records']} bản ghi, checksum OK")
+            else:
+                all_ok = False
+                print(
+                    f"❌ {collection}: nguồn {check['source_records']} / đích {check['target_records']} bản ghi, "
+                    f"checksum {'OK' if check['checksum_match'] else 'KHÔNG khớp'}"
+                )
+    finally:
+        target.close()
+
+    return 0 if all_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# once: chạy bù một lần rồi nhảy tới lần kế tiếp trong tương lai (gộp các lần lỡ)
+# skip: bỏ qua các lần lỡ, chờ lần kế tiếp
+# all:  chạy bù từng lần đã lỡ (tối đa MISFIRE_MAX_CATCH_UP lần gần nhất)
+MISFIRE_POLICIES = ('once', 'skip', 'all')
+
+
+def misfire_settings(schedule_info: Dict[str, Any]) -> Tuple[str, float]:
+    """(chính sách, thời gian ân hạn giây) của một lịch; mặc định lấy từ Config"""
+    from config import Config
+    policy = schedule_info.get('misfire_policy') or Config.MISFIRE_POLICY
+    if policy not in MISFIRE_POLICIES:
+        policy = 'once'
+    grace = schedule_info.get('misfire_grace')
+    if grace is None:
+        grace = Config.MISFIRE_GRACE_SECONDS
+    return policy, float(grace)
+
+
+def trim_missed(recurrence, current: datetime, now: datetime, limit: int) -> Tuple[datetime, int]:
+    """
+    Giữ lại tối đa `limit` lần lỡ gần nhất (từ `current` tới `now`) của một lịch lặp.
+
+    Trả về (lần cần chạy tiếp theo, số lần bị bỏ qua). Các lần lỡ được sinh lười
+    và chỉ giữ `limit` lần cuối trong bộ nhớ.
+    """
+    if limit <= 0:
+        return current, 0
+    kept = deque([current], maxlen=limit)
+    total = 1
+    for occurrence in recurrence.iter_after(current):
+        if occurrence > now:
+            break
+        kept.append(occurrence)
+        total += 1
+    return kept[0], total - len(kept)
+
+
+class CatchUpPlanner:
+    """
+    Xếp các lần chạy bù vào một "làn" riêng: mỗi lần chiếm ít nhất `spacing` giây và đủ lâu
+    để gửi hết số kênh của nó với tốc độ `rate` tin/giây. Nhờ vậy sau khi bot khởi động lại,
+    các lịch quá hạn được chạy lần lượt thay vì dồn một lúc vượt giới hạn của Telegram.
+    """
+
+    def __init__(self, spacing: float, rate: float):
+        self.spacing = max(0.0, spacing)
+        self.rate = rate
+        self.free_at = 0.0  # epoch lúc làn chạy bù rảnh
+
+    def slot(self, channel_count: int, now: float) -> float:
+        """Đặt chỗ cho một lần chạy bù gửi tới `channel_count` kênh, trả về thời điểm chạy"""
+        start = max(now, self.free_at)
+        duration = channel_count / self.rate if self.rate > 0 else 0.0
+        self.free_at = start + max(self.spacing, duration)
+        return start
+
+    def backlog(self, now: float) -> float:
+        """Số giây còn lại tới khi làn chạy bù rảnh"""
+        return max(0.0, self.free_at - now)
+
+
+def deferred_iso(timestamp: float) -> str:
+    """Thời điểm chạy bù dạng ISO (giờ máy, có múi giờ)"""
+    return datetime.fromtimestamp(timestamp).astimezone().isoformat()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import struct
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Set
+import logging
+
+from records import json_default
+
+logger = logging.getLogger(__name__)
+
+# Mỗi entry index: created_at (ASCII, đệm tới 32 byte) + offset dòng trong file dữ liệu
+INDEX_ENTRY = struct.Struct('<32sQ')
+
+
+class PostArchive:
+    """
+    Kho lưu bài đăng cũ trên đĩa, sắp xếp theo created_at.
+
+    - `<db>.archive.jsonl`: mỗi dòng một bài đăng (JSON), theo thứ tự thời gian
+    - `<db>.archive.idx`: index nhị phân kích thước cố định -> đọc trang bất kỳ bằng seek
+    - `<db>.archive.meta.json`: số liệu tổng hợp để thống kê không cần đọc lại dữ liệu
+
+    Mọi thao tác ghi chạy trong `lock` (PostManager truyền khóa của posts.json): bot và
+    dashboard cùng chuyển bài sang kho / xóa bài cũ mà không ghi chồng lên nhau.
+    """
+
+    def __init__(self, db_file: str = "posts.json", lock: Optional[Callable[[], ContextManager]] = None):
+        base, _ = os.path.splitext(db_file)
+        self.data_file = f"{base}.archive.jsonl"
+        self.index_file = f"{base}.archive.idx"
+        self.meta_file = f"{base}.archive.meta.json"
+        self._meta: Optional[Dict[str, Any]] = None
+        self._locked = lock or nullcontext
+
+    # ---------- Metadata ----------
+
+    @staticmethod
+    def _empty_meta() -> Dict[str, Any]:
+        return {'successful_posts': 0, 'channels': {}}
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        """Số liệu tổng hợp của các bài đã lưu trữ (tải lười)"""
+        if self._meta is None:
+            self._meta = self._empty_meta()
+            if os.path.exists(self.meta_file):
+                try:
+                    with open(self.meta_file, 'r', encoding='utf-8') as f:
+                        self._meta.update(json.load(f))
+                except Exception as e:
+                    logger.error(f"Lỗi khi tải metadata lưu trữ bài đăng: {e}")
+        return self._meta
+
+    def _save_meta(self):
+        with open(self.meta_file, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+
+    def _apply_to_meta(self, post: Dict[str, Any], sign: int = 1):
+        """Cộng (sign=1) hoặc trừ (sign=-1) một bài đăng vào số liệu tổng hợp"""
+        meta = self.meta
+        if post.get('successful_sends', 0) > 0:
+            meta['successful_posts'] += sign
+        for channel_id, result in post.get('channels', {}).items():
+            stats = meta['channels'].setdefault(
+                str(channel_id), {'title': result.get('channel_title', 'Unknown'), 'success': 0, 'failed': 0}
+            )
+            stats['success' if result.get('success', False) else 'failed'] += sign
+
+    # ---------- Đọc ----------
+
+    def count(self) -> int:
+        """Số bài đã lưu trữ (O(1), chỉ cần stat file index)"""
+        if not os.path.exists(self.index_file):
+            return 0
+        return os.path.getsize(self.index_file) // INDEX_ENTRY.size
+
+    def _read_entries(self, start: int, stop: int) -> List[tuple]:
+        """Đọc entry index trong khoảng [start, stop)"""
+        if stop <= start:
+            return []
+        with open(self.index_file, 'rb') as f:
+            f.seek(start * INDEX_ENTRY.size)
+            raw = f.read((stop - start) * INDEX_ENTRY.size)
+        return [
+            (created_at.rstrip(b'\0').decode('ascii'), offset)
+            for created_at, offset in INDEX_ENTRY.iter_unpack(raw)
+        ]
+
+    def _last_created_at(self) -> Optional[str]:
+        total = self.count()
+        if total == 0:
+            return None
+        return self._read_entries(total - 1, total)[0][0]
+
+    def _first_at_or_after(self, created_at: str) -> int:
+        """Vị trí entry đầu tiên có created_at >= `created_at` (tìm nhị phân trên index)"""
+        lo, hi = 0, self.count()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._read_entries(mid, mid + 1)[0][0] < created_at:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _ids_since(self, created_at: str) -> Set[str]:
+        """ID các bài đã lưu trữ có created_at >= `created_at` (chỉ đọc phần cuối kho)"""
+        start = self._first_at_or_after(created_at)
+        if start >= self.count():
+            return set()
+        ids = set()
+        with open(self.data_file, 'rb') as f:
+            f.seek(self._read_entries(start, start + 1)[0][1])
+            for line in f:
+                if line.strip():
+                    ids.add(json.loads(line).get('id'))
+        return ids
+
+    def _not_archived(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Bỏ các bài đã có trong kho (tiến trình khác vừa chuyển cùng bài sang)"""
+        last = self._last_created_at()
+        if last is None:
+            return posts
+        overlap = [post.get('created_at', '') for post in posts if post.get('created_at', '') <= last]
+        if not overlap:
+            return posts
+        archived = self._ids_since(min(overlap)[:32])
+        return [post for post in posts if post.get('id') not in archived]
+
+    def read_newest(self, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        """Đọc một trang bài đăng, mới nhất trước (offset tính từ bài mới nhất)"""
+        total = self.count()
+        stop = max(0, total - offset)
+        start = max(0, stop - limit)
+        entries = self._read_entries(start, stop)
+        posts = []
+        if entries:
+            with open(self.data_file, 'rb') as f:
+                for _, line_offset in reversed(entries):
+                    f.seek(line_offset)
+                    posts.append(json.loads(f.readline()))
+        return posts
+
+    def iter_posts(self) -> Iterator[Dict[str, Any]]:
+        """Duyệt toàn bộ bài đã lưu trữ theo thứ tự thời gian (streaming)"""
+        if not os.path.exists(self.data_file):
+            return
+        with open(self.data_file, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def find(self, post_id: str) -> Optional[Dict[str, Any]]:
+        """Tìm bài đã lưu trữ theo ID (quét tuần tự, chỉ dùng khi không có trong bộ nhớ)"""
+        needle = json.dumps(post_id, ensure_ascii=False)
+        for post in self._iter_matching_lines(needle):
+            if post.get('id') == post_id:
+                return post
+        return None
+
+    def _iter_matching_lines(self, needle: str) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(self.data_file):
+            return
+        encoded = needle.encode('utf-8')
+        with open(self.data_file, 'rb') as f:
+            for line in f:
+                if encoded in line:
+                    yield json.loads(line)
+
+    # ---------- Ghi ----------
+
+    def append(self, posts: List[Dict[str, Any]]) -> int:
+        """Thêm các bài (đã sắp xếp theo created_at) vào cuối kho lưu trữ, bỏ qua bài đã có; trả về số bài đã thêm"""
+        with self._locked():
+            self._meta = None  # tiến trình khác có thể vừa cập nhật số liệu
+            posts = self._not_archived(posts)
+            if posts:
+                self._append(posts)
+        return len(posts)
+
+    def _append(self, posts: List[Dict[str, Any]]):
+        last = self._last_created_at()
+        if last is not None and posts[0].get('created_at', '') < last:
+            # Hiếm gặp: bài cũ hơn phần đã lưu trữ -> ghi lại toàn bộ để giữ thứ tự
+            logger.warning("Bài đăng lưu trữ không theo thứ tự thời gian, sắp xếp lại kho lưu trữ")
+            merged = sorted(list(self.iter_posts()) + posts, key=lambda p: p.get('created_at', ''))
+            self._rewrite(merged)
+            for post in posts:
+                self._apply_to_meta(post)
+            self._save_meta()
+            return
+
+        with open(self.data_file, 'ab') as data_f, open(self.index_file, 'ab') as index_f:
+            offset = data_f.tell()
+            for post in posts:
+                line = json.dumps(post, ensure_ascii=False, default=json_default).encode('utf-8') + b'\n'
+                data_f.write(line)
+                index_f.write(INDEX_ENTRY.pack(post.get('created_at', '').encode('ascii', 'ignore')[:32], offset))
+                offset += len(line)
+                self._apply_to_meta(post)
+        self._save_meta()
+
+    def _rewrite(self, posts):
+        """Ghi lại toàn bộ kho lưu trữ từ một iterable bài đăng đã sắp xếp"""
+        tmp_data = f"{self.data_file}.tmp"
+        tmp_index = f"{self.index_file}.tmp"
+        with open(tmp_data, 'wb') as data_f, open(tmp_index, 'wb') as index_f:
+            offset = 0
+            for post in posts:
+                line = json.dumps(post, ensure_ascii=False, default=json_default).encode('utf-8') + b'\n'
+                data_f.write(line)
+                index_f.write(INDEX_ENTRY.pack(post.get('created_at', '').encode('ascii', 'ignore')[:32], offset))
+                offset += len(line)
+        os.replace(tmp_data, self.data_file)
+        os.replace(tmp_index, self.index_file)
+
+    def remove(self, post_id: str) -> bool:
+        """Xóa một bài khỏi kho lưu trữ"""
+        removed = []
+
+        def keep(post):
+            if post.get('id') == post_id:
+                removed.append(post)
+                return False
+            return True
+
+        with self._locked():
+            if self.find(post_id) is None:
+                return False
+            self._meta = None
+            self._rewrite(post for post in self.iter_posts() if keep(post))
+            for post in removed:
+                self._apply_to_meta(post, -1)
+            self._save_meta()
+        return bool(removed)
+
+    def truncate_before(
+        self,
+        cutoff: str,
+        on_removed: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> int:
+        """Xóa các bài có created_at < cutoff (tìm nhị phân trên index), trả về số bài đã xóa"""
+        with self._locked():
+            self._meta = None
+            return self._truncate_before(cutoff, on_removed)
+
+    def _truncate_before(self, cutoff: str, on_removed: Optional[Callable[[Dict[str, Any]], None]]) -> int:
+        total = self.count()
+        lo = self._first_at_or_after(cutoff)
+        if lo == 0:
+            return 0
+
+        entries = self._read_entries(0, total)
+        split_offset = entries[lo][1] if lo < total else os.path.getsize(self.data_file)
+        with open(self.data_file, 'rb') as f:
+            for _ in range(lo):
+                post = json.loads(f.readline())
+                self._apply_to_meta(post, -1)
+                if on_removed:
+                    on_removed(post)
+            f.seek(split_offset)
+            tail = f.read()
+
+        tmp_data = f"{self.data_file}.tmp"
+        tmp_index = f"{self.index_file}.tmp"
+        with open(tmp_data, 'wb') as data_f:
+            data_f.write(tail)
+        with open(tmp_index, 'wb') as index_f:
+            for created_at, offset in entries[lo:]:
+                index_f.write(INDEX_ENTRY.pack(created_at.encode('ascii'), offset - split_offset))
+        os.replace(tmp_data, self.data_file)
+        os.replace(tmp_index, self.index_file)
+        self._save_meta()
+        return lo
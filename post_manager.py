@@ -5,10 +5,17 @@ import json
 import os
 import asyncio
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, List, Optional, Any
 from telegram import Bot, InputMediaPhoto, InputMediaVideo, InputMediaDocument
 from telegram.constants import ParseMode
-from telegram.error import TelegramError
+from telegram.error import RetryAfter, TelegramError
+from config import Config
+from post_archive import PostArchive
+from history_rollups import DailyRollups, rollup_file_for, merge_channel_counts
+from file_sync import SharedJSONStore
+from records import PostRecord, DeliveryResult, json_default
+from rate_limiter import TokenBucket
+from expiry import delivery_expiry, expiry_time, is_expiry_pending
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,37 +24,107 @@ logger = logging.getLogger(__name__)
 class PostManager:
     """Quản lý bài đăng và gửi hàng loạt"""
     
-    def __init__(self, db_file: str = "posts.json"):
+    def __init__(
+        self,
+        db_file: str = "posts.json",
+        window_days: Optional[int] = None,
+        window_posts: Optional[int] = None
+    ):
         self.db_file = db_file
-        self.posts = {}  # post_id: post_info
+        self._store = SharedJSONStore(db_file, record_type=PostRecord)  # khóa file + theo dõi thay đổi từ dashboard
+        self.posts = {}  # post_id: post_info (chỉ phần nằm trong cửa sổ)
+        self.window_days = Config.POST_HISTORY_WINDOW_DAYS if window_days is None else window_days
+        self.window_posts = Config.POST_HISTORY_WINDOW_POSTS if window_posts is None else window_posts
+        self.archive = PostArchive(db_file, lock=self._store.locked)  # ghi kho lưu trữ dưới khóa của posts.json
+        self.rollups = DailyRollups(rollup_file_for(db_file))  # số liệu theo ngày của bài đã dọn
+        # Ngân sách gửi chung cho mọi lần gửi đồng thời qua manager này (kể cả lịch đăng)
+        self.rate_limiter = TokenBucket(Config.SEND_RATE_PER_SECOND)
+        self._sending = set()  # ID các bài đang gửi (chưa nằm trong self.posts)
+        self.on_expiry = None  # ExpiryWorker.schedule: nhận (post_id, expires_at) của bài có hạn tự xóa
         self.load_posts()
     
     def load_posts(self):
         """Tải lịch sử bài đăng từ file"""
         if os.path.exists(self.db_file):
             try:
-                with open(self.db_file, 'r', encoding='utf-8') as f:
-                    self.posts = json.load(f)
+                self.posts = self._store.load() or {}
                 logger.info(f"Đã tải {len(self.posts)} bài đăng từ {self.db_file}")
             except Exception as e:
                 logger.error(f"Lỗi khi tải bài đăng: {e}")
                 self.posts = {}
         else:
             self.posts = {}
+
+        self._enforce_window()
+
+    @property
+    def windowed(self) -> bool:
+        """Có đang giới hạn số bài giữ trong bộ nhớ không"""
+        return self.window_days > 0 or self.window_posts > 0
+
+    def _enforce_window(self, changed: Iterable[str] = ()) -> int:
+        """
+        Chuyển các bài nằm ngoài cửa sổ sang kho lưu trữ rồi lưu posts.json, trả về số bài đã chuyển.
+        `changed`: các bài vừa thêm/sửa, được lưu cùng lần ghi đó.
+
+        Chạy dưới khóa của posts.json: bot và dashboard không cùng chuyển một bài hai lần
+        (bài tiến trình kia vừa chuyển được nạp lại là đã xóa, bài đã có trong kho bị bỏ qua).
+        """
+        if not self.windowed or not self.posts:
+            return 0
+        with self._store.locked():
+            self._sync()
+            return self._evict_outside_window(changed)
+
+    def _evict_outside_window(self, changed: Iterable[str] = ()) -> int:
+        # Bài chưa tự xóa xong phải ở lại bộ nhớ để worker ghi được trạng thái xóa
+        ordered = sorted(
+            (p for p in self.posts.values() if not is_expiry_pending(p)),
+            key=lambda p: p.get('created_at', '')
+        )
+        keep_from = 0
+        if self.window_days > 0:
+            cutoff = (datetime.now() - timedelta(days=self.window_days)).isoformat()
+            while keep_from < len(ordered) and ordered[keep_from].get('created_at', '') < cutoff:
+                keep_from += 1
+        if self.window_posts > 0:
+            keep_from = max(keep_from, len(ordered) - self.window_posts)
+        if keep_from == 0:
+            return 0
+
+        evicted = ordered[:keep_from]
+        appended = self.archive.append(evicted)
+        for post in evicted:
+            del self.posts[post['id']]
+        self.save_posts([*changed, *(post['id'] for post in evicted)])
+        logger.info(f"Đã chuyển {appended}/{len(evicted)} bài đăng cũ sang kho lưu trữ {self.archive.data_file}")
+        return len(evicted)
     
-    def save_posts(self):
-        """Lưu lịch sử bài đăng vào file"""
+    def save_posts(self, changed: Optional[Iterable[str]] = None):
+        """Lưu lịch sử bài đăng vào file; `changed`: các bài đã thêm/sửa/xóa (None = không rõ, như mọi bài đều đổi)"""
         try:
-            with open(self.db_file, 'w', encoding='utf-8') as f:
-                json.dump(self.posts, f, ensure_ascii=False, indent=2)
+            self._store.save(self.posts, changed=changed)
             logger.info(f"Đã lưu {len(self.posts)} bài đăng vào {self.db_file}")
         except Exception as e:
             logger.error(f"Lỗi khi lưu bài đăng: {e}")
+
+    def save_snapshot(self) -> bool:
+        """Ghi snapshot nhị phân để lần khởi động sau nạp nhanh hơn"""
+        return self._store.write_snapshot(self.posts)
+    
+    def _sync(self):
+        """Nạp thay đổi từ file nếu tiến trình khác vừa ghi"""
+        self._store.refresh(self.posts)
     
     def create_post_id(self) -> str:
-        """Tạo ID duy nhất cho bài đăng"""
+        """Tạo ID duy nhất cho bài đăng (không trùng với bài đang gửi dở)"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return f"post_{timestamp}_{len(self.posts)}"
+        index = len(self.posts) + self.archive.count()
+        post_id = f"post_{timestamp}_{index}"
+        while post_id in self.posts or post_id in self._sending:
+            index += 1
+            post_id = f"post_{timestamp}_{index}"
+        return post_id
     
     async def send_to_multiple_channels(
         self, 
@@ -63,25 +140,27 @@ class PostManager:
             post_data: Dữ liệu bài đăng
             channels: Danh sách kênh
             bot: Bot instance
-            delay_between_sends: Delay giữa các lần gửi (giây)
+            delay_between_sends: Delay giữa các lần gửi (giây), 0 = gửi đồng thời
+                trong giới hạn SEND_CONCURRENCY / SEND_RATE_PER_SECOND
             
         Returns:
             Dict chứa kết quả gửi
         """
         post_id = self.create_post_id()
+        self._sending.add(post_id)
         
         # Tạo bản ghi bài đăng
-        post_record = {
-            'id': post_id,
-            'content': post_data.get('content', ''),
-            'type': post_data.get('type', 'text'),
-            'created_at': datetime.now().isoformat(),
-            'channels': {},
-            'total_channels': len(channels),
-            'successful_sends': 0,
-            'failed_sends': 0,
-            'status': 'sending'
-        }
+        post_record = PostRecord(
+            id=post_id,
+            content=post_data.get('content', ''),
+            type=post_data.get('type', 'text'),
+            created_at=datetime.now().isoformat(),
+            channels={},
+            total_channels=len(channels),
+            successful_sends=0,
+            failed_sends=0,
+            status='sending'
+        )
         
         results = {
             'post_id': post_id,
@@ -91,78 +170,145 @@ class PostManager:
             'results': []
         }
         
-        # Gửi đến từng kênh
-        for i, channel in enumerate(channels):
-            try:
-                # Delay giữa các lần gửi
-                if i > 0 and delay_between_sends > 0:
+        if delay_between_sends > 0:
+            # Gửi lần lượt, cách nhau delay_between_sends giây
+            delivered = []
+            for i, channel in enumerate(channels):
+                if i > 0:
                     await asyncio.sleep(delay_between_sends)
-                
-                # Gửi bài đăng
-                message = await self.send_to_channel(post_data, channel, bot)
-                
-                if message:
-                    # Thành công
-                    channel_result = {
-                        'channel_id': channel['id'],
-                        'channel_title': channel['title'],
-                        'success': True,
-                        'message_id': message.message_id,
-                        'sent_at': datetime.now().isoformat()
-                    }
-                    results['successful_sends'] += 1
-                    post_record['successful_sends'] += 1
-                else:
-                    # Thất bại
-                    channel_result = {
-                        'channel_id': channel['id'],
-                        'channel_title': channel['title'],
-                        'success': False,
-                        'error': 'Không thể gửi tin nhắn',
-                        'sent_at': datetime.now().isoformat()
-                    }
-                    results['failed_sends'] += 1
-                    post_record['failed_sends'] += 1
-                
-                results['results'].append(channel_result)
-                post_record['channels'][str(channel['id'])] = channel_result
-                
-            except Exception as e:
-                logger.error(f"Lỗi khi gửi đến kênh {channel['title']}: {e}")
-                
-                channel_result = {
-                    'channel_id': channel['id'],
-                    'channel_title': channel['title'],
-                    'success': False,
-                    'error': str(e),
-                    'sent_at': datetime.now().isoformat()
-                }
+                delivered.append(await self._deliver(post_data, channel, bot))
+        else:
+            # Gửi đồng thời, giới hạn bởi SEND_CONCURRENCY và ngân sách chung của rate_limiter
+            semaphore = asyncio.Semaphore(max(1, Config.SEND_CONCURRENCY))
+
+            async def deliver_limited(channel: Dict[str, Any]) -> DeliveryResult:
+                async with semaphore:
+                    await self.rate_limiter.acquire()
+                    return await self._deliver(post_data, channel, bot)
+
+            delivered = await asyncio.gather(*(deliver_limited(channel) for channel in channels))
+        
+        for channel, channel_result in zip(channels, delivered):
+            if channel_result['success']:
+                results['successful_sends'] += 1
+                post_record['successful_sends'] += 1
+            else:
                 results['failed_sends'] += 1
                 post_record['failed_sends'] += 1
-                results['results'].append(channel_result)
-                post_record['channels'][str(channel['id'])] = channel_result
+            results['results'].append(channel_result)
+            post_record['channels'][str(channel['id'])] = channel_result
         
         # Cập nhật trạng thái bài đăng
         post_record['status'] = 'completed'
         post_record['completed_at'] = datetime.now().isoformat()
         
         # Lưu bản ghi
-        self.posts[post_id] = post_record
-        self.save_posts()
+        self._store_post(post_record, post_data)
+        self._sending.discard(post_id)
+        if post_record.get('expires_at'):
+            results['expires_at'] = post_record['expires_at']
         
         return results
+
+    def record_sent_post(self, post_data: Dict[str, Any], delivered: List[DeliveryResult]) -> PostRecord:
+        """Lưu bài đã gửi thẳng qua bot (menu đăng bài) cùng message_id, để theo dõi và tự xóa khi hết hạn"""
+        now = datetime.now().isoformat()
+        successful = sum(1 for result in delivered if result.get('success'))
+        post_record = PostRecord(
+            id=self.create_post_id(),
+            content=post_data.get('content') or post_data.get('text') or post_data.get('caption') or '',
+            type=post_data.get('type', 'text'),
+            created_at=now,
+            channels={str(result['channel_id']): result for result in delivered},
+            total_channels=len(delivered),
+            successful_sends=successful,
+            failed_sends=len(delivered) - successful,
+            status='completed',
+            completed_at=now
+        )
+        self._store_post(post_record, post_data)
+        return post_record
+
+    def _store_post(self, post_record: PostRecord, post_data: Dict[str, Any]):
+        """
+        Lưu bài vừa gửi xong; nếu post_data có hạn tự xóa thì ghi expires_at và báo cho worker.
+
+        Hạn tính riêng cho từng kênh từ lúc gửi tới kênh đó (gửi lâu hoặc theo đợt thì tin gửi
+        sớm không bị giữ quá hạn); expires_at của bài là hạn sớm nhất.
+        """
+        now = datetime.now()
+        expires_at = expiry_time(post_data, now)
+        if expires_at is not None:
+            for result in post_record['channels'].values():
+                if result.get('success'):
+                    result_expires_at = delivery_expiry(post_data, result, now)
+                    result['expires_at'] = result_expires_at.isoformat()
+                    expires_at = min(expires_at, result_expires_at)
+            post_record['expires_at'] = expires_at.isoformat()
+        self.posts[post_record['id']] = post_record
+        if not self._enforce_window([post_record['id']]):
+            self.save_posts([post_record['id']])
+        if expires_at is not None and self.on_expiry is not None:
+            self.on_expiry(post_record['id'], expires_at)
+    
+    async def _deliver(self, post_data: Dict[str, Any], channel: Dict[str, Any], bot: Bot) -> DeliveryResult:
+        """Gửi tới một kênh và trả về kết quả; gặp RetryAfter thì tạm dừng ngân sách chung rồi thử lại một lần"""
+        error = None
+        messages = []
+        for attempt in range(2):
+            try:
+                messages = await self.send_messages(post_data, channel, bot)
+                error = None if messages else 'Không thể gửi tin nhắn'
+                break
+            except RetryAfter as e:
+                error = str(e)
+                retry_after = e.retry_after
+                self.rate_limiter.pause(getattr(retry_after, 'total_seconds', lambda: retry_after)())
+                if attempt == 0:
+                    await self.rate_limiter.acquire()
+            except Exception as e:
+                logger.error(f"Lỗi khi gửi đến kênh {channel['title']}: {e}")
+                error = str(e)
+                break
+        
+        if messages:
+            result = DeliveryResult(
+                channel_id=channel['id'],
+                channel_title=channel['title'],
+                success=True,
+                message_id=messages[0].message_id,
+                sent_at=datetime.now().isoformat()
+            )
+            if len(messages) > 1:
+                # Album: lưu mọi tin để tự xóa được cả album
+                result['message_ids'] = [message.message_id for message in messages]
+            return result
+        return DeliveryResult(
+            channel_id=channel['id'],
+            channel_title=channel['title'],
+            success=False,
+            error=error,
+            sent_at=datetime.now().isoformat()
+        )
     
     async def send_to_channel(self, post_data: Dict[str, Any], channel: Dict[str, Any], bot: Bot):
-        """Gửi bài đăng đến một kênh"""
+        """Gửi bài đăng đến một kênh, trả về tin đầu tiên đã gửi (None nếu lỗi)"""
+        messages = await self.send_messages(post_data, channel, bot)
+        return messages[0] if messages else None
+
+    async def send_messages(self, post_data: Dict[str, Any], channel: Dict[str, Any], bot: Bot) -> list:
+        """Gửi bài đăng đến một kênh, trả về mọi tin đã gửi (album có nhiều tin; [] nếu lỗi)"""
         try:
             channel_id = channel['id']
             post_type = post_data.get('type', 'text')
+            # Bài soạn trong bot lưu nội dung ở 'text' và file_id theo loại ('photo', 'video'...)
+            media = post_data.get('media') or post_data.get(post_type)
             
             if post_type == 'text':
                 # Gửi tin nhắn text
                 message = await bot.send_message(
                     chat_id=channel_id,
-                    text=post_data['content'],
+                    text=post_data.get('content') or post_data['text'],
                     parse_mode=ParseMode.MARKDOWN if post_data.get('markdown', False) else None
                 )
                 
@@ -170,7 +316,7 @@ class PostManager:
                 # Gửi hình ảnh
                 message = await bot.send_photo(
                     chat_id=channel_id,
-                    photo=post_data['media'],
+                    photo=media,
                     caption=post_data.get('caption', ''),
                     parse_mode=ParseMode.MARKDOWN if post_data.get('markdown', False) else None
                 )
@@ -179,7 +325,7 @@ class PostManager:
                 # Gửi video
                 message = await bot.send_video(
                     chat_id=channel_id,
-                    video=post_data['media'],
+                    video=media,
                     caption=post_data.get('caption', ''),
                     parse_mode=ParseMode.MARKDOWN if post_data.get('markdown', False) else None
                 )
@@ -188,7 +334,7 @@ class PostManager:
                 # Gửi file
                 message = await bot.send_document(
                     chat_id=channel_id,
-                    document=post_data['media'],
+                    document=media,
                     caption=post_data.get('caption', ''),
                     parse_mode=ParseMode.MARKDOWN if post_data.get('markdown', False) else None
                 )
@@ -212,33 +358,54 @@ class PostManager:
                         chat_id=channel_id,
                         media=media_list
                     )
-                    message = messages[0] if messages else None
+                    return list(messages or [])
                 else:
                     logger.warning(f"Loại bài đăng không hỗ trợ: {post_type}")
                     message = None
             
-            return message
+            return [message] if message else []
             
+        except RetryAfter:
+            raise  # để người gọi tạm dừng theo yêu cầu của Telegram
         except TelegramError as e:
             logger.error(f"Lỗi Telegram khi gửi đến kênh {channel['title']}: {e}")
-            return None
+            return []
         except Exception as e:
             logger.error(f"Lỗi không xác định khi gửi đến kênh {channel['title']}: {e}")
-            return None
+            return []
     
-    async def get_post_history(self, limit: int = 20) -> List[Dict[str, Any]]:
-        """Lấy lịch sử bài đăng"""
+    async def get_post_history(self, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """Lấy lịch sử bài đăng (mới nhất trước), tự đọc thêm từ kho lưu trữ khi lùi trang"""
+        self._sync()
         posts = list(self.posts.values())
         posts.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        return posts[:limit]
+        page = posts[offset:offset + limit]
+
+        remaining = limit - len(page)
+        if remaining > 0:
+            archive_offset = max(0, offset - len(posts))
+            page.extend(self.archive.read_newest(archive_offset, remaining))
+        return page
+
+    def iter_all_posts(self):
+        """Duyệt toàn bộ lịch sử (kho lưu trữ trước, sau đó bài trong bộ nhớ)"""
+        yield from self.archive.iter_posts()
+        yield from sorted(self.posts.values(), key=lambda x: x.get('created_at', ''))
     
     async def get_post_by_id(self, post_id: str) -> Optional[Dict[str, Any]]:
         """Lấy thông tin bài đăng theo ID"""
-        return self.posts.get(post_id)
+        self._sync()
+        post = self.posts.get(post_id)
+        if post is None and self.archive.count():
+            post = self.archive.find(post_id)
+        return post
     
     async def get_statistics(self) -> Dict[str, Any]:
         """Lấy thống kê bài đăng"""
-        total_posts = len(self.posts)
+        self._sync()
+        archive_meta = self.archive.meta
+        rollup_totals = self.rollups.totals
+        total_posts = len(self.posts) + self.archive.count() + rollup_totals['posts']
         if total_posts == 0:
             return {
                 'total_posts': 0,
@@ -251,6 +418,7 @@ class PostManager:
             }
         
         successful_posts = sum(1 for post in self.posts.values() if post.get('successful_sends', 0) > 0)
+        successful_posts += archive_meta['successful_posts'] + rollup_totals['successful_posts']
         failed_posts = total_posts - successful_posts
         success_rate = (successful_posts / total_posts * 100) if total_posts > 0 else 0
         
@@ -271,6 +439,8 @@ class PostManager:
         
         # Tìm kênh được đăng nhiều nhất
         channel_stats = {}
+        merge_channel_counts(channel_stats, archive_meta['channels'].values())
+        merge_channel_counts(channel_stats, rollup_totals['channels'].values())
         for post in self.posts.values():
             for channel_id, channel_result in post.get('channels', {}).items():
                 if channel_result.get('success', False):
@@ -297,19 +467,24 @@ class PostManager:
     
     async def delete_post(self, post_id: str) -> bool:
         """Xóa bài đăng khỏi lịch sử"""
+        self._sync()
         if post_id in self.posts:
             del self.posts[post_id]
-            self.save_posts()
+            self.save_posts([post_id])
             return True
+        if self.archive.count():
+            return self.archive.remove(post_id)
         return False
     
     async def cleanup_old_posts(self, days: int = 30) -> int:
-        """Dọn dẹp bài đăng cũ"""
+        """Dọn dẹp bài đăng cũ (gộp vào rollup theo ngày trước khi xóa)"""
         cutoff_date = datetime.now() - timedelta(days=days)
         deleted_count = 0
         posts_to_delete = []
         
         for post_id, post in self.posts.items():
+            if is_expiry_pending(post):
+                continue  # còn chờ tự xóa
             try:
                 post_date = datetime.fromisoformat(post.get('created_at', ''))
                 if post_date < cutoff_date:
@@ -319,11 +494,19 @@ class PostManager:
                 posts_to_delete.append(post_id)
         
         for post_id in posts_to_delete:
-            del self.posts[post_id]
+            self.rollups.add_post_record(self.posts.pop(post_id))
             deleted_count += 1
         
         if deleted_count > 0:
-            self.save_posts()
+            self.save_posts(posts_to_delete)
+        
+        if self.archive.count():
+            deleted_count += self.archive.truncate_before(
+                cutoff_date.isoformat(), on_removed=self.rollups.add_post_record
+            )
+        
+        if deleted_count > 0:
+            self.rollups.save()
         
         return deleted_count
     
@@ -342,6 +525,15 @@ class PostManager:
                 else:
                     failed_posts += 1
         
+        older_sources = [self.rollups.totals['channels'].get(str(channel_id))]
+        if self.archive.count():
+            older_sources.append(self.archive.meta['channels'].get(str(channel_id)))
+        for older in older_sources:
+            if older:
+                successful_posts += older['success']
+                failed_posts += older['failed']
+                total_posts += older['success'] + older['failed']
+        
         success_rate = (successful_posts / total_posts * 100) if total_posts > 0 else 0
         
         return {
@@ -352,12 +544,12 @@ class PostManager:
         }
     
     async def get_total_posts(self) -> int:
-        """Trả về tổng số bài đã lưu"""
-        return len(self.posts)
+        """Trả về tổng số bài đã lưu (không tính bài đã gộp vào rollup)"""
+        return len(self.posts) + self.archive.count()
 
     async def count_posts(self) -> int:
         """Alias cho get_total_posts (giữ tương thích)"""
-        return len(self.posts)
+        return await self.get_total_posts()
     
     def export_posts_to_json(self, filename: str = None) -> str:
         """Xuất dữ liệu bài đăng ra file JSON"""
@@ -365,8 +557,14 @@ class PostManager:
             filename = f"posts_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         
         try:
+            # Ghi từng bài một để không phải nạp kho lưu trữ vào bộ nhớ
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(self.posts, f, ensure_ascii=False, indent=2)
+                f.write('{')
+                for i, post in enumerate(self.iter_all_posts()):
+                    f.write(',\n' if i else '\n')
+                    f.write(f"  {json.dumps(post.get('id'), ensure_ascii=False)}: ")
+                    f.write(json.dumps(post, ensure_ascii=False, indent=2, default=json_default).replace('\n', '\n  '))
+                f.write('\n}')
             return filename
         except Exception as e:
             logger.error(f"Lỗi khi xuất dữ liệu: {e}", exc_info=True)
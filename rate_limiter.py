@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import time
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket dùng chung cho mọi lần gửi của bot (mọi event loop, mọi luồng).
+
+    `rate` token/giây, tối đa `capacity` token tích lũy. Mỗi lần acquire đặt trước
+    một suất gửi rồi ngủ tới đúng suất đó, nên nhiều coroutine chạy đồng thời vẫn
+    không vượt quá ngân sách chung. Khi bị tạm dừng (pause), `_updated` được đẩy tới
+    thời điểm hết dừng: token không tích lũy trong lúc dừng và các lần dừng chồng nhau
+    chỉ kéo dài tới mốc xa nhất chứ không cộng dồn.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """Trừ token (có thể âm = nợ) và trả về số giây phải chờ"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            paused = max(0.0, self._updated - now)
+            return paused + (0.0 if self._tokens >= 0 else -self._tokens / self.rate)
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        if self.rate <= 0:
+            return  # không giới hạn
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Dừng cấp token trong `seconds` giây (khi Telegram trả về RetryAfter)"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = max(self._updated, now + seconds)
+        logger.warning(f"Telegram yêu cầu chờ {seconds} giây, tạm dừng gửi")
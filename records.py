@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+from collections.abc import MutableMapping
+from typing import Any, Dict, FrozenSet, Iterator, Optional, Tuple
+
+
+class SlotRecord(MutableMapping):
+    """
+    Bản ghi gọn nhẹ dùng __slots__ nhưng vẫn dùng được như dict
+    (record['key'], record.get(...), 'key' in record, items()...).
+
+    Các field đã biết nằm trong slot (không có __dict__, không lặp lại chuỗi key
+    cho mỗi bản ghi); key lạ được giữ trong `extra` nên đọc/ghi JSON không mất dữ liệu.
+    Slot chưa gán được coi như key không tồn tại.
+    """
+
+    __slots__ = ('extra',)
+    FIELDS: Tuple[str, ...] = ()
+    _FIELD_SET: FrozenSet[str] = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None, **kwargs):
+        self.extra: Optional[Dict[str, Any]] = None
+        if data:
+            for key, value in data.items():
+                self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data: Any):
+        """Tạo bản ghi từ dict đọc từ JSON (giữ nguyên nếu đã là bản ghi)"""
+        if isinstance(data, cls) or not isinstance(data, dict):
+            return data
+        return cls(data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Đọc thẳng các slot thay vì qua items() của MutableMapping: được gọi cho mọi bản ghi mỗi lần ghi file
+        data = {}
+        for key in self.FIELDS:
+            try:
+                data[key] = getattr(self, key)
+            except AttributeError:
+                pass
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    # ---------- Giao diện mapping ----------
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._FIELD_SET:
+            return getattr(self, key, default)
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in self._FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._FIELD_SET:
+            return hasattr(self, key)
+        return self.extra is not None and key in self.extra
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for key in self.FIELDS if hasattr(self, key)) + len(self.extra or ())
+
+    def copy(self):
+        return type(self)(self.to_dict())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class ChannelRecord(SlotRecord):
+    """Một kênh trong channels.json"""
+
+    FIELDS = (
+        'id', 'title', 'username', 'type', 'active', 'added_date',
+        'post_count', 'success_count', 'fail_count', 'last_post', 'tags'
+    )
+    __slots__ = FIELDS
+
+
+class DeliveryResult(SlotRecord):
+    """Kết quả gửi một bài tới một kênh"""
+
+    FIELDS = (
+        'channel_id', 'channel_title', 'success', 'message_id', 'message_ids', 'error', 'sent_at',
+        'expires_at', 'deleted_at', 'delete_error'
+    )
+    __slots__ = FIELDS
+
+    def __setitem__(self, key: str, value: Any):
+        # Tên kênh lặp lại ở mọi kết quả gửi -> dùng chung một chuỗi
+        if key == 'channel_title' and isinstance(value, str):
+            value = sys.intern(value)
+        super().__setitem__(key, value)
+
+
+class PostRecord(SlotRecord):
+    """Một bài đăng trong posts.json, `channels` là {channel_id: DeliveryResult}"""
+
+    FIELDS = (
+        'id', 'content', 'type', 'created_at', 'channels', 'total_channels',
+        'successful_sends', 'failed_sends', 'status', 'completed_at', 'expires_at', 'expired_at',
+        'expiry_attempts'
+    )
+    __slots__ = FIELDS
+
+    def __setitem__(self, key: str, value: Any):
+        if key == 'channels' and isinstance(value, dict):
+            value = {channel_id: DeliveryResult.from_dict(result) for channel_id, result in value.items()}
+        super().__setitem__(key, value)
+
+
+class ScheduleRecord(SlotRecord):
+    """Một lịch đăng trong scheduled_posts.json"""
+
+    FIELDS = (
+        'id', 'post_data', 'channels', 'scheduled_time', 'repeat_type', 'repeat_count',
+        'executed_count', 'status', 'created_at', 'next_execution', 'last_execution',
+        'execution_history', 'recurrence', 'timezone', 'exdates', 'misfire_policy',
+        'misfire_grace', 'deferred_until', 'missed_count', 'load_offset',
+        'run_stats', 'target'
+    )
+    __slots__ = FIELDS
+
+
+def json_default(value: Any) -> Any:
+    """Hook `default=` cho json.dump: ghi bản ghi như dict thường"""
+    if isinstance(value, SlotRecord):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bộ máy lặp lịch: biểu thức cron (5 trường) và RRULE (RFC 5545, phần thường dùng).
+
+Các lần chạy được sinh lười bằng iterator theo giờ địa phương (wall clock) của múi giờ
+lịch đăng, rồi mới quy đổi sang thời điểm tuyệt đối bằng pytz nên an toàn với DST:
+giờ rơi vào khoảng nhảy giờ được đẩy tới sau khoảng đó, giờ bị lặp lấy lần đầu tiên.
+
+    rec = Recurrence("cron: 0 9,18 * * 1-5", dtstart=datetime(2024, 1, 1), tz="Asia/Ho_Chi_Minh")
+    rec.next_after(datetime.now(pytz.utc))
+"""
+
+import calendar
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+import pytz
+
+WEEKDAY_CODES = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+MONTH_NAMES = ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')
+CRON_DAY_NAMES = ('SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT')
+CRON_MACROS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+# Quy tắc không bao giờ khớp (vd: ngày 30/2) dừng sau chừng này chu kỳ rỗng liên tiếp
+MAX_EMPTY_PERIODS = 200000
+
+
+# ---------- Cron ----------
+
+def _cron_value(token: str, names: Optional[Tuple[str, ...]], offset: int) -> int:
+    token = token.strip().upper()
+    if names and token in names:
+        return names.index(token) + offset
+    return int(token)
+
+
+def _parse_cron_field(text: str, low: int, high: int,
+                      names: Optional[Tuple[str, ...]] = None, offset: int = 0) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(','):
+        step = 1
+        has_step = '/' in part
+        if has_step:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"Bước cron không hợp lệ: {text}")
+        if part in ('*', '?'):
+            start, end = low, high
+        elif '-' in part:
+            first, last = part.split('-', 1)
+            start, end = _cron_value(first, names, offset), _cron_value(last, names, offset)
+        else:
+            start = _cron_value(part, names, offset)
+            end = high if has_step else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Giá trị cron ngoài phạm vi {low}-{high}: {text}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronRule:
+    """Biểu thức cron 5 trường: phút giờ ngày-trong-tháng tháng thứ (0/7 = Chủ nhật)"""
+
+    def __init__(self, expression: str):
+        expression = CRON_MACROS.get(expression.strip().lower(), expression)
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron cần đúng 5 trường: {expression}")
+        minute, hour, day, month, weekday = fields
+        self.minutes = sorted(_parse_cron_field(minute, 0, 59))
+        self.hours = sorted(_parse_cron_field(hour, 0, 23))
+        self.days = _parse_cron_field(day, 1, 31)
+        self.months = _parse_cron_field(month, 1, 12, MONTH_NAMES, 1)
+        cron_weekdays = _parse_cron_field(weekday, 0, 7, CRON_DAY_NAMES, 0)
+        self.weekdays = frozenset((d - 1) % 7 for d in cron_weekdays)  # về weekday() của Python
+        # Như cron chuẩn: nếu giới hạn cả ngày-trong-tháng lẫn thứ thì khớp một trong hai
+        self.day_restricted = day not in ('*', '?')
+        self.weekday_restricted = weekday not in ('*', '?')
+
+    def _day_matches(self, day: date) -> bool:
+        in_month = day.day in self.days
+        in_week = day.weekday() in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return in_month or in_week
+        return in_month and in_week
+
+    def iter_wall(self, dtstart: datetime, after: datetime,
+                  until: Optional[datetime] = None) -> Iterator[datetime]:
+        """Các thời điểm (giờ địa phương, naive) > after, >= dtstart và <= until"""
+        if after < dtstart:
+            after = dtstart - timedelta(microseconds=1)
+        day = after.date()
+        first_day = True
+        empty = 0
+        while empty < MAX_EMPTY_PERIODS:
+            if day.month not in self.months:
+                # Nhảy thẳng tới ngày đầu tháng kế tiếp
+                day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+                first_day = False
+                empty += 1
+                continue
+            if self._day_matches(day):
+                hours = self.hours
+                if first_day:
+                    hours = hours[bisect_left(hours, after.hour):]
+                for hour in hours:
+                    minutes = self.minutes
+                    if first_day and hour == after.hour:
+                        minutes = minutes[bisect_left(minutes, after.minute):]
+                    for minute in minutes:
+                        candidate = datetime.combine(day, time(hour, minute))
+                        if until is not None and candidate > until:
+                            return
+                        if candidate > after:
+                            empty = 0
+                            yield candidate
+            else:
+                empty += 1
+            day += timedelta(days=1)
+            first_day = False
+
+
+# ---------- RRULE ----------
+
+def _parse_weekday(token: str) -> Tuple[Optional[int], int]:
+    """'MO' -> (None, 0), '-1FR' -> (-1, 4), '2TU' -> (2, 1)"""
+    token = token.strip().upper()
+    code = token[-2:]
+    if code not in WEEKDAY_CODES:
+        raise ValueError(f"BYDAY không hợp lệ: {token}")
+    ordinal = int(token[:-2]) if token[:-2] else None
+    if ordinal == 0:
+        raise ValueError(f"BYDAY không hợp lệ: {token}")
+    return ordinal, WEEKDAY_CODES.index(code)
+
+
+def _parse_until(value: str) -> datetime:
+    value = value.strip().upper()
+    utc = value.endswith('Z')
+    value = value.rstrip('Z')
+    parsed = datetime.strptime(value, '%Y%m%dT%H%M%S') if 'T' in value else datetime.strptime(value, '%Y%m%d').replace(hour=23, minute=59, second=59)
+    return parsed.replace(tzinfo=pytz.utc) if utc else parsed
+
+
+def _int_list(value: str, low: int, high: int, allow_negative: bool = False) -> List[int]:
+    values = []
+    for token in value.split(','):
+        number = int(token)
+        if not (low <= abs(number) <= high) or (number < 0 and not allow_negative):
+            raise ValueError(f"Giá trị RRULE ngoài phạm vi: {value}")
+        values.append(number)
+    return values
+
+
+def _add_months(year: int, month: int, months: int) -> Tuple[int, int]:
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+class RRule:
+    """RRULE: FREQ, INTERVAL, COUNT, UNTIL, BYMONTH, BYMONTHDAY, BYDAY, BYHOUR, BYMINUTE, BYSECOND, BYSETPOS, WKST"""
+
+    FREQUENCIES = ('YEARLY', 'MONTHLY', 'WEEKLY', 'DAILY', 'HOURLY', 'MINUTELY')
+
+    def __init__(self, text: str):
+        text = text.strip()
+        if text.upper().startswith('RRULE:'):
+            text = text[6:]
+        parts = {}
+        for item in filter(None, text.split(';')):
+            key, _, value = item.partition('=')
+            parts[key.strip().upper()] = value.strip()
+        self.freq = parts.pop('FREQ', '').upper()
+        if self.freq not in self.FREQUENCIES:
+            raise ValueError(f"RRULE cần FREQ thuộc {', '.join(self.FREQUENCIES)}")
+        self.interval = int(parts.pop('INTERVAL', '1'))
+        if self.interval < 1:
+            raise ValueError("INTERVAL phải >= 1")
+        self.count = int(parts.pop('COUNT')) if 'COUNT' in parts else None
+        self.until = _parse_until(parts.pop('UNTIL')) if 'UNTIL' in parts else None
+        self.by_month = set(_int_list(parts.pop('BYMONTH'), 1, 12)) if 'BYMONTH' in parts else None
+        self.by_month_day = _int_list(parts.pop('BYMONTHDAY'), 1, 31, True) if 'BYMONTHDAY' in parts else None
+        self.by_day = [_parse_weekday(t) for t in parts.pop('BYDAY').split(',')] if 'BYDAY' in parts else None
+        self.by_hour = sorted(_int_list(parts.pop('BYHOUR'), 0, 23)) if 'BYHOUR' in parts else None
+        self.by_minute = sorted(_int_list(parts.pop('BYMINUTE'), 0, 59)) if 'BYMINUTE' in parts else None
+        self.by_second = sorted(_int_list(parts.pop('BYSECOND'), 0, 59)) if 'BYSECOND' in parts else None
+        self.by_set_pos = _int_list(parts.pop('BYSETPOS'), 1, 366, True) if 'BYSETPOS' in parts else None
+        self.week_start = WEEKDAY_CODES.index(parts.pop('WKST', 'MO').upper())
+        if parts:
+            raise ValueError(f"RRULE chưa hỗ trợ: {', '.join(parts)}")
+        self.weekdays = {weekday for ordinal, weekday in self.by_day or () if ordinal is None}
+
+    # ----- Các ngày trong một chu kỳ -----
+
+    def _days_in_month(self, year: int, month: int, dtstart: datetime) -> List[date]:
+        if self.by_month is not None and month not in self.by_month:
+            return []
+        last_day = calendar.monthrange(year, month)[1]
+        days = None
+        if self.by_month_day is not None:
+            days = {d if d > 0 else last_day + d + 1 for d in self.by_month_day}
+            days = {d for d in days if 1 <= d <= last_day}
+        if self.by_day is not None:
+            by_day = set()
+            for ordinal, weekday in self.by_day:
+                matching = [d for d in range(1, last_day + 1) if calendar.weekday(year, month, d) == weekday]
+                if ordinal is None:
+                    by_day.update(matching)
+                elif -len(matching) <= ordinal <= len(matching):
+                    by_day.add(matching[ordinal - 1 if ordinal > 0 else ordinal])
+            days = by_day if days is None else days & by_day
+        if days is None:
+            days = {dtstart.day} if dtstart.day <= last_day else set()
+        return [date(year, month, d) for d in sorted(days)]
+
+    def _day_allowed(self, day: date) -> bool:
+        """Bộ lọc BYxxx cho FREQ=DAILY/HOURLY/MINUTELY"""
+        if self.by_month is not None and day.month not in self.by_month:
+            return False
+        if self.by_month_day is not None:
+            last_day = calendar.monthrange(day.year, day.month)[1]
+            if not any(day.day == (d if d > 0 else last_day + d + 1) for d in self.by_month_day):
+                return False
+        if self.by_day is not None and day.weekday() not in self.weekdays:
+            return False
+        return True
+
+    def _times(self, dtstart: datetime) -> List[time]:
+        hours = self.by_hour if self.by_hour is not None else [dtstart.hour]
+        minutes = self.by_minute if self.by_minute is not None else [dtstart.minute]
+        seconds = self.by_second if self.by_second is not None else [dtstart.second]
+        return [time(h, m, s) for h in hours for m in minutes for s in seconds]
+
+    def _period(self, index: int, dtstart: datetime, times: List[time]) -> List[datetime]:
+        """Các thời điểm ứng viên (đã sắp xếp) của chu kỳ thứ `index` tính từ dtstart"""
+        freq = self.freq
+        step = index * self.interval
+        if freq in ('HOURLY', 'MINUTELY'):
+            base = dtstart.replace(second=0, microsecond=0)
+            if freq == 'HOURLY':
+                moment = base.replace(minute=0) + timedelta(hours=step)
+                if (self.by_hour is not None and moment.hour not in self.by_hour) or not self._day_allowed(moment.date()):
+                    return []
+                minutes = self.by_minute if self.by_minute is not None else [dtstart.minute]
+                seconds = self.by_second if self.by_second is not None else [dtstart.second]
+                return [moment.replace(minute=m, second=s) for m in minutes for s in seconds]
+            moment = base + timedelta(minutes=step)
+            if ((self.by_hour is not None and moment.hour not in self.by_hour)
+                    or (self.by_minute is not None and moment.minute not in self.by_minute)
+                    or not self._day_allowed(moment.date())):
+                return []
+            seconds = self.by_second if self.by_second is not None else [dtstart.second]
+            return [moment.replace(second=s) for s in seconds]
+
+        if freq == 'DAILY':
+            day = dtstart.date() + timedelta(days=step)
+            days = [day] if self._day_allowed(day) else []
+        elif freq == 'WEEKLY':
+            week_start = dtstart.date() - timedelta(days=(dtstart.weekday() - self.week_start) % 7)
+            week_start += timedelta(weeks=step)
+            weekdays = self.weekdays or {dtstart.weekday()}
+            days = [
+                week_start + timedelta(days=offset) for offset in range(7)
+                if (self.week_start + offset) % 7 in weekdays
+            ]
+            if self.by_month is not None:
+                days = [d for d in days if d.month in self.by_month]
+        elif freq == 'MONTHLY':
+            year, month = _add_months(dtstart.year, dtstart.month, step)
+            days = self._days_in_month(year, month, dtstart)
+        else:  # YEARLY
+            year = dtstart.year + step
+            if self.by_month is not None:
+                months = sorted(self.by_month)
+            elif self.by_month_day is not None or self.by_day is not None:
+                months = range(1, 13)
+            else:
+                months = [dtstart.month]
+            days = [d for month in months for d in self._days_in_month(year, month, dtstart)]
+        return [datetime.combine(day, t) for day in days for t in times]
+
+    def _first_period(self, dtstart: datetime, after: datetime) -> int:
+        """Chu kỳ đầu cần xét: nhảy thẳng tới gần `after` khi không có COUNT"""
+        if self.count is not None or after <= dtstart:
+            return 0
+        delta = after - dtstart
+        if self.freq == 'MINUTELY':
+            periods = int(delta.total_seconds() // 60)
+        elif self.freq == 'HOURLY':
+            periods = int(delta.total_seconds() // 3600)
+        elif self.freq == 'DAILY':
+            periods = delta.days
+        elif self.freq == 'WEEKLY':
+            periods = delta.days // 7
+        elif self.freq == 'MONTHLY':
+            periods = (after.year - dtstart.year) * 12 + after.month - dtstart.month
+        else:
+            periods = after.year - dtstart.year
+        return max(0, periods // self.interval - 1)
+
+    def iter_wall(self, dtstart: datetime, after: datetime,
+                  until: Optional[datetime] = None) -> Iterator[datetime]:
+        """Các thời điểm (giờ địa phương, naive) > after và >= dtstart, theo đúng COUNT/UNTIL"""
+        times = self._times(dtstart)
+        emitted = 0
+        empty = 0
+        index = self._first_period(dtstart, after)
+        while empty < MAX_EMPTY_PERIODS:
+            candidates = self._period(index, dtstart, times)
+            index += 1
+            if self.by_set_pos is not None and candidates:
+                candidates = sorted({
+                    candidates[pos - 1 if pos > 0 else pos]
+                    for pos in self.by_set_pos if -len(candidates) <= pos <= len(candidates)
+                })
+            if not candidates:
+                empty += 1
+                continue
+            empty = 0
+            for candidate in candidates:
+                if candidate < dtstart:
+                    continue
+                if until is not None and candidate > until:
+                    return
+                emitted += 1
+                if candidate > after:
+                    yield candidate
+                if self.count is not None and emitted >= self.count:
+                    return
+
+
+# ---------- Recurrence ----------
+
+@lru_cache(maxsize=1024)
+def compile_rule(rule: str):
+    """Biên dịch (có cache) một quy tắc: 'cron: ...', '@daily', 'RRULE:...' hoặc 'FREQ=...'"""
+    text = rule.strip()
+    lowered = text.lower()
+    if lowered.startswith('cron:'):
+        return CronRule(text[5:])
+    if lowered.startswith('@'):
+        return CronRule(text)
+    if lowered.startswith('rrule:') or lowered.startswith('freq='):
+        return RRule(text)
+    return CronRule(text)
+
+
+@lru_cache(maxsize=64)
+def _timezone(name: str):
+    return pytz.timezone(name)
+
+
+@lru_cache(maxsize=8192)
+def _localize(tz_name: str, wall: datetime) -> datetime:
+    """Giờ địa phương -> thời điểm có múi giờ; có cache vì nhiều lịch chung giờ chạy"""
+    tz = _timezone(tz_name)
+    try:
+        return tz.localize(wall, is_dst=None)
+    except pytz.exceptions.AmbiguousTimeError:
+        return tz.localize(wall, is_dst=True)  # giờ bị lặp khi lùi giờ: lấy lần đầu
+    except pytz.exceptions.NonExistentTimeError:
+        return tz.normalize(tz.localize(wall, is_dst=False))  # giờ bị nhảy qua: đẩy tới sau
+
+
+def _parse_exdate(value) -> Tuple[Optional[date], Optional[datetime]]:
+    if isinstance(value, datetime):
+        return None, value
+    if isinstance(value, date):
+        return value, None
+    text = str(value).strip()
+    if len(text) == 8 and text.isdigit():
+        return datetime.strptime(text, '%Y%m%d').date(), None
+    if len(text) == 10:
+        return date.fromisoformat(text), None
+    if len(text) >= 15 and text[8] == 'T' and text[:8].isdigit():
+        return None, datetime.strptime(text.rstrip('Z'), '%Y%m%dT%H%M%S')
+    return None, datetime.fromisoformat(text)
+
+
+class Recurrence:
+    """
+    Một quy tắc lặp gắn với thời điểm bắt đầu, múi giờ và danh sách ngày loại trừ.
+
+    - `tz=None`: làm việc với giờ naive (giờ hệ thống), như lịch lặp kiểu cũ
+    - `exdates`: ngày (YYYY-MM-DD, loại cả ngày) hoặc thời điểm cụ thể (ISO) theo giờ địa phương
+    """
+
+    def __init__(self, rule: str, dtstart: datetime, tz: Optional[str] = None, exdates: Iterable = ()):
+        self.rule = compile_rule(rule)
+        self.tz_name = tz
+        self.tz = _timezone(tz) if tz else None
+        self.dtstart = self._to_wall(dtstart)
+        # UNTIL dạng UTC (...Z) được quy về giờ địa phương của quy tắc
+        until = getattr(self.rule, 'until', None)
+        self.until = self._to_wall(until) if until is not None else None
+        self.excluded_days = set()
+        self.excluded_times = set()
+        for value in exdates or ():
+            day, moment = _parse_exdate(value)
+            if day is not None:
+                self.excluded_days.add(day)
+            else:
+                self.excluded_times.add(self._to_wall(moment))
+
+    def _to_wall(self, moment: datetime) -> datetime:
+        """Quy đổi về giờ địa phương naive của quy tắc"""
+        if moment.tzinfo is None:
+            return moment
+        if self.tz is None:
+            return moment.astimezone().replace(tzinfo=None)
+        return moment.astimezone(self.tz).replace(tzinfo=None)
+
+    def localize(self, wall: datetime) -> datetime:
+        """Giờ địa phương -> thời điểm có múi giờ (an toàn với DST)"""
+        if self.tz is None:
+            return wall
+        return _localize(self.tz_name, wall)
+
+    def _excluded(self, wall: datetime) -> bool:
+        return wall.date() in self.excluded_days or wall in self.excluded_times
+
+    def iter_after(self, after: datetime) -> Iterator[datetime]:
+        """Các lần chạy sau `after` (sinh lười, không tạo danh sách)"""
+        for wall in self.rule.iter_wall(self.dtstart, self._to_wall(after), self.until):
+            if not self._excluded(wall):
+                yield self.localize(wall)
+
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        """Lần chạy kế tiếp sau `after`, None nếu quy tắc đã kết thúc"""
+        return next(self.iter_after(after), None)
+
+    def first(self) -> Optional[datetime]:
+        """Lần chạy đầu tiên (>= dtstart)"""
+        return self.next_after(self.localize(self.dtstart) - timedelta(microseconds=1))
+
+
+def legacy_rule(repeat_type: str, start: datetime) -> Optional[str]:
+    """Quy tắc tương ứng với repeat_type kiểu cũ (daily/weekly/monthly), None nếu không lặp"""
+    if repeat_type == 'daily':
+        return 'FREQ=DAILY'
+    if repeat_type == 'weekly':
+        return 'FREQ=WEEKLY'
+    if repeat_type == 'monthly':
+        if start.day > 28:
+            # Ngày 29-31: chạy vào ngày cuối tháng ở những tháng ngắn hơn
+            return f"FREQ=MONTHLY;BYMONTHDAY={','.join(str(d) for d in range(28, start.day + 1))};BYSETPOS=-1"
+        return 'FREQ=MONTHLY'
+    return None
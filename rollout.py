@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gửi hàng loạt theo kiểu canary: gửi thử tới vài kênh trước, đánh giá tỷ lệ lỗi (và chờ admin
+xác nhận nếu bật), rồi mới gửi phần còn lại theo từng đợt.
+
+Bài hỏng (URL nút sai, markdown lỗi...) chỉ tốn vài lần gửi thay vì cả danh sách kênh.
+Mỗi đợt gửi đồng thời trong giới hạn SEND_CONCURRENCY và ngân sách gửi chung (TokenBucket),
+và có thể dừng giữa chừng: các kênh chưa gửi trong đợt bị bỏ qua ngay. Gặp RetryAfter thì tạm
+dừng ngân sách chung rồi thử lại một lần như PostManager; kênh vẫn bị giới hạn tốc độ không
+tính vào tỷ lệ lỗi (đó là lỗi của tốc độ gửi chứ không phải của bài).
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+import logging
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Trạng thái của một lần gửi canary
+ROLLOUT_RUNNING = 'running'            # đang gửi một đợt
+ROLLOUT_AWAITING = 'awaiting_confirm'  # canary xong, chờ admin cho gửi tiếp
+ROLLOUT_HALTED = 'halted'              # tỷ lệ lỗi vượt ngưỡng, chờ admin quyết định
+ROLLOUT_ABORTED = 'aborted'
+ROLLOUT_COMPLETED = 'completed'
+
+
+def plan_waves(channel_ids: List[str], canary_size: int, wave_size: int) -> List[List[str]]:
+    """Chia danh sách kênh: đợt canary `canary_size` kênh, sau đó các đợt `wave_size` kênh"""
+    canary_size = max(1, canary_size)
+    wave_size = max(1, wave_size)
+    waves = [channel_ids[:canary_size]]
+    for i in range(canary_size, len(channel_ids), wave_size):
+        waves.append(channel_ids[i:i + wave_size])
+    return [wave for wave in waves if wave]
+
+
+class Rollout:
+    """Một lần gửi theo đợt tới `channel_ids`; `send_one(channel_id)` trả về tin đã gửi hoặc ném lỗi"""
+
+    def __init__(
+        self,
+        channel_ids: List[str],
+        send_one: Callable[[str], Awaitable[Any]],
+        canary_size: int = 3,
+        wave_size: int = 20,
+        max_error_rate: float = 0.2,
+        rate_limiter=None,
+        concurrency: int = 10,
+        confirm_canary: bool = False
+    ):
+        self.waves = plan_waves(list(channel_ids), canary_size, wave_size)
+        self.total = sum(len(wave) for wave in self.waves)
+        self.send_one = send_one
+        self.max_error_rate = max_error_rate
+        self.rate_limiter = rate_limiter
+        self.concurrency = max(1, concurrency)
+        self.confirm_canary = confirm_canary
+        self.next_wave = 0
+        self.messages: Dict[str, Any] = {}  # channel_id -> tin đã gửi
+        self.sent_at: Dict[str, datetime] = {}  # channel_id -> lúc gửi (hạn tự xóa tính từ đây)
+        self.failed: Dict[str, str] = {}  # channel_id -> lỗi
+        self.rate_limited: Set[str] = set()  # kênh trong `failed` chỉ vì RetryAfter
+        self.skipped = 0  # kênh bị bỏ qua vì dừng giữa đợt
+        self.status = ROLLOUT_RUNNING
+        self.last_wave: Dict[str, int] = {}
+        self._aborted = False
+
+    @property
+    def sent(self) -> int:
+        return len(self.messages)
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.sent - len(self.failed) - self.skipped
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (ROLLOUT_ABORTED, ROLLOUT_COMPLETED)
+
+    def abort(self):
+        """Dừng: đợt đang gửi bỏ qua các kênh chưa gửi, không gửi thêm đợt nào"""
+        self._aborted = True
+        if self.status != ROLLOUT_RUNNING:
+            self._finish_aborted()
+
+    def _finish_aborted(self):
+        self.skipped = self.total - self.sent - len(self.failed)
+        self.status = ROLLOUT_ABORTED
+        logger.info(f"Đã dừng gửi theo đợt: {self.sent}/{self.total} kênh đã gửi")
+
+    async def _send(self, channel_id: str, semaphore: asyncio.Semaphore) -> Optional[bool]:
+        async with semaphore:
+            if self._aborted:
+                return None
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            if self._aborted:
+                return None
+            message = None
+            for attempt in range(2):
+                try:
+                    message = await self.send_one(channel_id)
+                    break
+                except RetryAfter as e:
+                    if self.rate_limiter is None or attempt == 1:
+                        self.failed[channel_id] = str(e)
+                        self.rate_limited.add(channel_id)
+                        return False
+                    retry_after = e.retry_after
+                    self.rate_limiter.pause(getattr(retry_after, 'total_seconds', lambda: retry_after)())
+                    await self.rate_limiter.acquire()
+                    if self._aborted:
+                        return None
+                except Exception as e:
+                    self.failed[channel_id] = str(e)
+                    return False
+            if message is None:
+                self.failed[channel_id] = 'Không thể gửi tin nhắn'
+                return False
+            self.messages[channel_id] = message
+            self.sent_at[channel_id] = datetime.now()
+            return True
+
+    async def run_next_wave(self) -> Dict[str, int]:
+        """
+        Gửi đợt kế tiếp rồi đánh giá: vượt ngưỡng lỗi -> halted, xong đợt canary và cần xác nhận
+        -> awaiting_confirm (người gọi quyết định), hết đợt -> completed.
+        """
+        if self.finished or self.next_wave >= len(self.waves):
+            return self.last_wave
+        if self._aborted:
+            self._finish_aborted()
+            return self.last_wave
+        self.status = ROLLOUT_RUNNING
+        wave = self.waves[self.next_wave]
+        self.next_wave += 1
+        semaphore = asyncio.Semaphore(self.concurrency)
+        outcomes = await asyncio.gather(*(self._send(channel_id, semaphore) for channel_id in wave))
+        rate_limited = sum(
+            1 for channel_id, outcome in zip(wave, outcomes) if outcome is False and channel_id in self.rate_limited
+        )
+        self.last_wave = {
+            'wave': self.next_wave,
+            'size': len(wave),
+            'sent': sum(1 for outcome in outcomes if outcome is True),
+            'failed': sum(1 for outcome in outcomes if outcome is False) - rate_limited,
+            'rate_limited': rate_limited
+        }
+        if self._aborted:
+            self._finish_aborted()
+        elif self.next_wave >= len(self.waves):
+            self.status = ROLLOUT_COMPLETED
+        elif self.error_rate(self.last_wave) > self.max_error_rate:
+            self.status = ROLLOUT_HALTED
+            logger.warning(
+                f"Dừng gửi theo đợt sau đợt {self.next_wave}: {self.last_wave['failed']}/{self.last_wave['size']} kênh lỗi"
+            )
+        elif self.next_wave == 1 and self.confirm_canary:
+            self.status = ROLLOUT_AWAITING
+        return self.last_wave
+
+    @staticmethod
+    def error_rate(wave: Dict[str, int]) -> float:
+        """Tỷ lệ lỗi của một đợt, không tính các kênh chỉ bị giới hạn tốc độ"""
+        attempted = wave.get('sent', 0) + wave.get('failed', 0)
+        return wave.get('failed', 0) / attempted if attempted else 0.0
+
+    def resume(self):
+        """Admin cho gửi tiếp sau canary hoặc sau khi bị dừng vì lỗi"""
+        if not self.finished:
+            self.status = ROLLOUT_RUNNING
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import logging
+
+from records import json_default
+
+logger = logging.getLogger(__name__)
+
+
+def compact_run(schedule_id: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Một dòng run log: số liệu của lần chạy + chỉ các kênh gửi lỗi"""
+    failures = [
+        {
+            'channel_id': result.get('channel_id'),
+            'channel_title': result.get('channel_title', ''),
+            'error': result.get('error', '')
+        }
+        for result in record.get('results', ())
+        if not result.get('success', False)
+    ]
+    return {
+        'schedule_id': schedule_id,
+        'ts': record.get('executed_at'),
+        'success': record.get('success', False),
+        'post_id': record.get('post_id'),
+        'sent': record.get('channels_sent', 0),
+        'failed': record.get('channels_failed', 0),
+        'failures': failures
+    }
+
+
+def inline_run(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Bản tóm tắt của một lần chạy giữ trong execution_history (không có kết quả từng kênh)"""
+    return {
+        'executed_at': record.get('executed_at'),
+        'success': record.get('success', False),
+        'post_id': record.get('post_id'),
+        'channels_sent': record.get('channels_sent', 0),
+        'channels_failed': record.get('channels_failed', 0)
+    }
+
+
+def add_to_stats(stats: Optional[Dict[str, Any]], record: Dict[str, Any]) -> Dict[str, Any]:
+    """Cộng một lần chạy vào bộ đếm tổng hợp của lịch (run_stats)"""
+    stats = dict(stats or {'runs': 0, 'successful_runs': 0, 'channels_sent': 0, 'channels_failed': 0})
+    stats['runs'] += 1
+    stats['channels_sent'] += record.get('channels_sent', 0)
+    stats['channels_failed'] += record.get('channels_failed', 0)
+    if record.get('success', False):
+        stats['successful_runs'] += 1
+        stats['last_success_at'] = record.get('executed_at')
+    return stats
+
+
+class ScheduleRunLog:
+    """
+    Run log chỉ ghi thêm của các lịch đăng: `<db>.runs.jsonl`, mỗi dòng một lần chạy.
+
+    File lịch đăng chỉ giữ vài lần chạy gần nhất và bộ đếm tổng hợp; toàn bộ lịch sử
+    (kèm các kênh gửi lỗi) nằm ở đây và chỉ được đọc khi cần xem chi tiết.
+    """
+
+    def __init__(self, db_file: str = "scheduled_posts.json"):
+        base, _ = os.path.splitext(db_file)
+        self.path = f"{base}.runs.jsonl"
+
+    def append(self, runs: Iterable[Dict[str, Any]]) -> int:
+        """Ghi thêm các lần chạy (một lần write, mỗi dòng một JSON), trả về số dòng đã ghi"""
+        payload = b''.join(
+            json.dumps(run, ensure_ascii=False, default=json_default).encode('utf-8') + b'\n'
+            for run in runs
+        )
+        if not payload:
+            return 0
+        # O_APPEND: các dòng ghi từ nhiều tiến trình không đè lên nhau
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, payload)
+        finally:
+            os.close(fd)
+        return payload.count(b'\n')
+
+    def iter_runs(self, schedule_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Duyệt các lần chạy theo thứ tự ghi (streaming); lọc theo lịch nếu có schedule_id"""
+        if not os.path.exists(self.path):
+            return
+        needle = json.dumps(schedule_id, ensure_ascii=False).encode('utf-8') if schedule_id else None
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.strip() or (needle is not None and needle not in line):
+                    continue
+                try:
+                    run = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Bỏ qua dòng hỏng trong {self.path}")
+                    continue
+                if schedule_id is None or run.get('schedule_id') == schedule_id:
+                    yield run
+
+    def recent(self, schedule_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """`limit` lần chạy gần nhất của một lịch, mới nhất trước"""
+        runs = deque(self.iter_runs(schedule_id), maxlen=max(1, limit))
+        return list(reversed(runs))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Lớn hơn mọi schedule_id: dùng làm cận trên khi bisect theo (thời điểm, id)
+_MAX_ID = '\uffff'
+# Số lần lặp tối đa của một lịch được tính vào tải (lịch lặp mỗi phút với horizon dài)
+MAX_PROJECTED_RUNS = 1000
+
+
+def due_timestamp(schedule_info: Dict[str, Any]) -> Optional[float]:
+    """
+    Thời điểm chạy kế tiếp (epoch) của một lịch pending, None nếu không cần chạy.
+    Lần chạy bù đã được xếp lịch (deferred_until) thì tính theo thời điểm xếp lịch.
+    """
+    if schedule_info.get('status') != 'pending':
+        return None
+    try:
+        due = datetime.fromisoformat(schedule_info['next_execution']).timestamp()
+        deferred = schedule_info.get('deferred_until')
+        if deferred:
+            due = max(due, datetime.fromisoformat(deferred).timestamp())
+        return due
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class ScheduleIndex:
+    """
+    Index của các lịch đăng, cập nhật mỗi khi một lịch thay đổi (`update`).
+
+    - Lịch pending sắp theo next_execution: truy vấn "trong N giờ tới" là O(log n + k)
+    - Danh sách theo scheduled_time cho từng trạng thái: lấy danh sách không cần sort lại
+    - Bộ đếm theo trạng thái và tổng số lần thực hiện: thống kê O(1)
+    - Tổng số kênh sẽ gửi theo từng khung `bucket_seconds` giây: tải dự kiến của một khung giờ
+      là O(1). Mỗi lịch pending góp lần chạy kế tiếp, và nếu có `occurrences` thì cả các lần lặp
+      sau đó trong `horizon_seconds` giây (tối đa MAX_PROJECTED_RUNS lần). Cửa sổ tính từ lần
+      chạy kế tiếp nên tự trượt theo mỗi lần chạy; tải xa hơn horizon chưa được tính.
+    """
+
+    def __init__(
+        self,
+        bucket_seconds: int = 60,
+        horizon_seconds: float = 0,
+        occurrences: Optional[Callable[[Dict[str, Any], float], Iterable[float]]] = None
+    ):
+        self.bucket_seconds = max(1, int(bucket_seconds))
+        self.horizon_seconds = max(0.0, horizon_seconds)
+        # occurrences(schedule_info, until): các lần chạy (epoch, tăng dần) sau lần kế tiếp
+        self.occurrences = occurrences
+        self._reset()
+
+    def _reset(self):
+        # schedule_id -> (status, next_execution epoch hoặc None, scheduled_time, executed_count,
+        #                 số kênh, các khung đã cộng tải)
+        self._entries: Dict[str, Tuple[str, Optional[float], str, int, int, Tuple[int, ...]]] = {}
+        self._pending_by_due: List[Tuple[float, str]] = []
+        self._by_scheduled_time: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        self._all_by_scheduled_time: List[Tuple[str, str]] = []
+        self.status_counts: Counter = Counter()
+        self.total_executions = 0
+        self.load_by_bucket: Counter = Counter()  # số khung -> tổng số kênh sẽ gửi
+
+    def rebuild(self, schedules: Dict[str, Dict[str, Any]]):
+        """Dựng lại toàn bộ index: thêm cuối danh sách rồi sort một lần (O(n log n) thay vì insort từng lịch)"""
+        self._reset()
+        for schedule_id, schedule_info in schedules.items():
+            self._add(schedule_id, schedule_info, list.append)
+        self._pending_by_due.sort()
+        self._all_by_scheduled_time.sort()
+        for items in self._by_scheduled_time.values():
+            items.sort()
+
+    @staticmethod
+    def _remove_sorted(items: list, item):
+        position = bisect_left(items, item)
+        if position < len(items) and items[position] == item:
+            del items[position]
+
+    def update(self, schedule_id: str, schedule_info: Optional[Dict[str, Any]]):
+        """Đồng bộ index với trạng thái hiện tại của một lịch (None = lịch đã bị xóa)"""
+        old = self._entries.pop(schedule_id, None)
+        if old is not None:
+            status, due, scheduled_time, executed_count, channel_count, buckets = old
+            self.status_counts[status] -= 1
+            self.total_executions -= executed_count
+            if due is not None:
+                self._remove_sorted(self._pending_by_due, (due, schedule_id))
+            for bucket in buckets:
+                self.load_by_bucket[bucket] -= channel_count
+                if self.load_by_bucket[bucket] <= 0:
+                    del self.load_by_bucket[bucket]
+            self._remove_sorted(self._by_scheduled_time[status], (scheduled_time, schedule_id))
+            self._remove_sorted(self._all_by_scheduled_time, (scheduled_time, schedule_id))
+
+        if schedule_info is not None:
+            self._add(schedule_id, schedule_info, insort)
+
+    def _add(self, schedule_id: str, schedule_info: Dict[str, Any], insert: Callable[[list, Any], None]):
+        status = schedule_info.get('status', '')
+        due = due_timestamp(schedule_info)
+        scheduled_time = schedule_info.get('scheduled_time') or ''
+        executed_count = schedule_info.get('executed_count', 0) or 0
+        channel_count = len(schedule_info.get('channels') or ())
+        buckets: Tuple[int, ...] = ()
+        if due is not None:
+            insert(self._pending_by_due, (due, schedule_id))
+            if channel_count:
+                buckets = self._load_buckets(schedule_info, due)
+                for bucket in buckets:
+                    self.load_by_bucket[bucket] += channel_count
+        self._entries[schedule_id] = (status, due, scheduled_time, executed_count, channel_count, buckets)
+        self.status_counts[status] += 1
+        self.total_executions += executed_count
+        insert(self._by_scheduled_time[status], (scheduled_time, schedule_id))
+        insert(self._all_by_scheduled_time, (scheduled_time, schedule_id))
+
+    def _load_buckets(self, schedule_info: Dict[str, Any], due: float) -> Tuple[int, ...]:
+        """Các khung mà lịch góp tải: lần chạy kế tiếp và các lần lặp trong horizon"""
+        buckets = [self.bucket_of(due)]
+        if self.occurrences is not None and self.horizon_seconds > 0:
+            until = due + self.horizon_seconds
+            for moment in self.occurrences(schedule_info, until):
+                if moment > until or len(buckets) > MAX_PROJECTED_RUNS:
+                    break
+                if moment > due:
+                    buckets.append(self.bucket_of(moment))
+        return tuple(buckets)
+
+    # ---------- Truy vấn ----------
+
+    def pending_between(self, start: float, end: float) -> List[str]:
+        """ID các lịch pending có next_execution trong [start, end], sắp theo thời gian"""
+        low = bisect_left(self._pending_by_due, (start, ''))
+        high = bisect_right(self._pending_by_due, (end, _MAX_ID))
+        return [schedule_id for _, schedule_id in self._pending_by_due[low:high]]
+
+    def count_pending_between(self, start: float, end: float) -> int:
+        return (bisect_right(self._pending_by_due, (end, _MAX_ID))
+                - bisect_left(self._pending_by_due, (start, '')))
+
+    def ids_by_scheduled_time(self, status: str = "") -> List[str]:
+        items = self._by_scheduled_time.get(status, []) if status else self._all_by_scheduled_time
+        return [schedule_id for _, schedule_id in items]
+
+    def bucket_of(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    def load_at(self, timestamp: float) -> int:
+        """Tổng số kênh sẽ gửi trong khung chứa `timestamp`"""
+        return self.load_by_bucket.get(self.bucket_of(timestamp), 0)
+
+    def peak_load_between(self, start: float, end: float) -> int:
+        """Khung bận nhất (số kênh) trong [start, end)"""
+        first, last = self.bucket_of(start), self.bucket_of(end - 1e-6)
+        if last - first > len(self.load_by_bucket):
+            return max((load for bucket, load in self.load_by_bucket.items() if first <= bucket <= last), default=0)
+        return max((self.load_by_bucket.get(bucket, 0) for bucket in range(first, last + 1)), default=0)
+
+    def count(self, status: str) -> int:
+        return self.status_counts.get(status, 0)
+
+    def __len__(self) -> int:
+        return len(self._entries)
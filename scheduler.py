@@ -1,36 +1,84 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import heapq
 import json
 import os
 import asyncio
-import time  # Fix: dùng cho time.sleep trong scheduler
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 from telegram import Bot  # thêm để khai báo type
 from threading import Thread
+from file_sync import SharedJSONStore, apply_updates
+from records import ScheduleRecord, json_default
+from recurrence import Recurrence, legacy_rule
+from load_smoothing import SMOOTHING_MODES, plan_offset
+from run_log import ScheduleRunLog, add_to_stats, compact_run, inline_run
+from misfire import MISFIRE_POLICIES, CatchUpPlanner, deferred_iso, misfire_settings, trim_missed
+from schedule_index import ScheduleIndex, due_timestamp
 import logging
 
 logger = logging.getLogger(__name__)
 
+class SystemClock:
+    """Đồng hồ thật của scheduler; benchmark truyền đồng hồ giả lập có cùng giao diện"""
+
+    @staticmethod
+    def time() -> float:
+        return time.time()
+
+    @staticmethod
+    def now() -> datetime:
+        return datetime.now()
+
+
 # pyright: reportOptionalMemberAccess=false, reportCallIssue=false, reportArgumentType=false, reportReturnType=false
 class PostScheduler:
     """Quản lý lịch đăng bài tự động"""
     
-    def __init__(self, db_file: str = "scheduled_posts.json", bot: Optional[Bot] = None):
+    def __init__(
+        self,
+        db_file: str = "scheduled_posts.json",
+        bot: Optional[Bot] = None,
+        manager_provider: Optional[Callable[[], Tuple[Any, Any]]] = None,
+        clock: Optional[SystemClock] = None
+    ):
         self.db_file = db_file
+        self.clock = clock or SystemClock()
+        # Trả về (PostManager, ChannelManager) dùng chung của bot; None = tự tạo một lần khi cần
+        self.manager_provider = manager_provider
+        self._own_managers: Optional[Tuple[Any, Any]] = None
+        self._store = SharedJSONStore(db_file, record_type=ScheduleRecord)  # khóa file + theo dõi thay đổi từ dashboard
+        self.run_log = ScheduleRunLog(db_file)  # toàn bộ lịch sử chạy, file lịch chỉ giữ vài lần gần nhất
         self.bot = bot  # Bot instance để gửi thông báo
         self.scheduled_posts = {}  # schedule_id: schedule_info
         self.running = False
-        self.scheduler_thread = None
+        # Khi chạy nhiều replica: chỉ thực hiện lịch khi hàm này trả về True (đang giữ lease leader)
+        self.should_run: Optional[Callable[[], bool]] = None
+        self._running_ids: Set[str] = set()  # lịch đang được gửi trong tiến trình này
+        self._unsaved: Set[str] = set()  # lịch đã đổi từ lần lưu trước
+        self.scheduler_thread = None  # chỉ dùng khi start() được gọi ngoài event loop
+        # Min-heap (thời điểm chạy, schedule_id) của các lịch pending; mục cũ (đã hủy/đổi giờ)
+        # được bỏ qua khi lấy ra thay vì xóa khỏi heap
+        self._heap: List[Tuple[float, str]] = []
+        from config import Config
+        # Truy vấn sắp tới / thống kê / tải theo khung giờ không cần duyệt toàn bộ
+        self.index = ScheduleIndex(
+            Config.LOAD_BUCKET_SECONDS, Config.LOAD_HORIZON_HOURS * 3600, self._projected_runs
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Làn chạy bù cho các lịch bị lỡ (sau khi bot tắt/treo), trải đều theo ngân sách gửi
+        self.catch_up = CatchUpPlanner(Config.CATCHUP_SPACING_SECONDS, Config.CATCHUP_RATE_PER_SECOND)
         self.load_scheduled_posts()
     
     def load_scheduled_posts(self):
         """Tải lịch đăng bài từ file"""
         if os.path.exists(self.db_file):
             try:
-                with open(self.db_file, 'r', encoding='utf-8') as f:
-                    self.scheduled_posts = json.load(f)
+                self.scheduled_posts = self._store.load() or {}
                 logger.info(f"Đã tải {len(self.scheduled_posts)} lịch đăng từ {self.db_file}")
             except Exception as e:
                 logger.error(f"Lỗi khi tải lịch đăng: {e}")
@@ -39,24 +87,144 @@ class PostScheduler:
             self.scheduled_posts = {}
 
         # Bổ sung trường next_execution cho các lịch cũ nếu thiếu
+        backfilled = 0
         for sched in self.scheduled_posts.values():
             if 'next_execution' not in sched or not sched['next_execution']:
-                sched['next_execution'] = sched.get('scheduled_time', datetime.now().isoformat())
-        # Lưu lại nếu đã cập nhật
-        self.save_scheduled_posts()
+                sched['next_execution'] = sched.get('scheduled_time', self.clock.now().isoformat())
+                backfilled += 1
+        # Chuyển lịch sử chạy dài (dữ liệu cũ) sang run log
+        moved = self._move_history_to_run_log()
+        # Chỉ ghi lại file khi thực sự có lịch được bổ sung
+        if backfilled or moved:
+            self._unsaved.update(self.scheduled_posts)
+            self.save_scheduled_posts()
+        self._rebuild_indexes()
     
+    def _move_history_to_run_log(self) -> int:
+        """
+        Dữ liệu trước khi có run log: ghi toàn bộ execution_history của lịch chưa có run_stats
+        vào run log, tính bộ đếm tổng hợp rồi chỉ giữ SCHEDULE_HISTORY_INLINE lần gần nhất.
+        """
+        from config import Config
+        keep = max(0, Config.SCHEDULE_HISTORY_INLINE)
+        changed, runs = 0, []
+        for schedule_id, sched in self.scheduled_posts.items():
+            history = sched.get('execution_history') or []
+            if sched.get('run_stats') is None and history:
+                stats = None
+                for record in history:
+                    runs.append(compact_run(schedule_id, record))
+                    stats = add_to_stats(stats, record)
+                sched['run_stats'] = stats
+            elif len(history) <= keep and all('results' not in record for record in history):
+                continue
+            sched['execution_history'] = [inline_run(record) for record in history[-keep:]] if keep else []
+            changed += 1
+        if runs:
+            self.run_log.append(runs)
+            logger.info(f"Đã chuyển {len(runs)} lần chạy của {changed} lịch sang {self.run_log.path}")
+        return changed
+
     def save_scheduled_posts(self):
         """Lưu lịch đăng bài vào file"""
         try:
-            with open(self.db_file, 'w', encoding='utf-8') as f:
-                json.dump(self.scheduled_posts, f, ensure_ascii=False, indent=2)
+            changed, self._unsaved = self._unsaved, set()
+            self._store.save(self.scheduled_posts, self._apply_remote_changes, changed)
             logger.info(f"Đã lưu {len(self.scheduled_posts)} lịch đăng vào {self.db_file}")
         except Exception as e:
+            self._unsaved |= changed
             logger.error(f"Lỗi khi lưu lịch đăng: {e}")
+
+    async def save_scheduled_posts_async(self):
+        """Lưu lịch đăng bài mà không chặn event loop: chỉ mã hóa lại các lịch đã đổi, ghi file trên thread pool"""
+        try:
+            changed, self._unsaved = self._unsaved, set()
+            await self._store.save_async(self.scheduled_posts, self._apply_remote_changes, changed)
+            logger.info(f"Đã lưu {len(self.scheduled_posts)} lịch đăng vào {self.db_file}")
+        except Exception as e:
+            logger.error(f"Lỗi khi lưu lịch đăng: {e}")
+
+    def save_snapshot(self) -> bool:
+        """Ghi snapshot nhị phân để lần khởi động sau nạp nhanh hơn"""
+        return self._store.write_snapshot(self.scheduled_posts)
+    
+    def _sync(self):
+        """Nạp thay đổi từ file nếu tiến trình khác (dashboard...) vừa ghi"""
+        self._store.refresh(self.scheduled_posts, self._apply_remote_changes)
+
+    def _apply_remote_changes(self, updates: Dict[str, Any]):
+        """Áp dụng thay đổi từ file và đưa các lịch mới/đổi giờ vào heap"""
+        apply_updates(self.scheduled_posts, updates)
+        for schedule_id in updates:
+            self._touch(schedule_id)
+        self._wake()
+
+    # ---------- Heap thời điểm chạy ----------
+
+    def _touch(self, schedule_id: str):
+        """Cập nhật index, đưa (lại) lịch vào heap và đánh dấu cần ghi sau khi lịch thay đổi"""
+        schedule_info = self.scheduled_posts.get(schedule_id)
+        self._unsaved.add(schedule_id)
+        self.index.update(schedule_id, schedule_info)
+        due = due_timestamp(schedule_info) if schedule_info is not None else None
+        if due is not None:
+            heapq.heappush(self._heap, (due, schedule_id))
+            # Dọn bớt mục cũ khi heap phình to vì đổi giờ/hủy nhiều lần
+            if len(self._heap) > 2 * len(self.scheduled_posts) + 64:
+                self._rebuild_heap()
+
+    def _rebuild_indexes(self):
+        self.index.rebuild(self.scheduled_posts)
+        self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [
+            (due, schedule_id)
+            for schedule_id, schedule_info in self.scheduled_posts.items()
+            for due in (due_timestamp(schedule_info),)
+            if due is not None
+        ]
+        heapq.heapify(self._heap)
+
+    def _is_current(self, due: float, schedule_id: str) -> bool:
+        """Mục heap còn đúng với trạng thái hiện tại của lịch không"""
+        schedule_info = self.scheduled_posts.get(schedule_id)
+        return schedule_info is not None and due_timestamp(schedule_info) == due
+
+    def _pop_due(self, now: float) -> List[str]:
+        """Lấy ra các lịch đã tới giờ (bỏ qua mục cũ)"""
+        due_ids = []
+        seen = set()
+        while self._heap and self._heap[0][0] <= now:
+            due, schedule_id = heapq.heappop(self._heap)
+            if self._is_current(due, schedule_id) and schedule_id not in seen:
+                seen.add(schedule_id)
+                due_ids.append(schedule_id)
+        return due_ids
+
+    def _next_due(self) -> Optional[float]:
+        """Thời điểm của lịch sớm nhất còn hiệu lực"""
+        while self._heap and not self._is_current(*self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def _wake(self):
+        """Đánh thức vòng lặp scheduler để tính lại thời điểm ngủ (gọi được từ luồng khác)"""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or wakeup is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            wakeup.set()
+        else:
+            loop.call_soon_threadsafe(wakeup.set)
     
     def create_schedule_id(self) -> str:
         """Tạo ID duy nhất cho lịch đăng"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = self.clock.now().strftime("%Y%m%d_%H%M%S")
         return f"schedule_{timestamp}_{len(self.scheduled_posts)}"
     
     async def schedule_post(
@@ -64,8 +232,15 @@ class PostScheduler:
         post_data: Dict[str, Any], 
         channels: List[Dict[str, Any]], 
         scheduled_time: datetime,
-        repeat_type: str = "none",  # none, daily, weekly, monthly
-        repeat_count: int = 1
+        repeat_type: str = "none",  # none, daily, weekly, monthly, custom
+        repeat_count: int = 1,
+        recurrence: Optional[str] = None,
+        timezone: Optional[str] = None,
+        exdates: Optional[List[str]] = None,
+        misfire_policy: Optional[str] = None,
+        misfire_grace: Optional[float] = None,
+        smoothing: Optional[str] = None,
+        target: Optional[str] = None
     ) -> str:
         """
         Lên lịch đăng bài
@@ -73,250 +248,582 @@ class PostScheduler:
         Args:
             post_data: Dữ liệu bài đăng
             channels: Danh sách kênh
-            scheduled_time: Thời gian đăng
+            scheduled_time: Thời gian đăng (với lịch lặp: mốc bắt đầu)
             repeat_type: Loại lặp lại
-            repeat_count: Số lần lặp lại
+            repeat_count: Số lần lặp lại (<= 0: không giới hạn)
+            recurrence: Quy tắc lặp cron ('cron: 0 9 * * 1-5') hoặc RRULE ('FREQ=WEEKLY;BYDAY=MO')
+            timezone: Múi giờ của quy tắc lặp (mặc định Config.TIMEZONE)
+            exdates: Ngày/thời điểm bỏ qua (YYYY-MM-DD hoặc ISO, theo giờ địa phương)
+            misfire_policy: Xử lý khi bị lỡ giờ: once, skip, all (mặc định Config.MISFIRE_POLICY)
+            misfire_grace: Trễ tối đa (giây) vẫn coi là đúng giờ (mặc định Config.MISFIRE_GRACE_SECONDS)
+            smoothing: Giãn tải khi trùng giờ với lịch khác: off, jitter, stagger (mặc định Config.SCHEDULE_SMOOTHING)
+            target: Biểu thức chọn kênh (vd 'vn & promo & !paused'); nếu có, danh sách kênh được
+                tính lại mỗi lần chạy, `channels` chỉ là ảnh chụp lúc lên lịch
             
         Returns:
             ID của lịch đăng
+
+        Raises:
+            ValueError: quy tắc lặp, múi giờ, chính sách lỡ giờ, biểu thức chọn kênh không hợp lệ
+                hoặc không còn lần chạy nào
         """
+        if misfire_policy is not None and misfire_policy not in MISFIRE_POLICIES:
+            raise ValueError(f"Chính sách lỡ giờ phải thuộc {', '.join(MISFIRE_POLICIES)}")
+        if target:
+            target = target.strip()
+            _, channel_manager = self._managers()
+            channels = channel_manager.resolve_target(target)  # TargetExpressionError là ValueError
+        next_execution = scheduled_time
+        if recurrence:
+            if not timezone:
+                from config import Config
+                timezone = Config.TIMEZONE
+            rule = Recurrence(recurrence, scheduled_time, timezone, exdates or ())
+            scheduled_time = rule.localize(rule.dtstart)
+            next_execution = rule.first()
+            if next_execution is None:
+                raise ValueError(f"Quy tắc lặp không có lần chạy nào: {recurrence}")
+            repeat_type = 'custom'
+
+        plan = self.plan_load(next_execution, len(channels), smoothing)
+        if plan['offset']:
+            next_execution = next_execution + timedelta(seconds=plan['offset'])
+        if plan['over_budget']:
+            logger.warning(
+                f"Khung giờ {next_execution} dự kiến gửi {plan['load']} tin, "
+                f"vượt ngân sách {plan['budget']} tin/{self.index.bucket_seconds} giây"
+            )
+
         schedule_id = self.create_schedule_id()
         
-        schedule_info = {
-            'id': schedule_id,
-            'post_data': post_data,
-            'channels': channels,
-            'scheduled_time': scheduled_time.isoformat(),
-            'repeat_type': repeat_type,
-            'repeat_count': repeat_count,
-            'executed_count': 0,
-            'status': 'pending',  # pending, executing, completed, failed
-            'created_at': datetime.now().isoformat(),
-            'next_execution': scheduled_time.isoformat(),
-            'last_execution': None,
-            'execution_history': []
-        }
+        schedule_info = ScheduleRecord(
+            id=schedule_id,
+            post_data=post_data,
+            channels=channels,
+            scheduled_time=scheduled_time.isoformat(),
+            repeat_type=repeat_type,
+            repeat_count=repeat_count,
+            executed_count=0,
+            status='pending',  # pending, executing, completed, failed
+            created_at=self.clock.now().isoformat(),
+            next_execution=next_execution.isoformat(),
+            last_execution=None,
+            execution_history=[]
+        )
+        if recurrence:
+            schedule_info['recurrence'] = recurrence
+            schedule_info['timezone'] = timezone
+            schedule_info['exdates'] = list(exdates or [])
+        if misfire_policy is not None:
+            schedule_info['misfire_policy'] = misfire_policy
+        if misfire_grace is not None:
+            schedule_info['misfire_grace'] = misfire_grace
+        if plan['offset']:
+            schedule_info['load_offset'] = plan['offset']  # áp dụng cho mọi lần lặp
+        if target:
+            schedule_info['target'] = target
         
         self.scheduled_posts[schedule_id] = schedule_info
         self.save_scheduled_posts()
+        self._touch(schedule_id)
+        self._wake()
         
         logger.info(f"Đã lên lịch đăng bài {schedule_id} vào {scheduled_time}")
         return schedule_id
     
+    def plan_load(self, when: datetime, channel_count: int, mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Tải dự kiến khi thêm một lần chạy gửi tới `channel_count` kênh vào `when`.
+
+        Trả về {'offset': giây nên lùi, 'load': số tin của khung, 'budget': ngân sách khung,
+        'over_budget': khung có vượt ngân sách không}. Không thay đổi lịch nào.
+        """
+        from config import Config
+        mode = mode or Config.SCHEDULE_SMOOTHING
+        if mode not in SMOOTHING_MODES:
+            raise ValueError(f"Chế độ giãn tải phải thuộc {', '.join(SMOOTHING_MODES)}")
+        return plan_offset(
+            self.index, when.timestamp(), channel_count, mode,
+            Config.SCHEDULE_SMOOTHING_TOLERANCE, Config.SEND_RATE_PER_SECOND
+        )
+
+    def slot_loads(self, start: datetime, slot_seconds: int, slots: int) -> List[Tuple[int, bool]]:
+        """(số tin của khung bận nhất, có vượt ngân sách) cho `slots` ô liên tiếp dài `slot_seconds` giây"""
+        from config import Config
+        budget = Config.SEND_RATE_PER_SECOND * self.index.bucket_seconds
+        origin = start.timestamp()
+        loads = []
+        for slot in range(slots):
+            peak = self.index.peak_load_between(origin + slot * slot_seconds, origin + (slot + 1) * slot_seconds)
+            loads.append((peak, budget > 0 and peak > budget))
+        return loads
+
     async def cancel_schedule(self, schedule_id: str) -> bool:
         """Hủy lịch đăng bài"""
+        self._sync()
         if schedule_id in self.scheduled_posts:
             self.scheduled_posts[schedule_id]['status'] = 'cancelled'
             self.save_scheduled_posts()
+            self._touch(schedule_id)
+            self._wake()
             logger.info(f"Đã hủy lịch đăng {schedule_id}")
             return True
         return False
 
     async def get_scheduled_posts(self, status: str = "") -> List[Dict[str, Any]]:
         """Lấy danh sách lịch đăng bài"""
-        posts = list(self.scheduled_posts.values())
-        
-        if status:
-            posts = [post for post in posts if post.get('status') == status]
-        
-        posts.sort(key=lambda x: x.get('scheduled_time', ''))
-        return posts
+        self._sync()
+        # Index đã sắp sẵn theo scheduled_time
+        return [self.scheduled_posts[schedule_id] for schedule_id in self.index.ids_by_scheduled_time(status)]
     
     async def get_scheduled_count(self) -> int:
         """Lấy số lượng bài đăng đang chờ"""
-        return len([post for post in self.scheduled_posts.values() if post.get('status') == 'pending'])
+        self._sync()
+        return self.index.count('pending')
     
     async def get_schedule_by_id(self, schedule_id: str) -> Optional[Dict[str, Any]]:
         """Lấy thông tin lịch đăng theo ID"""
+        self._sync()
         return self.scheduled_posts.get(schedule_id)
     
     def start(self):
-        """Bắt đầu scheduler"""
-        if not self.running:
-            self.running = True
-            self.scheduler_thread = Thread(target=self._run_scheduler, daemon=True)
+        """
+        Bắt đầu scheduler.
+
+        Gọi trong event loop (vd: post_init của Application) thì chạy như một task trên
+        chính loop đó; gọi ngoài event loop thì chạy trên một luồng riêng với loop riêng.
+        """
+        if self.running:
+            return
+        self.running = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            self._task = loop.create_task(self._run_loop())
+        else:
+            self.scheduler_thread = Thread(target=lambda: asyncio.run(self._run_loop()), daemon=True)
             self.scheduler_thread.start()
-            logger.info("Scheduler đã bắt đầu")
+        logger.info("Scheduler đã bắt đầu")
     
     def stop(self):
         """Dừng scheduler"""
+        if not self.running:
+            return
         self.running = False
+        task, loop = self._task, self._loop
+        if task is not None and loop is not None and not loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                task.cancel()
+            else:
+                loop.call_soon_threadsafe(task.cancel)
+        self._task = None
+        self._wake()
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=5)
+            self.scheduler_thread = None
         logger.info("Scheduler đã dừng")
-    
-    def _run_scheduler(self):
-        """Chạy scheduler loop"""
-        while self.running:
-            try:
-                # Kiểm tra các lịch đăng cần thực hiện
-                asyncio.run(self._check_and_execute_scheduled_posts())
-                
-                # Nghỉ 30 giây trước khi check lại
-                for _ in range(30):
-                    if not self.running:
-                        break
-                    time.sleep(1)
-                    
-            except Exception as e:
-                logger.error(f"Lỗi trong scheduler loop: {e}")
-                # Nghỉ 10 giây rồi thử lại
-                time.sleep(10)
+
+    async def _run_loop(self):
+        """
+        Vòng lặp scheduler: ngủ đúng tới lịch sớm nhất trong heap, thức dậy ngay khi có lịch
+        được thêm/hủy/đổi giờ. Thời gian ngủ tối đa SCHEDULER_CHECK_INTERVAL giây để nhận
+        thay đổi mà tiến trình khác (dashboard) ghi vào file.
+        """
+        from config import Config
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        max_sleep = max(1, Config.SCHEDULER_CHECK_INTERVAL)
+        self._sync()
+        self._recover_interrupted()
+        try:
+            while self.running:
+                self._wakeup.clear()
+                try:
+                    await self._check_and_execute_scheduled_posts()
+                except Exception as e:
+                    logger.error(f"Lỗi trong scheduler loop: {e}")
+
+                next_due = self._next_due()
+                timeout = max_sleep if next_due is None else min(max_sleep, max(0.0, next_due - self.clock.time()))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._loop = None
+            self._wakeup = None
+
+    def _recover_interrupted(self) -> int:
+        """
+        Đưa các lịch kẹt ở 'executing' (bot chết giữa lúc gửi, leader cũ mất lease) về 'pending'.
+
+        Chỉ gọi khi tiến trình này bắt đầu chạy lịch (khởi động hoặc vừa được bầu leader): các lịch
+        đó không còn ai gửi tiếp. next_execution giữ nguyên nên lần chạy dở được xử lý theo chính
+        sách misfire như mọi lần lỡ giờ khác.
+        """
+        recovered = [
+            schedule_id for schedule_id, schedule_info in self.scheduled_posts.items()
+            if schedule_info.get('status') == 'executing' and schedule_id not in self._running_ids
+        ]
+        for schedule_id in recovered:
+            self.scheduled_posts[schedule_id]['status'] = 'pending'
+            self._touch(schedule_id)
+        if recovered:
+            logger.warning(f"{len(recovered)} lịch bị gián đoạn khi đang gửi, đưa về pending: {', '.join(recovered)}")
+            self.save_scheduled_posts()
+        return len(recovered)
 
     async def _check_and_execute_scheduled_posts(self):
-        """Kiểm tra và thực hiện các lịch đăng"""
-        from datetime import datetime  # Thêm import nếu chưa có
-        current_time = datetime.now()
+        """Thực hiện các lịch đăng đã tới giờ (lấy từ heap, không duyệt toàn bộ)"""
+        if self.should_run is not None and not self.should_run():
+            return  # lease leader đã hết hạn: replica khác sẽ thực hiện
+        self._sync()
         
-        for schedule_id, schedule_info in self.scheduled_posts.items():
-            if schedule_info.get('status') != 'pending':
-                continue
-            
-            try:
-                next_execution = datetime.fromisoformat(schedule_info['next_execution'])
-                
-                # Kiểm tra thời gian thực hiện
-                if current_time >= next_execution:
-                    await self._execute_scheduled_post(schedule_id, schedule_info)
-                    
-            except Exception as e:
-                logger.error(f"Lỗi khi xử lý lịch đăng {schedule_id}: {e}")
+        now = self.clock.time()
+        due_ids = self._handle_misfires(self._pop_due(now), now)
+        if not due_ids:
+            return
+        # Các lịch tới giờ cùng lúc chạy đồng thời, dùng chung ngân sách gửi của PostManager.
+        # Kết quả của cả lượt được ghi file một lần sau khi gửi xong, trên thread pool để
+        # handler không phải chờ; các thay đổi khác (lên lịch/hủy từ bot, dashboard) vẫn được ghi ngay.
+        outcomes = await asyncio.gather(
+            *(self._execute_scheduled_post(schedule_id, self.scheduled_posts[schedule_id], save=False)
+              for schedule_id in due_ids),
+            return_exceptions=True
+        )
+        for schedule_id, outcome in zip(due_ids, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Lỗi khi xử lý lịch đăng {schedule_id}: {outcome}")
                 # Đánh dấu lỗi
+                schedule_info = self.scheduled_posts[schedule_id]
                 schedule_info['status'] = 'failed'
-                schedule_info['error'] = str(e)
-                self.save_scheduled_posts()
+                schedule_info['error'] = str(outcome)
+                self._touch(schedule_id)
+        await self.save_scheduled_posts_async()
+
+    def _handle_misfires(self, due_ids: List[str], now: float) -> List[str]:
+        """
+        Tách các lịch bị lỡ giờ (trễ quá thời gian ân hạn) khỏi các lịch đúng giờ.
+
+        Lịch lỡ giờ được xử lý theo chính sách của nó: `skip` nhảy tới lần kế tiếp trong tương lai,
+        `once`/`all` được xếp vào làn chạy bù. Trả về các lịch cần chạy ngay.
+        """
+        run_now, changed = [], []
+        overdue = []
+        for schedule_id in due_ids:
+            schedule_info = self.scheduled_posts[schedule_id]
+            if schedule_info.get('deferred_until'):
+                run_now.append(schedule_id)  # lần chạy bù đã được xếp lịch, tới lượt
+                continue
+            policy, grace = misfire_settings(schedule_info)
+            try:
+                lateness = now - datetime.fromisoformat(schedule_info['next_execution']).timestamp()
+            except (KeyError, TypeError, ValueError):
+                lateness = 0.0
+            if lateness <= grace:
+                run_now.append(schedule_id)
+            elif policy == 'skip':
+                self._skip_missed(schedule_id, schedule_info, now - grace)
+                changed.append(schedule_id)
+            else:
+                if policy == 'all':
+                    self._trim_missed(schedule_info, now)
+                overdue.append(schedule_id)
+
+        # Lịch lỡ lâu nhất được chạy bù trước
+        overdue.sort(key=lambda sid: self.scheduled_posts[sid]['next_execution'])
+        for schedule_id in overdue:
+            schedule_info = self.scheduled_posts[schedule_id]
+            start = self.catch_up.slot(len(schedule_info.get('channels') or []), now)
+            if start <= now:
+                run_now.append(schedule_id)
+            else:
+                schedule_info['deferred_until'] = deferred_iso(start)
+                changed.append(schedule_id)
+        if overdue:
+            logger.warning(
+                f"{len(overdue)} lịch bị lỡ giờ được chạy bù lần lượt "
+                f"(làn chạy bù còn {self.catch_up.backlog(now):.0f} giây)"
+            )
+        if changed:
+            self.save_scheduled_posts()
+            for schedule_id in changed:
+                self._touch(schedule_id)
+        return run_now
+
+    def _skip_missed(self, schedule_id: str, schedule_info: Dict[str, Any], cutoff: float):
+        """Bỏ qua các lần lỡ trước `cutoff`, chuyển lịch sang lần kế tiếp (hoặc 'missed' nếu hết lần chạy)"""
+        next_execution, missed = None, 1
+        try:
+            recurrence = self._recurrence_of(schedule_info)
+        except (KeyError, ValueError):
+            recurrence = None
+        if recurrence is not None:
+            offset = timedelta(seconds=schedule_info.get('load_offset') or 0)
+            current = datetime.fromisoformat(schedule_info['next_execution']) - offset
+            moment = datetime.fromtimestamp(cutoff).astimezone()
+            if current.tzinfo is None:
+                moment = moment.replace(tzinfo=None)
+            for occurrence in recurrence.iter_after(current):
+                if occurrence + offset >= moment:
+                    next_execution = occurrence + offset
+                    break
+                missed += 1
+        schedule_info['missed_count'] = (schedule_info.get('missed_count') or 0) + missed
+        if next_execution is None:
+            schedule_info['status'] = 'missed'
+        else:
+            schedule_info['next_execution'] = next_execution.isoformat()
+        logger.warning(f"Bỏ qua {missed} lần lỡ giờ của lịch {schedule_id}")
+
+    def _trim_missed(self, schedule_info: Dict[str, Any], now: float):
+        """Chính sách 'all': chỉ chạy bù tối đa MISFIRE_MAX_CATCH_UP lần lỡ gần nhất"""
+        from config import Config
+        try:
+            recurrence = self._recurrence_of(schedule_info)
+        except (KeyError, ValueError):
+            return
+        if recurrence is None:
+            return
+        offset = timedelta(seconds=schedule_info.get('load_offset') or 0)
+        current = datetime.fromisoformat(schedule_info['next_execution']) - offset
+        moment = datetime.fromtimestamp(now).astimezone() - offset
+        if current.tzinfo is None:
+            moment = moment.replace(tzinfo=None)
+        first, skipped = trim_missed(recurrence, current, moment, Config.MISFIRE_MAX_CATCH_UP)
+        if skipped:
+            schedule_info['next_execution'] = (first + offset).isoformat()
+            schedule_info['missed_count'] = (schedule_info.get('missed_count') or 0) + skipped
+            logger.warning(f"Lịch {schedule_info.get('id')}: bỏ qua {skipped} lần lỡ cũ nhất, chạy bù {Config.MISFIRE_MAX_CATCH_UP} lần")
+
+    def _managers(self) -> Tuple[Any, Any]:
+        """(PostManager, ChannelManager) dùng để gửi lịch đăng"""
+        if self.manager_provider is not None:
+            return self.manager_provider()
+        if self._own_managers is None:
+            from post_manager import PostManager
+            from channel_manager import ChannelManager
+            self._own_managers = (PostManager(), ChannelManager())
+        return self._own_managers
+
+    async def _resolve_channels(self, channel_manager, channels: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Lấy thông tin kênh hiện tại; trả về (kênh gửi được, kết quả lỗi của kênh đã xóa/tắt)"""
+        targets, skipped = [], []
+        for channel in channels:
+            current = await channel_manager.get_channel(str(channel['id']))
+            if current is None or not current.get('active', True):
+                skipped.append({
+                    'channel_id': channel['id'],
+                    'channel_title': channel.get('title', ''),
+                    'success': False,
+                    'error': 'Kênh đã bị xóa hoặc tạm dừng'
+                })
+            else:
+                targets.append(current)
+        return targets, skipped
     
-    async def _execute_scheduled_post(self, schedule_id: str, schedule_info: Dict[str, Any]):
-        """Thực hiện đăng bài theo lịch"""
+    async def _execute_scheduled_post(self, schedule_id: str, schedule_info: Dict[str, Any], save: bool = True):
+        """
+        Thực hiện đăng bài theo lịch qua PostManager/ChannelManager dùng chung của bot.
+
+        `save=False`: người gọi tự ghi file sau khi cả lượt chạy xong.
+        """
+        from config import Config
+        started_at = schedule_info.get('next_execution')
+        self._running_ids.add(schedule_id)
         try:
             logger.info(f"Đang thực hiện lịch đăng {schedule_id}")
             
             # Cập nhật trạng thái
             schedule_info['status'] = 'executing'
-            schedule_info['last_execution'] = datetime.now().isoformat()
-            
-            # Import post_manager và channel_manager
-            from post_manager import PostManager
-            from channel_manager import ChannelManager
+            schedule_info['last_execution'] = self.clock.now().isoformat()
+            schedule_info.pop('deferred_until', None)
+            self.index.update(schedule_id, schedule_info)
+            if not self.bot:
+                raise RuntimeError("Scheduler chưa có bot instance để gửi bài")
             
-            # Tạo instance
-            post_manager = PostManager()
-            channel_manager = ChannelManager()
+            post_manager, channel_manager = self._managers()
+            channels = schedule_info['channels']
+            if schedule_info.get('target'):
+                # Tag/nhóm có thể đã đổi từ lúc lên lịch: chọn lại kênh theo biểu thức
+                channels = channel_manager.resolve_target(schedule_info['target'])
+            targets, skipped = await self._resolve_channels(channel_manager, channels)
             
-            # Lấy bot instance (cần được truyền từ main bot)
-            # Tạm thời skip phần thực hiện gửi bài
-            # Trong thực tế, cần có cách để get bot instance
+            # Gửi đồng thời (delay 0) trong giới hạn SEND_CONCURRENCY / SEND_RATE_PER_SECOND
+            send_result = await post_manager.send_to_multiple_channels(
+                schedule_info['post_data'], targets, self.bot, delay_between_sends=0
+            )
+            results = [dict(r) for r in send_result['results']] + skipped
+            await channel_manager.update_channel_stats_many(send_result['results'])
             
-            # Ghi lại lịch sử thực hiện
+            # Ghi lại lịch sử thực hiện với kết quả thật của từng kênh
             execution_record = {
-                'executed_at': datetime.now().isoformat(),
-                'success': True,  # Tạm thời đặt true
-                'channels_sent': len(schedule_info['channels']),
-                'results': []
+                'executed_at': self.clock.now().isoformat(),
+                'success': send_result['successful_sends'] > 0,
+                'post_id': send_result['post_id'],
+                'channels_sent': send_result['successful_sends'],
+                'channels_failed': send_result['failed_sends'] + len(skipped),
+                'results': results
             }
             
-            schedule_info['execution_history'].append(execution_record)
-            schedule_info['executed_count'] += 1
+            # Trong lúc gửi, lịch có thể đã bị hủy (bot) hoặc thay bằng bản mới từ file (dashboard):
+            # ghi kết quả vào bản hiện tại
+            schedule_info = self.scheduled_posts.get(schedule_id, schedule_info)
+
+            # Run log giữ toàn bộ lịch sử (kèm kênh lỗi); file lịch chỉ giữ N lần gần nhất + bộ đếm
+            self.run_log.append([compact_run(schedule_id, execution_record)])
+            keep = max(0, Config.SCHEDULE_HISTORY_INLINE)
+            history = (schedule_info.get('execution_history') or []) + [inline_run(execution_record)]
+            schedule_info['execution_history'] = history[-keep:] if keep else []
+            schedule_info['run_stats'] = add_to_stats(schedule_info.get('run_stats'), execution_record)
+            schedule_info['executed_count'] = (schedule_info.get('executed_count') or 0) + 1
             
-            # Tính toán lần thực hiện tiếp theo
-            await self._calculate_next_execution(schedule_info)
+            # Tính toán lần thực hiện tiếp theo, trừ khi lịch đã bị hủy/đổi giờ trong lúc gửi
+            if self._still_running(schedule_info, started_at):
+                await self._calculate_next_execution(schedule_info)
+            else:
+                logger.info(f"Lịch đăng {schedule_id} đã bị đổi ({schedule_info.get('status')}) trong lúc gửi, giữ nguyên")
             
-            logger.info(f"Đã thực hiện lịch đăng {schedule_id}")
-            await self._notify_admins(f"✅ Đã thực hiện lịch đăng <b>{schedule_id}</b> thành công.")
+            summary = f"{execution_record['channels_sent']}/{len(results)} kênh"
+            if execution_record['success']:
+                logger.info(f"Đã thực hiện lịch đăng {schedule_id}: {summary}")
+                await self._notify_admins(f"✅ Đã thực hiện lịch đăng <b>{schedule_id}</b>: {summary} thành công.")
+            else:
+                logger.warning(f"Lịch đăng {schedule_id} không gửi được kênh nào")
+                await self._notify_admins(f"⚠️ Lịch đăng <b>{schedule_id}</b> không gửi được kênh nào ({len(results)} kênh).")
             
         except Exception as e:
             logger.error(f"Lỗi khi thực hiện lịch đăng {schedule_id}: {e}")
-            schedule_info['status'] = 'failed'
-            schedule_info['error'] = str(e)
+            schedule_info = self.scheduled_posts.get(schedule_id, schedule_info)
+            if self._still_running(schedule_info, started_at):
+                schedule_info['status'] = 'failed'
+                schedule_info['error'] = str(e)
             await self._notify_admins(f"❌ Lỗi khi thực hiện lịch đăng <b>{schedule_id}</b>: {e}")
         
         finally:
-            self.save_scheduled_posts()
+            self._running_ids.discard(schedule_id)
+            if save:
+                await self.save_scheduled_posts_async()
+            self._touch(schedule_id)
     
+    @staticmethod
+    def _still_running(schedule_info: Dict[str, Any], started_at: Optional[str]) -> bool:
+        """
+        Lịch vẫn là lần chạy đang gửi: còn 'executing', hoặc là bản nạp lại từ file (chưa kịp ghi
+        'executing') với cùng next_execution. Lịch đã hủy hay đổi giờ thì giữ nguyên trạng thái.
+        """
+        status = schedule_info.get('status')
+        if status == 'executing':
+            return True
+        return status == 'pending' and schedule_info.get('next_execution') == started_at
+
+    @staticmethod
+    def _recurrence_of(schedule_info: Dict[str, Any]) -> Optional[Recurrence]:
+        """Quy tắc lặp của một lịch: cron/RRULE đã lưu, hoặc quy đổi từ repeat_type kiểu cũ"""
+        start = datetime.fromisoformat(schedule_info['scheduled_time'])
+        rule = schedule_info.get('recurrence')
+        if rule:
+            return Recurrence(rule, start, schedule_info.get('timezone'), schedule_info.get('exdates') or ())
+        rule = legacy_rule(schedule_info.get('repeat_type', 'none'), start)
+        return Recurrence(rule, start) if rule else None
+
+    @classmethod
+    def _projected_runs(cls, schedule_info: Dict[str, Any], until: float) -> Iterator[float]:
+        """Các lần lặp sau next_execution tới `until` (epoch), theo repeat_count còn lại; dùng để tính tải"""
+        try:
+            recurrence = cls._recurrence_of(schedule_info)
+            after = datetime.fromisoformat(schedule_info['next_execution'])
+        except (KeyError, TypeError, ValueError):
+            return
+        if recurrence is None:
+            return
+        repeat_count = schedule_info.get('repeat_count', 1)
+        remaining = repeat_count - (schedule_info.get('executed_count', 0) or 0) - 1 if repeat_count > 0 else None
+        offset = timedelta(seconds=schedule_info.get('load_offset') or 0)
+        for occurrence in recurrence.iter_after(after - offset):
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                remaining -= 1
+            moment = (occurrence + offset).timestamp()
+            if moment > until:
+                return
+            yield moment
+
     async def _calculate_next_execution(self, schedule_info: Dict[str, Any]):
         """Tính toán thời gian thực hiện tiếp theo"""
-        repeat_type = schedule_info.get('repeat_type', 'none')
         repeat_count = schedule_info.get('repeat_count', 1)
         executed_count = schedule_info.get('executed_count', 0)
         
-        # Kiểm tra xem đã đủ số lần lặp lại chưa
-        if executed_count >= repeat_count:
+        # Kiểm tra xem đã đủ số lần lặp lại chưa (repeat_count <= 0: lặp không giới hạn)
+        if repeat_count > 0 and executed_count >= repeat_count:
             schedule_info['status'] = 'completed'
             return
         
-        # Tính toán thời gian thực hiện tiếp theo
-        if repeat_type == 'none':
+        try:
+            recurrence = self._recurrence_of(schedule_info)
+        except (KeyError, ValueError) as e:
+            logger.error(f"Quy tắc lặp của lịch {schedule_info.get('id')} không hợp lệ: {e}")
+            recurrence = None
+        
+        # Tính toán thời gian thực hiện tiếp theo; trừ chính sách 'all', các lần đã lỡ quá
+        # thời gian ân hạn được gộp lại (nhảy thẳng tới lần kế tiếp chưa lỡ)
+        next_execution = None
+        offset = timedelta(seconds=schedule_info.get('load_offset') or 0)
+        if recurrence is not None:
+            after = datetime.fromisoformat(schedule_info['next_execution']) - offset
+            policy, grace = misfire_settings(schedule_info)
+            if policy != 'all':
+                cutoff = self.clock.now().astimezone() - timedelta(seconds=grace)
+                if after.tzinfo is None:
+                    cutoff = cutoff.replace(tzinfo=None)
+                after = max(after, cutoff)
+            next_execution = recurrence.next_after(after)
+            if next_execution is not None:
+                next_execution += offset
+        if next_execution is None:
             schedule_info['status'] = 'completed'
-            
-        elif repeat_type == 'daily':
-            current_next = datetime.fromisoformat(schedule_info['next_execution'])
-            next_execution = current_next + timedelta(days=1)
-            schedule_info['next_execution'] = next_execution.isoformat()
-            
-        elif repeat_type == 'weekly':
-            current_next = datetime.fromisoformat(schedule_info['next_execution'])
-            next_execution = current_next + timedelta(weeks=1)
-            schedule_info['next_execution'] = next_execution.isoformat()
-            
-        elif repeat_type == 'monthly':
-            current_next = datetime.fromisoformat(schedule_info['next_execution'])
-            # Tính toán tháng tiếp theo
-            if current_next.month == 12:
-                next_execution = current_next.replace(year=current_next.year + 1, month=1)
-            else:
-                next_execution = current_next.replace(month=current_next.month + 1)
+        else:
             schedule_info['next_execution'] = next_execution.isoformat()
-        
-        # Đặt lại trạng thái pending nếu còn lần thực hiện
-        if schedule_info['status'] != 'completed':
             schedule_info['status'] = 'pending'
     
     async def get_upcoming_posts(self, hours: int = 24) -> List[Dict[str, Any]]:
-        """Lấy các bài đăng sắp tới trong vòng X giờ"""
-        current_time = datetime.now()
-        cutoff_time = current_time + timedelta(hours=hours)
-        
-        upcoming_posts = []
-        for schedule_info in self.scheduled_posts.values():
-            if schedule_info.get('status') != 'pending':
-                continue
-            
-            try:
-                next_execution = datetime.fromisoformat(schedule_info['next_execution'])
-                if current_time <= next_execution <= cutoff_time:
-                    upcoming_posts.append(schedule_info)
-            except:
-                pass
-        
-        upcoming_posts.sort(key=lambda x: x.get('next_execution', ''))
-        return upcoming_posts
+        """Lấy các bài đăng sắp tới trong vòng X giờ (truy vấn khoảng trên index, O(log n + k))"""
+        self._sync()
+        now = self.clock.time()
+        return [
+            self.scheduled_posts[schedule_id]
+            for schedule_id in self.index.pending_between(now, now + hours * 3600)
+        ]
     
+    async def get_execution_history(self, schedule_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Các lần chạy gần nhất của một lịch (đọc từ run log, mới nhất trước)"""
+        return self.run_log.recent(schedule_id, limit)
+
     async def get_scheduler_stats(self) -> Dict[str, Any]:
-        """Lấy thống kê scheduler"""
-        total_scheduled = len(self.scheduled_posts)
-        pending_count = len([s for s in self.scheduled_posts.values() if s.get('status') == 'pending'])
-        completed_count = len([s for s in self.scheduled_posts.values() if s.get('status') == 'completed'])
-        failed_count = len([s for s in self.scheduled_posts.values() if s.get('status') == 'failed'])
-        
-        # Tổng số lần thực hiện
-        total_executions = sum(s.get('executed_count', 0) for s in self.scheduled_posts.values())
-        
-        # Upcoming posts trong 24h
-        upcoming_posts = await self.get_upcoming_posts(24)
-        
+        """Lấy thống kê scheduler (đọc bộ đếm của index, không duyệt toàn bộ lịch)"""
+        self._sync()
+        now = self.clock.time()
         return {
-            'total_scheduled': total_scheduled,
-            'pending_count': pending_count,
-            'completed_count': completed_count,
-            'failed_count': failed_count,
-            'total_executions': total_executions,
-            'upcoming_24h': len(upcoming_posts),
+            'total_scheduled': len(self.scheduled_posts),
+            'pending_count': self.index.count('pending'),
+            'completed_count': self.index.count('completed'),
+            'failed_count': self.index.count('failed'),
+            'total_executions': self.index.total_executions,
+            'upcoming_24h': self.index.count_pending_between(now, now + 24 * 3600),
             'scheduler_running': self.running
         }
     
     async def cleanup_old_schedules(self, days: int = 30) -> int:
         """Dọn dẹp lịch đăng cũ đã hoàn thành"""
-        cutoff_date = datetime.now() - timedelta(days=days)
+        self._sync()
+        cutoff_date = self.clock.now() - timedelta(days=days)
         deleted_count = 0
         schedules_to_delete = []
         
@@ -332,6 +839,8 @@ class PostScheduler:
         
         for schedule_id in schedules_to_delete:
             del self.scheduled_posts[schedule_id]
+            self.index.update(schedule_id, None)
+            self._unsaved.add(schedule_id)
             deleted_count += 1
         
         if deleted_count > 0:
@@ -341,11 +850,14 @@ class PostScheduler:
     
     async def reschedule_post(self, schedule_id: str, new_time: datetime) -> bool:
         """Thay đổi thời gian lịch đăng"""
+        self._sync()
         if schedule_id in self.scheduled_posts:
             schedule_info = self.scheduled_posts[schedule_id]
             if schedule_info.get('status') == 'pending':
                 schedule_info['next_execution'] = new_time.isoformat()
                 self.save_scheduled_posts()
+                self._touch(schedule_id)
+                self._wake()
                 return True
         return False
     
@@ -356,7 +868,7 @@ class PostScheduler:
         
         try:
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(self.scheduled_posts, f, ensure_ascii=False, indent=2)
+                json.dump(self.scheduled_posts, f, ensure_ascii=False, indent=2, default=json_default)
             return filename
         except Exception as e:
             logger.exception("Lỗi khi xuất dữ liệu lịch đăng")
@@ -1,21 +1,61 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import copy
 import json
 import os
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from types import MappingProxyType
+from typing import Dict, Any, Optional, List, Mapping
 from config import Config
+from backup_store import BackupStore
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+class SettingsSnapshot:
+    """
+    Ảnh chụp cài đặt chỉ đọc tại một phiên bản.
+
+    Dùng cho đường nóng (mỗi lần gửi bài): một lần tra dict theo (category, key),
+    không phải đi qua các dict lồng nhau và không bị thay đổi giữa chừng.
+    """
+
+    __slots__ = ('version', '_values', '_categories')
+
+    def __init__(self, version: int, settings: Dict[str, Any]):
+        self.version = version
+        frozen = copy.deepcopy(settings)
+        self._values = {
+            (category, key): value
+            for category, values in frozen.items() if isinstance(values, dict)
+            for key, value in values.items()
+        }
+        self._categories = {
+            category: MappingProxyType(values)
+            for category, values in frozen.items() if isinstance(values, dict)
+        }
+
+    def get(self, category: str, key: str, default=None):
+        return self._values.get((category, key), default)
+
+    def category(self, category: str) -> Mapping[str, Any]:
+        return self._categories.get(category, MappingProxyType({}))
+
+
 class SettingsManager:
     """Quản lý cài đặt bot"""
     
     def __init__(self, settings_file: str = "bot_settings.json"):
         self.settings_file = settings_file
         self.settings = self._get_default_settings()
+        self._version = 0  # tăng mỗi lần cài đặt được ghi (commit)
+        self._snapshot: Optional[SettingsSnapshot] = None
+        self._batch_depth = 0
+        self._batch_dirty = False
+        self._batch_backup: Optional[Dict[str, Any]] = None  # bản đã commit trước batch
         self.load_settings()
     
     def _get_default_settings(self) -> Dict[str, Any]:
@@ -128,18 +168,69 @@ class SettingsManager:
                     default[key] = value
     
     def save_settings(self):
-        """Lưu cài đặt vào file"""
+        """Lưu cài đặt vào file (trong batch(): hoãn tới khi batch kết thúc)"""
+        if self._batch_depth > 0:
+            self._batch_dirty = True
+            return
+        self._version += 1
+        self._snapshot = None
         try:
             # Cập nhật metadata
             self.settings["meta"]["last_updated"] = datetime.now().isoformat()
             self.settings["meta"]["update_count"] += 1
             
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
+            tmp_file = f"{self.settings_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(self.settings, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.settings_file)
             logger.info(f"Đã lưu cài đặt vào {self.settings_file}")
         except Exception as e:
             logger.error(f"Lỗi khi lưu cài đặt: {e}")
     
+    @contextmanager
+    def batch(self):
+        """
+        Gom nhiều thay đổi thành một lần ghi:
+
+            with settings_manager.batch():
+                settings_manager.set_setting("notifications", "admin_notifications", False)
+                ...
+
+        Lỗi bên trong khối lệnh sẽ hoàn tác toàn bộ thay đổi. Cho phép lồng nhau,
+        chỉ batch ngoài cùng mới ghi file.
+        """
+        outermost = self._batch_depth == 0
+        if outermost:
+            self._batch_backup = copy.deepcopy(self.settings)
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if outermost:
+                self.settings = self._batch_backup
+                self._batch_backup = None
+                self._batch_dirty = False
+            raise
+        self._batch_depth -= 1
+        if outermost:
+            self._batch_backup = None
+            if self._batch_dirty:
+                self._batch_dirty = False
+                self.save_settings()
+    
+    def snapshot(self) -> SettingsSnapshot:
+        """Ảnh chụp chỉ đọc của cài đặt đã commit (dùng lại tới lần ghi tiếp theo)"""
+        if self._snapshot is None or self._snapshot.version != self._version:
+            # Trong batch, thay đổi chưa commit không được lộ ra cho người đọc
+            committed = self._batch_backup if self._batch_backup is not None else self.settings
+            self._snapshot = SettingsSnapshot(self._version, committed)
+        return self._snapshot
+    
+    @property
+    def version(self) -> int:
+        return self._version
+    
     def get_setting(self, category: str, key: str, default=None):
         """Lấy giá trị cài đặt"""
         return self.settings.get(category, {}).get(key, default)
@@ -173,29 +264,39 @@ class SettingsManager:
         self.settings = self._get_default_settings()
         self.save_settings()
     
+    def _backup_store(self) -> BackupStore:
+        """Kho backup theo cấu hình hiện tại (thư mục, số bản tối đa)"""
+        backup_settings = self.settings.get("backup", {})
+        return BackupStore(
+            root=backup_settings.get("backup_location") or "backups",
+            max_backups=backup_settings.get("max_backup_files", 10)
+        )
+    
     def create_backup(self):
-        """Tạo backup cài đặt"""
+        """Tạo backup cài đặt (kho backup chống trùng lặp), trả về ID backup"""
         try:
-            backup_name = f"settings_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            backup_path = os.path.join("backups", backup_name)
-            
-            # Tạo thư mục backup nếu chưa có
-            os.makedirs("backups", exist_ok=True)
+            data = json.dumps(self.settings, ensure_ascii=False, indent=2).encode('utf-8')
+            backup_id = self._backup_store().backup_bytes(data, 'settings', source=self.settings_file)['id']
             
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(self.settings, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"Đã tạo backup cài đặt: {backup_path}")
-            return backup_path
+            logger.info(f"Đã tạo backup cài đặt: {backup_id}")
+            return backup_id
         except Exception as e:
             logger.error(f"Lỗi khi tạo backup: {e}")
             return None
     
+    def list_backups(self) -> List[Dict[str, Any]]:
+        """Danh sách backup cài đặt (mới nhất trước)"""
+        return self._backup_store().list_backups('settings')
+    
     def restore_from_backup(self, backup_file: str) -> bool:
-        """Khôi phục từ backup"""
+        """Khôi phục từ backup (ID trong kho backup hoặc đường dẫn file kiểu cũ)"""
         try:
-            with open(backup_file, 'r', encoding='utf-8') as f:
-                backup_settings = json.load(f)
+            store = self._backup_store()
+            if store.get_backup(backup_file) is not None:
+                backup_settings = json.loads(store.read_text(backup_file))
+            else:
+                with open(backup_file, 'r', encoding='utf-8') as f:
+                    backup_settings = json.load(f)
             
             self.settings = backup_settings
             self.save_settings()
@@ -205,6 +306,25 @@ class SettingsManager:
             logger.error(f"Lỗi khi khôi phục từ backup: {e}")
             return False
     
+    def import_settings(self, import_file: str) -> bool:
+        """Nhập cài đặt từ file JSON (chỉ các key đã biết), ghi một lần"""
+        try:
+            with open(import_file, 'r', encoding='utf-8') as f:
+                imported = json.load(f)
+            
+            with self.batch():
+                for category, values in imported.items():
+                    if category == "meta" or not isinstance(values, dict):
+                        continue
+                    for key, value in values.items():
+                        if key in self.settings.get(category, {}):
+                            self.set_setting(category, key, value)
+            logger.info(f"Đã nhập cài đặt từ {import_file}")
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi nhập cài đặt: {e}")
+            return False
+    
     def export_settings(self, export_file: Optional[str] = None) -> Optional[str]:
         """Xuất cài đặt ra file"""
         if not export_file:
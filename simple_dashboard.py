@@ -9,6 +9,7 @@ from urllib.parse import urlparse, parse_qs
 import socketserver
 import threading
 import webbrowser
+from file_sync import SharedJSONStore
 
 class BotDashboard:
     """Bảng điều khiển web đơn giản cho bot"""
@@ -19,22 +20,36 @@ class BotDashboard:
         self.channels_file = "channels.json"
         self.posts_file = "posts.json"
         self.scheduled_file = "scheduled_posts.json"
+        self._stores = {}  # filename: SharedJSONStore
+        self._cache = {}  # filename: dữ liệu đã đọc, chỉ đọc lại khi file đổi
         
+    def _store(self, filename):
+        if filename not in self._stores:
+            self._stores[filename] = SharedJSONStore(filename)
+        return self._stores[filename]
+    
     def load_json_file(self, filename):
-        """Tải file JSON"""
+        """Tải file JSON (có khóa, dùng lại bản đã đọc nếu file chưa đổi)"""
+        store = self._store(filename)
+        if filename in self._cache:
+            store.refresh(self._cache[filename])
+            return self._cache[filename]
         if os.path.exists(filename):
             try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                self._cache[filename] = store.load() or {}
+                return self._cache[filename]
             except:
                 return {}
         return {}
     
     def save_json_file(self, filename, data):
-        """Lưu file JSON"""
+        """Lưu file JSON (khóa + gộp thay đổi của bot trước khi ghi)"""
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            store = self._store(filename)
+            if filename not in self._cache:
+                store.load()
+            store.save(data)
+            self._cache[filename] = data
             return True
         except:
             return False
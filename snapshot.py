@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import pickle
+from typing import Any, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Định dạng: MAGIC + sha256(body) + body, body = pickle((chữ ký file JSON nguồn, payload))
+MAGIC = b'MPBSNAP1'
+DIGEST_SIZE = 32
+PICKLE_PROTOCOL = min(5, pickle.HIGHEST_PROTOCOL)
+
+
+def snapshot_path(source: str) -> str:
+    """File snapshot đi kèm một file JSON (vd: posts.json -> posts.json.snap)"""
+    return f"{source}.snap"
+
+
+def source_signature(source: str) -> Optional[Tuple[int, int]]:
+    """Chữ ký (mtime_ns, size) của file JSON nguồn, None nếu chưa có file"""
+    try:
+        st = os.stat(source)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def write_snapshot(source: str, payload: Any) -> bool:
+    """
+    Ghi snapshot nhị phân của dữ liệu đã nạp từ `source`.
+
+    Chỉ gọi khi dữ liệu trong bộ nhớ đã khớp với file JSON (vừa lưu xong):
+    snapshot ghi kèm chữ ký của file JSON lúc đó và chỉ được dùng lại khi file chưa đổi.
+    """
+    signature = source_signature(source)
+    if signature is None:
+        return False
+    path = snapshot_path(source)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        body = pickle.dumps((signature, payload), protocol=PICKLE_PROTOCOL)
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(hashlib.sha256(body).digest())
+            f.write(body)
+        os.replace(tmp_path, path)
+        logger.info(f"Đã ghi snapshot {path} ({len(body)} byte)")
+        return True
+    except Exception as e:
+        logger.error(f"Lỗi khi ghi snapshot {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def read_snapshot(source: str) -> Optional[Any]:
+    """
+    Đọc snapshot của `source` nếu còn dùng được, ngược lại trả về None (đọc JSON như thường).
+
+    Snapshot bị bỏ qua khi: không tồn tại, cũ hơn file JSON, file JSON đã bị sửa sau khi
+    ghi snapshot (chữ ký khác), hoặc checksum không khớp. Snapshot là file cục bộ do chính
+    bot ghi ra; checksum chỉ phát hiện file hỏng, không dùng để xác thực nguồn.
+    """
+    path = snapshot_path(source)
+    signature = source_signature(source)
+    if signature is None or not os.path.exists(path):
+        return None
+    try:
+        if os.stat(path).st_mtime_ns < signature[0]:
+            return None
+        with open(path, 'rb') as f:
+            raw = f.read()
+        header_size = len(MAGIC) + DIGEST_SIZE
+        if raw[:len(MAGIC)] != MAGIC:
+            logger.warning(f"Snapshot {path} sai định dạng, bỏ qua")
+            return None
+        body = raw[header_size:]
+        if hashlib.sha256(body).digest() != raw[len(MAGIC):header_size]:
+            logger.warning(f"Snapshot {path} sai checksum, bỏ qua")
+            return None
+        stored_signature, payload = pickle.loads(body)
+        if tuple(stored_signature) != signature:
+            return None
+        return payload
+    except Exception as e:
+        logger.error(f"Lỗi khi đọc snapshot {path}: {e}")
+        return None
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import builtins
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Mốc thời gian sớm nhất đo được (lúc module này được import)
+PROCESS_START = time.perf_counter()
+PROFILE_FLAG = '--profile-startup'
+
+
+class StartupTimer:
+    """Ghi lại thời gian từng giai đoạn khởi động để in ra log"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        return f"tổng {self.elapsed() * 1000:.0f}ms ({parts})"
+
+    def report(self) -> str:
+        lines = ["⏱️ Các giai đoạn khởi tạo:"]
+        for name, seconds in sorted(self.phases.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"  {seconds * 1000:8.1f} ms  {name}")
+        lines.append(f"  {self.elapsed() * 1000:8.1f} ms  tổng thời gian khởi tạo bot")
+        return "\n".join(lines)
+
+
+class ImportProfiler:
+    """
+    Đo thời gian import từng module (bọc builtins.__import__).
+
+    Chỉ đo lần import đầu của mỗi module; thời gian là inclusive (gồm cả các module con
+    mà nó kéo theo), độ sâu được tính riêng cho từng luồng.
+    """
+
+    def __init__(self):
+        self.records: List[Tuple[str, int, float]] = []  # (module, độ sâu, giây)
+        self._original = None
+        self._local = threading.local()
+
+    def install(self) -> 'ImportProfiler':
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+        return self
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            self._local.depth = depth
+            self.records.append((name, depth, time.perf_counter() - start))
+
+    def report(self, limit: int = 15) -> str:
+        top_level = sorted((r for r in self.records if r[1] == 0), key=lambda r: r[2], reverse=True)
+        total = sum(r[2] for r in top_level)
+        lines = [f"📦 Thời gian import ({len(self.records)} module, {total * 1000:.1f} ms):"]
+        for name, _, seconds in top_level[:limit]:
+            lines.append(f"  {seconds * 1000:8.1f} ms  {name}")
+        return "\n".join(lines)
+
+
+def profile_imports_if_requested(argv: Optional[List[str]] = None) -> Optional[ImportProfiler]:
+    """Bật đo thời gian import nếu chạy với --profile-startup (gọi trước các import nặng)"""
+    if PROFILE_FLAG in (sys.argv if argv is None else argv):
+        return ImportProfiler().install()
+    return None
+
+
+class lazy_component:
+    """
+    Thuộc tính được tạo bằng `factory(instance)` ở lần truy cập đầu tiên rồi lưu vào
+    instance (các lần sau là truy cập thuộc tính thường). An toàn khi nhiều luồng cùng truy cập.
+    """
+
+    def __init__(self, factory: Callable[[Any], Any]):
+        self.factory = factory
+        self.name = factory.__name__
+        self._lock = threading.RLock()
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        with self._lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.factory(instance)
+        return instance.__dict__[self.name]
+
+    @staticmethod
+    def is_loaded(instance, name: str) -> bool:
+        return name in instance.__dict__
+
+
+class LazyProxy:
+    """Đại diện cho một đối tượng dùng chung cấp module, chỉ khởi tạo khi được dùng lần đầu"""
+
+    __slots__ = ('_factory', '_instance', '_lock')
+
+    def __init__(self, factory: Callable[[], Any]):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _resolve(self) -> Any:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    instance = self._factory()
+                    object.__setattr__(self, '_instance', instance)
+        return instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._resolve(), name)
+
+    def __repr__(self) -> str:
+        state = 'đã tạo' if self._instance is not None else 'chưa tạo'
+        return f"<LazyProxy {state}: {self._factory!r}>"
+
+
+def load_managers(
+    factories: Dict[str, Callable[[], Any]],
+    timer: Optional[StartupTimer] = None,
+    parallel: bool = True
+) -> Dict[str, Any]:
+    """
+    Khởi tạo các manager (mỗi cái tự đọc file của mình) song song trên thread pool.
+
+    Trả về {tên: instance} theo đúng thứ tự của `factories`. Lỗi của một manager
+    được ném lại sau khi các manager khác đã xong, giống như khi khởi tạo tuần tự.
+    """
+    def timed(name: str, factory: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        instance = factory()
+        if timer is not None:
+            timer.record(name, time.perf_counter() - start)
+        return instance
+
+    if not parallel or len(factories) < 2:
+        return {name: timed(name, factory) for name, factory in factories.items()}
+
+    with ThreadPoolExecutor(max_workers=len(factories), thread_name_prefix="startup") as pool:
+        futures = {name: pool.submit(timed, name, factory) for name, factory in factories.items()}
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import backup_store
+from backup_store import BackupStore
+
+
+def test_reused_chunk_is_touched_so_gc_keeps_it(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = BackupStore(root=str(tmp_path / "backups"))
+    digest, written = store._put_chunk(b"noi dung chunk")
+    assert written > 0
+    path = store._find_chunk(digest)
+    old = time.time() - backup_store.GC_GRACE_SECONDS - 60
+    os.utime(path, (old, old))
+
+    assert store._put_chunk(b"noi dung chunk") == (digest, 0)
+    assert os.path.getmtime(path) > time.time() - 5
+    # Chưa có recipe nào dùng chunk nhưng vẫn trong thời gian ân hạn nên không bị dọn
+    assert store._collect_garbage({}) == 0
+    assert os.path.exists(path)
+
+
+def test_chunk_removed_before_reuse_is_written_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = BackupStore(root=str(tmp_path / "backups"))
+    digest, _ = store._put_chunk(b"noi dung chunk")
+    path = store._find_chunk(digest)
+    monkeypatch.setattr(store, '_find_chunk', lambda digest: path)
+    os.remove(path)
+
+    _, written = store._put_chunk(b"noi dung chunk")
+
+    assert written > 0 and os.path.exists(path)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""Chạy MassPostBot thật (Application + handler) với Bot API giả, không cần mạng"""
+import asyncio
+import itertools
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from telegram import Update
+from telegram.error import Forbidden
+from telegram.ext import Application, ExtBot
+
+from config import Config
+
+ADMIN = Config.ADMIN_IDS[0]
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'testbot'}
+
+
+class FakeApiBot(ExtBot):
+    """Trả lời Bot API ngay trong tiến trình: ghi lại mọi lời gọi, kênh trong `_kicked` trả Forbidden"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._calls = []
+        self._kicked = set()
+        self._ids = itertools.count(100)
+
+    def _message(self, chat_id, text=''):
+        chat = {'id': int(chat_id), 'type': 'channel', 'title': 'Kênh'}
+        return {'message_id': next(self._ids), 'date': int(time.time()), 'chat': chat, 'text': text}
+
+    async def _do_post(self, endpoint, data, **kwargs):
+        self._calls.append((endpoint, dict(data)))
+        chat_id = data.get('chat_id')
+        if endpoint == 'getMe':
+            return BOT_USER
+        if endpoint.startswith('send') and str(chat_id) in self._kicked:
+            raise Forbidden('bot was kicked from the channel chat')
+        if endpoint.startswith(('send', 'edit')):
+            return self._message(chat_id or ADMIN, data.get('text', ''))
+        if endpoint == 'getChat':
+            return {'id': int(chat_id), 'type': 'channel', 'title': f'Kênh {chat_id}'}
+        if endpoint == 'getChatMember':
+            return {
+                'status': 'administrator', 'user': BOT_USER, 'can_be_edited': False, 'is_anonymous': False,
+                'can_manage_chat': True, 'can_delete_messages': True, 'can_manage_video_chats': True,
+                'can_restrict_members': True, 'can_promote_members': False, 'can_change_info': True,
+                'can_invite_users': True, 'can_post_messages': True
+            }
+        return True
+
+    def sent_to(self, endpoint):
+        return [data for name, data in self._calls if name == endpoint]
+
+
+class Harness:
+    def __init__(self, api, app, bot):
+        self.api = api
+        self.app = app
+        self.bot = bot
+        self.errors = []
+        self._updates = itertools.count(1)
+        app.add_error_handler(self._on_error)
+
+    async def _on_error(self, update, context):
+        self.errors.append(context.error)
+
+    def _admin_message(self, text):
+        message = {
+            'message_id': next(self._updates), 'date': int(time.time()), 'text': text,
+            'chat': {'id': ADMIN, 'type': 'private'}, 'from': {'id': ADMIN, 'is_bot': False, 'first_name': 'Admin'}
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return message
+
+    async def text(self, text):
+        update = {'update_id': next(self._updates), 'message': self._admin_message(text)}
+        await self.app.process_update(Update.de_json(update, self.api))
+
+    async def press(self, data):
+        query = {
+            'id': str(next(self._updates)), 'chat_instance': 'chat', 'data': data,
+            'from': {'id': ADMIN, 'is_bot': False, 'first_name': 'Admin'}, 'message': self._admin_message('menu')
+        }
+        await self.app.process_update(Update.de_json({'update_id': next(self._updates), 'callback_query': query}, self.api))
+
+    def last_text(self, endpoint='editMessageText'):
+        sent = self.api.sent_to(endpoint)
+        return sent[-1].get('text', '') if sent else ''
+
+    async def compose(self, text, **settings):
+        """Mở Đăng bài nhanh, nhập nội dung, bỏ qua nút -> tới bàn phím chọn kênh"""
+        await self.press('quick_post')
+        self.bot.user_states[ADMIN]['settings'].update(settings)
+        await self.press('quick_post_next')
+        await self.text(text)
+        await self.press('skip_add_buttons')
+
+
+async def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("hết thời gian chờ")
+        await asyncio.sleep(0.05)
+
+
+@pytest.fixture(params=['off', 'sqlite'])
+def run_bot(request, tmp_path, monkeypatch):
+    """Chạy một kịch bản trên bot đã khởi động (post_init), dừng bot khi xong"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, 'LEADER_ELECTION', request.param)
+    monkeypatch.setattr(Config, 'LEADER_LEASE_TTL', 2)
+    monkeypatch.setattr(Config, 'SCHEDULER_CHECK_INTERVAL', 1)
+    monkeypatch.setattr(Config, 'EXPIRY_CHECK_INTERVAL', 1)
+    monkeypatch.setattr(Config, 'ROLLOUT_CANARY_SIZE', 2)
+    monkeypatch.setattr(Config, 'ROLLOUT_WAVE_SIZE', 3)
+    monkeypatch.setattr(Config, 'ROLLOUT_WAVE_INTERVAL', 0)
+    monkeypatch.setattr(Config, 'ROLLOUT_CONFIRM_CANARY', False)
+    import mass_post_bot
+    monkeypatch.setattr(mass_post_bot.MassPostBot, '_delete_webhook', lambda self: None)
+
+    def run(scenario):
+        async def main():
+            api = FakeApiBot('123:abc')
+            app = Application.builder().bot(api).updater(None).build()
+            bot = mass_post_bot.MassPostBot('123:abc', application=app)
+            await app.initialize()
+            await app.start()
+            await bot._on_post_init(app)
+            harness = Harness(api, app, bot)
+            try:
+                for channel_id in range(-1001, -1008, -1):
+                    await harness.text(f'/add_channel {channel_id}')
+                await scenario(harness)
+            finally:
+                await bot._on_post_shutdown(app)
+                await app.stop()
+                await app.shutdown()
+                # Ghi ngay ngôn ngữ đã chọn vào tmp_path (không để tới atexit, khi cwd đã đổi lại)
+                bot.language_manager.flush_user_languages()
+            assert harness.errors == []
+
+        asyncio.run(main())
+
+    return run
+
+
+def test_quick_post_to_group_with_expiry(run_bot):
+    async def scenario(h):
+        await h.text('/tag -1001 vip')
+        await h.text('/tag -1002 vip')
+        await h.text('/group vips vip')
+        assert '2 kênh' in h.last_text('sendMessage')
+
+        await h.compose('Xin chào', expire_after=1)
+        await h.press('picker_groups')
+        assert 'vips' in str(h.api.sent_to('editMessageText')[-1]['reply_markup'].to_dict())
+        await h.press('picker_group_0')
+        await h.press('select_channels_done')
+        assert h.last_text().startswith('📤 Đã gửi bài tới 2/2 kênh.')
+        assert '⏳ Tự xóa' in h.last_text()
+        assert sorted(data['chat_id'] for data in h.api.sent_to('sendMessage')[-2:]) == ['-1001', '-1002']
+
+        await _wait_for(lambda: len(h.api.sent_to('deleteMessage')) == 2)
+
+    run_bot(scenario)
+
+
+def test_rollout_reports_failed_channel(run_bot):
+    async def scenario(h):
+        h.api._kicked.add('-1007')
+        await h.compose('Gửi theo đợt', rollout=True)
+        await h.press('post_to_all')
+        await _wait_for(lambda: ADMIN not in h.bot.rollouts)
+        assert '6/7 kênh đã gửi, 1 lỗi' in h.last_text()
+        assert '-1007' in h.last_text()
+
+    run_bot(scenario)
+
+
+def test_rollout_canary_expires_from_its_own_send_time(run_bot):
+    async def scenario(h):
+        Config.ROLLOUT_WAVE_INTERVAL = 1  # fixture monkeypatch khôi phục giá trị sau test
+        await h.compose('Canary có hạn', rollout=True, expire_after=1)
+        await h.press('post_to_all')
+        await _wait_for(lambda: ADMIN not in h.bot.rollouts)
+
+        record = next(post for post in h.bot.post_manager.posts.values() if post.get('expires_at'))
+        results = sorted(record['channels'].values(), key=lambda result: result['sent_at'])
+        canary, last = results[0], results[-1]
+        # Tin canary hết hạn 1 giây sau khi gửi, trước cả khi đợt cuối được gửi
+        assert canary['expires_at'] == (datetime.fromisoformat(canary['sent_at']) + timedelta(seconds=1)).isoformat()
+        assert canary['expires_at'] < last['sent_at'] < last['expires_at']
+
+        await _wait_for(lambda: len(h.api.sent_to('deleteMessage')) == 7)
+
+    run_bot(scenario)
+
+
+def test_scheduled_post_is_sent(run_bot):
+    async def scenario(h):
+        when = datetime.now() + timedelta(seconds=1)
+        schedule_id = await h.bot.scheduler.schedule_post(
+            {'type': 'text', 'text': 'Đã hẹn giờ'}, [{'id': -1003, 'title': 'Kênh -1003'}], when
+        )
+        schedules = h.bot.scheduler.scheduled_posts
+        await _wait_for(lambda: schedules[schedule_id]['status'] != 'pending')
+        assert schedules[schedule_id]['status'] == 'completed'
+        assert {'chat_id': -1003, 'text': 'Đã hẹn giờ'} in h.api.sent_to('sendMessage')
+
+    run_bot(scenario)
+
+
+def test_admin_menus_open_without_errors(run_bot):
+    async def scenario(h):
+        await h.text('/admin')
+        await h.text('/language')
+        await h.press('show_language_menu')
+        pending = [
+            button.callback_data
+            for row in h.api.sent_to('sendMessage')[-2]['reply_markup'].inline_keyboard for button in row
+        ]
+        seen = set()
+        while pending:
+            data = pending.pop(0)
+            # Bỏ các nút xóa/đặt lại dữ liệu, chỉ mở menu
+            if not data or data in seen or data.startswith(('confirm_', 'reset', 'cleanup', 'bulk_', 'delete_', 'remove_')):
+                continue
+            seen.add(data)
+            start = len(h.api._calls)
+            await h.press(data)
+            for _, sent in h.api._calls[start:]:
+                markup = sent.get('reply_markup')
+                if hasattr(markup, 'inline_keyboard'):
+                    pending.extend(button.callback_data for row in markup.inline_keyboard for button in row)
+            h.bot.user_states.pop(ADMIN, None)
+        assert len(seen) > 50
+
+    run_bot(scenario)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from channel_manager import ChannelManager
+from channel_targeting import TargetExpressionError
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = ChannelManager(str(tmp_path / "channels.json"))
+    for i, (tags, active) in enumerate([(['vn', 'promo'], True), (['vn'], False), (['us', 'promo'], True)]):
+        manager.upsert_channel(f"-10{i}", {'id': f"-10{i}", 'title': f"Kênh {i}", 'tags': tags, 'active': active})
+    return manager
+
+
+def test_resolve_target_uses_tags_groups_and_builtins(manager):
+    manager.save_group('viet', 'vn & active')
+    assert [ch['id'] for ch in manager.resolve_target('@viet | us')] == ['-100', '-102']
+    assert manager.count_target('promo & !@viet') == 1
+    assert manager.count_target('paused') == 1
+
+
+def test_delete_group_refuses_when_other_group_uses_it(manager):
+    manager.save_group('viet', 'vn')
+    manager.save_group('viet_promo', '@viet & promo')
+
+    with pytest.raises(TargetExpressionError, match='@viet_promo'):
+        manager.delete_group('viet')
+    assert 'viet' in manager.get_groups()
+
+
+def test_delete_group_refuses_when_pending_schedule_targets_it(manager):
+    manager.save_group('viet', 'vn')
+
+    with pytest.raises(TargetExpressionError, match='sched_1'):
+        manager.delete_group('@viet', {'sched_1': '@viet & promo', 'sched_2': 'us'})
+    assert manager.group_references('viet', {'sched_2': 'us'}) == []
+
+
+def test_delete_unused_group(manager):
+    manager.save_group('viet', 'vn')
+    manager.save_group('us_only', 'us')
+
+    assert manager.delete_group('viet', {'sched_2': '@us_only'}) is True
+    assert manager.delete_group('viet') is False
+    assert list(manager.get_groups()) == ['us_only']
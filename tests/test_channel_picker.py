@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from channel_manager import ChannelManager
+from channel_picker import ChannelPicker
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = ChannelManager(str(tmp_path / "channels.json"))
+    for i in range(3):
+        manager.upsert_channel(f"-10{i}", {'id': f"-10{i}", 'title': f"Kênh {i}", 'tags': [f"t{i}", 'all_vn'], 'active': True})
+    return manager
+
+
+def _buttons(markup):
+    return [[(button.text, button.callback_data) for button in row] for row in markup.inline_keyboard]
+
+
+def test_groups_are_paginated_like_channels(manager):
+    for i in range(4):
+        manager.save_group(f"g{i}", f"t{i % 3}")
+    picker = ChannelPicker(manager, page_size=3)  # 4 nhóm + 4 tag = 8 mục, 3 trang
+
+    _, markup = picker.groups_markup()
+    rows = _buttons(markup)
+    assert [row[0] for row in rows[:3]] == [
+        ('👥 @g0 (1)', 'picker_group_0'), ('👥 @g1 (1)', 'picker_group_1'), ('👥 @g2 (1)', 'picker_group_2')
+    ]
+    assert [data for _, data in rows[3]] == [
+        'picker_groups_page_0', 'picker_groups_page_0', 'noop', 'picker_groups_page_1', 'picker_groups_page_2'
+    ]
+
+    _, markup = picker.groups_markup(2)
+    rows = _buttons(markup)
+    assert [row[0] for row in rows[:2]] == [('🏷️ t1 (1)', 'picker_group_6'), ('🏷️ t2 (1)', 'picker_group_7')]
+    assert rows[2][2][0] == '3/3'
+    assert picker.group_expression(7) == 't2'
+
+    picker.groups_markup(99)
+    assert picker.group_page == 2
+    _, markup = picker.groups_markup()  # mở lại thì giữ trang đang xem
+    assert _buttons(markup)[0][0][1] == 'picker_group_6'
+
+
+def test_few_groups_fit_on_one_page(manager):
+    picker = ChannelPicker(manager, page_size=10)
+    _, markup = picker.groups_markup()
+    rows = _buttons(markup)
+    assert len(rows) == 5  # 4 tag + nút quay lại, không có hàng chuyển trang
+    assert rows[-1] == [('🔙 Quay lại', 'select_channels_show')]
+
+
+def test_broken_group_shows_unknown_count(manager):
+    manager.save_group('a', 't0')
+    manager.save_group('b', '@a | t1')
+    manager.groups['a'] = {'expression': '@b'}  # vòng a -> b -> a (vd: sửa tay file nhóm)
+    manager._save_groups()
+    picker = ChannelPicker(manager, page_size=10)
+
+    text, markup = picker.groups_markup()
+
+    labels = [row[0][0] for row in _buttons(markup)]
+    assert labels[:3] == ['👥 @a (?)', '👥 @b (?)', '🏷️ all_vn (3)']
+    assert 'Chọn theo nhóm/tag' in text
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from channel_targeting import MembershipIndex, TargetExpressionError, normalize_tag, parse_target, referenced_groups
+
+
+def test_precedence_not_and_or():
+    assert parse_target('a | b & !c') == ('or', ('tag', 'a'), ('and', ('tag', 'b'), ('not', ('tag', 'c'))))
+    assert parse_target('(a | b) & c') == ('and', ('or', ('tag', 'a'), ('tag', 'b')), ('tag', 'c'))
+
+
+def test_names_are_case_insensitive_and_builtins_recognised():
+    assert parse_target('VN & Active') == ('and', ('tag', 'vn'), ('builtin', 'active'))
+    assert parse_target('@Khach_VIP') == ('group', 'khach_vip')
+
+
+@pytest.mark.parametrize('expression', ['', 'a &', '(a | b', 'a b', 'a $ b', '& a', '@all'])
+def test_invalid_expressions(expression):
+    with pytest.raises(TargetExpressionError):
+        parse_target(expression)
+
+
+def test_normalize_tag():
+    assert normalize_tag('#Promo') == 'promo'
+    with pytest.raises(TargetExpressionError):
+        normalize_tag('paused')
+
+
+def test_referenced_groups():
+    assert referenced_groups(parse_target('@a & !(@b | c)')) == ['a', 'b']
+
+
+@pytest.fixture
+def index():
+    index = MembershipIndex()
+    index.add('c0', ['vn', 'promo'], True)
+    index.add('c1', ['vn'], False)
+    index.add('c2', ['us', 'promo'], True)
+    return index
+
+
+def _keys(index, expression, groups=None):
+    groups = groups or {}
+    bits = index.evaluate(parse_target(expression), lambda name: index.evaluate(parse_target(groups[name]), None))
+    return index.keys_of(bits)
+
+
+def test_evaluate(index):
+    assert _keys(index, 'vn & promo & !paused') == ['c0']
+    assert _keys(index, 'promo | paused') == ['c0', 'c1', 'c2']
+    assert _keys(index, '!vn') == ['c2']
+    assert _keys(index, 'all') == ['c0', 'c1', 'c2']
+    assert _keys(index, 'missing') == []
+    assert _keys(index, '@viet & active', {'viet': 'vn'}) == ['c0']
+
+
+def test_remove_frees_ordinal_for_reuse(index):
+    index.remove('c1')
+    assert 'vn' in index.tag_bits and _keys(index, 'vn') == ['c0']
+    index.add('c3', ['vn'], True)
+    assert index.ordinals['c3'] == 1
+    assert _keys(index, 'vn') == ['c0', 'c3']
+    assert index.tag_counts() == {'promo': 2, 'us': 1, 'vn': 2}
+
+
+def test_set_active_and_version(index):
+    version = index.version
+    index.set_active('c1', True)
+    assert _keys(index, 'paused') == []
+    assert index.version > version
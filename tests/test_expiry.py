@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from telegram.error import BadRequest
+
+from expiry import ExpiryWorker
+from post_manager import PostManager
+from records import DeliveryResult
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    async def acquire(self, tokens: int = 1):
+        self.acquired += tokens
+
+    def pause(self, seconds: float):
+        pass
+
+
+class FakeBot:
+    def __init__(self, missing=()):
+        self.deleted = []
+        self.missing = set(missing)
+
+    async def delete_message(self, chat_id, message_id):
+        if message_id in self.missing:
+            raise BadRequest("Message to delete not found")
+        self.deleted.append((chat_id, message_id))
+
+    async def send_media_group(self, chat_id, media):
+        return [SimpleNamespace(message_id=100 + i) for i in range(len(media))]
+
+
+class FakePostManager:
+    def __init__(self, posts):
+        self.posts = posts
+        self.rate_limiter = CountingLimiter()
+        self.on_expiry = None
+        self.saves = 0
+        self._store = SimpleNamespace(generation=0)
+
+    def save_posts(self, changed=None):
+        self.saves += 1
+
+
+def _post(*results):
+    return {
+        'expires_at': datetime.now().isoformat(),
+        'channels': {str(result['channel_id']): result for result in results}
+    }
+
+
+def test_album_deletes_every_message_one_token_each():
+    album = DeliveryResult(channel_id='-1', success=True, message_id=7, message_ids=[7, 8, 9])
+    single = DeliveryResult(channel_id='-2', success=True, message_id=3)
+    manager = FakePostManager({'p1': _post(album, single)})
+    worker = ExpiryWorker(manager, FakeBot())
+
+    summary = asyncio.run(worker.expire(['p1']))
+
+    assert sorted(worker.bot.deleted) == [('-1', 7), ('-1', 8), ('-1', 9), ('-2', 3)]
+    assert manager.rate_limiter.acquired == 4
+    assert summary['deleted'] == 2
+    assert album['deleted_at'] and single['deleted_at']
+    assert manager.saves == 1
+
+
+def test_message_already_gone_counts_as_deleted():
+    album = DeliveryResult(channel_id='-1', success=True, message_id=7, message_ids=[7, 8])
+    manager = FakePostManager({'p1': _post(album)})
+    worker = ExpiryWorker(manager, FakeBot(missing={7}))
+
+    asyncio.run(worker.expire(['p1']))
+
+    assert worker.bot.deleted == [('-1', 8)]
+    assert album['deleted_at'] and not album.get('delete_error')
+
+
+def test_pop_due_returns_each_post_once():
+    manager = FakePostManager({'p1': _post(), 'p2': _post()})
+    worker = ExpiryWorker(manager, FakeBot())
+    for post_id in ('p1', 'p2', 'p1', 'p1'):
+        heapq.heappush(worker._heap, (datetime.fromisoformat(manager.posts[post_id]['expires_at']).timestamp(), post_id))
+
+    due = worker._pop_due(datetime.now().timestamp() + 1)
+
+    assert sorted(due) == ['p1', 'p2']
+
+
+def test_media_group_delivery_keeps_all_message_ids(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = PostManager()
+    post_data = {'type': 'media_group', 'media_list': [{'type': 'photo', 'file_id': 'a'}, {'type': 'photo', 'file_id': 'b'}]}
+
+    result = asyncio.run(manager._deliver(post_data, {'id': '-1', 'title': 'Kênh'}, FakeBot()))
+
+    assert result['message_id'] == 100
+    assert result['message_ids'] == [100, 101]
+
+
+def test_expiry_is_measured_from_each_delivery(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = PostManager()
+    canary_sent = datetime.now() - timedelta(minutes=30)
+    delivered = [
+        DeliveryResult(channel_id='-1', success=True, message_id=1, sent_at=canary_sent.isoformat()),
+        DeliveryResult(channel_id='-2', success=True, message_id=2, sent_at=(canary_sent + timedelta(minutes=20)).isoformat()),
+        DeliveryResult(channel_id='-3', success=False, error='Forbidden', sent_at=canary_sent.isoformat())
+    ]
+
+    record = manager.record_sent_post({'type': 'text', 'text': 'x', 'expire_after': 3600}, delivered)
+
+    channels = record['channels']
+    assert channels['-1']['expires_at'] == (canary_sent + timedelta(hours=1)).isoformat()
+    assert channels['-2']['expires_at'] == (canary_sent + timedelta(minutes=80)).isoformat()
+    assert 'expires_at' not in channels['-3']
+    assert record['expires_at'] == channels['-1']['expires_at']
+
+
+def test_deliveries_expire_on_their_own_schedule():
+    now = datetime.now()
+    early = DeliveryResult(channel_id='-1', success=True, message_id=1, expires_at=(now - timedelta(seconds=1)).isoformat())
+    late = DeliveryResult(channel_id='-2', success=True, message_id=2, expires_at=(now + timedelta(minutes=20)).isoformat())
+    manager = FakePostManager({'p1': _post(early, late)})
+    worker = ExpiryWorker(manager, FakeBot())
+
+    summary = asyncio.run(worker.expire(['p1']))
+
+    post = manager.posts['p1']
+    assert worker.bot.deleted == [('-1', 1)]
+    assert summary == {'deleted': 1, 'failed': 0, 'retrying': 0}
+    assert early['deleted_at'] and not late.get('deleted_at')
+    assert not post.get('expired_at') and not post.get('expiry_attempts')
+    assert post['expires_at'] == late['expires_at']
+    assert worker.next_due() == datetime.fromisoformat(late['expires_at']).timestamp()
+
+    late['expires_at'] = now.isoformat()
+    asyncio.run(worker.expire(['p1']))
+
+    assert worker.bot.deleted == [('-1', 1), ('-2', 2)]
+    assert post['expired_at']
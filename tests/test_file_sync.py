@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+from file_sync import SharedJSONStore, _fingerprint
+from records import ScheduleRecord
+
+
+def _store(tmp_path):
+    return SharedJSONStore(str(tmp_path / "data.json"), record_type=ScheduleRecord)
+
+
+def _read(store):
+    with open(store.path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_save_async_writes_file_and_sync_point(tmp_path):
+    store = _store(tmp_path)
+    data = {'a': ScheduleRecord(id='a', status='pending'), 'b': {'id': 'b', 'note': 'Tiếng Việt'}}
+
+    asyncio.run(store.save_async(data))
+
+    assert _read(store) == {'a': {'id': 'a', 'status': 'pending'}, 'b': {'id': 'b', 'note': 'Tiếng Việt'}}
+    assert not store.changed()
+    assert store._base == {key: _fingerprint(value) for key, value in data.items()}
+    assert _store(tmp_path).load() == data
+
+
+def test_save_async_reencodes_only_changed_keys(tmp_path):
+    store = _store(tmp_path)
+    data = {'a': {'n': 1}, 'b': {'n': 1}}
+    asyncio.run(store.save_async(data))
+    fragment_b = store._fragments['b']
+
+    data['a']['n'] = 2
+    asyncio.run(store.save_async(data, changed=['a']))
+
+    assert _read(store) == {'a': {'n': 2}, 'b': {'n': 1}}
+    assert store._fragments['b'] is fragment_b
+    assert store._base['a'] == _fingerprint({'n': 2})
+
+
+def test_save_async_merges_write_from_other_process(tmp_path):
+    store = _store(tmp_path)
+    data = {'a': {'n': 1}}
+    asyncio.run(store.save_async(data))
+
+    other = _store(tmp_path)
+    remote = other.load()
+    remote['c'] = {'n': 3}
+    other.save(remote)
+    data['a']['n'] = 2
+    asyncio.run(store.save_async(data, changed=['a']))
+
+    assert _read(store) == {'a': {'n': 2}, 'c': {'n': 3}}
+    assert data['c'] == {'n': 3}
+
+
+def test_overlapping_save_async_calls_are_coalesced(tmp_path):
+    store = _store(tmp_path)
+    data = {'a': {'n': 0}}
+    writes = []
+    write = store._write_fragments
+
+    def counted(entries, signature):
+        writes.append(len(entries))
+        return write(entries, signature)
+
+    store._write_fragments = counted
+
+    async def burst():
+        saves = []
+        for n in range(1, 4):
+            data[f'k{n}'] = {'n': n}
+            saves.append(asyncio.ensure_future(store.save_async(data, changed=[f'k{n}'])))
+        await asyncio.gather(*saves)
+
+    asyncio.run(burst())
+
+    assert len(writes) <= 2
+    assert _read(store) == {'a': {'n': 0}, 'k1': {'n': 1}, 'k2': {'n': 2}, 'k3': {'n': 3}}
+
+
+def _assert_synced(store):
+    """Mốc đồng bộ khớp đúng nội dung file (như khi tính lại fingerprint mọi key)"""
+    assert not store.changed()
+    assert store._base == {key: _fingerprint(value) for key, value in _read(store).items()}
+
+
+def _two_processes(tmp_path, data):
+    SharedJSONStore(str(tmp_path / "data.json")).save(data)
+    first, second = SharedJSONStore(str(tmp_path / "data.json")), SharedJSONStore(str(tmp_path / "data.json"))
+    return first, first.load(), second, second.load()
+
+
+def test_save_and_refresh_fingerprint_only_written_or_merged_keys(tmp_path, monkeypatch):
+    import file_sync
+    first, mine, second, theirs = _two_processes(tmp_path, {f"k{i}": {'n': i} for i in range(100)})
+    calls = []
+    monkeypatch.setattr(file_sync, '_fingerprint', lambda value: calls.append(value) or _fingerprint(value))
+
+    mine['k1']['n'] = -1
+    first.save(mine, changed=['k1'])
+    assert len(calls) == 1
+
+    calls.clear()
+    second.refresh(theirs)
+    assert theirs['k1'] == {'n': -1}
+    assert len(calls) == 100 + 1  # so sánh mọi key trên đĩa một lần, không tính lại cả mốc
+    _assert_synced(first)
+    _assert_synced(second)
+
+
+def test_concurrent_edits_to_different_keys_are_merged(tmp_path):
+    first, mine, second, theirs = _two_processes(tmp_path, {'a': {'n': 0}, 'b': {'n': 0}})
+
+    mine['a']['n'] = 1
+    theirs['b']['n'] = 2
+    first.save(mine, changed=['a'])
+    second.save(theirs, changed=['b'])
+    first.refresh(mine)
+
+    assert _read(first) == mine == theirs == {'a': {'n': 1}, 'b': {'n': 2}}
+    _assert_synced(first)
+    _assert_synced(second)
+
+
+def test_concurrent_edits_to_same_key_keep_last_writer(tmp_path):
+    first, mine, second, theirs = _two_processes(tmp_path, {'a': {'n': 0}, 'b': {'n': 0}})
+
+    mine['a']['n'] = 1
+    theirs['a']['n'] = 2
+    first.save(mine, changed=['a'])
+    second.save(theirs, changed=['a'])  # xung đột: giữ bản cục bộ của tiến trình ghi sau
+    first.refresh(mine)  # tiến trình kia không sửa thêm nên nhận bản mới
+
+    assert _read(first) == mine == theirs == {'a': {'n': 2}, 'b': {'n': 0}}
+    _assert_synced(first)
+    _assert_synced(second)
+
+
+def test_delete_then_concurrent_edit_keeps_edit(tmp_path):
+    first, mine, second, theirs = _two_processes(tmp_path, {'a': {'n': 0}, 'b': {'n': 0}})
+
+    del mine['a']
+    theirs['a']['n'] = 2
+    first.save(mine, changed=['a'])
+    second.save(theirs, changed=['a'])  # bản sửa ghi sau xóa: giữ bản sửa
+    first.refresh(mine)
+
+    assert _read(first) == mine == theirs == {'a': {'n': 2}, 'b': {'n': 0}}
+    _assert_synced(first)
+    _assert_synced(second)
+
+
+def test_edit_then_concurrent_delete_removes_key(tmp_path):
+    first, mine, second, theirs = _two_processes(tmp_path, {'a': {'n': 0}, 'b': {'n': 0}})
+
+    mine['a']['n'] = 1
+    del theirs['a']
+    first.save(mine, changed=['a'])
+    second.save(theirs, changed=['a'])  # xóa ghi sau sửa: key bị xóa
+    first.refresh(mine)
+
+    assert _read(first) == mine == theirs == {'b': {'n': 0}}
+    _assert_synced(first)
+    _assert_synced(second)
+
+
+def test_delete_is_merged_into_unchanged_copy(tmp_path):
+    first, mine, second, theirs = _two_processes(tmp_path, {'a': {'n': 0}, 'b': {'n': 0}})
+
+    del mine['a']
+    theirs['b']['n'] = 2
+    first.save(mine, changed=['a'])
+    second.save(theirs, changed=['b'])
+    first.refresh(mine)
+
+    assert _read(first) == mine == theirs == {'b': {'n': 2}}
+    assert 'a' not in second._base
+    _assert_synced(first)
+    _assert_synced(second)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from history_rollups import DailyRollups
+
+
+def test_analytics_record_counts_posts_per_channel_only(tmp_path):
+    rollups = DailyRollups(str(tmp_path / "analytics.rollups.json"))
+    rollups.add_analytics_record({
+        'timestamp': '2030-01-01T09:00:00', 'channels': ['-1', '-2'], 'success_count': 1, 'failure_count': 1
+    })
+
+    day = rollups.get_day('2030-01-01')
+    assert day['successful_sends'] == 1 and day['failed_sends'] == 1
+    assert day['channels']['-1'] == {'title': '-1', 'posts': 1, 'success': 0, 'failed': 0}
+    assert rollups.totals['channels']['-2']['success'] == 0
+
+
+def test_post_record_keeps_per_channel_outcome(tmp_path):
+    rollups = DailyRollups(str(tmp_path / "posts.rollups.json"))
+    rollups.add_post_record({
+        'created_at': '2030-01-01T09:00:00',
+        'channels': {
+            '-1': {'success': True, 'channel_title': 'A'},
+            '-2': {'success': False, 'channel_title': 'B'}
+        }
+    })
+
+    channels = rollups.totals['channels']
+    assert channels['-1'] == {'title': 'A', 'posts': 1, 'success': 1, 'failed': 0}
+    assert channels['-2'] == {'title': 'B', 'posts': 1, 'success': 0, 'failed': 1}
+
+
+def test_old_rollup_without_posts_field(tmp_path):
+    rollups = DailyRollups(str(tmp_path / "posts.rollups.json"))
+    rollups.days = {'2030-01-01': dict(rollups._empty_day(), channels={'-1': {'title': 'A', 'success': 2, 'failed': 1}})}
+    rollups.add_post_record({'created_at': '2030-01-01T10:00:00', 'channels': {'-1': {'success': True}}})
+
+    assert rollups.totals['channels']['-1']['posts'] == 4
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import leader_election
+from leader_election import LeaderElector, create_backend
+from scheduler import PostScheduler
+
+TTL = 10
+
+
+class FakeClock:
+    """Thay `time` trong leader_election: cả đồng hồ epoch của backend lẫn monotonic của elector"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(leader_election, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    return create_backend(request.param, str(tmp_path / 'leader.db'))
+
+
+def _elector(backend, owner, events=None, **kwargs):
+    events = events if events is not None else []
+    return LeaderElector(
+        backend, owner=owner, ttl=TTL,
+        on_elected=lambda: events.append((owner, 'elected')),
+        on_demoted=lambda: events.append((owner, 'demoted')),
+        **kwargs
+    )
+
+
+def test_expired_lease_is_taken_over(backend, clock):
+    assert backend.try_acquire('scheduler', 'a', TTL) == 1
+    assert backend.try_acquire('scheduler', 'b', TTL) is None
+
+    clock.advance(TTL - 1)
+    assert backend.try_acquire('scheduler', 'b', TTL) is None  # còn hạn: chưa được giành
+
+    clock.advance(1)
+    assert backend.try_acquire('scheduler', 'b', TTL) == 2
+    assert backend.holder('scheduler')[0] == 'b'
+    assert backend.try_acquire('scheduler', 'a', TTL) is None
+
+
+def test_renew_after_lease_lost_demotes(backend, clock):
+    events = []
+    a = _elector(backend, 'a', events)
+    b = _elector(backend, 'b', events)
+
+    async def scenario():
+        await a.step()
+        await b.step()
+        assert a.is_leader and a.token == 1
+        assert not b.is_leader
+
+        clock.advance(TTL)  # leader treo, không gia hạn kịp
+        assert not a.is_leader  # tự coi là mất quyền ngay khi hết hạn, chưa cần hỏi backend
+        await b.step()
+        assert b.is_leader and b.token == 2
+
+        await a.step()  # gia hạn muộn: lease đã thuộc replica khác
+        assert a.token is None and not a.is_leader
+
+    asyncio.run(scenario())
+    assert events == [('a', 'elected'), ('b', 'elected'), ('a', 'demoted')]
+    assert backend.holder('scheduler')[0] == 'b'
+
+
+def test_fencing_token_increases_on_every_change_of_owner(backend, clock):
+    tokens = []
+    tokens.append(backend.try_acquire('scheduler', 'a', TTL))
+    assert backend.try_acquire('scheduler', 'a', TTL) == tokens[-1]  # gia hạn giữ nguyên token
+
+    assert backend.release('scheduler', 'a')
+    assert not backend.release('scheduler', 'a')  # đã trả rồi
+    tokens.append(backend.try_acquire('scheduler', 'b', TTL))
+
+    clock.advance(TTL)
+    tokens.append(backend.try_acquire('scheduler', 'b', TTL))  # giành lại lease của chính mình đã hết hạn
+    tokens.append(backend.try_acquire('scheduler', 'b', TTL))
+
+    clock.advance(TTL)
+    tokens.append(backend.try_acquire('scheduler', 'a', TTL))
+    assert not backend.release('scheduler', 'b')  # không trả hộ lease của replica khác
+
+    assert tokens == [1, 2, 3, 3, 4]
+    assert backend.holder('scheduler') == ('a', clock.now + TTL, 4)
+
+
+def test_fencing_token_survives_restart(tmp_path, clock):
+    path = str(tmp_path / 'leader.db')
+    assert create_backend('sqlite', path).try_acquire('scheduler', 'a', TTL) == 1
+    clock.advance(TTL)
+    assert create_backend('sqlite', path).try_acquire('scheduler', 'b', TTL) == 2
+
+
+class InstantPostManager:
+    def __init__(self):
+        self.sends = []
+
+    async def send_to_multiple_channels(self, post_data, channels, bot, delay_between_sends=0):
+        self.sends.append([ch['id'] for ch in channels])
+        results = [{'channel_id': ch['id'], 'channel_title': '', 'success': True, 'message_id': 1} for ch in channels]
+        return {'post_id': 'p1', 'results': results, 'successful_sends': len(results), 'failed_sends': 0}
+
+
+class FakeChannelManager:
+    async def get_channel(self, channel_id):
+        return {'id': channel_id, 'title': '', 'active': True}
+
+    async def update_channel_stats_many(self, results):
+        return len(results)
+
+
+class FakeBot:
+    async def send_message(self, **kwargs):
+        return None
+
+
+def test_new_leader_recovers_schedule_left_executing(backend, clock, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_file = str(tmp_path / 'scheduled_posts.json')
+    start = datetime.now().replace(microsecond=0) - timedelta(seconds=1)
+
+    # Leader cũ đã ghi 'executing' rồi mất lease giữa lúc gửi (treo/chết)
+    old = PostScheduler(db_file=db_file)
+    old.scheduled_posts['s1'] = {
+        'id': 's1', 'status': 'executing', 'post_data': {'type': 'text', 'content': 'x'},
+        'channels': [{'id': '-1'}], 'scheduled_time': start.isoformat(), 'next_execution': start.isoformat(),
+        'repeat_type': 'daily', 'repeat_count': 0, 'executed_count': 0
+    }
+    old._touch('s1')
+    old.save_scheduled_posts()
+    assert backend.try_acquire('scheduler', 'old', TTL) == 1
+    clock.advance(TTL)
+
+    post_manager = InstantPostManager()
+    scheduler = PostScheduler(
+        db_file=db_file, bot=FakeBot(), manager_provider=lambda: (post_manager, FakeChannelManager())
+    )
+    elector = LeaderElector(
+        backend, owner='new', ttl=TTL, on_elected=scheduler.start, on_demoted=scheduler.stop
+    )
+    scheduler.should_run = lambda: elector.is_leader
+
+    def saved():
+        with open(db_file, encoding='utf-8') as f:
+            return json.load(f)['s1']
+
+    async def scenario():
+        await elector.step()  # được bầu -> scheduler.start() -> đưa 's1' về pending rồi chạy
+        assert elector.token == 2
+        for _ in range(100):
+            if saved()['executed_count']:
+                break
+            await asyncio.sleep(0.02)
+        elector.stop()
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+
+    assert post_manager.sends == [['-1']]
+    info = saved()
+    assert info['status'] == 'pending'
+    assert info['executed_count'] == 1
+    assert info['next_execution'] == (start + timedelta(days=1)).isoformat()
+    assert backend.holder('scheduler')[0] == ''  # dừng elector thì trả lease
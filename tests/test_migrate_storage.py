@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+
+import pytest
+
+from migrate_storage import JSONStreamReader, migrate_collection, verify_collection, SQLiteMigrationTarget
+
+
+def read_all(text, chunk_size, expand=()):
+    return list(JSONStreamReader(io.StringIO(text), chunk_size=chunk_size).iter_records(expand))
+
+
+@pytest.mark.parametrize("number", ["98.5", "-0.25", "1e5", "3.5E-7", "12345678", "2.0e+10"])
+def test_number_split_at_every_chunk_offset(number):
+    text = '{"a": ' + number + ', "b": [' + number + ', 1], "c": "x"}'
+    expected = json.loads(text)
+    for chunk_size in range(1, len(text) + 1):
+        records = dict(read_all(text, chunk_size))
+        assert records == {key: expected[key] for key in expected}, chunk_size
+
+
+def test_number_split_inside_expanded_array():
+    text = '{"posts": [98.5, 1.25e3, 7], "other": 0.5}'
+    for chunk_size in range(1, len(text) + 1):
+        assert read_all(text, chunk_size, expand=("posts",)) == [
+            ("posts/0", 98.5), ("posts/1", 1250.0), ("posts/2", 7), ("other", 0.5)
+        ]
+
+
+def test_empty_expanded_containers_are_kept():
+    text = '{"posts": [], "channels": {}, "daily_stats": {"d": 1}}'
+    assert read_all(text, 4, expand=("posts", "channels", "daily_stats")) == [
+        ("posts", []), ("channels", {}), ("daily_stats/d", 1)
+    ]
+
+
+def test_invalid_json_still_fails():
+    with pytest.raises(ValueError):
+        read_all('{"a": 1 "b": 2}', 3)
+
+
+def test_migrate_and_verify_roundtrip(tmp_path):
+    source = tmp_path / "analytics_data.json"
+    data = {"posts": [{"id": i, "score": i / 7} for i in range(50)], "errors": [], "version": 1.5}
+    source.write_text(json.dumps(data), encoding="utf-8")
+    target = SQLiteMigrationTarget(str(tmp_path / "out.db"))
+    try:
+        result = migrate_collection(target, "analytics", str(source), expand=("posts", "errors"), batch_size=7)
+        assert result["records"] == 52
+        check = verify_collection(target, "analytics", str(source), expand=("posts", "errors"))
+        assert check["success"]
+    finally:
+        target.close()
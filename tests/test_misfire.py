@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+import pytest
+
+from misfire import CatchUpPlanner, misfire_settings, trim_missed
+from recurrence import Recurrence
+from scheduler import PostScheduler
+
+NOW = datetime(2030, 1, 20, 10, 0)
+
+
+def test_misfire_settings_fall_back_to_config():
+    from config import Config
+    assert misfire_settings({}) == (Config.MISFIRE_POLICY, float(Config.MISFIRE_GRACE_SECONDS))
+    assert misfire_settings({'misfire_policy': 'bogus', 'misfire_grace': 0}) == ('once', 0.0)
+
+
+def test_trim_missed_keeps_latest_runs():
+    recurrence = Recurrence('FREQ=DAILY', datetime(2030, 1, 1, 9))
+    first, skipped = trim_missed(recurrence, datetime(2030, 1, 1, 9), NOW, 5)
+    assert first == datetime(2030, 1, 16, 9)
+    assert skipped == 15
+
+
+def test_catch_up_planner_spaces_runs():
+    planner = CatchUpPlanner(spacing=5, rate=10)
+    assert planner.slot(3, 100.0) == 100.0
+    assert planner.slot(100, 100.0) == 105.0  # chờ lần trước (5 giây)
+    assert planner.slot(1, 100.0) == 115.0  # 100 kênh / 10 tin mỗi giây
+    assert planner.backlog(100.0) == pytest.approx(20.0)
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return PostScheduler(db_file=str(tmp_path / "scheduled_posts.json"))
+
+
+def _add(scheduler, schedule_id, policy, late_days):
+    start = NOW.replace(hour=9) - timedelta(days=late_days)
+    scheduler.scheduled_posts[schedule_id] = {
+        'id': schedule_id, 'status': 'pending', 'repeat_type': 'daily', 'repeat_count': 0,
+        'scheduled_time': start.isoformat(), 'next_execution': start.isoformat(),
+        'channels': [{'id': '-1'}], 'misfire_policy': policy, 'misfire_grace': 300
+    }
+
+
+def test_on_time_schedule_runs_now(scheduler):
+    _add(scheduler, 's1', 'skip', 0)
+    now = NOW.replace(hour=9, minute=1).timestamp()
+    assert scheduler._handle_misfires(['s1'], now) == ['s1']
+
+
+def test_skip_jumps_to_next_future_run(scheduler):
+    _add(scheduler, 's1', 'skip', 3)
+    assert scheduler._handle_misfires(['s1'], NOW.timestamp()) == []
+    info = scheduler.scheduled_posts['s1']
+    assert info['next_execution'] == (NOW.replace(hour=9) + timedelta(days=1)).isoformat()
+    assert info['missed_count'] == 4
+
+
+def test_once_runs_one_catch_up_and_spaces_the_rest(scheduler):
+    _add(scheduler, 's1', 'once', 3)
+    _add(scheduler, 's2', 'once', 2)
+    assert scheduler._handle_misfires(['s2', 's1'], NOW.timestamp()) == ['s1']  # lỡ lâu nhất chạy trước
+    assert scheduler.scheduled_posts['s2']['deferred_until']
+    assert 'missed_count' not in scheduler.scheduled_posts['s1']
+
+
+def test_all_catches_up_only_latest_runs(scheduler):
+    from config import Config
+    _add(scheduler, 's1', 'all', 20)
+    assert scheduler._handle_misfires(['s1'], NOW.timestamp()) == ['s1']
+    info = scheduler.scheduled_posts['s1']
+    limit = Config.MISFIRE_MAX_CATCH_UP
+    assert info['next_execution'] == (NOW.replace(hour=9) - timedelta(days=limit - 1)).isoformat()
+    assert info['missed_count'] == 21 - limit
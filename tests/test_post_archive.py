@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import json
+from contextlib import contextmanager
+
+from post_archive import PostArchive
+from post_manager import PostManager
+
+
+def _post(n, day=1):
+    return {
+        'id': f"p{n}", 'created_at': f"2030-01-{day:02d}T09:00:{n:02d}", 'successful_sends': 1,
+        'channels': {'-1': {'success': True, 'channel_title': 'A'}}
+    }
+
+
+def test_append_skips_posts_already_archived(tmp_path):
+    db_file = str(tmp_path / "posts.json")
+    bot, dashboard = PostArchive(db_file), PostArchive(db_file)
+    posts = [_post(1), _post(2)]
+
+    assert bot.append(posts) == 2
+    assert dashboard.append(posts + [_post(3)]) == 1
+
+    assert [post['id'] for post in bot.iter_posts()] == ['p1', 'p2', 'p3']
+    assert bot.count() == 3
+    assert PostArchive(db_file).meta['successful_posts'] == 3
+
+
+def test_append_reloads_meta_written_by_other_process(tmp_path):
+    db_file = str(tmp_path / "posts.json")
+    bot, dashboard = PostArchive(db_file), PostArchive(db_file)
+    assert dashboard.meta['successful_posts'] == 0  # đã nạp số liệu trước khi bot ghi
+
+    bot.append([_post(1)])
+    dashboard.append([_post(2)])
+
+    assert PostArchive(db_file).meta['channels']['-1']['success'] == 2
+
+
+def test_writes_run_under_the_given_lock(tmp_path):
+    held = []
+
+    @contextmanager
+    def lock():
+        held.append(True)
+        yield
+
+    archive = PostArchive(str(tmp_path / "posts.json"), lock=lock)
+    archive.append([_post(1), _post(2)])
+    archive.remove('p1')
+    archive.truncate_before('2030-02-01')
+
+    assert len(held) == 3
+    assert archive.count() == 0
+
+
+def test_bot_and_dashboard_evict_the_same_posts_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_file = str(tmp_path / "posts.json")
+    with open(db_file, 'w', encoding='utf-8') as f:
+        json.dump({f"p{n}": _post(n, day=n) for n in range(1, 5)}, f)
+
+    bot = PostManager(db_file, window_days=0, window_posts=0)
+    dashboard = PostManager(db_file, window_days=0, window_posts=0)
+    for manager in (bot, dashboard):
+        manager.window_posts = 1
+        manager._enforce_window()
+
+    archived = [post['id'] for post in PostArchive(db_file).iter_posts()]
+    assert archived == ['p1', 'p2', 'p3']
+    assert list(bot.posts) == list(dashboard.posts) == ['p4']
+    with open(db_file, encoding='utf-8') as f:
+        assert list(json.load(f)) == ['p4']
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+import pytest
+
+from rate_limiter import TokenBucket
+
+
+def test_burst_up_to_capacity_then_paced():
+    bucket = TokenBucket(rate=10, capacity=5)
+    waits = [bucket._reserve(1) for _ in range(7)]
+    assert waits[:5] == [0.0] * 5
+    assert waits[5] == pytest.approx(0.1, abs=0.01)
+    assert waits[6] == pytest.approx(0.2, abs=0.01)
+
+
+def test_concurrent_pauses_do_not_stack():
+    bucket = TokenBucket(rate=10, capacity=10)
+    for _ in range(10):  # 10 lần gửi đồng thời cùng nhận RetryAfter 30 giây
+        bucket.pause(30)
+    wait = bucket._reserve(1)
+    assert 29.9 < wait < 30.2
+
+
+def test_longer_pause_extends_shorter_one():
+    bucket = TokenBucket(rate=10)
+    bucket.pause(5)
+    bucket.pause(20)
+    bucket.pause(1)
+    assert 19.9 < bucket._reserve(1) < 20.2
+
+
+def test_no_tokens_accrue_during_pause():
+    bucket = TokenBucket(rate=100, capacity=100)
+    bucket.pause(0.05)
+    time.sleep(0.06)
+    # Hết dừng chưa lâu: chỉ vừa tích lại vài token chứ không phải cả capacity
+    waits = [bucket._reserve(1) for _ in range(20)]
+    assert waits[-1] > 0.1
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(rate=0)
+    bucket.pause(30)
+    started = time.monotonic()
+    asyncio.run(bucket.acquire())
+    assert time.monotonic() - started < 0.05
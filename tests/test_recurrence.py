@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from itertools import islice
+
+import pytest
+
+from recurrence import Recurrence, legacy_rule
+
+
+def _runs(rule, start, count, tz=None, exdates=()):
+    recurrence = Recurrence(rule, start, tz, exdates)
+    return [moment.isoformat() for moment in islice(recurrence.iter_after(start), count)]
+
+
+def test_legacy_monthly_on_31st_clamps_to_month_end():
+    start = datetime(2030, 1, 31, 9)
+    assert _runs(legacy_rule('monthly', start), start, 3) == [
+        '2030-02-28T09:00:00', '2030-03-31T09:00:00', '2030-04-30T09:00:00'
+    ]
+
+
+def test_bymonthday_31_skips_short_months():
+    start = datetime(2030, 1, 31, 9)
+    assert _runs('FREQ=MONTHLY;BYMONTHDAY=31', start, 2) == ['2030-03-31T09:00:00', '2030-05-31T09:00:00']
+
+
+def test_weekly_interval_with_byday():
+    start = datetime(2030, 1, 7, 9)  # thứ Hai
+    assert _runs('FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE', start, 4) == [
+        '2030-01-09T09:00:00', '2030-01-21T09:00:00', '2030-01-23T09:00:00', '2030-02-04T09:00:00'
+    ]
+
+
+def test_count_includes_first_run():
+    start = datetime(2030, 1, 1, 9)
+    recurrence = Recurrence('FREQ=DAILY;COUNT=3', start)
+    assert recurrence.first() == start
+    assert _runs('FREQ=DAILY;COUNT=3', start, 5) == ['2030-01-02T09:00:00', '2030-01-03T09:00:00']
+
+
+def test_cron_weekdays_only():
+    start = datetime(2030, 1, 4)  # thứ Sáu
+    assert _runs('cron: 0 9 * * 1-5', start, 3) == [
+        '2030-01-04T09:00:00', '2030-01-07T09:00:00', '2030-01-08T09:00:00'
+    ]
+
+
+def test_dst_gap_moves_run_after_the_gap():
+    runs = _runs('cron: 30 2 * * *', datetime(2030, 3, 9), 3, tz='America/New_York')
+    assert runs == ['2030-03-09T02:30:00-05:00', '2030-03-10T03:30:00-04:00', '2030-03-11T02:30:00-04:00']
+
+
+def test_dst_repeated_hour_runs_once():
+    runs = _runs('FREQ=DAILY;BYHOUR=1;BYMINUTE=30', datetime(2030, 11, 2), 3, tz='America/New_York')
+    assert runs == ['2030-11-02T01:30:00-04:00', '2030-11-03T01:30:00-04:00', '2030-11-04T01:30:00-05:00']
+
+
+def test_exdates_skip_whole_day():
+    assert _runs('FREQ=DAILY', datetime(2030, 1, 1, 9), 2, exdates=['2030-01-02']) == [
+        '2030-01-03T09:00:00', '2030-01-04T09:00:00'
+    ]
+
+
+def test_legacy_rule_without_repeat():
+    assert legacy_rule('none', datetime(2030, 1, 1)) is None
+
+
+@pytest.mark.parametrize('rule', ['FREQ=SOMETIMES', 'cron: 61 * * * *', 'FREQ=DAILY;FOO=1', 'FREQ=DAILY;INTERVAL=0'])
+def test_invalid_rules_raise_value_error(rule):
+    with pytest.raises(ValueError):
+        Recurrence(rule, datetime(2030, 1, 1))
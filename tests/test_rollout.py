@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from telegram.error import RetryAfter
+
+from rollout import ROLLOUT_COMPLETED, ROLLOUT_HALTED, ROLLOUT_RUNNING, Rollout
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.acquired = 0
+        self.pauses = []
+
+    async def acquire(self, tokens: int = 1):
+        self.acquired += tokens
+
+    def pause(self, seconds: float):
+        self.pauses.append(seconds)
+
+
+def _sender(retry_after=(), always_limited=(), broken=()):
+    attempts = {}
+
+    async def send_one(channel_id):
+        attempts[channel_id] = attempts.get(channel_id, 0) + 1
+        if channel_id in broken:
+            raise ValueError("Nút URL không hợp lệ")
+        if channel_id in always_limited or (channel_id in retry_after and attempts[channel_id] == 1):
+            raise RetryAfter(30)
+        return object()
+    return send_one, attempts
+
+
+def test_retry_after_pauses_bucket_and_retries():
+    limiter = RecordingLimiter()
+    send_one, attempts = _sender(retry_after={'a', 'b'})
+    rollout = Rollout(['a', 'b', 'c'], send_one, canary_size=3, rate_limiter=limiter)
+
+    wave = asyncio.run(rollout.run_next_wave())
+
+    assert wave['sent'] == 3 and wave['failed'] == 0
+    assert attempts == {'a': 2, 'b': 2, 'c': 1}
+    assert limiter.pauses == [30, 30]
+    assert limiter.acquired == 5
+    assert rollout.status == ROLLOUT_COMPLETED
+
+
+def test_rate_limited_channels_do_not_halt_rollout():
+    send_one, _ = _sender(always_limited={'a', 'b'})
+    rollout = Rollout(['a', 'b', 'c', 'd', 'e'], send_one, canary_size=3, wave_size=2,
+                      max_error_rate=0.2, rate_limiter=RecordingLimiter())
+
+    wave = asyncio.run(rollout.run_next_wave())
+
+    assert wave['failed'] == 0 and wave['rate_limited'] == 2
+    assert rollout.error_rate(wave) == 0.0
+    assert rollout.status == ROLLOUT_RUNNING
+    assert set(rollout.failed) == {'a', 'b'}
+
+
+def test_real_errors_still_halt_rollout():
+    send_one, _ = _sender(broken={'a', 'b'})
+    rollout = Rollout(['a', 'b', 'c', 'd', 'e'], send_one, canary_size=3, wave_size=2,
+                      max_error_rate=0.2, rate_limiter=RecordingLimiter())
+
+    wave = asyncio.run(rollout.run_next_wave())
+
+    assert wave['failed'] == 2
+    assert rollout.status == ROLLOUT_HALTED
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+from load_smoothing import plan_offset
+from schedule_index import ScheduleIndex
+from scheduler import PostScheduler
+
+START = datetime(2030, 1, 1, 9, 0)
+
+
+def _schedule(repeat_type='daily', repeat_count=0, channels=5, start=START):
+    return {
+        'status': 'pending',
+        'scheduled_time': start.isoformat(),
+        'next_execution': start.isoformat(),
+        'repeat_type': repeat_type,
+        'repeat_count': repeat_count,
+        'executed_count': 0,
+        'channels': [str(i) for i in range(channels)]
+    }
+
+
+def _index(hours=72):
+    return ScheduleIndex(60, hours * 3600, PostScheduler._projected_runs)
+
+
+def test_recurring_runs_inside_horizon_count_toward_load():
+    index = _index()
+    index.update('s1', _schedule())
+    for day in range(4):
+        assert index.load_at((START + timedelta(days=day)).timestamp()) == 5
+    assert index.load_at((START + timedelta(days=4)).timestamp()) == 0
+
+
+def test_repeat_count_limits_projection():
+    index = _index()
+    index.update('s1', _schedule(repeat_count=2))
+    assert index.load_at((START + timedelta(days=1)).timestamp()) == 5
+    assert index.load_at((START + timedelta(days=2)).timestamp()) == 0
+
+
+def test_update_removes_every_projected_run():
+    index = _index()
+    index.update('s1', _schedule())
+    index.update('s1', dict(_schedule(), status='cancelled'))
+    assert not index.load_by_bucket
+
+
+def test_without_horizon_only_next_run_counts():
+    index = ScheduleIndex(60)
+    index.update('s1', _schedule())
+    assert index.load_at(START.timestamp()) == 5
+    assert index.load_at((START + timedelta(days=1)).timestamp()) == 0
+
+
+def test_stagger_sees_other_schedules_later_runs():
+    index = _index()
+    index.update('daily', _schedule(channels=600))  # 9:00 mỗi ngày
+    tomorrow = (START + timedelta(days=1)).timestamp()
+    plan = plan_offset(index, tomorrow, 600, 'stagger', 120, rate=10)
+    assert plan['offset'] > 0
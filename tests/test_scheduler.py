@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import heapq
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from scheduler import PostScheduler
+
+
+class SlowPostManager:
+    """Gửi giả, chờ `release` rồi mới trả kết quả (mô phỏng một lần gửi chậm)"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.sends = 0
+
+    async def send_to_multiple_channels(self, post_data, channels, bot, delay_between_sends=0):
+        self.sends += 1
+        self.started.set()
+        await self.release.wait()
+        results = [{'channel_id': ch['id'], 'channel_title': '', 'success': True, 'message_id': 1} for ch in channels]
+        return {'post_id': f"p{self.sends}", 'results': results, 'successful_sends': len(results), 'failed_sends': 0}
+
+
+class FakeChannelManager:
+    async def get_channel(self, channel_id):
+        return {'id': channel_id, 'title': '', 'active': True}
+
+    async def update_channel_stats_many(self, results):
+        return len(results)
+
+
+class FakeBot:
+    async def send_message(self, **kwargs):
+        return None
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return str(tmp_path / "scheduled_posts.json")
+
+
+def _scheduler(db_file, post_manager=None):
+    post_manager = post_manager or SlowPostManager()
+    return PostScheduler(db_file=db_file, bot=FakeBot(), manager_provider=lambda: (post_manager, FakeChannelManager()))
+
+
+def test_pop_due_returns_each_schedule_once(db_file):
+    scheduler = PostScheduler(db_file=db_file)
+    when = datetime(2030, 1, 1, 9, 0)
+    for schedule_id in ('a', 'b'):
+        scheduler.scheduled_posts[schedule_id] = {
+            'status': 'pending', 'scheduled_time': when.isoformat(), 'next_execution': when.isoformat()
+        }
+    scheduler._heap = []
+    for schedule_id in ('a', 'b', 'a', 'a', 'b'):
+        heapq.heappush(scheduler._heap, (when.timestamp(), schedule_id))
+
+    assert sorted(scheduler._pop_due(when.timestamp())) == ['a', 'b']
+    assert not scheduler._heap
+
+
+def _run_with(scheduler, post_manager, during):
+    """Chạy lịch 's1', gọi `during()` khi đang gửi, trả về lịch sau khi gửi xong"""
+    async def scenario():
+        task = asyncio.ensure_future(
+            scheduler._execute_scheduled_post('s1', scheduler.scheduled_posts['s1'])
+        )
+        await post_manager.started.wait()
+        await during()
+        post_manager.release.set()
+        await task
+    asyncio.run(scenario())
+    return scheduler.scheduled_posts['s1']
+
+
+def _daily(scheduler):
+    start = datetime.now().replace(microsecond=0) - timedelta(seconds=1)
+    scheduler.scheduled_posts['s1'] = {
+        'id': 's1', 'status': 'pending', 'post_data': {'type': 'text', 'content': 'x'},
+        'channels': [{'id': '-1'}], 'scheduled_time': start.isoformat(), 'next_execution': start.isoformat(),
+        'repeat_type': 'daily', 'repeat_count': 0, 'executed_count': 0
+    }
+    scheduler._touch('s1')
+    return start
+
+
+def test_cancel_during_send_is_kept(db_file):
+    post_manager = SlowPostManager()
+    scheduler = _scheduler(db_file, post_manager)
+    start = _daily(scheduler)
+
+    async def cancel():
+        assert await scheduler.cancel_schedule('s1')
+
+    info = _run_with(scheduler, post_manager, cancel)
+
+    assert info['status'] == 'cancelled'
+    assert info['next_execution'] == start.isoformat()
+    assert info['executed_count'] == 1  # lần gửi đã xảy ra vẫn được ghi lại
+    assert scheduler._next_due() is None
+
+
+def test_run_without_interference_moves_to_next_occurrence(db_file):
+    post_manager = SlowPostManager()
+    scheduler = _scheduler(db_file, post_manager)
+    start = _daily(scheduler)
+
+    async def nothing():
+        pass
+
+    info = _run_with(scheduler, post_manager, nothing)
+
+    assert info['status'] == 'pending'
+    assert info['next_execution'] == (start + timedelta(days=1)).isoformat()
+
+
+def test_executing_written_by_concurrent_save_is_recovered_on_start(db_file):
+    post_manager = SlowPostManager()
+    scheduler = _scheduler(db_file, post_manager)
+    start = _daily(scheduler)
+
+    async def concurrent_save():
+        scheduler.save_scheduled_posts()  # vd: schedule_post từ bot trong lúc đang gửi
+
+    async def crash_mid_send():
+        task = asyncio.ensure_future(scheduler._execute_scheduled_post('s1', scheduler.scheduled_posts['s1']))
+        await post_manager.started.wait()
+        await concurrent_save()
+        task.cancel()  # tiến trình chết giữa lúc gửi
+    asyncio.run(crash_mid_send())
+    with open(db_file, encoding='utf-8') as f:
+        assert json.load(f)['s1']['status'] == 'executing'
+
+    restarted = _scheduler(db_file)
+    assert restarted._recover_interrupted() == 1
+    info = restarted.scheduled_posts['s1']
+    assert info['status'] == 'pending' and info['next_execution'] == start.isoformat()
+    assert restarted._next_due() == start.timestamp()
+    with open(db_file, encoding='utf-8') as f:
+        assert json.load(f)['s1']['status'] == 'pending'
+
+
+def test_recover_skips_schedules_running_in_this_process(db_file):
+    scheduler = _scheduler(db_file)
+    _daily(scheduler)
+    scheduler.scheduled_posts['s1']['status'] = 'executing'
+    scheduler._running_ids.add('s1')
+    assert scheduler._recover_interrupted() == 0
+
+
+def test_tick_saves_results_without_synchronous_write(db_file):
+    post_manager = SlowPostManager()
+    post_manager.release.set()
+    scheduler = _scheduler(db_file, post_manager)
+    start = _daily(scheduler)
+    scheduler._store.save = None  # lượt kiểm tra không được ghi đồng bộ trên event loop
+
+    asyncio.run(scheduler._check_and_execute_scheduled_posts())
+
+    with open(db_file, encoding='utf-8') as f:
+        saved = json.load(f)['s1']
+    assert saved['executed_count'] == 1
+    assert saved['next_execution'] == (start + timedelta(days=1)).isoformat()
+    assert not scheduler._store.changed()